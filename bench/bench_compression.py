@@ -0,0 +1,87 @@
+"""
+Benchmark: CPU vs bytes saved by the compression of a connection, for typical message sizes.
+
+every message is a JSON telemetry reading of about the given size (same keys, drifting values), one after the other
+like on a connection:
+
+1. zlib.compress per message - a new deflate context for every message (what a straightforward "compress it" does)
+2. Compression               - the context of the connection is reused (see src/compression.py), a message is
+                               compressed against the ones before it
+
+for every size + level: microseconds per message (compress + decompress) and bytes on the wire / bytes of the message.
+messages shorter than the threshold are sent plain (marker byte only) - see the first rows.
+
+run from the repo root:
+    python -m bench.bench_compression
+    python -m bench.bench_compression --messages 5000 --sizes 128 1024 --levels 1 9
+"""
+import argparse
+import json
+import random
+import time
+import zlib
+
+from src.compression import Compression, DEFAULT_THRESHOLD
+
+
+def _messages(size, messages):
+    generator = random.Random(size) # same messages every run
+    result = []
+    value = 20.0
+    for index in range(messages):
+        reading = {"sensor": f"sensor-{index % 16}", "sequence": index, "status": "ok", "samples": []}
+        length = len(json.dumps(reading))
+        timestamp = 1700000000 + index
+        while length < size:
+            value += generator.uniform(-0.5, 0.5) # a measurement that drifts slowly
+            sample = {"t": timestamp, "unit": "celsius", "value": round(value, 2)}
+            timestamp += 1
+            reading["samples"].append(sample)
+            length += len(json.dumps(sample)) + 2 # ", "
+        result.append(json.dumps(reading).encode())
+    return result
+
+
+def bench_per_message(messages, level):
+    start = time.perf_counter()
+    sent = 0
+    for message in messages:
+        compressed = zlib.compress(message, level)
+        sent += len(compressed)
+        zlib.decompress(compressed)
+    return (time.perf_counter() - start) / len(messages) * 1e6, sent
+
+
+def bench_connection(messages, level, threshold):
+    sender, receiver = Compression(threshold, level), Compression(threshold, level)
+    start = time.perf_counter()
+    sent = 0
+    for message in messages:
+        compressed = sender.compress(message)
+        sent += len(compressed)
+        receiver.decompress(compressed)
+    return (time.perf_counter() - start) / len(messages) * 1e6, sent
+
+
+def main():
+    parser = argparse.ArgumentParser(description="compression of a connection: CPU per message vs bytes saved")
+    parser.add_argument("--messages", type=int, default=1000)
+    parser.add_argument("--sizes", type=int, nargs="+", default=[64, 256, 1024, 4096, 16384])
+    parser.add_argument("--levels", type=int, nargs="+", default=[1, 6, 9])
+    parser.add_argument("--threshold", type=int, default=DEFAULT_THRESHOLD)
+    args = parser.parse_args()
+
+    print(f"{'size':>6} | {'level':>5} | {'per message us':>14} | {'ratio':>6} | {'connection us':>13} | {'ratio':>6}")
+    print("-" * 66)
+    for size in args.sizes:
+        messages = _messages(size, args.messages)
+        total = sum(len(message) for message in messages)
+        for level in args.levels:
+            per_message_us, per_message_sent = bench_per_message(messages, level)
+            connection_us, connection_sent = bench_connection(messages, level, args.threshold)
+            print(f"{size:>6} | {level:>5} | {per_message_us:>14.1f} | {per_message_sent / total:>6.2f} | "
+                  f"{connection_us:>13.1f} | {connection_sent / total:>6.2f}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,94 @@
+"""
+Benchmark: cost of a single wakeup of the server scanning loop, as function of the amount of IDLE connections.
+
+every connection is simulated by socket.socketpair() - one end is monitored (like server's client socket),
+the other end plays the client. In every round exactly ONE 'client' sends 1 byte, so the scan returns exactly
+one ready socket, what we measure is how much it cost to find this single socket among all the idle ones.
+
+compared:
+1. select-list: select.select() with the list rebuilt on every scan (the old _scan_sockets), only possible below FD_SETSIZE (1024)
+2. EventLoop with every backend available on this machine (persistent registration)
+
+run from the repo root:
+    python -m bench.bench_event_loop
+    python -m bench.bench_event_loop --connections 100 1000 10000 --rounds 2000
+"""
+import argparse
+import resource
+import select
+import socket
+import time
+
+from src.event_loop import EventLoop, EVENT_READ, BACKENDS
+
+FD_SETSIZE = 1024
+
+
+def _create_idle_connections(amount):
+    return [socket.socketpair() for _ in range(amount)]
+
+
+def _bench_select(pairs, rounds):
+    monitored = [server_end for server_end, _ in pairs]
+    active_server_end, active_client_end = pairs[len(pairs) // 2]
+    start = time.perf_counter()
+    for _ in range(rounds):
+        active_client_end.send(b"x")
+        readable, _, _ = select.select([] + monitored, [], [], 5)  # list is rebuilt on every scan, as the old server did
+        readable[0].recv(1)
+    return (time.perf_counter() - start) / rounds
+
+
+def _bench_event_loop(pairs, rounds, backend):
+    event_loop = EventLoop(backend)
+    for server_end, _ in pairs:
+        event_loop.register(server_end, EVENT_READ)
+    active_server_end, active_client_end = pairs[len(pairs) // 2]
+    start = time.perf_counter()
+    for _ in range(rounds):
+        active_client_end.send(b"x")
+        notified = event_loop.poll(5)
+        notified[0][0].recv(1)
+    elapsed = (time.perf_counter() - start) / rounds
+    event_loop.close()
+    return elapsed
+
+
+def main():
+    parser = argparse.ArgumentParser(description="event loop wakeup cost vs amount of idle connections")
+    parser.add_argument("--connections", type=int, nargs="+", default=[100, 1000, 10000])
+    parser.add_argument("--rounds", type=int, default=1000)
+    args = parser.parse_args()
+
+    # every connection takes 2 fds (both ends of the pair) + some spare for the selectors themselves
+    soft, hard = resource.getrlimit(resource.RLIMIT_NOFILE)
+    needed = 2 * max(args.connections) + 64
+    if soft < needed:
+        resource.setrlimit(resource.RLIMIT_NOFILE, (min(needed, hard), hard))
+
+    backends = [name for name, cls in BACKENDS.items() if cls and name != "auto"]
+    print(f"{'connections':>12} | {'backend':>8} | {'usec / wakeup':>14}")
+    print("-" * 42)
+    for amount in args.connections:
+        try:
+            pairs = _create_idle_connections(amount)
+        except OSError as ee:
+            print(f"{amount:>12} | cannot open {amount} connections: {ee}")
+            continue
+        results = {}
+        # select() can not handle fd numbers >= FD_SETSIZE
+        if max(server_end.fileno() for server_end, _ in pairs) < FD_SETSIZE:
+            results["select-list"] = _bench_select(pairs, args.rounds)
+        for backend in backends:
+            if backend == "select" and "select-list" not in results:
+                continue
+            results[backend] = _bench_event_loop(pairs, args.rounds, backend)
+        for name, seconds in results.items():
+            print(f"{amount:>12} | {name:>8} | {seconds * 1e6:>14.2f}")
+        for server_end, client_end in pairs:
+            server_end.close()
+            client_end.close()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,140 @@
+"""
+Benchmark: cost of logging on the message hot path, print per message (before) vs src.log (after).
+
+1. micro - calls per second of a single per-message log line:
+   print() to the console stream (how every message was logged before), log.debug() with DEBUG off,
+   log.info() through the queue (QueueHandler -> QueueListener thread)
+2. end to end - messages per second of the select server, N clients sending in parallel (send + wait for response):
+   log_level DEBUG (a line per message, same amount of output as the prints before) vs log_level INFO.
+   the server output goes to a pipe that is read and thrown away, like a console that nobody reads.
+
+run from the repo root:
+    python -m bench.bench_logging
+    python -m bench.bench_logging --calls 200000 --clients 4 --messages 5000
+"""
+import argparse
+import io
+import os
+import subprocess
+import sys
+import threading
+import time
+from contextlib import redirect_stdout
+
+from bench.bench_servers import _connect, _create_client_context, _load_server_address
+from src.config_resolver import REPO_ROOT
+from src.framing import FrameBuffer, send_frame, recv_frame
+from src.log import get_logger, setup_logging, stop_logging, LEVEL_ENV
+
+
+class _NullConsole(io.TextIOBase):
+    # a console that takes the text and throws it away (the cost of the write call itself is measured, not the terminal)
+    def write(self, text):
+        return len(text)
+
+
+def bench_micro(calls):
+    console = _NullConsole()
+    message, client_address = "Hello, client! I received your message: x.", ("127.0.0.1", 50000)
+    results = {}
+
+    with redirect_stdout(console):
+        start = time.perf_counter()
+        for index in range(calls):
+            print(f"[SERVER]: Sending response message back to client: {client_address}, [{index}]:{message}")
+        results["print() per message"] = calls / (time.perf_counter() - start)
+
+    setup_logging("INFO", stream=console)
+    log = get_logger("SERVER")
+    start = time.perf_counter()
+    for index in range(calls):
+        log.debug("Sending response message back to client: %s, [%s]:%s", client_address, index, message)
+    results["log.debug(), DEBUG off"] = calls / (time.perf_counter() - start)
+
+    start = time.perf_counter()
+    for index in range(calls):
+        log.info("Sending response message back to client: %s, [%s]:%s", client_address, index, message)
+    results["log.info() via queue"] = calls / (time.perf_counter() - start)
+    stop_logging()
+    return results
+
+
+def _drain(pipe):
+    while pipe.read(64 * 1024):
+        pass
+
+
+def _start_server(level, context, address):
+    env = dict(os.environ, PYTHONPATH=str(REPO_ROOT), **{LEVEL_ENV: level})
+    server_process = subprocess.Popen([sys.executable, "-m", "src.run_server", "--engine", "select"],
+                                      cwd=REPO_ROOT, env=env,
+                                      stdout=subprocess.PIPE, stderr=subprocess.STDOUT)
+    threading.Thread(target=_drain, args=(server_process.stdout,), daemon=True).start()
+    deadline = time.monotonic() + 15
+    while time.monotonic() < deadline:
+        try:
+            return server_process, _connect(context, address)
+        except OSError:
+            time.sleep(0.1)
+    server_process.kill()
+    raise RuntimeError("select server did not start")
+
+
+def _client(context, address, messages, errors):
+    try:
+        with _connect(context, address) as tls_socket:
+            frame_buffer = FrameBuffer(64 * 1024)
+            for index in range(messages):
+                send_frame(tls_socket, b"x" * 100, index)
+                if recv_frame(tls_socket, frame_buffer) is None:
+                    raise RuntimeError("server closed the connection")
+            send_frame(tls_socket, b"q")
+    except Exception as ee:
+        errors.append(ee)
+
+
+def bench_end_to_end(level, context, address, clients, messages):
+    server_process, anchor_socket = _start_server(level, context, address)
+    try:
+        errors = []
+        threads = [threading.Thread(target=_client, args=(context, address, messages, errors)) for _ in range(clients)]
+        start = time.perf_counter()
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        elapsed = time.perf_counter() - start
+        if errors:
+            raise errors[0]
+        send_frame(anchor_socket, b"q")
+        anchor_socket.close()
+        server_process.wait(timeout=10)
+    finally:
+        if server_process.poll() is None:
+            server_process.kill()
+            server_process.wait()
+    return clients * messages / elapsed
+
+
+def main():
+    parser = argparse.ArgumentParser(description="print per message vs leveled + queued logging")
+    parser.add_argument("--calls", type=int, default=100000)
+    parser.add_argument("--clients", type=int, default=4)
+    parser.add_argument("--messages", type=int, default=2000)
+    args = parser.parse_args()
+
+    print(f"{'micro':>40} | {'calls/sec':>12}")
+    print("-" * 56)
+    for name, calls_per_sec in bench_micro(args.calls).items():
+        print(f"{name:>40} | {calls_per_sec:>12.0f}")
+
+    context = _create_client_context()
+    address = _load_server_address()
+    print(f"\n{'select server, ' + str(args.clients) + ' clients':>40} | {'msgs/sec':>12}")
+    print("-" * 56)
+    for name, level in (("DEBUG - line per message (before)", "DEBUG"), ("INFO (after)", "INFO")):
+        print(f"{name:>40} | {bench_end_to_end(level, context, address, args.clients, args.messages):>12.0f}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,83 @@
+"""
+Benchmark: sustained insert rate of the sqlite message store.
+
+1. commit per message - INSERT + COMMIT for every message (what a straightforward "add to SQL DB" does)
+2. SQLiteStore        - the workers only queue the records, a writer thread inserts them in batches
+                        (batch size + batch interval), measured until the last record is committed
+
+N producer threads (like the working threads of the server) add the records in parallel.
+
+run from the repo root:
+    python -m bench.bench_message_store
+    python -m bench.bench_message_store --messages 50000 --producers 4 --batch-size 1000
+"""
+import argparse
+import sqlite3
+import tempfile
+import threading
+import time
+from pathlib import Path
+
+from src.message_store import MessageRecord, SQLiteStore, DEFAULT_BATCH_SIZE, DEFAULT_BATCH_INTERVAL
+
+
+def _run_producers(producers, messages, add):
+    def producer(client_index):
+        for index in range(messages // producers):
+            add(MessageRecord(("127.0.0.1", 50000 + client_index), index, f"message {index}",
+                              "Hello, client! I received your message."))
+
+    threads = [threading.Thread(target=producer, args=(client_index,)) for client_index in range(producers)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+
+def bench_commit_per_message(path, producers, messages):
+    connection = sqlite3.connect(path, check_same_thread=False)
+    connection.execute("PRAGMA journal_mode=WAL")
+    connection.execute("CREATE TABLE messages (client TEXT, message_index INTEGER, message TEXT, response TEXT, timestamp REAL)")
+    lock = threading.Lock() # a single connection, used by all the producers
+
+    def add(record):
+        with lock, connection:
+            connection.execute("INSERT INTO messages VALUES (?, ?, ?, ?, ?)", SQLiteStore._row(record))
+
+    start = time.perf_counter()
+    _run_producers(producers, messages, add)
+    elapsed = time.perf_counter() - start
+    connection.close()
+    return messages / elapsed
+
+
+def bench_sqlite_store(path, producers, messages, batch_size, batch_interval):
+    store = SQLiteStore(path, batch_size, batch_interval)
+    start = time.perf_counter()
+    _run_producers(producers, messages, store.add)
+    store.flush() # all committed
+    elapsed = time.perf_counter() - start
+    store.close()
+    return messages / elapsed
+
+
+def main():
+    parser = argparse.ArgumentParser(description="sqlite insert rate: commit per message vs batched writer thread")
+    parser.add_argument("--messages", type=int, default=20000)
+    parser.add_argument("--producers", type=int, default=4)
+    parser.add_argument("--batch-size", type=int, default=DEFAULT_BATCH_SIZE)
+    parser.add_argument("--batch-interval", type=float, default=DEFAULT_BATCH_INTERVAL)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as directory:
+        print(f"{str(args.producers) + ' producers, ' + str(args.messages) + ' messages':>40} | {'msgs/sec':>12}")
+        print("-" * 56)
+        rate = bench_commit_per_message(Path(directory) / "per_message.db", args.producers, args.messages)
+        print(f"{'commit per message (before)':>40} | {rate:>12.0f}")
+        rate = bench_sqlite_store(Path(directory) / "batched.db", args.producers, args.messages,
+                                  args.batch_size, args.batch_interval)
+        print(f"{'SQLiteStore, batch ' + str(args.batch_size) + ' (after)':>40} | {rate:>12.0f}")
+
+
+if __name__ == '__main__':
+    main()
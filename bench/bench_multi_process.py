@@ -0,0 +1,123 @@
+"""
+Benchmark: throughput of the select server vs amount of server processes (number_worker_processes / --processes).
+
+for every amount of processes the server is started (python -m src.run_server --engine select --processes N),
+then C client processes connect (the kernel spreads the connections between the server processes, SO_REUSEPORT)
+and every client connection pipelines messages: keeps 'window' messages in flight, sends a new one per response.
+measured: messages per second of all the clients together.
+
+with a single process the event loop + the working threads share one GIL, with N processes every one has its own,
+so the throughput scales up to the amount of cores (the client processes run on the same machine and use cores too).
+
+run from the repo root:
+    python -m bench.bench_multi_process
+    python -m bench.bench_multi_process --processes 1 2 4 8 --clients 8 --messages 5000
+"""
+import argparse
+import multiprocessing
+import os
+import signal
+import subprocess
+import sys
+import time
+
+from src.config_resolver import REPO_ROOT
+from src.framing import FrameBuffer, send_frame, recv_frame
+from bench.bench_servers import _connect, _create_client_context, _load_server_address
+
+
+def _start_server(processes, context, address):
+    env = dict(os.environ, PYTHONPATH=str(REPO_ROOT))
+    server_process = subprocess.Popen([sys.executable, "-m", "src.run_server", "--engine", "select", "--processes", str(processes)],
+                                      cwd=REPO_ROOT, env=env,
+                                      stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    deadline = time.monotonic() + 20
+    while time.monotonic() < deadline:
+        try:
+            anchor_socket = _connect(context, address)
+            time.sleep(processes * 0.5) # the first process listens, give the others time to start
+            return server_process, anchor_socket
+        except OSError:
+            time.sleep(0.1)
+    server_process.kill()
+    raise RuntimeError(f"server with {processes} processes did not start")
+
+
+def _client(address, messages, window, message_size, ready, go, results):
+    # runs in its own process, a single connection
+    tls_socket = _connect(_create_client_context(), address, timeout=30)
+    frame_buffer = FrameBuffer(64 * 1024)
+    message = b"x" * message_size
+    ready.release()
+    go.wait()
+    start = time.perf_counter()
+    sent = 0
+    for _ in range(min(window, messages)):
+        send_frame(tls_socket, message, sent)
+        sent += 1
+    for _ in range(messages):
+        if recv_frame(tls_socket, frame_buffer) is None:
+            raise RuntimeError("server closed the connection")
+        if sent < messages:
+            send_frame(tls_socket, message, sent)
+            sent += 1
+    results.put((messages, time.perf_counter() - start))
+    send_frame(tls_socket, b"q")
+    tls_socket.close()
+
+
+def bench_processes(processes, context, address, clients, messages, window, message_size):
+    server_process, anchor_socket = _start_server(processes, context, address)
+    try:
+        ready = multiprocessing.Semaphore(0)
+        go = multiprocessing.Event()
+        results = multiprocessing.Queue()
+        client_processes = [multiprocessing.Process(target=_client,
+                                                    args=(address, messages, window, message_size, ready, go, results))
+                            for _ in range(clients)]
+        for client_process in client_processes:
+            client_process.start()
+        for _ in range(clients):
+            ready.acquire()
+        start = time.perf_counter()
+        go.set()
+        total = sum(results.get(timeout=120)[0] for _ in range(clients))
+        elapsed = time.perf_counter() - start
+        for client_process in client_processes:
+            client_process.join()
+        send_frame(anchor_socket, b"q")
+        anchor_socket.close()
+    finally:
+        if server_process.poll() is None:
+            server_process.send_signal(signal.SIGTERM) # supervisor stops its workers
+            try:
+                server_process.wait(timeout=15)
+            except subprocess.TimeoutExpired:
+                server_process.kill()
+                server_process.wait()
+    return total / elapsed
+
+
+def main():
+    parser = argparse.ArgumentParser(description="select server throughput vs amount of server processes (SO_REUSEPORT)")
+    parser.add_argument("--processes", type=int, nargs="+", default=[1, 2, 4])
+    parser.add_argument("--clients", type=int, default=8, help="client processes, a connection each")
+    parser.add_argument("--messages", type=int, default=2000, help="per client")
+    parser.add_argument("--window", type=int, default=16, help="messages in flight per client")
+    parser.add_argument("--message-size", type=int, default=100)
+    args = parser.parse_args()
+
+    context = _create_client_context()
+    address = _load_server_address()
+    print(f"cores: {os.cpu_count()}, {args.clients} clients x {args.messages} messages, window: {args.window}")
+    print(f"{'processes':>10} | {'msgs/sec':>12} | {'speedup':>8}")
+    print("-" * 38)
+    baseline = None
+    for processes in args.processes:
+        rate = bench_processes(processes, context, address, args.clients, args.messages, args.window, args.message_size)
+        baseline = baseline or rate
+        print(f"{processes:>10} | {rate:>12.0f} | {rate / baseline:>7.2f}x")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,124 @@
+"""
+Benchmark: the 3 server engines (threaded | select | asyncio) one against the other.
+
+measured for every engine:
+1. connections per second - connect + TLS handshake + 'q' + close, one after the other
+   (not measured for 'threaded' engine, it serves a single client only)
+2. round trip time of a message (send + wait for the response) - p50 / p99
+
+every server is started in its own process (python -m src.run_server --engine ...), with the configuration from configs/server_config.yaml.
+the servers finish when the last client disconnects, so an 'anchor' client stays connected during the whole measurement.
+
+run from the repo root:
+    python -m bench.bench_servers
+    python -m bench.bench_servers --engines select asyncio --connections 500 --messages 5000
+"""
+import argparse
+import os
+import socket
+import statistics
+import subprocess
+import sys
+import time
+
+from src.config_resolver import find_file, load_config, REPO_ROOT, SERVER_CONFIG_FILE, CERT_FILE
+from src import tls_contexts
+from src.framing import FrameBuffer, send_frame, recv_frame
+
+
+def _load_server_address():
+    config = load_config(SERVER_CONFIG_FILE)
+    return config["server"]["ip_address"], config["server"]["port"]
+
+
+def _create_client_context():
+    cert_file = find_file(CERT_FILE)
+    if not cert_file:
+        raise FileExistsError
+    return tls_contexts.get_client_context(cert_file)
+
+
+def _connect(context, address, timeout=5):
+    tls_socket = context.wrap_socket(socket.create_connection(address, timeout=timeout), server_hostname=address[0])
+    tls_socket.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+    return tls_socket
+
+
+def _start_server(engine, context, address):
+    env = dict(os.environ, PYTHONPATH=str(REPO_ROOT))
+    server_process = subprocess.Popen([sys.executable, "-m", "src.run_server", "--engine", engine],
+                                      cwd=REPO_ROOT, env=env,
+                                      stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    deadline = time.monotonic() + 15
+    while time.monotonic() < deadline:
+        try:
+            return server_process, _connect(context, address)
+        except OSError:
+            time.sleep(0.1)
+    server_process.kill()
+    raise RuntimeError(f"server engine: {engine} did not start")
+
+
+def _percentile(sorted_samples, percent):
+    return sorted_samples[min(len(sorted_samples) - 1, int(len(sorted_samples) * percent / 100))]
+
+
+def _bench_round_trip(tls_socket, messages, message_size):
+    frame_buffer = FrameBuffer(64 * 1024)
+    message = b"x" * message_size
+    samples = []
+    for _ in range(messages):
+        start = time.perf_counter()
+        send_frame(tls_socket, message)
+        if recv_frame(tls_socket, frame_buffer) is None:
+            raise RuntimeError("server closed the connection")
+        samples.append(time.perf_counter() - start)
+    samples.sort()
+    return _percentile(samples, 50), _percentile(samples, 99), statistics.fmean(samples)
+
+
+def _bench_connections(context, address, connections):
+    start = time.perf_counter()
+    for _ in range(connections):
+        tls_socket = _connect(context, address)
+        send_frame(tls_socket, b"q")
+        tls_socket.close()
+    return connections / (time.perf_counter() - start)
+
+
+def bench_engine(engine, context, address, connections, messages, message_size):
+    server_process, anchor_socket = _start_server(engine, context, address)
+    try:
+        p50, p99, mean = _bench_round_trip(anchor_socket, messages, message_size)
+        connections_per_sec = None if engine == "threaded" else _bench_connections(context, address, connections)
+        send_frame(anchor_socket, b"q")
+        anchor_socket.close()
+        server_process.wait(timeout=10)
+    finally:
+        if server_process.poll() is None:
+            server_process.kill()
+            server_process.wait()
+    return connections_per_sec, p50, p99, mean
+
+
+def main():
+    parser = argparse.ArgumentParser(description="compare the server engines: connections/sec and round trip p50/p99")
+    parser.add_argument("--engines", nargs="+", default=["threaded", "select", "asyncio"])
+    parser.add_argument("--connections", type=int, default=200)
+    parser.add_argument("--messages", type=int, default=2000)
+    parser.add_argument("--message-size", type=int, default=100)
+    args = parser.parse_args()
+
+    context = _create_client_context()
+    address = _load_server_address()
+    print(f"{'engine':>10} | {'conn/sec':>10} | {'rtt p50 ms':>10} | {'rtt p99 ms':>10} | {'rtt avg ms':>10}")
+    print("-" * 62)
+    for engine in args.engines:
+        connections_per_sec, p50, p99, mean = bench_engine(engine, context, address,
+                                                           args.connections, args.messages, args.message_size)
+        connections_text = f"{connections_per_sec:>10.1f}" if connections_per_sec else f"{'n/a':>10}"
+        print(f"{engine:>10} | {connections_text} | {p50 * 1000:>10.3f} | {p99 * 1000:>10.3f} | {mean * 1000:>10.3f}")
+
+
+if __name__ == '__main__':
+    main()
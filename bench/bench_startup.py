@@ -0,0 +1,82 @@
+"""
+Benchmark: startup cost of locating config + certificates, old way vs config_resolver.
+
+a fake 'big shared parent directory' is created in a temp dir (many sub directories and files), the config / cert files
+are placed deep inside it, then N 'constructions' of Client + Server are simulated:
+1. old way - os.walk() of the whole parent for every file, on every construction (config yaml + cert + key)
+2. resolver - a new FileResolver per process (first construction walks once), next constructions are served from the cache
+
+run from the repo root:
+    python -m bench.bench_startup
+    python -m bench.bench_startup --dirs 2000 --files-per-dir 20 --constructions 20
+"""
+import argparse
+import os
+import tempfile
+import time
+from pathlib import Path
+
+from src.config_resolver import FileResolver, CLIENT_CONFIG_FILE, SERVER_CONFIG_FILE, CERT_FILE, KEY_FILE
+
+LOOKED_UP_FILES = (CLIENT_CONFIG_FILE, CERT_FILE, SERVER_CONFIG_FILE, CERT_FILE, KEY_FILE)
+
+
+def _find_full_file_path(my_path, my_file):
+    # the way Client / Servers used to search their files
+    for dirpath, _, filenames in os.walk(my_path):
+        if my_file in filenames:
+            return Path(str(os.path.join(dirpath, my_file)))
+    return None
+
+
+def _create_shared_directory(root, dirs, files_per_dir):
+    for dir_ind in range(dirs):
+        directory = root / f"project_{dir_ind % 50}" / f"dir_{dir_ind}"
+        directory.mkdir(parents=True)
+        for file_ind in range(files_per_dir):
+            (directory / f"file_{file_ind}.txt").touch()
+    app_dir = root / "project_49" / f"dir_{dirs - 1}" / "client_servers_app"
+    (app_dir / "configs").mkdir(parents=True)
+    (app_dir / "certs").mkdir()
+    (app_dir / "configs" / CLIENT_CONFIG_FILE).write_text("client: {}\n")
+    (app_dir / "configs" / SERVER_CONFIG_FILE).write_text("server: {}\n")
+    (app_dir / "certs" / CERT_FILE).write_text("cert")
+    (app_dir / "certs" / KEY_FILE).write_text("key")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="startup time: os.walk per lookup vs cached config_resolver")
+    parser.add_argument("--dirs", type=int, default=1000)
+    parser.add_argument("--files-per-dir", type=int, default=20)
+    parser.add_argument("--constructions", type=int, default=10)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as temp_dir:
+        root = Path(temp_dir)
+        _create_shared_directory(root, args.dirs, args.files_per_dir)
+        print(f"shared directory: {args.dirs} directories, {args.dirs * args.files_per_dir} files, "
+              f"{args.constructions} constructions of Client + Server")
+
+        start = time.perf_counter()
+        for _ in range(args.constructions):
+            for file_name in LOOKED_UP_FILES:
+                assert _find_full_file_path(root, file_name)
+        old_way = time.perf_counter() - start
+
+        # the repo's own configs/ certs/ must not be found first, so the well known dirs are skipped
+        resolver = FileResolver(search_root=root, well_known_dirs=())
+        start = time.perf_counter()
+        first_construction = None
+        for _ in range(args.constructions):
+            for file_name in LOOKED_UP_FILES:
+                assert resolver.find(file_name)
+            if first_construction is None:
+                first_construction = time.perf_counter() - start
+        resolver_way = time.perf_counter() - start
+
+    print(f"{'old way (os.walk per file)':>32}: {old_way * 1000:>10.2f} ms total, {old_way / args.constructions * 1000:>8.2f} ms per construction")
+    print(f"{'config_resolver (cached)':>32}: {resolver_way * 1000:>10.2f} ms total, first construction: {first_construction * 1000:.2f} ms")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,418 @@
+"""
+Load generator: N concurrent clients against one of the servers, results as JSON (diff them between releases).
+
+targets (every one is started in its own process, with the configuration from configs/server_config.yaml):
+    threaded - src.server_tcp.Server (single client: --clients 1, no --churn)
+    select   - src.multi_client_by_select_server_tcp.Server (--server-processes N for the multi process mode)
+    asyncio  - src.async_server_tcp.Server
+    mock     - bench.mock_server, TLS echo without working threads / store / handlers (the floor)
+
+clients (--mode):
+    threads   - a thread per client (one process, shares the GIL with the other clients)
+    processes - a process per client
+    asyncio   - a task per client, single thread
+
+every client sends a message and waits for its response (one in flight), till --messages are answered or --duration passed.
+    --rate R    - R messages per second per client (0 - as fast as possible). latency is measured from the time the message
+                  should have been sent, so a server that falls behind is not hidden by the client waiting for it (coordinated omission)
+    --churn K   - the client reconnects (new TCP + TLS handshake) every K messages
+    --codec C   - offered in the TLS handshake (see codec), default: nothing is offered (legacy text)
+
+reported: messages/sec, latency p50 / p95 / p99 / p999, connections, errors,
+CPU seconds + peak RSS of the server (with its worker processes) and of the clients.
+
+run from the repo root:
+    python -m bench.load --target select --clients 16 --messages 2000
+    python -m bench.load --target asyncio --mode asyncio --clients 64 --duration 10 --rate 100 --output asyncio.json
+    python -m bench.load --target select --mode processes --churn 50 --output after.json --compare before.json
+"""
+import argparse
+import asyncio
+import json
+import multiprocessing
+import os
+import platform
+import resource
+import signal
+import socket
+import ssl
+import subprocess
+import sys
+import threading
+import time
+
+from src import tls_contexts
+from src.codec import LEGACY_CODEC, alpn_protocols, disconnect_frame, negotiated_codec
+from src.config_resolver import find_file, CERT_FILE, REPO_ROOT
+from src.framing import FrameBuffer, FrameError, encode_frame, recv_frame
+from bench.bench_servers import _load_server_address
+
+try:
+    import psutil # optional, without it the server usage is read from /proc (Linux only)
+except ImportError:
+    psutil = None
+
+TARGETS = {"threaded": ["-m", "src.run_server", "--engine", "threaded"],
+           "select": ["-m", "src.run_server", "--engine", "select"],
+           "asyncio": ["-m", "src.run_server", "--engine", "asyncio"],
+           "mock": ["-m", "bench.mock_server"]}
+MODES = ("threads", "processes", "asyncio")
+PERCENTILES = (50, 95, 99, 99.9)
+CONNECT_TIMEOUT = 15 # seconds, the server process may still be starting
+
+
+############################################################################################
+# client side
+############################################################################################
+
+def _context(codec):
+    return tls_contexts.get_client_context(find_file(CERT_FILE), alpn_protocols([codec]) if codec else None)
+
+
+def _connect(address, codec):
+    # retried while the server is starting (threaded target has no anchor connection that shows it is ready)
+    deadline = time.monotonic() + CONNECT_TIMEOUT
+    while True:
+        try:
+            tcp_socket = socket.create_connection(address, timeout=30)
+            break
+        except ConnectionRefusedError:
+            if time.monotonic() > deadline:
+                raise
+            time.sleep(0.05)
+    tcp_socket.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+    tls_socket = _context(codec).wrap_socket(tcp_socket, server_hostname=address[0])
+    return tls_socket, negotiated_codec(tls_socket)
+
+
+def run_session(settings) -> dict:
+    """
+    a single client (thread / process), blocking sockets
+    :return: latency samples (seconds), connections, errors, started / finished (time.monotonic(), same clock in all the processes)
+    """
+    address, messages, churn = tuple(settings["address"]), settings["messages"], settings["churn"]
+    deadline = time.monotonic() + settings["duration"] if settings["duration"] else None
+    interval = 1 / settings["rate"] if settings["rate"] else None # message 'index' is sent at start + (index - first_index) * interval
+    samples, connections, errors, started = [], 0, 0, None
+    tls_socket = None
+    start, first_index = None, 0 # schedule of the messages starts at the first connection
+    index = 0
+    while (deadline is None and index < messages) or (deadline is not None and time.monotonic() < deadline):
+        try:
+            if tls_socket is None:
+                tls_socket, codec = _connect(address, settings["codec"])
+                if started is None: # waiting for the server to start is not measured, not even as latency of the first messages
+                    started = time.monotonic()
+                    start, first_index = time.perf_counter(), index
+                connections += 1
+                frame_buffer = FrameBuffer(64 * 1024)
+                payload = codec.encode(b"x" * settings["message_size"])
+            if interval:
+                send_time = start + (index - first_index) * interval
+                delay = send_time - time.perf_counter()
+                if delay > 0:
+                    time.sleep(delay)
+            else:
+                send_time = time.perf_counter()
+            tls_socket.sendall(encode_frame(payload, index & 0xFFFFFFFF))
+            if recv_frame(tls_socket, frame_buffer) is None:
+                raise ConnectionError("server closed the connection")
+            samples.append(time.perf_counter() - send_time)
+        except (OSError, ssl.SSLError, FrameError):
+            errors += 1
+            if tls_socket is not None:
+                tls_socket.close()
+            tls_socket = None
+            if errors > 100:
+                break
+        index += 1
+        if tls_socket is not None and churn and index % churn == 0:
+            _close(tls_socket, codec)
+            tls_socket = None
+    if tls_socket is not None:
+        _close(tls_socket, codec)
+    return {"samples": samples, "connections": connections, "errors": errors, "started": started, "finished": time.monotonic()}
+
+
+def _close(tls_socket, codec):
+    try:
+        tls_socket.sendall(disconnect_frame(codec))
+    except OSError:
+        pass
+    tls_socket.close()
+
+
+async def _connect_async(address, context):
+    # same retries as _connect, the server may still be starting
+    deadline = time.monotonic() + CONNECT_TIMEOUT
+    while True:
+        try:
+            return await asyncio.open_connection(*address, ssl=context, server_hostname=address[0])
+        except ConnectionRefusedError:
+            if time.monotonic() > deadline:
+                raise
+            await asyncio.sleep(0.05)
+
+
+async def run_async_session(settings) -> dict:
+    """
+    same as run_session, a task in a single thread event loop
+    """
+    address, messages, churn = tuple(settings["address"]), settings["messages"], settings["churn"]
+    loop = asyncio.get_running_loop()
+    deadline = loop.time() + settings["duration"] if settings["duration"] else None
+    interval = 1 / settings["rate"] if settings["rate"] else None
+    context = _context(settings["codec"])
+    samples, connections, errors, started = [], 0, 0, None
+    writer = None
+    start, first_index = None, 0
+    index = 0
+    while (deadline is None and index < messages) or (deadline is not None and loop.time() < deadline):
+        try:
+            if writer is None:
+                reader, writer = await _connect_async(address, context)
+                codec = negotiated_codec(writer.get_extra_info("ssl_object"))
+                if started is None:
+                    started = time.monotonic()
+                    start, first_index = time.perf_counter(), index
+                connections += 1
+                frame_buffer = FrameBuffer(64 * 1024)
+                payload = codec.encode(b"x" * settings["message_size"])
+            if interval:
+                send_time = start + (index - first_index) * interval
+                delay = send_time - time.perf_counter()
+                if delay > 0:
+                    await asyncio.sleep(delay)
+            else:
+                send_time = time.perf_counter()
+            writer.write(encode_frame(payload, index & 0xFFFFFFFF))
+            while frame_buffer.next_frame() is None:
+                data = await reader.read(64 * 1024)
+                if not data:
+                    raise ConnectionError("server closed the connection")
+                frame_buffer.feed(data)
+            samples.append(time.perf_counter() - send_time)
+        except (OSError, ssl.SSLError, FrameError):
+            errors += 1
+            if writer is not None:
+                writer.close()
+            writer = None
+            if errors > 100:
+                break
+        index += 1
+        if writer is not None and churn and index % churn == 0:
+            writer.write(disconnect_frame(codec))
+            writer.close()
+            writer = None
+    if writer is not None:
+        writer.write(disconnect_frame(codec))
+        writer.close()
+    return {"samples": samples, "connections": connections, "errors": errors, "started": started, "finished": time.monotonic()}
+
+
+def run_clients(mode, clients, settings) -> list:
+    """
+    :return: result of every client (see run_session)
+    """
+    if mode == "threads":
+        results = [None] * clients
+        def target(client_index):
+            results[client_index] = run_session(settings)
+        threads = [threading.Thread(target=target, args=(client_index,)) for client_index in range(clients)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        return results
+    if mode == "processes":
+        with multiprocessing.Pool(clients) as pool:
+            return pool.map(run_session, [settings] * clients)
+    if mode == "asyncio":
+        async def gather():
+            return await asyncio.gather(*(run_async_session(settings) for _ in range(clients)))
+        return asyncio.run(gather())
+    raise ValueError(f"unknown mode: '{mode}', supported: {MODES}")
+
+
+############################################################################################
+# server side
+############################################################################################
+
+def _process_usage(pid) -> dict:
+    """
+    :return: CPU seconds (user + system) and peak RSS bytes of the process + its children (worker processes), None if unknown
+    """
+    if psutil:
+        try:
+            processes = [psutil.Process(pid)]
+            processes += processes[0].children(recursive=True)
+            return {"cpu_seconds": sum(sum(process.cpu_times()[:2]) for process in processes),
+                    "rss_bytes": sum(process.memory_info().rss for process in processes)}
+        except psutil.Error:
+            return {"cpu_seconds": None, "rss_bytes": None}
+    if not os.path.isdir("/proc"):
+        return {"cpu_seconds": None, "rss_bytes": None}
+    pids = [pid] + [int(child) for child in os.listdir("/proc") if child.isdigit() and _parent_pid(child) == pid]
+    cpu_seconds, rss_bytes = 0.0, 0
+    for process_id in pids:
+        try:
+            with open(f"/proc/{process_id}/stat") as stat_file:
+                fields = stat_file.read().rsplit(")", 1)[1].split()
+            cpu_seconds += (int(fields[11]) + int(fields[12])) / os.sysconf("SC_CLK_TCK") # utime + stime
+            with open(f"/proc/{process_id}/status") as status_file:
+                for line in status_file:
+                    if line.startswith("VmHWM:"): # peak RSS
+                        rss_bytes += int(line.split()[1]) * 1024
+        except (OSError, IndexError, ValueError):
+            pass
+    return {"cpu_seconds": cpu_seconds, "rss_bytes": rss_bytes}
+
+
+def _parent_pid(pid) -> int:
+    try:
+        with open(f"/proc/{pid}/stat") as stat_file:
+            return int(stat_file.read().rsplit(")", 1)[1].split()[1])
+    except (OSError, IndexError, ValueError):
+        return -1
+
+
+def start_server(target, address, server_processes=None):
+    """
+    :return: server process, anchor connection (None for the threaded target - it serves a single client)
+    """
+    command = [sys.executable] + TARGETS[target]
+    if server_processes and target == "select":
+        command += ["--processes", str(server_processes)]
+    env = dict(os.environ, PYTHONPATH=str(REPO_ROOT))
+    server_process = subprocess.Popen(command, cwd=REPO_ROOT, env=env, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    if target == "threaded":
+        return server_process, None
+    # servers finish when their last client disconnects, the anchor stays connected during the whole run
+    try:
+        anchor_socket, _ = _connect(address, None)
+    except OSError:
+        server_process.kill()
+        raise RuntimeError(f"server: {target} did not start")
+    if server_processes:
+        time.sleep(server_processes * 0.5) # the other worker processes are still starting
+    return server_process, anchor_socket
+
+
+def stop_server(server_process, anchor_socket):
+    if anchor_socket is not None:
+        _close(anchor_socket, LEGACY_CODEC)
+    try:
+        server_process.wait(timeout=5)
+    except subprocess.TimeoutExpired: # mock server + multi process select run till SIGTERM
+        server_process.send_signal(signal.SIGTERM)
+        try:
+            server_process.wait(timeout=15)
+        except subprocess.TimeoutExpired:
+            server_process.kill()
+            server_process.wait()
+
+
+############################################################################################
+# report
+############################################################################################
+
+def percentile(sorted_samples, percent) -> float:
+    if not sorted_samples:
+        return 0.0
+    return sorted_samples[min(len(sorted_samples) - 1, int(len(sorted_samples) * percent / 100))]
+
+
+def summarize(client_results) -> dict:
+    samples = sorted(sample for result in client_results for sample in result["samples"])
+    started = [result["started"] for result in client_results if result["started"] is not None]
+    elapsed = max(result["finished"] for result in client_results) - min(started) if started else 0
+    summary = {"messages": len(samples),
+               "elapsed_seconds": elapsed,
+               "messages_per_sec": len(samples) / elapsed if elapsed else 0,
+               "connections": sum(result["connections"] for result in client_results),
+               "errors": sum(result["errors"] for result in client_results),
+               "latency_ms": {f"p{percent:g}": percentile(samples, percent) * 1000 for percent in PERCENTILES}}
+    summary["latency_ms"]["mean"] = sum(samples) / len(samples) * 1000 if samples else 0
+    return summary
+
+
+def _client_usage(before) -> dict:
+    after_self, after_children = resource.getrusage(resource.RUSAGE_SELF), resource.getrusage(resource.RUSAGE_CHILDREN)
+    cpu = lambda usage: usage.ru_utime + usage.ru_stime
+    return {"cpu_seconds": cpu(after_self) - cpu(before[0]) + cpu(after_children) - cpu(before[1]),
+            "rss_bytes": max(after_self.ru_maxrss, after_children.ru_maxrss) * 1024} # ru_maxrss is in KB on Linux
+
+
+def print_report(report, baseline=None):
+    result = report["result"]
+    print(f"\n{report['target']} / {report['mode']}: {report['settings']['clients']} clients, "
+          f"{report['settings']['message_size']} bytes messages")
+    print(f"{'messages/sec':>16}: {result['messages_per_sec']:.0f}{_change(result, baseline, 'messages_per_sec')}")
+    for name, value in result["latency_ms"].items():
+        print(f"{'latency ' + name:>16}: {value:.3f}ms{_change(result['latency_ms'], baseline and baseline['latency_ms'], name)}")
+    print(f"{'connections':>16}: {result['connections']}, errors: {result['errors']}")
+    for side in ("server", "clients"):
+        usage = report[side]
+        if usage["cpu_seconds"] is not None:
+            print(f"{side + ' CPU':>16}: {usage['cpu_seconds']:.2f}s, peak RSS: {usage['rss_bytes'] / 2**20:.1f}MB")
+
+
+def _change(values, baseline, key) -> str:
+    if not baseline or not baseline.get(key):
+        return ""
+    return f"  ({(values[key] - baseline[key]) / baseline[key] * 100:+.1f}% vs baseline)"
+
+
+def main():
+    parser = argparse.ArgumentParser(description="load generator: N clients against a server, results as JSON")
+    parser.add_argument("--target", choices=TARGETS, default="select")
+    parser.add_argument("--mode", choices=MODES, default="threads")
+    parser.add_argument("--clients", type=int, default=8)
+    parser.add_argument("--messages", type=int, default=1000, help="per client (ignored with --duration)")
+    parser.add_argument("--duration", type=float, default=0, help="seconds, 0 - till --messages were sent")
+    parser.add_argument("--message-size", type=int, default=100)
+    parser.add_argument("--rate", type=float, default=0, help="messages per second per client, 0 - as fast as possible")
+    parser.add_argument("--churn", type=int, default=0, help="reconnect every N messages, 0 - a single connection per client")
+    parser.add_argument("--codec", default=None, help="codec offered in the handshake: text | binary | raw, default: legacy text")
+    parser.add_argument("--server-processes", type=int, default=None, help="select target only, see number_worker_processes")
+    parser.add_argument("--output", default=None, help="write the report to this JSON file")
+    parser.add_argument("--compare", default=None, help="JSON report of an earlier run, the changes are printed")
+    args = parser.parse_args()
+    if args.target == "threaded" and (args.clients != 1 or args.churn):
+        parser.error("threaded server serves a single client: --clients 1 and no --churn")
+
+    address = _load_server_address()
+    settings = {"address": address, "codec": args.codec, "messages": args.messages, "duration": args.duration,
+                "message_size": args.message_size, "rate": args.rate, "churn": args.churn}
+    server_process, anchor_socket = start_server(args.target, address, args.server_processes)
+    try:
+        server_before = _process_usage(server_process.pid) # CPU of the server start (imports, config, ...) is not counted
+        before = resource.getrusage(resource.RUSAGE_SELF), resource.getrusage(resource.RUSAGE_CHILDREN)
+        client_results = run_clients(args.mode, args.clients, settings)
+        client_usage = _client_usage(before)
+        server_usage = _process_usage(server_process.pid)
+        if server_usage["cpu_seconds"] is not None and server_before["cpu_seconds"] is not None:
+            server_usage["cpu_seconds"] -= server_before["cpu_seconds"]
+    finally:
+        stop_server(server_process, anchor_socket)
+
+    report = {"target": args.target,
+              "mode": args.mode,
+              "settings": dict(settings, clients=args.clients, address=list(address), server_processes=args.server_processes),
+              "environment": {"python": platform.python_version(), "platform": platform.platform(), "cores": os.cpu_count()},
+              "result": summarize(client_results),
+              "server": server_usage,
+              "clients": client_usage}
+    baseline = None
+    if args.compare:
+        with open(args.compare) as compare_file:
+            baseline = json.load(compare_file)["result"]
+    print_report(report, baseline)
+    if args.output:
+        with open(args.output, "w") as output_file:
+            json.dump(report, output_file, indent=2, sort_keys=True)
+        print(f"\nreport is written to: {args.output}")
+
+
+if __name__ == '__main__':
+    main()
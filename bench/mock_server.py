@@ -0,0 +1,65 @@
+"""
+Echo mock server for the load generator (bench.load --target mock): answers every frame with the same payload + id.
+
+no working threads, no message store, no handlers - a thread per connection that echoes the frames,
+so it shows the cost of TLS + framing alone (the floor the real servers are compared with).
+runs till SIGTERM / Ctrl+C, message 'q' (or the control frame BYE) closes the connection.
+
+run from the repo root:
+    python -m bench.mock_server
+"""
+import argparse
+import signal
+import socket
+import ssl
+import sys
+import threading
+
+from src import tls_contexts
+from src.codec import LEGACY_CODEC, is_disconnect
+from src.config_resolver import find_file, CERT_FILE, KEY_FILE
+from src.framing import FrameBuffer, FrameError, send_frame, recv_frame
+from bench.bench_servers import _load_server_address
+
+
+def _echo(tls_socket):
+    frame_buffer = FrameBuffer(64 * 1024)
+    with tls_socket:
+        try:
+            while (frame := recv_frame(tls_socket, frame_buffer)) is not None and not is_disconnect(frame, LEGACY_CODEC):
+                send_frame(tls_socket, frame.payload, frame.message_id)
+        except (OSError, FrameError):
+            pass
+
+
+def serve(address):
+    context = tls_contexts.get_server_context(find_file(CERT_FILE), find_file(KEY_FILE))
+    server_socket = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+    server_socket.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+    server_socket.bind(address)
+    server_socket.listen(1024)
+    while True:
+        client_socket, _ = server_socket.accept()
+        client_socket.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+        try:
+            tls_socket = context.wrap_socket(client_socket, server_side=True)
+        except (OSError, ssl.SSLError):
+            client_socket.close()
+            continue
+        threading.Thread(target=_echo, args=(tls_socket,), daemon=True).start()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="TLS echo mock server")
+    parser.add_argument("--port", type=int, default=None, help="default: port of server_config.yaml")
+    args = parser.parse_args()
+    ip, port = _load_server_address()
+    signal.signal(signal.SIGTERM, lambda signum, frame: sys.exit(0))
+    try:
+        serve((ip, args.port or port))
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,235 @@
+import asyncio
+import ssl
+from typing import Final # makes my types be final without ability to change their type
+
+from src.config_resolver import find_file, load_config, CLIENT_CONFIG_FILE, CERT_FILE
+from src import tls_contexts
+from src.framing import FrameBuffer, FrameError, encode_frame, MAX_MESSAGE_ID
+from src.reconnect import ReconnectPolicy
+from src.log import get_logger, setup_logging
+from src.message_store import MessageRecord, create_store
+from src.codec import LEGACY_CODEC, CodecError, alpn_protocols, disconnect_frame, negotiated_codec, negotiated_compression, printable
+from src.compression import DEFAULT_LEVEL, DEFAULT_THRESHOLD, CompressionError, create as create_compression
+
+
+class AsyncClient:
+    ############################################################################################
+    # ASYNCIO CLIENT with PIPELINING:
+    # the regular Client sends a message and waits for the response before sending the next one (1 message per round trip)
+    # this client sends the next messages without waiting, every message gets a sequence id (message id in the frame header)
+    # and the server answers with the same id, so the responses are matched to the messages even if they arrive out of order.
+    #
+    # amount of messages that wait for response is bounded by 'max_in_flight' (the window),
+    # send() waits when the window is full, so a fast sender can not flood the server
+    #
+    # usage:
+    #   client = AsyncClient()
+    #   await client.connect()
+    #   response = await client.request("hello")                               # send + wait for response
+    #   futures = [await client.send(f"msg {ind}") for ind in range(1000)]     # pipelining
+    #   responses = await asyncio.gather(*futures)
+    #   await client.disconnect()
+    ############################################################################################
+    def __init__(self, max_in_flight: int = None, config_path = None, cert_path = None):
+        """
+        :param max_in_flight: max messages that wait for a response, None -> taken from client_config.yaml
+        :param config_path: explicit path of client_config.yaml, None -> searched (see config_resolver)
+        :param cert_path: explicit path of the server certificate, None -> searched (see config_resolver)
+        """
+        self.app: Final[str] = "CLIENT"
+        self.log = get_logger(self.app)
+        self.config_path = config_path
+        self.cert_path = cert_path
+        self.reader = None
+        self.writer = None
+        self.connection_store = None # sent messages + their responses, bounded (see message_store), created in _init
+        self._in_flight = {}         # key is message id, value is (future that gets the response, record of the message)
+        self._next_message_id = 0
+        self._window = None          # asyncio.Semaphore, created inside the running loop
+        self._receiver_task = None
+        self.codec = LEGACY_CODEC    # negotiated in the TLS handshake (see codec)
+        self.compression = None      # Compression of the connection if it was negotiated (see compression)
+
+        ip, port, max_retries, retry_delay, max_data_size, config_max_in_flight, policy, codecs, compression_threshold, compression_level = self._init()
+        self.IP: Final[str] = ip
+        self.log.info("app is executed using the next parameters: ")
+        self.log.info(f"IP: {self.IP}")
+
+        self.PORT: Final[int] = port
+        self.log.info(f"PORT: {self.PORT}")
+
+        self.max_retries = max_retries
+        self.log.info(f"Max number of connection retries: {self.max_retries}")
+
+        self.retry_delay = retry_delay
+        self.log.info(f"Delay between retries: {self.retry_delay}")
+
+        self.MAX_DATA_SIZE = max_data_size
+        self.log.info(f"Max data size: {self.MAX_DATA_SIZE}")
+
+        self.MAX_IN_FLIGHT: Final[int] = max_in_flight or config_max_in_flight
+        self.log.info(f"Max messages in flight: {self.MAX_IN_FLIGHT}")
+
+        self.reconnect_policy = policy # exponential backoff with jitter between the connect attempts
+
+        self.CODECS: Final[list] = codecs # offered to the server, in order of preference
+        self.log.info(f"Codecs: {self.CODECS}")
+
+        self.COMPRESSION_THRESHOLD: Final[int] = compression_threshold
+        self.COMPRESSION_LEVEL: Final[int] = compression_level
+
+    def _init(self):
+        full_path_to_file = find_file(CLIENT_CONFIG_FILE, self.config_path)
+        if not full_path_to_file:
+            raise FileExistsError
+
+        config = load_config(CLIENT_CONFIG_FILE, self.config_path)
+        setup_logging(config["client"].get("log_level"))
+        self.log.info(f"Loaded configuration for the client from: {full_path_to_file}")
+        self.connection_store = create_store(config["client"])
+        return config["client"]["ip_address"], \
+               config["client"]["port"], \
+               config["client"]["max_retries"], \
+               config["client"]["retry_delay"], \
+               config["client"]["max_data_size"], \
+               config["client"].get("max_in_flight", 64), \
+               ReconnectPolicy.from_config(config["client"]), \
+               config["client"].get("codecs", ["text"]), \
+               config["client"].get("compression_threshold", DEFAULT_THRESHOLD), \
+               config["client"].get("compression_level", DEFAULT_LEVEL)
+
+    def _create_ssl_context(self):
+        full_path_to_cert_file = find_file(CERT_FILE, self.cert_path)
+        if not full_path_to_cert_file:
+            raise FileExistsError
+        self.log.info(f"Loading cert from file: {full_path_to_cert_file}")
+        # self-signed certificate, see Client._connect
+        return tls_contexts.get_client_context(full_path_to_cert_file, alpn_protocols(self.CODECS))
+
+    async def connect(self):
+        """
+        connect with retries (see ReconnectPolicy), raises ReconnectError if all the attempts failed
+        """
+        context = self._create_ssl_context()
+        self.log.info(f"Attempting to connect Client to Server, ip: {self.IP}, port: {self.PORT} ...")
+        self.reader, self.writer = await self.reconnect_policy.retry_async(
+            lambda: asyncio.open_connection(self.IP, self.PORT, ssl=context, server_hostname=self.IP),
+            log=self.log)
+        self.codec = negotiated_codec(self.writer.get_extra_info("ssl_object"))
+        self.compression = create_compression(negotiated_compression(self.writer.get_extra_info("ssl_object")),
+                                              self.COMPRESSION_THRESHOLD, self.COMPRESSION_LEVEL)
+        self.log.info(f"Connected to the Server successfully ! codec: {self.codec.name}{' (legacy)' if self.codec.legacy else ''}"
+                      f"{' + compression' if self.compression else ''}")
+
+        self._window = asyncio.Semaphore(self.MAX_IN_FLIGHT)
+        self._receiver_task = asyncio.create_task(self._receive_responses())
+
+    def _take_message_id(self) -> int:
+        message_id = self._next_message_id
+        self._next_message_id = 0 if message_id == MAX_MESSAGE_ID else message_id + 1
+        return message_id
+
+    async def send(self, message, message_type: str = None) -> asyncio.Future:
+        """
+        send the message without waiting for the response
+        :param message: str / bytes, encoded by the codec of the connection
+        :param message_type: binary codec only - handler of the message on the server side
+        :return: future that will get the response (str on a text connection, bytes on raw / binary), await it when the response is needed
+        """
+        if self.writer is None or self._receiver_task.done():
+            raise ConnectionError("Client is not connected")
+        await self._window.acquire() # waits if there are already MAX_IN_FLIGHT messages without response
+        message_id = self._take_message_id()
+        response_future = asyncio.get_running_loop().create_future()
+        self._in_flight[message_id] = response_future, MessageRecord((self.IP, self.PORT), message_id, printable(message))
+        payload = self.codec.encode(message, message_type)
+        # written right away (no await before it), so the messages are compressed in the order they go out
+        self.writer.write(encode_frame(self.compression.compress(payload) if self.compression else payload, message_id))
+        try:
+            await self.writer.drain()
+        except (ConnectionError, ssl.SSLError) as ee:
+            self._fail_in_flight(ee)
+            raise
+        return response_future
+
+    async def request(self, message, message_type: str = None):
+        """
+        send the message and wait for its response
+        :param message: str / bytes
+        :param message_type: binary codec only - handler of the message on the server side
+        :return: response (str on a text connection, bytes on raw / binary)
+        """
+        return await (await self.send(message, message_type))
+
+    async def _receive_responses(self):
+        # single task that receives all the responses and hands each one to the future of its message
+        frame_buffer = FrameBuffer(self.MAX_DATA_SIZE)
+        try:
+            while True:
+                data = await self.reader.read(self.MAX_DATA_SIZE)
+                if not data:
+                    self.log.info("No received data, probably Server closed the connection")
+                    self._fail_in_flight(ConnectionError("Server closed the connection"))
+                    return
+                frame_buffer.feed(data)
+                for frame in frame_buffer.frames():
+                    # every response is decompressed, also one that is ignored - the context must see all of them
+                    payload = self.compression.decompress(frame.payload) if self.compression and not frame.control else frame.payload
+                    in_flight = self._in_flight.pop(frame.message_id, None)
+                    if in_flight is None:
+                        self.log.warning("Received response with unknown message id: %s, ignored", frame.message_id)
+                        continue
+                    response_future, record = in_flight
+                    try:
+                        _, _, response = self.codec.decode(payload)
+                    except CodecError as ee:
+                        response_future.set_exception(ee)
+                        self._window.release()
+                        continue
+                    if not isinstance(response, str): # payload is a slice of the frame buffer, valid only till the next feed
+                        response = bytes(response)
+                    record.response = printable(response)
+                    self.connection_store.add(record)
+                    self._window.release()
+                    if not response_future.done(): # caller could cancel the waiting
+                        response_future.set_result(response)
+        except (ConnectionError, ssl.SSLError, FrameError, CompressionError) as ee:
+            self.log.error(f"Receive has failed, error: {ee}, probably Server failed")
+            self._fail_in_flight(ee)
+
+    def _fail_in_flight(self, error):
+        # messages that will never get a response
+        for response_future, record in self._in_flight.values():
+            self.connection_store.add(record) # kept without response
+            self._window.release()
+            if not response_future.done():
+                response_future.set_exception(ConnectionError(str(error)))
+        self._in_flight.clear()
+
+    async def disconnect(self):
+        self.log.info("Closing the SOCKET (connection) ....")
+        if self.writer is None:
+            return
+        try:
+            # control frame (or 'q' to a server that didn't negotiate a codec) tells the server that client disconnects, server doesn't answer it
+            self.writer.write(disconnect_frame(self.codec, self._take_message_id()))
+            await self.writer.drain()
+        except (ConnectionError, ssl.SSLError):
+            pass
+        self._receiver_task.cancel()
+        self._fail_in_flight(ConnectionError("Client disconnected"))
+        self.writer.close()
+        try:
+            await self.writer.wait_closed()
+        except (ConnectionError, ssl.SSLError):
+            pass
+        self.writer = None
+        self.connection_store.close()
+        self.log.info("SOCKET (connection) is closed")
+
+    def print_sent_messages(self):
+        print(f"\n[{self.app}]: All the messages that were sent: Client -> Server\n"
+              f"--------------------------------------------------------------------")
+        print(f"[{self.app}]: {len(self.connection_store)} messages are kept")
+        for record in self.connection_store.records():
+            print(f"[{self.app}]: [{record.index}]: {[record.message, record.response]}")
@@ -0,0 +1,234 @@
+import asyncio
+import ssl
+from typing import Final # makes my types be final without ability to change their type
+
+from src.config_resolver import find_file, load_config, SERVER_CONFIG_FILE, CERT_FILE, KEY_FILE
+from src import tls_contexts
+from src.metrics import Counter
+from src.framing import FrameBuffer, FrameError, encode_frame
+from src.log import get_logger, setup_logging
+from src.message_store import MessageRecord, MemoryStore, create_store
+from src.handlers import HandlerRegistry, Request
+from src.codec import CODECS, CodecError, alpn_protocols, is_disconnect, negotiated_codec, negotiated_compression, printable
+from src.compression import DEFAULT_LEVEL, DEFAULT_THRESHOLD, CompressionError, create as create_compression
+from src.streaming import STREAM_OPEN, abort_frame, stream_kind
+
+# uvloop is optional, it is a faster drop-in replacement of the asyncio event loop (not available on Windows)
+try:
+    import uvloop
+except ImportError:
+    uvloop = None
+
+
+class Server:
+    ############################################################################################
+    # ASYNCIO Server:
+    # same config, same certificates and same protocol (framed messages, codec negotiated in the handshake) as the other servers,
+    # but all the clients are served by a single thread using asyncio:
+    # start_server (bind + listen + accept + TLS handshake are all done by asyncio, without blocking other clients)
+    # each client connection gets 2 tasks:
+    #   reader task - receives messages from the client and prepares the responses
+    #   writer task - sends the responses back to the client
+    ############################################################################################
+
+    def __init__(self, config_path = None, cert_path = None, key_path = None):
+        """
+        :param config_path: explicit path of server_config.yaml, None -> searched (see config_resolver)
+        :param cert_path: explicit path of the certificate, None -> searched (see config_resolver)
+        :param key_path: explicit path of the private key, None -> searched (see config_resolver)
+        """
+        self.app: Final[str] = "SERVER"
+        self.log = get_logger(self.app)
+        self.config_path = config_path
+        self.cert_path = cert_path
+        self.key_path = key_path
+        self.IP: str = None
+        self.PORT: int = None
+        self.MAX_DATA_SIZE: int = 1024
+        self.USE_UVLOOP: bool = True
+        self.TLS_NUM_TICKETS: int = tls_contexts.DEFAULT_NUM_TICKETS
+        self.CODECS: list = list(CODECS) # codecs the clients can choose, in order of preference
+        self.COMPRESSION_THRESHOLD: int = DEFAULT_THRESHOLD # clients that negotiated compression (see compression)
+        self.COMPRESSION_LEVEL: int = DEFAULT_LEVEL
+        self.full_handshakes = Counter("full TLS handshakes")
+        self.resumed_handshakes = Counter("resumed TLS handshakes")
+        self.ssl_context = None
+        self.all_clients = {}             # key is client address, value is the writer (stream) of this client
+        self.received_messages_store = MemoryStore() # replaced by the configured store (see message_store) in _init
+        self.handlers = HandlerRegistry() # builds the responses, handlers of the config are added in _init (see handlers)
+        self._all_clients_disconnected = None # asyncio.Event, created inside the running loop
+
+    def _init(self):
+        full_path_to_file = find_file(SERVER_CONFIG_FILE, self.config_path)
+        if not full_path_to_file:
+            raise FileExistsError
+
+        config = load_config(SERVER_CONFIG_FILE, self.config_path)
+        setup_logging(config["server"].get("log_level"), config["server"].get("log_color", False))
+        self.log.info("app is executed with the next parameters: ")
+        self.log.info(f"Loaded configuration for the server from: {full_path_to_file}")
+        self.IP = config["server"]["ip_address"]
+        self.log.info(f"IP: {self.IP}")
+
+        self.PORT = config["server"]["port"]
+        self.log.info(f"PORT: {self.PORT}")
+
+        self.MAX_DATA_SIZE = config["server"]["max_data_size"]
+        self.log.info(f"Max data size: {self.MAX_DATA_SIZE}")
+
+        self.USE_UVLOOP = config["server"].get("use_uvloop", True)
+        self.log.info(f"Use uvloop (if installed): {self.USE_UVLOOP}")
+
+        self.TLS_NUM_TICKETS = config["server"].get("tls_num_tickets", tls_contexts.DEFAULT_NUM_TICKETS)
+        self.log.info(f"TLS session tickets: {self.TLS_NUM_TICKETS}")
+
+        self.CODECS = config["server"].get("codecs", self.CODECS)
+        self.log.info(f"Codecs: {self.CODECS}")
+
+        self.COMPRESSION_THRESHOLD = config["server"].get("compression_threshold", DEFAULT_THRESHOLD)
+        self.COMPRESSION_LEVEL = config["server"].get("compression_level", DEFAULT_LEVEL)
+
+        self.received_messages_store = create_store(config["server"])
+        self.log.info(f"Message store: {type(self.received_messages_store).__name__}")
+
+        self.handlers.configure(config["server"])
+
+    def _create_ssl_context(self):
+        self.log.info("Creating the secured SSL context (set of rules for secure connection) ...")
+
+        full_path_to_cert_file = find_file(CERT_FILE, self.cert_path)
+        full_path_to_key_file = find_file(KEY_FILE, self.key_path)
+        if not full_path_to_cert_file or not full_path_to_key_file:
+            raise FileExistsError
+        self.log.info(f"Loading cert + key files from: {full_path_to_cert_file}")
+        self.ssl_context = tls_contexts.get_server_context(full_path_to_cert_file, full_path_to_key_file, self.TLS_NUM_TICKETS,
+                                                           alpn_protocols(self.CODECS))
+
+    async def _reader_task(self, reader, client_address, codec, responses_queue, compression = None):
+        """
+        receives the messages of a single client, puts the responses (encoded frames) in the queue of the writer task
+        :param codec: codec negotiated in the TLS handshake of this client
+        :param compression: Compression of this client, None - not negotiated. messages + responses of a client are handled one
+                            by one by this task, so they are decompressed / compressed in the order of the wire
+        :return: None
+        """
+        frame_buffer = FrameBuffer(self.MAX_DATA_SIZE)
+        index = 0
+        while True:
+            data = await reader.read(self.MAX_DATA_SIZE)
+            if not data: # client disconnected forcibly
+                self.log.info(f"client: {client_address} - disconnected")
+                return
+            frame_buffer.feed(data)
+            for frame in frame_buffer.frames():
+                if is_disconnect(frame, codec): # client sent disconnection message
+                    self.log.info(f"client: {client_address} - sent disconnection message")
+                    return
+                if stream_kind(frame) == STREAM_OPEN: # only the select server handles streams, Client.send_stream would wait for its credit forever
+                    self.log.warning(f"client: {client_address} opened stream [{frame.message_id}], streams are not supported, aborting it")
+                    await responses_queue.put(abort_frame(frame.message_id, "streams are not supported"))
+                    continue
+                if frame.control:
+                    self.log.warning(f"client: {client_address} sent unknown control frame, ignored")
+                    continue
+                try:
+                    # payload is a slice of the frame buffer, it stays valid here - the buffer is fed only by this task
+                    message_type, flags, message = codec.decode(compression.decompress(frame.payload) if compression else frame.payload)
+                except CodecError as ee:
+                    self.log.error(f"client: {client_address} sent invalid message [{frame.message_id}], error: {ee} ###")
+                    continue
+                # async handlers are awaited here, plain ones run on the thread pool / process pool - the loop keeps serving the others
+                resp_message = await self.handlers.handle_async(Request(client_address, frame.message_id, message, message_type, flags=flags))
+                # response is sent with the same id
+                payload = codec.encode(resp_message, message_type)
+                await responses_queue.put(encode_frame(compression.compress(payload) if compression else payload, frame.message_id))
+                self.received_messages_store.add(MessageRecord(client_address, index, printable(message), printable(resp_message)))
+                index += 1
+
+    async def _writer_task(self, writer, client_address, responses_queue):
+        """
+        sends the responses (encoded frames) of a single client, None in the queue means - no more responses
+        :return: None
+        """
+        while True:
+            response = await responses_queue.get()
+            if response is None:
+                return
+            writer.write(response)
+            # drain() waits only if the OS buffer is full (slow client), the other clients are not affected
+            await writer.drain()
+
+    async def _handle_client(self, reader, writer):
+        # called by asyncio for every new client, after the TLS handshake is done
+        client_address = writer.get_extra_info("peername")
+        ssl_object = writer.get_extra_info("ssl_object")
+        resumed = tls_contexts.count_handshake(ssl_object, self.full_handshakes, self.resumed_handshakes)
+        codec = negotiated_codec(ssl_object)
+        compression = create_compression(negotiated_compression(ssl_object), self.COMPRESSION_THRESHOLD, self.COMPRESSION_LEVEL)
+        self.log.info(f"new Client connection: IP: {client_address}, TLS: {ssl_object.version()}, handshake: {'resumed' if resumed else 'full'}, "
+                      f"codec: {codec.name}{' (legacy)' if codec.legacy else ''}{' + compression' if compression else ''}")
+        self.all_clients[client_address] = writer
+
+        responses_queue = asyncio.Queue()
+        writer_task = asyncio.create_task(self._writer_task(writer, client_address, responses_queue))
+        try:
+            await self._reader_task(reader, client_address, codec, responses_queue, compression)
+        except (ConnectionError, ssl.SSLError, FrameError, CompressionError) as ee:
+            self.log.error(f"### Receive error: Client: {client_address} connection failed, error:\n {ee} ###")
+        finally:
+            await responses_queue.put(None) # let the writer send what is left and finish
+            try:
+                await writer_task
+            except (ConnectionError, ssl.SSLError) as ee:
+                self.log.warning(f"failed sending response to client: {client_address}, error: {ee}")
+            writer.close()
+            try:
+                await writer.wait_closed()
+            except (ConnectionError, ssl.SSLError):
+                pass
+            del self.all_clients[client_address]
+
+            # same as the other servers - finish when the last client is gone
+            if not self.all_clients:
+                self.log.info("main process is finished")
+                self._all_clients_disconnected.set()
+            else:
+                self.log.info("main process keep on running because more client/s are still running")
+
+    async def _serve(self):
+        self._all_clients_disconnected = asyncio.Event()
+        server = await asyncio.start_server(self._handle_client,
+                                            self.IP,
+                                            self.PORT,
+                                            ssl=self.ssl_context,
+                                            reuse_address=True)
+        self.log.info(f"Ready and is listening on port {self.PORT}, event loop: {type(asyncio.get_running_loop()).__module__} ...")
+        async with server:
+            await self._all_clients_disconnected.wait()
+
+    def start(self):
+        self._init()
+        self._create_ssl_context()
+        if self.USE_UVLOOP and uvloop:
+            asyncio.set_event_loop_policy(uvloop.EventLoopPolicy())
+        asyncio.run(self._serve())
+
+    def disconnect(self):
+        # server socket and client sockets are closed by asyncio when _serve() finishes
+        self.received_messages_store.close() # still can be read after close
+        self.handlers.close()
+        self.log.info("Server socket is closed + all client sockets are close, app is finished !!!")
+        self.log.info(f"{self.full_handshakes}, {self.resumed_handshakes}")
+
+    def print_received_messages(self):
+        print(f"\n[{self.app}]: All the messages that were sent: Client -> Server (last {len(self.received_messages_store)} are kept)\n")
+        for record in self.received_messages_store.records():
+            print(f"[{self.app}]: Client: [{record.client}]: {record}")
+
+
+# I added here a main just in case I wish to run the server directly and not from run_server.py
+if __name__ == '__main__':
+    server = Server()
+    server.start()
+    server.disconnect()
+    server.print_received_messages()
@@ -0,0 +1,64 @@
+from typing import Final # makes my types be final without ability to change their type
+
+from src.framing import MAX_MESSAGE_ID, encode_frame
+
+############################################################################################
+# CHANNELS (many logical conversations over one connection):
+# the message id of a frame is split: the high bits are the channel, the low bits the sequence number in the channel
+#
+#   +---------------------------+-----------------------------------------+
+#   | channel (12 bits)         | sequence (20 bits)                      |   <- message id (32 bits)
+#   +---------------------------+-----------------------------------------+
+#
+# channel 0 is the connection itself (a client that never opens a channel, its message ids are just numbers).
+# a channel is opened with a control frame CO (+ message type: all the messages of the channel go to that handler)
+# and closed with CC (the server sends CC + reason when it refuses a channel). both carry the channel in the message id.
+#
+# the select server hands every channel to a working thread of its own (hash of the connection + channel), so:
+#   messages of a channel are answered in order, different channels of one connection are handled in parallel
+# see multiplex_client.MultiplexClient for the client side (per channel window + fair scheduling of the writes)
+############################################################################################
+
+CHANNEL_SHIFT: Final[int] = 20
+SEQUENCE_MASK: Final[int] = (1 << CHANNEL_SHIFT) - 1
+MAX_CHANNELS: Final[int] = MAX_MESSAGE_ID >> CHANNEL_SHIFT # 4095, channel 0 is not a channel
+CHANNEL_OPEN: Final[bytes] = b"CO"
+CHANNEL_CLOSE: Final[bytes] = b"CC"
+KIND_SIZE: Final[int] = 2
+
+
+class ChannelError(Exception):
+    pass
+
+
+def channel_of(message_id: int) -> int:
+    return message_id >> CHANNEL_SHIFT
+
+
+def channel_message_id(channel: int, sequence: int) -> int:
+    return (channel << CHANNEL_SHIFT) | (sequence & SEQUENCE_MASK)
+
+
+def channel_kind(frame):
+    """
+    :return: CHANNEL_OPEN / CHANNEL_CLOSE, None if the frame is not a channel frame
+    """
+    if not frame.control:
+        return None
+    kind = bytes(frame.payload[:KIND_SIZE])
+    return kind if kind in (CHANNEL_OPEN, CHANNEL_CLOSE) else None
+
+
+def open_channel_frame(channel: int, message_type: str = None) -> bytes:
+    return encode_frame(CHANNEL_OPEN + (message_type or "").encode('ascii'), channel_message_id(channel, 0), control=True)
+
+
+def close_channel_frame(channel: int, reason: str = "") -> bytes:
+    return encode_frame(CHANNEL_CLOSE + reason.encode('utf-8', 'replace'), channel_message_id(channel, 0), control=True)
+
+
+def channel_argument(frame) -> str:
+    """
+    :return: message type of CO / reason of CC
+    """
+    return str(frame.payload[KIND_SIZE:], 'utf-8', 'replace')
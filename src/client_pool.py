@@ -0,0 +1,187 @@
+import queue
+import selectors
+import ssl
+import threading
+from contextlib import contextmanager
+from typing import Final # makes my types be final without ability to change their type
+
+from src.client_tcp import Client
+from src.config_resolver import load_config, CLIENT_CONFIG_FILE
+from src.reconnect import ReconnectError
+from src.log import get_logger, setup_logging
+
+
+class ClientPool:
+    ############################################################################################
+    # CLIENT CONNECTION POOL:
+    # keeps N connected (warm) Clients to the server, so a batch sender gets parallel connections
+    # without paying the TCP + TLS handshake per message and without managing sockets by itself.
+    #
+    # usage:
+    #   pool = ClientPool(size=8)
+    #   with pool.connection() as client:     # checkout, checkin is done automatically
+    #       client.send("hello")
+    #       client._receive()
+    #   pool.close()
+    #
+    # each connection is a regular Client, so it connects with the same retry logic (Client._connect)
+    # a background thread checks the idle connections, broken connections are replaced in the background
+    ############################################################################################
+    def __init__(self, size: int = None, health_check_interval: float = None, config_path = None, cert_path = None):
+        """
+        :param size: amount of connections, None -> 'pool_size' from client_config.yaml
+        :param health_check_interval: seconds between checks of the idle connections, None -> from client_config.yaml
+        :param config_path, cert_path: passed to every Client
+        """
+        self.app: Final[str] = "CLIENT_POOL"
+        self.log = get_logger(self.app)
+        config = load_config(CLIENT_CONFIG_FILE, config_path)["client"]
+        setup_logging(config.get("log_level"))
+        self.SIZE: Final[int] = size or config.get("pool_size", 4)
+        self.HEALTH_CHECK_INTERVAL: Final[float] = health_check_interval or config.get("pool_health_check_interval", 30)
+        self.config_path = config_path
+        self.cert_path = cert_path
+
+        self._idle_clients = queue.Queue()   # connected clients that are not checked out
+        self._all_clients = set()            # idle + checked out clients
+        self._lock = threading.Lock()
+        self._closed = threading.Event()
+
+        self.log.info(f"opening {self.SIZE} connections ...")
+        for _ in range(self.SIZE):
+            self._add_client(self._create_client())
+        self.log.info(f"{self.SIZE} connections are ready")
+
+        self._health_check_thread = threading.Thread(target=self._health_check_loop,
+                                                     name="client_pool_health_check",
+                                                     daemon=True)
+        self._health_check_thread.start()
+
+    def _create_client(self) -> Client:
+        # the pool replaces broken connections by itself, so the clients don't reconnect in the background
+        return Client(config_path=self.config_path, cert_path=self.cert_path, auto_reconnect=False)
+
+    def _add_client(self, client: Client):
+        with self._lock:
+            self._all_clients.add(client)
+        self._idle_clients.put(client)
+
+    def checkout(self, timeout: float = None) -> Client:
+        """
+        take a connected client for exclusive use, must be returned by checkin()
+        :param timeout: seconds to wait if all the clients are checked out, None means forever
+        :return: Client
+        """
+        if self._closed.is_set():
+            raise RuntimeError("pool is closed")
+        try:
+            return self._idle_clients.get(timeout=timeout)
+        except queue.Empty:
+            raise TimeoutError(f"no free connection in the pool after {timeout} seconds") from None
+
+    def checkin(self, client: Client, broken: bool = False) -> None:
+        """
+        :param client: client that was taken by checkout()
+        :param broken: True if send / receive failed on this client - it will be replaced
+        """
+        # send / _receive report a lost connection by returning False (not raising), the client is not connected anymore then
+        if broken or self._closed.is_set() or not client._connected.is_set():
+            self._discard(client)
+        else:
+            self._idle_clients.put(client)
+
+    @contextmanager
+    def connection(self, timeout: float = None):
+        """
+        checkout + checkin, if the code inside the 'with' raises - the connection is considered broken
+        """
+        client = self.checkout(timeout)
+        try:
+            yield client
+        except Exception:
+            self.checkin(client, broken=True)
+            raise
+        else:
+            self.checkin(client)
+
+    def _discard(self, client: Client):
+        with self._lock:
+            self._all_clients.discard(client)
+        try:
+            client.disconnect()
+        except OSError:
+            pass
+        if not self._closed.is_set():
+            # new connection is opened in the background, so the caller doesn't wait for the connect retries
+            threading.Thread(target=self._replace_client, name="client_pool_replace", daemon=True).start()
+
+    def _replace_client(self):
+        while not self._closed.is_set():
+            try:
+                client = self._create_client()
+            except ReconnectError as ee:
+                self.log.warning(f"failed to open replacement connection: {ee}, will retry")
+                self._closed.wait(self.HEALTH_CHECK_INTERVAL)
+                continue
+            if self._closed.is_set():
+                client.disconnect()
+                return
+            self._add_client(client)
+            self.log.info("broken connection was replaced")
+            return
+
+    @staticmethod
+    def _is_healthy(client: Client) -> bool:
+        # idle connection must not be readable: readable means the server closed it (or sent something nobody waits for)
+        client_socket = client.client_socket
+        if client_socket is None or client_socket.fileno() == -1:
+            return False
+        with selectors.DefaultSelector() as selector:
+            selector.register(client_socket, selectors.EVENT_READ)
+            if not selector.select(0) and not client_socket.pending():
+                return True
+        # readable may be only TLS records without application data (TLS 1.3 session tickets after the handshake)
+        # a non blocking read consumes them and tells: SSLWantReadError -> healthy, b'' -> closed, data -> out of sync
+        client_socket.setblocking(False)
+        try:
+            client_socket.recv(1)
+        except ssl.SSLWantReadError:
+            return True
+        except OSError:
+            return False
+        finally:
+            if client_socket.fileno() != -1:
+                client_socket.setblocking(True)
+        return False
+
+    def _health_check_loop(self):
+        while not self._closed.wait(self.HEALTH_CHECK_INTERVAL):
+            # check only the clients that are idle right now, checked out clients are checked by their users
+            for _ in range(self._idle_clients.qsize()):
+                try:
+                    client = self._idle_clients.get_nowait()
+                except queue.Empty:
+                    break
+                if self._is_healthy(client):
+                    self._idle_clients.put(client)
+                else:
+                    self.log.warning("idle connection is broken, replacing it")
+                    self._discard(client)
+
+    def __len__(self) -> int:
+        with self._lock:
+            return len(self._all_clients)
+
+    def close(self):
+        self.log.info("closing all the connections ...")
+        self._closed.set()
+        with self._lock:
+            clients = list(self._all_clients)
+            self._all_clients.clear()
+        for client in clients:
+            try:
+                client.send_disconnect() # tells the server that this client disconnects
+                client.disconnect()
+            except OSError:
+                pass
+        self.log.info("all the connections are closed")
@@ -1,11 +1,20 @@
+import collections
 import socket
-from pathlib import Path
-from typing import Final # makes my types be final without ability to change their type
-import yaml
+import threading
 import time
-import ssl
-import os
+from typing import Final # makes my types be final without ability to change their type
+
+from src.config_resolver import find_file, load_config, CLIENT_CONFIG_FILE, CERT_FILE
+from src import tls_contexts
+from src.framing import FrameBuffer, encode_frame, send_frame, recv_frame
+from src.reconnect import ReconnectPolicy, ReconnectError
+from src.log import get_logger, setup_logging
+from src.message_store import MessageRecord, create_store
+from src.codec import LEGACY_CODEC, alpn_protocols, disconnect_frame, negotiated_codec, negotiated_compression, printable
+from src.compression import DEFAULT_LEVEL, DEFAULT_THRESHOLD, create as create_compression
+from src.streaming import DEFAULT_CHUNK_SIZE, StreamError, send_stream
 
+WRITE_BATCH_SIZE: Final[int] = 64 * 1024 # send_many without auto-batching: max bytes per sendall
 
 
 class Client:
@@ -17,132 +26,437 @@ class Client:
 
     # here we will use ECHO Server that will always answer upon connect to it
     ############################################################################################
-    def __init__(self, ip = None, port = None):
+    def __init__(self, ip = None, port = None, config_path = None, cert_path = None, auto_reconnect: bool = None,
+                 batch_max_bytes: int = None, batch_max_delay_us: int = None):
+        """
+        :param config_path: explicit path of client_config.yaml, None -> searched (see config_resolver)
+        :param cert_path: explicit path of the server certificate, None -> searched (see config_resolver)
+        :param auto_reconnect: reconnect in the background when the connection is lost, None -> taken from client_config.yaml
+        :param batch_max_bytes, batch_max_delay_us: auto-batching of send() (0 - off), None -> taken from client_config.yaml
+        """
         self.app: Final[str] = "CLIENT"
+        self.log = get_logger(self.app)
+        self.config_path = config_path
+        self.cert_path = cert_path
         # self.ip: Final[str] = "127.0.0.1" if not ip else ip
         # self.port: Final[int] = 8820 if not port else port
 
         self.client_socket = None
-        self.connection_store = {}
+        self.tls_session = None # TLS session of the last connection, used to resume the handshake on reconnect
+        self._session_remembered = False # session of the current connection was already remembered
+        self.connection_store = None # sent messages + their responses, bounded (see message_store), created in _init
+        self._sent_record = None     # last sent message, waits for its response
+        self.last_response = None
+        self.codec = LEGACY_CODEC    # negotiated in the TLS handshake of every connection (see codec)
+        self.compression = None      # Compression of the connection if it was negotiated (see compression), new per connection
         self.index = 0
+        self._connected = threading.Event()    # set while there is a working connection
+        self._closing = threading.Event()      # set by disconnect(), stops the background reconnect
+        self._reconnect_thread = None
+        self.reconnect_error = None            # error of the last background reconnect that gave up (ReconnectError) or failed
+        # batches (send_many / auto-batching): frames are collected and sent with a single sendall - one syscall and full TLS records
+        # instead of a syscall + a TLS record per message. the flusher thread sends a batch that waited BATCH_MAX_DELAY
+        self._batch = bytearray()              # frames that were not sent yet
+        self._batch_frames = 0
+        self._batch_since = 0.0                # time the oldest frame of the batch was added
+        self._batch_records = collections.deque() # batched messages that wait for their response, oldest first (ids: index, index + 1, ...)
+        self._batch_condition = threading.Condition() # guards the batch and its sendall (main thread + flusher thread)
+        self._flusher_thread = None
+        self.batches = 0
+        self.batched_messages = 0
 
-        ip, port, max_retries, retry_delay, max_data_size = self._init()
+        (ip, port, max_retries, retry_delay, max_data_size, policy, config_auto_reconnect, codecs, stream_chunk_size,
+         max_in_flight, config_batch_max_bytes, config_batch_max_delay_us, compression_threshold, compression_level) = self._init()
         self.IP: Final[str] =  ip  # also possible to do: socket.gethostbyname(socket.gethostname())  # <---- this way we determine the local host address, this way -> we set it hard codded: "127.0.0.1" if not ip else ip
-        print(f"[{self.app}]: app is executed using the next parameters: ")
-        print(f"[{self.app}]: IP: {self.IP}")
+        self.log.info("app is executed using the next parameters: ")
+        self.log.info(f"IP: {self.IP}")
 
         self.PORT: Final[int] = port # also possible to do: 8820 if not port else port
-        print(f"[{self.app}]: PORT: {self.PORT}")
+        self.log.info(f"PORT: {self.PORT}")
 
         self.max_retries = max_retries
-        print(f"[{self.app}]: Max number of connection retries: {self.max_retries}")
+        self.log.info(f"Max number of connection retries: {self.max_retries}")
 
         self.retry_delay = retry_delay
-        print(f"[{self.app}]: Delay between retries: {self.retry_delay}")
+        self.log.info(f"Delay between retries: {self.retry_delay}")
 
         self.MAX_DATA_SIZE = max_data_size
-        print(f"[{self.app}]: Max data size: {self.MAX_DATA_SIZE}")
+        self.log.info(f"Max data size: {self.MAX_DATA_SIZE}")
+        # received bytes are collected here till a whole message (frame) arrives, MAX_DATA_SIZE is only the size of a single recv
+        self.frame_buffer = FrameBuffer(self.MAX_DATA_SIZE)
 
-        self._connect()
+        self.reconnect_policy = policy # exponential backoff with jitter between the connect attempts
+        self.AUTO_RECONNECT: Final[bool] = config_auto_reconnect if auto_reconnect is None else auto_reconnect
+        self.log.info(f"Auto reconnect: {self.AUTO_RECONNECT}")
+
+        self.CODECS: Final[list] = codecs # offered to the server, in order of preference
+        self.log.info(f"Codecs: {self.CODECS}")
+
+        self.COMPRESSION_THRESHOLD: Final[int] = compression_threshold # messages shorter than this are not compressed
+        self.COMPRESSION_LEVEL: Final[int] = compression_level
 
-    def _find_full_file_path(self, my_path, my_file):
-        for dirpath, _, filenames in os.walk(my_path): #
-            if my_file in filenames:
-                full_file_path = Path(str(os.path.join(dirpath, my_file)))  # Return full path if found
-                return full_file_path
-        return None  # Return None if not found
+        self.STREAM_CHUNK_SIZE: Final[int] = stream_chunk_size # data bytes per frame of send_stream
+        self.log.info(f"Stream chunk size: {self.STREAM_CHUNK_SIZE}")
+
+        self.MAX_IN_FLIGHT: Final[int] = max_in_flight # batched messages without response, more are sent after half of them were answered
+        self.BATCH_MAX_BYTES: Final[int] = config_batch_max_bytes if batch_max_bytes is None else batch_max_bytes # auto-batching of send(): batch is sent when it reaches this size, 0 - off
+        batch_max_delay_us = config_batch_max_delay_us if batch_max_delay_us is None else batch_max_delay_us
+        self.BATCH_MAX_DELAY: Final[float] = batch_max_delay_us / 1_000_000 # ... or when its oldest message waited this long
+        self.log.info(f"Auto-batching: {f'{self.BATCH_MAX_BYTES} bytes / {batch_max_delay_us}us' if self.BATCH_MAX_BYTES else 'off'}")
+
+        self._connect()
+        if self.BATCH_MAX_BYTES:
+            self._flusher_thread = threading.Thread(target=self._flush_when_due, name="client_batch_flusher", daemon=True)
+            self._flusher_thread.start()
 
     def _init(self):
-        full_path_to_file = self._find_full_file_path(Path.cwd().parent,"client_config.yaml")
+        full_path_to_file = find_file(CLIENT_CONFIG_FILE, self.config_path)
         if not full_path_to_file:
             raise FileExistsError
-        print(f"[{self.app}]: Loading configuration for the client from: {full_path_to_file}")
 
-        with (open(full_path_to_file, "r") as yaml_file):
-            config = yaml.safe_load(yaml_file)
-            return config["client"]["ip_address"],\
-                   config["client"]["port"],\
-                   config["client"]["max_retries"],\
-                   config["client"]["retry_delay"], \
-                   config["client"]["max_data_size"]
+        config = load_config(CLIENT_CONFIG_FILE, self.config_path) # loaded once per process, reloaded only if the file was modified
+        # log_level: DEBUG prints also a line per sent / received message
+        setup_logging(config["client"].get("log_level"))
+        self.log.info(f"Loaded configuration for the client from: {full_path_to_file}")
+        self.connection_store = create_store(config["client"])
+        return config["client"]["ip_address"],\
+               config["client"]["port"],\
+               config["client"]["max_retries"],\
+               config["client"]["retry_delay"], \
+               config["client"]["max_data_size"], \
+               ReconnectPolicy.from_config(config["client"]), \
+               config["client"].get("auto_reconnect", True), \
+               config["client"].get("codecs", ["text"]), \
+               config["client"].get("stream_chunk_size", DEFAULT_CHUNK_SIZE), \
+               config["client"].get("max_in_flight", 64), \
+               config["client"].get("batch_max_bytes", 0), \
+               config["client"].get("batch_max_delay_us", 200), \
+               config["client"].get("compression_threshold", DEFAULT_THRESHOLD), \
+               config["client"].get("compression_level", DEFAULT_LEVEL)
 
     def _connect(self):
-        # 1. create client 'regular' socket - this operation has nothing to do with Server (it doesnt requires a Server be connected)
-        print(f"\n\n[{self.app}]: Creating the 'regular' socket ...")
-        self.client_socket = socket.socket(socket.AF_INET,     # this means we use protocol IP (our socket will expect to connect between 2 IP addresses
-                                           socket.SOCK_STREAM) # this means we use protocol TCP (in charge of reliable connection)
-        print(f"[{self.app}]: 'regular' socket ... created")
-
-        # 2. creating a context object that holds all relevant settings and configurations related to SSL/TLS secured connection
-        print(f"[{self.app}]: Creating the secured SSL context (set of rules for secure connection) ...")
-        full_path_to_cert_file = self._find_full_file_path(Path.cwd().parent, "ilana_cert_01.pem")
+        """
+        connect with retries, the delay between the attempts grows exponentially with a random jitter (see ReconnectPolicy)
+        raises ReconnectError if all the attempts failed (the process is not exited, the caller decides what to do)
+        """
+        # 1. creating a context object that holds all relevant settings and configurations related to SSL/TLS secured connection
+        self.log.info("Creating the secured SSL context (set of rules for secure connection) ...")
+        full_path_to_cert_file = find_file(CERT_FILE, self.cert_path)
         if not full_path_to_cert_file:
             raise FileExistsError
-        print(f"[{self.app}]: Loading cert from file: {full_path_to_cert_file}")
+        self.log.info(f"Loading cert from file: {full_path_to_cert_file}")
         # context = ssl.create_default_context() # <--- if I do it this way, I actually tell client to accept any cert from server, while server will by default create self signed certificate that will be by default rejected by python ssl so I need tell Client that will be sent specific self signed cert from server and please deal only with this one
-        context = ssl.create_default_context(cafile=full_path_to_cert_file)# <--- if I do it this way, I actually tell client to verify specific self signed certificate
-        print(f"[{self.app}]: default SSL context ... created")
+        # the context trusts only this self signed cert and doesn't check the hostname, it is built once per process (see tls_contexts)
+        context = tls_contexts.get_client_context(full_path_to_cert_file, alpn_protocols(self.CODECS))
+        self.log.info("default SSL context ... created")
 
-        # since we use self-signed certificate, which is default, by default python ssl module will reject it so we must handle it:
-        # Disable hostname verification, it is good while testing but in production we must replace this with: True
-        context.check_hostname = False
-        # this way we say: allow only this cert: 'certs/ilana_cert_01.pem',  or we can use ssl.CERT_NONE to make Client not check certificate at all
-        context.load_verify_locations(full_path_to_cert_file)
-        # context.verify_mode = ssl.CERT_NONE # Accept any certificate, it is good while testing but in production we must replace this with: CERT_REQUIRED
-
-        print(f"[{self.app}]: Wrapping 'regular' socket with SSL")
-        self.client_socket = context.wrap_socket(self.client_socket,server_hostname=self.IP) # if we set flag: context.check_hostname = False Server IP will not be checked
-        print(f"[{self.app}]: socket is wrapped with TLS/SSL, TLS version is: {self.client_socket.version()}")
+        try:
+            self.reconnect_policy.retry(lambda: self._connect_once(context), cancelled=self._closing, log=self.log)
+        except ReconnectError as ee:
+            self.log.error(f"{ee} ###")
+            raise
+        self._connected.set()
 
+    def _connect_once(self, context):
         # the correct order is:
         # 0. create ssl context
         # 1. create 'regular' socket
         # 2. wrap socket with ssl
-        for connect_attempt in range(1, self.max_retries + 1):
-            print(f"[{self.app}]: Attempting to connect Client to Server [{connect_attempt}], ip: {self.IP}, port: {self.PORT} ...")
-            # 3. connect server - here socket already need to be ssl socket as Server side expects ssl socket !
-            try:
-                self.client_socket.connect((self.IP, self.PORT))
-                print(f"[{self.app}]: Connected to the Server successfully !")
-                break
-            except (ConnectionRefusedError, socket.timeout):
-                print(f"[{self.app}]: Server is down / not started yet, retrying in {self.retry_delay} seconds...")
-                time.sleep(self.retry_delay)
-        else:
-            print(f"[{self.app}]: Failed to connect to the Server after {self.max_retries} attempts ###")
-            exit(1)  # Exit if connection never succeeded
+        # 3. connect
+        # new socket on every attempt, a socket whose connect has failed is not reused
+        if self._closing.is_set(): # disconnect() was called while the background reconnect was starting
+            raise ReconnectError("client is closed")
+        self.log.info("Creating the 'regular' socket ...")
+        client_socket = socket.socket(socket.AF_INET,     # this means we use protocol IP (our socket will expect to connect between 2 IP addresses
+                                      socket.SOCK_STREAM) # this means we use protocol TCP (in charge of reliable connection)
+        self.log.info("'regular' socket ... created")
+
+        # session of the previous connection to this server (if there was) - the handshake will be a short (resumed) one
+        if self.tls_session is None:
+            self.tls_session = tls_contexts.get_session((self.IP, self.PORT), context)
 
-    def send(self, message):
-        # actual sending of the data to the server
-        print(f"[{self.app}]: Sending message: {message} to Server ..")
+        self.log.info("Wrapping 'regular' socket with SSL")
+        client_socket = context.wrap_socket(client_socket,
+                                            server_hostname=self.IP, # if we set flag: context.check_hostname = False Server IP will not be checked
+                                            session=self.tls_session)
+
+        self.log.info(f"Attempting to connect Client to Server, ip: {self.IP}, port: {self.PORT} ...")
         try:
-            self.client_socket.sendall(message.encode())
+            # here socket already need to be ssl socket as Server side expects ssl socket !
+            client_socket.connect((self.IP, self.PORT))
+        except OSError:
+            client_socket.close()
+            raise
+        if self._closing.is_set():
+            client_socket.close()
+            raise ReconnectError("client is closed")
+        self.client_socket = client_socket
+        self._session_remembered = False
+        self.codec = negotiated_codec(client_socket) # server that doesn't negotiate -> legacy text
+        self.compression = create_compression(negotiated_compression(client_socket), self.COMPRESSION_THRESHOLD, self.COMPRESSION_LEVEL)
+        resumed = tls_contexts.count_handshake(self.client_socket)
+        self.log.info(f"Connected to the Server successfully ! TLS version is: {self.client_socket.version()}, "
+              f"TLS handshake: {'resumed' if resumed else 'full'}, codec: {self.codec.name}{' (legacy)' if self.codec.legacy else ''}"
+              f"{' + compression' if self.compression else ''}")
+
+    def _connection_lost(self):
+        # called when send / receive found that the connection is broken,
+        # the reconnect runs in the background (if auto_reconnect), the caller doesn't wait for it
+        self._connected.clear()
+        self._drop_batch()
+        if not self.AUTO_RECONNECT or self._closing.is_set():
+            return
+        if self._reconnect_thread is not None and self._reconnect_thread.is_alive():
+            return
+        self._reconnect_thread = threading.Thread(target=self._reconnect_in_background,
+                                                  name="client_reconnect",
+                                                  daemon=True)
+        self._reconnect_thread.start()
+
+    def _reconnect_in_background(self):
+        try:
+            self.reconnect()
+            self.reconnect_error = None
+        except ReconnectError as ee:
+            self.reconnect_error = ee
+            self.log.error(f"Background reconnect gave up: {ee}")
+        except Exception as ee: # not retried (bad certificate, ...) - recorded, the thread doesn't end silently
+            self.reconnect_error = ee
+            self.log.error(f"Background reconnect failed: {ee!r}")
+
+    def wait_connected(self, timeout: float = None) -> bool:
+        """
+        :param timeout: seconds, None - wait forever
+        :return: True if the client is connected (for example the background reconnect has finished)
+        """
+        return self._connected.wait(timeout)
+
+    def send(self, message, message_type: str = None):
+        """
+        actual sending of the data to the server
+        :param message: str / bytes, encoded by the codec of the connection
+        :param message_type: binary codec only - handler of the message on the server side (on a text connection use "type:message")
+        """
+        self.log.debug("Sending message: %s to Server ..", message)
+        if not self._connected.is_set():
+            self.log.warning("Not connected to the Server (reconnect is in progress), message is not sent")
+            return False
+        if self.BATCH_MAX_BYTES: # auto-batching: sent with the next messages, read its response with _receive() as usual
+            return self._send_batched((message,), message_type)
+        try:
+            send_frame(self.client_socket, self._compress(self.codec.encode(message, message_type)), self.index)
         except Exception as ee: # (BrokenPipeError, ConnectionResetError, ):
-            print(f"[{self.app}]: Connection lost. Received error: {ee}, Server may have crashed/disconnected.")
+            self.log.warning(f"Connection lost. Received error: {ee}, Server may have crashed/disconnected.")
+            self._connection_lost()
             return False
         else:
-            print(f"[{self.app}]: Message was sent")
-            self.connection_store.setdefault(self.index,[]).append(message)
+            self.log.debug("Message was sent")
+            self._store_sent_record()
+            self._sent_record = MessageRecord((self.IP, self.PORT), self.index, printable(message))
+            return True
+
+    def send_many(self, messages, message_type: str = None):
+        """
+        sends the messages in batches: many frames in a single sendall (one syscall, the frames share the TLS records),
+        MAX_IN_FLIGHT messages at most wait for their responses, the next ones are sent while the responses are read
+        :param messages: iterable of str / bytes, encoded by the codec of the connection
+        :param message_type: binary codec only - handler of the messages on the server side
+        :return: list of the responses in the order of the messages, None if the connection was lost
+        """
+        if not self._connected.is_set():
+            self.log.warning("Not connected to the Server (reconnect is in progress), messages are not sent")
+            return None
+        responses = []
+        first_id = self.index + len(self._batch_records) # responses of older batched messages are read first, but not returned
+        if not self._send_batched(messages, message_type, responses, first_id) or not self._drain_batch(responses, first_id):
+            return None
+        return responses
+
+    def _send_batched(self, messages, message_type: str = None, responses: list = None, first_id: int = 0) -> bool:
+        # the frame gets the next id after the batched messages that were not answered yet
+        batch_limit = self.BATCH_MAX_BYTES or WRITE_BATCH_SIZE
+        try:
+            for message in messages:
+                if len(self._batch_records) >= self.MAX_IN_FLIGHT: # window is full - half of it is answered before sending more
+                    if not self._drain_batch(responses, first_id, self.MAX_IN_FLIGHT // 2):
+                        return False
+                with self._batch_condition:
+                    message_id = self.index + len(self._batch_records)
+                    if not self._batch:
+                        self._batch_since = time.monotonic()
+                        self._batch_condition.notify() # flusher thread starts counting the delay
+                    self._batch += encode_frame(self._compress(self.codec.encode(message, message_type)), message_id)
+                    self._batch_frames += 1
+                    self._batch_records.append(MessageRecord((self.IP, self.PORT), message_id, printable(message)))
+                    if len(self._batch) >= batch_limit and not self._flush_batch():
+                        return False
+        except Exception as ee:
+            self.log.warning(f"Connection lost. Received error: {ee}, Server may have crashed/disconnected.")
+            self._connection_lost()
+            return False
+        return True
+
+    def _drain_batch(self, responses: list = None, first_id: int = 0, keep: int = 0) -> bool:
+        """
+        reads the responses of the batched messages till only 'keep' of them wait
+        :param responses: responses of the messages with id >= first_id are appended here
+        """
+        while len(self._batch_records) > keep:
+            message_id = self._batch_records[0].index
+            if not self._receive():
+                return False
+            if responses is not None and message_id >= first_id:
+                responses.append(self.last_response)
+        return True
+
+    def _flush_batch(self) -> bool:
+        # called with _batch_condition held
+        if not self._batch:
             return True
+        try:
+            self.client_socket.sendall(self._batch)
+        except OSError as ee:
+            self.log.warning(f"Sending a batch of {self._batch_frames} messages failed, error: {ee}")
+            self._connection_lost()
+            return False
+        self.log.debug("batch of %s messages, %s bytes was sent", self._batch_frames, len(self._batch))
+        self.batches += 1
+        self.batched_messages += self._batch_frames
+        self._batch.clear() # keeps its memory for the next batch
+        self._batch_frames = 0
+        return True
+
+    def _drop_batch(self):
+        # connection is lost: batched messages will not be answered, they are stored without response
+        with self._batch_condition:
+            self._batch.clear()
+            self._batch_frames = 0
+            while self._batch_records:
+                self.connection_store.add(self._batch_records.popleft())
+
+    def _flush_when_due(self):
+        # flusher thread (auto-batching): a batch that didn't fill up is sent BATCH_MAX_DELAY after its first message (like Nagle)
+        with self._batch_condition:
+            while not self._closing.is_set():
+                if not self._batch:
+                    self._batch_condition.wait()
+                    continue
+                left = self._batch_since + self.BATCH_MAX_DELAY - time.monotonic()
+                if left > 0:
+                    self._batch_condition.wait(left)
+                    continue
+                self._flush_batch()
+
+    def batch_stats(self) -> dict:
+        """
+        :return: batches sent, messages in them, messages_per_batch > 1 means several messages went out in a single sendall
+        """
+        return {"batches": self.batches,
+                "batched_messages": self.batched_messages,
+                "messages_per_batch": self.batched_messages / self.batches if self.batches else 0,
+                "waiting_responses": len(self._batch_records)}
+
+    def send_stream(self, source, message_type: str = None, size: int = None, progress = None):
+        """
+        sends a big payload as a stream of chunks (see streaming) and waits for the response of its stream handler on the server.
+        only STREAM_CHUNK_SIZE bytes of the source are in memory at a time, the server controls the pace (credit)
+        :param source: file opened in binary mode (read with readinto into a reused buffer) / bytes / iterable of bytes chunks
+        :param message_type: stream handler on the server side, None - the default stream handler
+        :param size: total bytes, None - taken from the file / bytes (unknown for an iterable)
+        :param progress: progress(sent bytes, size) after every chunk
+        :return: the response, None if the stream failed (connection lost / aborted by the server)
+        """
+        if not self._connected.is_set():
+            self.log.warning("Not connected to the Server (reconnect is in progress), stream is not sent")
+            return None
+        if not self._drain_batch(): # the stream reads its own frames, responses of batched messages must not be among them
+            return None
+        stream_id = self.index
+        self.index += 1
+        try:
+            response_frame = send_stream(self.client_socket, self.frame_buffer, stream_id, source, message_type, size,
+                                         self.STREAM_CHUNK_SIZE, progress)
+            _, _, response = self.codec.decode(self._decompress(response_frame.payload))
+        except StreamError as ee:
+            self.log.warning(f"Stream [{stream_id}] failed: {ee}")
+            return None
+        except Exception as ee:
+            self.log.warning(f"Connection lost in the middle of stream [{stream_id}], error: {ee}")
+            self._connection_lost()
+            return None
+        if isinstance(response, memoryview): # binary codec - body is a slice of the frame
+            response = bytes(response)
+        self._remember_tls_session()
+        self.last_response = response
+        self.connection_store.add(MessageRecord((self.IP, self.PORT), stream_id, f"stream: {message_type or ''}", printable(response)))
+        return response
+
+    def send_disconnect(self):
+        """
+        tells the server that this client disconnects (control frame, or 'q' to a server that didn't negotiate a codec)
+        """
+        if not self._connected.is_set():
+            return False
+        try:
+            with self._batch_condition: # batched messages go out before the disconnect
+                if not self._flush_batch():
+                    return False
+                self.client_socket.sendall(disconnect_frame(self.codec, self.index + len(self._batch_records)))
+        except OSError as ee:
+            self.log.warning(f"Disconnection message was not sent, error: {ee}")
+            return False
+        return True
 
     def _receive(self):
         # Client waits to get the answer from the server
-        # we need to define MAX bytes we allow to extract from the socket - here we say max 1024 bytes (1K) if will be less ok
-        print(f"[{self.app}]: Waiting for response from the server ...")
+        # answer can arrive in several pieces (or together with next answer), recv_frame() returns exactly one whole message
+        self.log.debug("Waiting for response from the server ...")
+        if not self._connected.is_set():
+            self.log.warning("Not connected to the Server (reconnect is in progress)")
+            return False
+        with self._batch_condition: # response of a batched message can't arrive before the batch was sent
+            if not self._flush_batch():
+                return False
         try:
-            received_data = self.client_socket.recv(self.MAX_DATA_SIZE).decode()  # blocking operation, client will not send next message before he got respond to the current message
-            if not received_data:
-                print(f"[{self.app}]: No received data, probably Server closed the connection")
+            received_frame = recv_frame(self.client_socket, self.frame_buffer)  # blocking operation, client will not send next message before he got respond to the current message
+            if received_frame is None:
+                self.log.warning("No received data, probably Server closed the connection")
+                self._connection_lost()
                 return False
+            _, _, received_data = self.codec.decode(self._decompress(received_frame.payload))
+            if isinstance(received_data, memoryview): # binary codec - body is a slice of the frame
+                received_data = bytes(received_data)
         except Exception as ee:
-            print(f"[{self.app}]: Receive has failed, error: {ee}, probably Server failed")
+            self.log.warning(f"Receive has failed, error: {ee}, probably Server failed")
+            self._connection_lost()
             return False
         else:
-            print(f"[{self.app}]: Received message from the server: <{received_data}>")
-            self.connection_store.setdefault(self.index, []).append(received_data)
+            self.log.debug("Received message from the server: <%s>", received_data)
+            self._remember_tls_session()
+            self.last_response = received_data
+            if self._batch_records:
+                record = self._batch_records.popleft()
+                record.response = printable(received_data)
+                self.connection_store.add(record)
+            elif self._sent_record is not None:
+                self._sent_record.response = printable(received_data)
+                self._store_sent_record()
             self.index += 1
             return True
 
+    def _compress(self, payload):
+        # messages are compressed in the order they are sent (the context of the connection is shared, see compression)
+        return self.compression.compress(payload) if self.compression else payload
+
+    def _decompress(self, payload):
+        return self.compression.decompress(payload) if self.compression else payload
+
+    def _store_sent_record(self):
+        # stored once its response arrived (or when it is clear that it will not arrive)
+        if self._sent_record is not None:
+            self.connection_store.add(self._sent_record)
+            self._sent_record = None
+
     def start(self):
         """
         Client works in a sequential manner - works like a chat:
@@ -158,29 +472,72 @@ class Client:
             message = input("Please enter message: ").rstrip()
             # check input
             if not message:
-                print(f"[{self.app}]: Empty message is ignored")
+                self.log.info("Empty message is ignored")
             else:
+                if message == 'q': # tells the server to finish
+                    self.send_disconnect()
+                    return
                 if not self.send(message):
-                    return  # send any message to server (either 'q' or not, as message 'q' tels the server to finish)
-                if message == 'q':
                     return
                 if not self._receive():
                     return
+                # SHOW
+                print(f"[{self.app}]: Received message from the server: <{self.last_response}>")
 
-    def disconnect(self):
-        print(f"[{self.app}]: Closing the SOCKET (connection) ....")
+    def _remember_tls_session(self):
+        # TLS 1.3 session ticket arrives after the handshake, together with the first data from the server.
+        # once per connection: every read of SSLSocket.session builds a new session object (~0.2ms, more than a whole small message)
+        if self._session_remembered:
+            return
+        session = self.client_socket.session
+        if session is None or not session.has_ticket: # ticket didn't arrive yet
+            return
+        tls_contexts.remember_session((self.IP, self.PORT), self.client_socket)
+        self.tls_session = tls_contexts.get_session((self.IP, self.PORT), self.client_socket.context)
+        self._session_remembered = True
+
+    def reconnect(self):
+        """
+        close the current connection and connect again, the TLS session of the current connection is resumed
+        """
+        self.log.info("Reconnecting to the Server ...")
+        self._connected.clear()
+        try:
+            self._remember_tls_session()
+        except (OSError, ValueError):
+            pass
         self.client_socket.close()
-        print(f"[{self.app}]: SOCKET (connection) is closed")
+        self._drop_batch() # responses of the old connection will not arrive
+        self.frame_buffer = FrameBuffer(self.MAX_DATA_SIZE)
+        self._connect()
+
+    def disconnect(self):
+        self.log.info("Closing the SOCKET (connection) ....")
+        self._closing.set() # stops the background reconnect (if running)
+        self._connected.clear()
+        with self._batch_condition: # stops the flusher thread
+            self._batch_condition.notify()
+        if self.client_socket is not None:
+            self.client_socket.close()
+        self.log.info("SOCKET (connection) is closed")
+        if self.connection_store is not None:
+            self._store_sent_record() # the last message (usually 'q') got no response
+            self._drop_batch()
+            self.connection_store.close()
 
     def print_sent_messages(self):
         print(f"\n[{self.app}]: All the messages that were sent: Client -> Server\n"
               f"--------------------------------------------------------------------")
-        for index, messages_list in self.connection_store.items():
-            print(f"[{self.app}]: [{index}]: {messages_list}")
+        print(f"[{self.app}]: {len(self.connection_store)} messages are kept")
+        for record in self.connection_store.records():
+            print(f"[{self.app}]: [{record.index}]: {[record.message, record.response]}")
 
 # I added here a main just in case I wish to run the client directly and not from simpl_client_server_app.py
 if __name__ == '__main__':
-    client = Client()
+    try:
+        client = Client()
+    except ReconnectError:
+        exit(1)  # Exit if connection never succeeded
     client.start()
     client.disconnect()
     client.print_sent_messages()
@@ -0,0 +1,187 @@
+import struct
+from typing import Final # makes my types be final without ability to change their type
+
+from src.framing import CONTROL_BYE, encode_frame
+from src.compression import COMPRESSIONS
+
+############################################################################################
+# MESSAGE CODECS:
+# the frame (see framing) carries a payload of bytes, the codec of the connection says what these bytes are:
+#   raw    - the bytes as they are, nothing is decoded (handlers get bytes / memoryview)
+#   text   - UTF-8 text (handlers get str)
+#   binary - compact envelope: flags (1 byte) + message type length (1 byte) + message type (ascii) + body (bytes)
+#
+#   +-----------------+---------------------------+---------------------------+---------------------+
+#   | flags (1 byte)  | type length (1 byte) = n  | message type (n bytes)    | body (rest)         |
+#   +-----------------+---------------------------+---------------------------+---------------------+
+#
+# the codec is negotiated per connection in the TLS handshake (ALPN), so it costs no extra round trip:
+# the client offers the codecs it wants (client_config.yaml 'codecs'), the server picks the first of its own list
+# (server_config.yaml 'codecs') that the client offered.
+# a peer that doesn't offer ALPN (older client / server) gets the legacy text codec: UTF-8 text and message 'q' = disconnect.
+# negotiated connections disconnect with an out-of-band control frame (CONTROL_BYE), so 'q' is a regular message there.
+# a codec can be offered with compression: "<codec>+<compression>" ("binary+zlib"), see compression
+############################################################################################
+
+ALPN_PREFIX: Final[str] = "csa-"
+COMPRESSION_SEPARATOR: Final[str] = "+"
+ENVELOPE: Final[struct.Struct] = struct.Struct("!BB") # flags, message type length
+LEGACY_DISCONNECT: Final[bytes] = b"q"
+
+
+class CodecError(ValueError):
+    pass
+
+
+class Codec:
+    """
+    base class: decode(payload) -> (message type, flags, body), encode(body, message type, flags) -> payload
+    """
+    name: str = None
+    legacy: bool = False # True - no control frames, message 'q' means disconnect
+
+    def decode(self, payload):
+        """
+        :param payload: bytes / memoryview of a single frame
+        :return: (message type or None, flags, body)
+        """
+        raise NotImplementedError
+
+    def encode(self, body, message_type: str = None, flags: int = 0) -> bytes:
+        raise NotImplementedError
+
+    @property
+    def alpn(self) -> str:
+        return ALPN_PREFIX + self.name
+
+
+def _to_bytes(body):
+    return body.encode() if isinstance(body, str) else body
+
+
+class RawCodec(Codec):
+    name = "raw"
+
+    def decode(self, payload):
+        return None, 0, payload
+
+    def encode(self, body, message_type: str = None, flags: int = 0) -> bytes:
+        return _to_bytes(body)
+
+
+class TextCodec(Codec):
+    name = "text"
+
+    def __init__(self, legacy: bool = False):
+        self.legacy = legacy
+
+    def decode(self, payload):
+        try:
+            return None, 0, str(payload, 'utf-8')
+        except UnicodeDecodeError as ee:
+            raise CodecError(f"text message is not valid UTF-8: {ee}") from None
+
+    def encode(self, body, message_type: str = None, flags: int = 0) -> bytes:
+        return _to_bytes(body)
+
+
+class BinaryCodec(Codec):
+    name = "binary"
+
+    def decode(self, payload):
+        # body is a slice of the payload (memoryview), no copy
+        if len(payload) < ENVELOPE.size:
+            raise CodecError(f"binary message of {len(payload)} bytes is shorter than its envelope")
+        flags, type_length = ENVELOPE.unpack_from(payload)
+        body_start = ENVELOPE.size + type_length
+        if len(payload) < body_start:
+            raise CodecError(f"binary message of {len(payload)} bytes is shorter than its message type")
+        view = memoryview(payload)
+        message_type = str(view[ENVELOPE.size:body_start], 'ascii') if type_length else None
+        return message_type, flags, view[body_start:]
+
+    def encode(self, body, message_type: str = None, flags: int = 0) -> bytes:
+        encoded_type = message_type.encode('ascii') if message_type else b""
+        if len(encoded_type) > 255:
+            raise CodecError(f"message type: '{message_type}' is longer than 255 bytes")
+        return ENVELOPE.pack(flags, len(encoded_type)) + encoded_type + _to_bytes(body)
+
+
+CODECS: Final[dict] = {codec.name: codec for codec in (RawCodec(), TextCodec(), BinaryCodec())}
+LEGACY_CODEC: Final[Codec] = TextCodec(legacy=True)
+
+
+def alpn_protocols(names) -> list:
+    """
+    :param names: codec names in order of preference, for example ["binary+zlib", "binary", "text"]
+    :return: ALPN protocol names for SSLContext.set_alpn_protocols()
+    """
+    unknown = [name for name in names if not _is_known(name)]
+    if unknown:
+        raise ValueError(f"unknown codecs: {unknown}, supported: {list(CODECS)}, with compression: {list(COMPRESSIONS)}")
+    return [ALPN_PREFIX + name for name in names]
+
+
+def _split(name: str) -> tuple:
+    # "binary+zlib" -> ("binary", "zlib"), "binary" -> ("binary", None)
+    codec_name, _, compression = name.partition(COMPRESSION_SEPARATOR)
+    return codec_name, compression or None
+
+
+def _is_known(name: str) -> bool:
+    codec_name, compression = _split(name)
+    return codec_name in CODECS and (compression is None or compression in COMPRESSIONS)
+
+
+def _selected(tls_socket):
+    selected = tls_socket.selected_alpn_protocol() if tls_socket is not None else None
+    if not selected or not selected.startswith(ALPN_PREFIX):
+        return None
+    return selected[len(ALPN_PREFIX):]
+
+
+def negotiated_codec(tls_socket) -> Codec:
+    """
+    :param tls_socket: SSL socket / SSLObject after the handshake
+    :return: codec both sides agreed on, LEGACY_CODEC if the peer doesn't do ALPN
+    """
+    selected = _selected(tls_socket)
+    if selected is None:
+        return LEGACY_CODEC
+    return CODECS.get(_split(selected)[0], LEGACY_CODEC)
+
+
+def negotiated_compression(tls_socket):
+    """
+    :param tls_socket: SSL socket / SSLObject after the handshake
+    :return: name of the compression both sides agreed on (see compression.create), None - messages are not compressed
+    """
+    selected = _selected(tls_socket)
+    return _split(selected)[1] if selected is not None else None
+
+
+def is_disconnect(frame, codec: Codec) -> bool:
+    """
+    :return: True if the frame tells that the peer disconnects (control frame BYE, or 'q' on a legacy connection)
+    """
+    if frame.control:
+        return frame.payload == CONTROL_BYE
+    return codec.legacy and frame.payload == LEGACY_DISCONNECT
+
+
+def disconnect_frame(codec: Codec, message_id: int = 0) -> bytes:
+    """
+    :return: frame that tells the server that the client disconnects, in the way the connection understands
+    """
+    if codec.legacy:
+        return encode_frame(LEGACY_DISCONNECT, message_id)
+    return encode_frame(CONTROL_BYE, message_id, control=True)
+
+
+def printable(value) -> str:
+    """
+    text of a message for the message store / logs, bytes are shown as UTF-8 (invalid bytes escaped)
+    """
+    if value is None or isinstance(value, str):
+        return value
+    return bytes(value).decode('utf-8', 'backslashreplace')
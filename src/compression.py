@@ -0,0 +1,118 @@
+import threading
+import zlib
+from typing import Final # makes my types be final without ability to change their type
+
+from src.framing import MAX_FRAME_SIZE
+
+############################################################################################
+# COMPRESSION (per connection):
+# negotiated in the TLS handshake together with the codec (see codec): "text+zlib", "binary+zlib", ...
+# a peer that didn't offer it gets the plain codec, nothing changes for it.
+#
+# the payload of every regular frame (control frames are never compressed) starts with a marker byte:
+#
+#   +------------------+--------------------------------------------------------------+
+#   | marker (1 byte)  | PLAIN: the payload of the codec as it is                     |
+#   |                  | ZLIB:  raw deflate of it (without the sync flush tail 00 00 ff ff) |
+#   +------------------+--------------------------------------------------------------+
+#
+# messages shorter than the threshold go PLAIN (deflate costs more than it saves on them).
+# the deflate context of the connection is reused by all its messages (one per direction, like permessage-deflate of websockets):
+# no allocation of a new context per message, and a message is compressed against the ones before it (a repeated prefix /
+# the request inside its echo response costs a few bytes). so both sides must compress / decompress in the order of the
+# frames on the wire - senders on several threads take the lock of the Compression.
+#
+# usage:
+#   compression = create(negotiated_compression(tls_socket), threshold=256, level=1)   # None - not negotiated
+#   payload = compression.compress(codec.encode(message)) ... codec.decode(compression.decompress(frame.payload))
+############################################################################################
+
+ZLIB: Final[str] = "zlib"
+COMPRESSIONS: Final[tuple] = (ZLIB,)
+PLAIN_MARKER: Final[bytes] = b"\x00"
+ZLIB_MARKER: Final[bytes] = b"\x01"
+SYNC_TAIL: Final[bytes] = b"\x00\x00\xff\xff" # end of every Z_SYNC_FLUSH, not sent
+DEFAULT_THRESHOLD: Final[int] = 256 # bytes
+DEFAULT_LEVEL: Final[int] = 1 # with the context reused the higher levels cost a lot more CPU for a few % (bench/bench_compression.py)
+
+
+class CompressionError(ValueError):
+    pass
+
+
+class Compression:
+
+    def __init__(self, threshold: int = DEFAULT_THRESHOLD, level: int = DEFAULT_LEVEL, max_size: int = MAX_FRAME_SIZE):
+        """
+        :param threshold: messages shorter than this are sent uncompressed
+        :param level: zlib level, 1 (fast) .. 9 (small)
+        :param max_size: max size of a decompressed message, bigger ones are rejected (decompression bomb)
+        """
+        self.THRESHOLD: Final[int] = threshold
+        self.LEVEL: Final[int] = level
+        self.MAX_SIZE: Final[int] = max_size
+        self._compressor = zlib.compressobj(level, zlib.DEFLATED, -zlib.MAX_WBITS)
+        self._decompressor = zlib.decompressobj(-zlib.MAX_WBITS)
+        self.lock = threading.Lock() # senders on several threads compress under it, in the order their frames are written
+        self.messages = 0            # messages given to compress()
+        self.compressed_messages = 0
+        self.input_bytes = 0         # bytes given to compress()
+        self.output_bytes = 0        # bytes compress() returned (markers included)
+
+    def compress(self, payload) -> bytes:
+        """
+        :param payload: encoded message (bytes), the frames must be sent in the order they were compressed
+        :return: marker + payload / its deflate
+        """
+        self.messages += 1
+        self.input_bytes += len(payload)
+        if len(payload) < self.THRESHOLD:
+            self.output_bytes += len(payload) + 1
+            return PLAIN_MARKER + payload
+        # even if it didn't get smaller it is sent compressed - the context already holds it, the receiver must see it too
+        compressed = self._compressor.compress(payload) + self._compressor.flush(zlib.Z_SYNC_FLUSH)
+        self.compressed_messages += 1
+        self.output_bytes += len(compressed) - len(SYNC_TAIL) + 1
+        return ZLIB_MARKER + compressed[:-len(SYNC_TAIL)]
+
+    def decompress(self, payload) -> bytes:
+        """
+        :param payload: payload of a regular frame, in the order the frames arrived
+        :return: encoded message (bytes)
+        """
+        if not payload:
+            raise CompressionError("compressed message without its marker byte")
+        with memoryview(payload) as view:
+            if view[:1] == PLAIN_MARKER:
+                return bytes(view[1:])
+            if view[:1] != ZLIB_MARKER:
+                raise CompressionError(f"unknown compression marker: {view[0]}")
+            try:
+                message = self._decompressor.decompress(view[1:], self.MAX_SIZE)
+                if self._decompressor.unconsumed_tail: # stopped at MAX_SIZE, the rest was not inflated
+                    raise CompressionError(f"decompressed message is bigger than {self.MAX_SIZE} bytes")
+                return message + self._decompressor.decompress(SYNC_TAIL) # empty block, only moves the context to the next message
+            except zlib.error as ee:
+                raise CompressionError(f"invalid compressed message: {ee}") from None
+
+    def stats(self) -> dict:
+        """
+        :return: messages + bytes before / after compress(), ratio = after / before (< 1 - bytes were saved)
+        """
+        return {"messages": self.messages,
+                "compressed_messages": self.compressed_messages,
+                "input_bytes": self.input_bytes,
+                "output_bytes": self.output_bytes,
+                "ratio": self.output_bytes / self.input_bytes if self.input_bytes else 1.0}
+
+
+def create(name: str, threshold: int = DEFAULT_THRESHOLD, level: int = DEFAULT_LEVEL):
+    """
+    :param name: compression the connection negotiated (see codec.negotiated_compression), None - not negotiated
+    :return: Compression for a new connection, None if the connection is not compressed
+    """
+    if name is None:
+        return None
+    if name not in COMPRESSIONS:
+        raise CompressionError(f"unknown compression: {name}, supported: {list(COMPRESSIONS)}")
+    return Compression(threshold, level)
@@ -0,0 +1,118 @@
+import os
+import threading
+from pathlib import Path
+from typing import Final # makes my types be final without ability to change their type
+
+import yaml
+
+############################################################################################
+# CONFIG + CREDENTIALS RESOLVER:
+# every Client / Server used to search its yaml + pem files by os.walk() of the parent directory, on every construction.
+# here it is done once per process, the file is searched in this order:
+#   1. explicit path given by the caller
+#   2. environment variable (see ENV_OVERRIDES), for example: CSA_SERVER_CONFIG=/etc/app/server_config.yaml
+#   3. well known directories of this repo: configs/, certs/, repo root
+#   4. os.walk() of the search root (CSA_SEARCH_ROOT, default: parent of the working directory) - like before,
+#      but a single walk looks for all the known files together and the results are cached
+#
+# loaded yaml files are cached too, and reloaded only if the file was modified (mtime changed)
+############################################################################################
+
+REPO_ROOT: Final[Path] = Path(__file__).resolve().parent.parent
+
+CLIENT_CONFIG_FILE: Final[str] = "client_config.yaml"
+SERVER_CONFIG_FILE: Final[str] = "server_config.yaml"
+CERT_FILE: Final[str] = "ilana_cert_01.pem"
+KEY_FILE: Final[str] = "ilana_key_01.pem"
+
+ENV_OVERRIDES: Final[dict] = {CLIENT_CONFIG_FILE: "CSA_CLIENT_CONFIG",
+                              SERVER_CONFIG_FILE: "CSA_SERVER_CONFIG",
+                              CERT_FILE: "CSA_CERT_FILE",
+                              KEY_FILE: "CSA_KEY_FILE"}
+SEARCH_ROOT_ENV: Final[str] = "CSA_SEARCH_ROOT"
+WELL_KNOWN_DIRS: Final[tuple] = (REPO_ROOT / "configs", REPO_ROOT / "certs", REPO_ROOT)
+
+
+class FileResolver:
+    def __init__(self, search_root=None, well_known_dirs: tuple = WELL_KNOWN_DIRS):
+        """
+        :param search_root: directory to walk if the file is not found in the well known places, None -> CSA_SEARCH_ROOT or cwd parent
+        :param well_known_dirs: directories checked (without walking) before the search root is walked
+        """
+        self.search_root = search_root
+        self.well_known_dirs = well_known_dirs
+        self._paths = {}    # key is file name, value is its full path
+        self._configs = {}  # key is full path, value is (mtime, loaded yaml)
+        self._lock = threading.Lock()
+
+    def _walk(self, file_name):
+        # single walk looks for all the known files, so next lookups of other files are answered from the cache
+        search_root = Path(self.search_root or os.environ.get(SEARCH_ROOT_ENV) or Path.cwd().parent)
+        wanted = {file_name, *ENV_OVERRIDES} - self._paths.keys()
+        for dirpath, _, filenames in os.walk(search_root):
+            for found in wanted.intersection(filenames):
+                self._paths[found] = Path(dirpath) / found
+            wanted -= self._paths.keys()
+            if not wanted:
+                break
+
+    def find(self, file_name: str, explicit_path=None):
+        """
+        :param file_name: for example: 'server_config.yaml'
+        :param explicit_path: if given, it is used as is (no search)
+        :return: full path (Path obj), None if not found
+        """
+        if explicit_path:
+            return Path(explicit_path)
+        env_path = os.environ.get(ENV_OVERRIDES.get(file_name, ""))
+        if env_path:
+            return Path(env_path)
+
+        with self._lock:
+            cached_path = self._paths.get(file_name)
+            if cached_path and cached_path.is_file():
+                return cached_path
+            self._paths.pop(file_name, None) # file was moved / deleted - search again
+            for directory in self.well_known_dirs:
+                if (directory / file_name).is_file():
+                    self._paths[file_name] = directory / file_name
+                    return self._paths[file_name]
+            self._walk(file_name)
+            return self._paths.get(file_name)
+
+    def load_config(self, file_name: str, explicit_path=None) -> dict:
+        """
+        :param file_name: yaml file name, for example: 'server_config.yaml'
+        :param explicit_path: if given, it is used as is (no search)
+        :return: loaded yaml, cached till the file is modified
+        """
+        full_path = self.find(file_name, explicit_path)
+        if not full_path:
+            raise FileExistsError(f"{file_name} was not found")
+        mtime = full_path.stat().st_mtime_ns
+        with self._lock:
+            cached = self._configs.get(full_path)
+            if cached and cached[0] == mtime:
+                return cached[1]
+        with open(full_path, "r") as yaml_file:
+            config = yaml.safe_load(yaml_file)
+        with self._lock:
+            self._configs[full_path] = (mtime, config)
+        return config
+
+    def clear(self):
+        with self._lock:
+            self._paths.clear()
+            self._configs.clear()
+
+
+# single resolver for the whole process
+resolver = FileResolver()
+
+
+def find_file(file_name: str, explicit_path=None):
+    return resolver.find(file_name, explicit_path)
+
+
+def load_config(file_name: str, explicit_path=None) -> dict:
+    return resolver.load_config(file_name, explicit_path)
@@ -0,0 +1,81 @@
+import selectors
+from typing import Final # makes my types be final without ability to change their type
+
+############################################################################################
+# EVENT LOOP BACKEND:
+# thin wrapper around the 'selectors' module, the sockets are registered ONCE (when client connects)
+# and unregistered ONCE (when client disconnects), the OS kernel keeps the list of monitored sockets.
+# with select.select() we had to hand over the full list of sockets on every scan -> O(n) per wakeup
+# and it can not monitor more than FD_SETSIZE (1024) sockets.
+# with epoll (Linux) / kqueue (BSD, macOS) add / remove of a socket is O(1) and the wakeup cost
+# depends on the number of 'ready' sockets and not on the number of 'monitored' sockets
+############################################################################################
+
+EVENT_READ: Final[int] = selectors.EVENT_READ
+EVENT_WRITE: Final[int] = selectors.EVENT_WRITE
+
+# name (as written in server_config.yaml) -> selector class, None if not supported by this OS
+BACKENDS = {"auto": selectors.DefaultSelector,  # the best one this OS has: epoll | kqueue | devpoll | poll | select
+            "epoll": getattr(selectors, "EpollSelector", None),
+            "kqueue": getattr(selectors, "KqueueSelector", None),
+            "devpoll": getattr(selectors, "DevpollSelector", None),
+            "poll": getattr(selectors, "PollSelector", None),
+            "select": selectors.SelectSelector}
+
+
+class EventLoop:
+    def __init__(self, backend: str = "auto"):
+        """
+        :param backend: one of the keys of BACKENDS (config key: 'event_loop_backend')
+        """
+        selector_class = BACKENDS.get(backend)
+        if selector_class is None:
+            raise ValueError(f"event loop backend: '{backend}' is not supported on this machine, "
+                             f"supported: {[name for name, cls in BACKENDS.items() if cls]}")
+        self.selector = selector_class()
+        self.backend: Final[str] = type(self.selector).__name__
+
+    def register(self, sock, events: int = EVENT_READ, data=None) -> None:
+        """
+        start monitoring the socket, done once per socket (and not once per scan)
+        :param sock: socket obj to monitor
+        :param events: EVENT_READ and/or EVENT_WRITE
+        :param data: any obj we wish to get back when the socket will be notified
+        :return: None
+        """
+        self.selector.register(sock, events, data)
+
+    def modify(self, sock, events: int, data=None) -> None:
+        self.selector.modify(sock, events, data)
+
+    def unregister(self, sock) -> None:
+        """
+        stop monitoring the socket, must be called BEFORE the socket is closed (closed socket has no fd)
+        :param sock: socket obj
+        :return: None
+        """
+        try:
+            self.selector.unregister(sock)
+        except (KeyError, ValueError): # not registered / already closed
+            pass
+
+    def is_registered(self, sock) -> bool:
+        try:
+            self.selector.get_key(sock)
+        except (KeyError, ValueError):
+            return False
+        return True
+
+    def poll(self, timeout: float = None) -> list:
+        """
+        blocking wait till at least one of the monitored sockets is ready or timeout expired
+        :param timeout: in seconds, None means wait forever
+        :return: list of tuples: (socket obj, events mask, data that was given on register)
+        """
+        return [(key.fileobj, mask, key.data) for key, mask in self.selector.select(timeout)]
+
+    def __len__(self) -> int:
+        return len(self.selector.get_map())
+
+    def close(self) -> None:
+        self.selector.close()
@@ -0,0 +1,200 @@
+import selectors
+import socket
+import ssl
+import struct
+from typing import Final, NamedTuple # makes my types be final without ability to change their type
+
+############################################################################################
+# MESSAGE FRAMING:
+# TCP is a stream of bytes and not a stream of messages:
+# 2 messages sent one after the other can arrive in a single recv() (coalescing)
+# and a single message bigger than the recv() size arrives in several recv() calls (splitting)
+# so 'one recv() = one message' is wrong, every message is sent as a frame:
+#
+#   +----------------------------+--------------------------------+---------------------------+
+#   | length (4 bytes, big end.) | message id (4 bytes, big end.) | payload (length bytes)    |
+#   +----------------------------+--------------------------------+---------------------------+
+#
+# message id is chosen by the client (sequence number) and the server puts the same id on the response,
+# so a client that sends many messages without waiting (pipelining) knows which response belongs to which message
+#
+# highest bit of the length marks a control frame (frame.control) - signalling between client and server (CONTROL_BYE = client disconnects)
+# that is out of band, it is never mixed with the messages (payload) of the user. frames are at most MAX_FRAME_SIZE, so the bit is free
+#
+# on the receiving side each connection has its own FrameBuffer that collects the bytes
+# and cuts them back to the original messages
+############################################################################################
+
+HEADER: Final[struct.Struct] = struct.Struct("!II")
+MAX_MESSAGE_ID: Final[int] = 0xFFFFFFFF
+MAX_FRAME_SIZE: Final[int] = 16 * 1024 * 1024 # protection from a client that announces a huge frame
+CONTROL_FLAG: Final[int] = 0x80000000          # in the length, the frame is a control frame
+LENGTH_MASK: Final[int] = 0x7FFFFFFF
+CONTROL_BYE: Final[bytes] = b"BYE"             # control frame payload: client disconnects, server doesn't answer it
+
+
+class FrameError(ValueError):
+    pass
+
+
+class Frame(NamedTuple):
+    message_id: int
+    payload: memoryview # bytes when returned by recv_frame()
+    control = False     # not a field, a frame is still compared as (message_id, payload)
+
+
+class ControlFrame(Frame):
+    __slots__ = ()
+    control = True
+
+
+def _frame(message_id: int, payload, control: bool) -> Frame:
+    return ControlFrame(message_id, payload) if control else Frame(message_id, payload)
+
+
+def encode_frame(payload, message_id: int = 0, control: bool = False) -> bytes:
+    """
+    :param payload: bytes / bytearray / memoryview
+    :param message_id: 0..MAX_MESSAGE_ID
+    :param control: control frame (see CONTROL_FLAG)
+    :return: header + payload, ready to be sent with a single sendall()
+    """
+    return HEADER.pack(len(payload) | CONTROL_FLAG if control else len(payload), message_id) + payload
+
+
+def send_frame(sock, payload, message_id: int = 0, timeout: float = None, control: bool = False) -> None:
+    """
+    send the whole frame, works for blocking and for non-blocking sockets
+    :param sock: socket obj (regular or SSL)
+    :param payload: bytes / bytearray / memoryview
+    :param message_id: 0..MAX_MESSAGE_ID, server answers with the id of the message it responds to
+    :param timeout: only for non-blocking socket, max seconds to wait for the socket to become writable, None means forever
+    :param control: control frame (see CONTROL_FLAG)
+    :return: None
+    """
+    if sock.gettimeout() is None: # blocking socket
+        sock.sendall(encode_frame(payload, message_id, control))
+        return
+    # non-blocking socket - sendall() would fail once the OS send buffer is full, so we wait till it is writable again
+    with memoryview(encode_frame(payload, message_id, control)) as view:
+        while view:
+            try:
+                view = view[sock.send(view):]
+            except (BlockingIOError, ssl.SSLWantWriteError, ssl.SSLWantReadError):
+                with selectors.DefaultSelector() as selector:
+                    selector.register(sock, selectors.EVENT_WRITE)
+                    if not selector.select(timeout):
+                        raise socket.timeout(f"socket was not writable for {timeout} seconds")
+
+
+class FrameBuffer:
+    """
+    per-connection reassembly buffer.
+    data is received straight into the buffer (recv_into, no temporary bytes obj per recv)
+    and complete frames are returned with the payload as memoryview slice of the buffer (no copy).
+
+    !! returned payload is valid only until the next recv_into() / feed() - bytes(frame.payload) if you wish to keep it
+    """
+    def __init__(self, recv_size: int = 1024, max_frame_size: int = MAX_FRAME_SIZE):
+        """
+        :param recv_size: max bytes to read from the socket in a single recv (config key: 'max_data_size')
+        :param max_frame_size: frames announcing bigger payload are rejected with FrameError
+        """
+        self.recv_size = recv_size
+        self.max_frame_size = max_frame_size
+        self._buffer = bytearray(max(recv_size, HEADER.size) * 4)
+        self._start = 0 # first byte that was not returned yet as part of a frame
+        self._end = 0   # end of the received bytes
+
+    def __len__(self) -> int:
+        # amount of received bytes that are not returned yet as part of a frame
+        return self._end - self._start
+
+    def _make_room(self, size: int) -> None:
+        if self._start == self._end: # everything was consumed - start from the beginning, nothing to copy
+            self._start = self._end = 0
+        if len(self._buffer) - self._end >= size:
+            return
+        pending = self._end - self._start
+        if len(self._buffer) >= pending + size: # enough room if we move the pending bytes to the beginning
+            self._buffer[:pending] = self._buffer[self._start:self._end]
+        else: # buffer is too small (big frame) - allocate bigger one, frames that were already returned stay valid
+            new_buffer = bytearray(max(len(self._buffer) * 2, pending + size))
+            new_buffer[:pending] = self._buffer[self._start:self._end]
+            self._buffer = new_buffer
+        self._start, self._end = 0, pending
+
+    def recv_into(self, sock) -> int:
+        """
+        receive available data from the socket into the buffer
+        :param sock: socket obj (regular or SSL)
+        :return: amount of received bytes, 0 means the peer closed the connection
+        """
+        self._make_room(self.recv_size)
+        with memoryview(self._buffer) as view:
+            received = sock.recv_into(view[self._end:self._end + self.recv_size], self.recv_size)
+        self._end += received
+        # SSL socket can hold already decrypted bytes that the OS (select / epoll) doesn't know about,
+        # so if we don't take them now, we will not be notified about them
+        # the whole decrypted rest of the record is taken in one call (a batch of small frames is a full record of 16KB)
+        pending = getattr(sock, "pending", None)
+        while received and pending and pending():
+            size = max(self.recv_size, pending())
+            self._make_room(size)
+            with memoryview(self._buffer) as view:
+                more = sock.recv_into(view[self._end:self._end + size], size)
+            if not more:
+                break
+            self._end += more
+            received += more
+        return received
+
+    def feed(self, data) -> None:
+        """
+        add bytes that were received by someone else (for example by asyncio) to the buffer
+        """
+        self._make_room(len(data))
+        self._buffer[self._end:self._end + len(data)] = data
+        self._end += len(data)
+
+    def next_frame(self):
+        """
+        :return: next complete Frame (payload as memoryview), None if no complete frame was received yet
+        """
+        if self._end - self._start < HEADER.size:
+            return None
+        length, message_id = HEADER.unpack_from(self._buffer, self._start)
+        control = bool(length & CONTROL_FLAG)
+        length &= LENGTH_MASK
+        if length > self.max_frame_size:
+            raise FrameError(f"frame of {length} bytes is bigger than max allowed: {self.max_frame_size}")
+        payload_start = self._start + HEADER.size
+        if self._end - payload_start < length:
+            self._make_room(payload_start + length - self._end) # make sure next recv will have room for the whole frame
+            return None
+        self._start = payload_start + length
+        return _frame(message_id, memoryview(self._buffer)[payload_start:self._start], control)
+
+    def frames(self):
+        """
+        generator of all complete frames that are already in the buffer
+        """
+        frame = self.next_frame()
+        while frame is not None:
+            yield frame
+            frame = self.next_frame()
+
+
+def recv_frame(sock, frame_buffer: FrameBuffer):
+    """
+    blocking receive of exactly one message
+    :param sock: blocking socket obj
+    :param frame_buffer: buffer of this connection, frames received after the returned one are kept there for next call
+    :return: Frame with the payload as bytes, None if the peer closed the connection
+    """
+    frame = frame_buffer.next_frame()
+    while frame is None:
+        if not frame_buffer.recv_into(sock):
+            return None
+        frame = frame_buffer.next_frame()
+    return _frame(frame.message_id, bytes(frame.payload), frame.control)
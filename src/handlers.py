@@ -0,0 +1,357 @@
+import asyncio
+import hashlib
+import importlib
+import inspect
+import os
+import threading
+import time
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from typing import Final # makes my types be final without ability to change their type
+
+from src.metrics import Counter, LocalHistogram
+from src.log import get_logger
+from src.streaming import StreamError
+
+############################################################################################
+# REQUEST HANDLERS:
+# the servers don't build the response by themselves, they pass every message to a HandlerRegistry:
+#   message "upper:hello" -> handler registered for the type "upper" gets the body "hello"
+#   binary codec (see codec) - the message type is a field of the envelope, it is not parsed out of the text
+#   any other message (no type, or a type nobody registered) -> the default handler gets the whole message
+#
+# a handler is a callable: handler(request: Request) -> str / bytes (the response)
+# request.body is str on a text connection, bytes / memoryview on raw + binary connections (never decoded)
+#   plain function       - runs on the calling thread (select server: the working thread), on a thread pool in the asyncio server
+#   async function       - awaited in the asyncio server, on a background event loop thread in the other servers
+#   cpu_bound=True       - runs on a process pool (own GIL), must be a module level function (it is pickled)
+#
+# middleware runs around every handler (in the order it was added): before(request) can return a response
+# (the handler is not called), after(request, response) can replace the response.
+#
+# every handler has its own latency histogram + error counter: HandlerRegistry.stats(), print_stats()
+#
+# stream handlers (see streaming) get the chunks of a big payload instead of a message: handler(stream: IncomingStream) -> response,
+# they run on the thread pool (a stream takes long, the working threads are not held by it), middleware doesn't run around them
+#
+# usage:
+#   registry = HandlerRegistry()
+#   registry.register("upper", lambda request: request.body.upper())
+#   registry.register("primes", count_primes, cpu_bound=True)
+#   registry.register_stream("upload", save_file)                            # for chunk in stream: ...
+#   registry.handle(Request(client_address, message_id, "upper:hello"))      # -> "HELLO"
+#   await registry.handle_async(...)                                           # asyncio server
+#
+# in server_config.yaml:
+#   handlers: {"upper": "my_package.my_module:upper"}
+#   cpu_bound_handlers: ["primes"]
+#   stream_handlers: {"upload": "my_package.my_module:save_file"}
+############################################################################################
+
+TYPE_SEPARATOR: Final[str] = ":"
+DEFAULT_TYPE: Final[str] = "default"
+
+
+class Request:
+    __slots__ = ("client", "message_id", "message", "message_type", "body", "flags")
+
+    def __init__(self, client, message_id: int, message, message_type: str = None, body = None, flags: int = 0):
+        """
+        :param client: address of the client
+        :param message: the whole message as it was received (decoded by the codec of the connection)
+        :param message_type: type from the binary envelope, None - parsed from a text message, the registry sets the handler it was routed to
+        :param body: message without its type prefix
+        :param flags: flags from the binary envelope
+        """
+        self.client = client
+        self.message_id = message_id
+        self.message = message
+        self.message_type = message_type
+        self.body = message if body is None else body
+        self.flags = flags
+
+
+def echo(request: Request):
+    # default response of the select + asyncio servers, bytes stay bytes
+    if isinstance(request.body, str):
+        return f"Hello, client! I received your message: {request.body}."
+    return b"Hello, client! I received your message: " + request.body + b"."
+
+
+def acknowledge(request: Request) -> str:
+    # default response of the threaded server
+    return "Hello, client! I received your message."
+
+
+def stream_summary(stream) -> str:
+    # default stream handler: reads the whole stream, answers with its size + sha256 (the sender can verify the transfer)
+    digest = hashlib.sha256()
+    for chunk in stream:
+        digest.update(chunk)
+    return f"Hello, client! I received your stream of {stream.consumed} bytes, sha256: {digest.hexdigest()}."
+
+
+def load_handler(target: str):
+    """
+    :param target: "package.module:function"
+    """
+    module_name, _, attribute = target.partition(":")
+    if not attribute:
+        raise ValueError(f"handler: '{target}', expected: package.module:function")
+    return getattr(importlib.import_module(module_name), attribute)
+
+
+class Middleware:
+    """
+    base class, override one or both
+    """
+    def before(self, request: Request):
+        """
+        :return: None - continue to the handler, anything else - the response (handler is not called)
+        """
+        return None
+
+    def after(self, request: Request, response: str) -> str:
+        return response
+
+
+class _Handler:
+    __slots__ = ("function", "is_async", "cpu_bound", "latency", "errors")
+
+    def __init__(self, message_type: str, function, cpu_bound: bool):
+        self.function = function
+        self.is_async = inspect.iscoroutinefunction(function)
+        if cpu_bound and self.is_async:
+            raise ValueError(f"handler: '{message_type}' is async, it can't run on the process pool")
+        self.cpu_bound = cpu_bound
+        self.latency = LocalHistogram(f"handler '{message_type}' latency")
+        self.errors = Counter(f"handler '{message_type}' errors")
+
+
+class HandlerRegistry:
+
+    def __init__(self, default = echo, process_pool_size: int = None, thread_pool_size: int = None):
+        """
+        :param default: handler of the messages that were not routed by their type
+        :param process_pool_size: processes for the cpu bound handlers, None -> amount of cores (pool is created on first use)
+        :param thread_pool_size: threads for the plain handlers in the asyncio server, None -> ThreadPoolExecutor default
+        """
+        self.app: Final[str] = "HANDLERS"
+        self.log = get_logger(self.app)
+        self.handlers = {}     # key is message type, value is _Handler
+        self.stream_handlers = {} # key is message type, value is _Handler of a stream handler
+        self.middleware = []
+        self.PROCESS_POOL_SIZE = process_pool_size or os.cpu_count()
+        self.THREAD_POOL_SIZE = thread_pool_size
+        self._process_pool = None
+        self._thread_pool = None
+        self._async_loop = None # background event loop of the async handlers, used by the threaded servers
+        self._lock = threading.Lock()
+        self.register(DEFAULT_TYPE, default)
+        self.register_stream(DEFAULT_TYPE, stream_summary)
+
+    def register(self, message_type: str, handler, cpu_bound: bool = False) -> None:
+        """
+        :param message_type: messages "<message_type>:<body>" are routed to this handler, DEFAULT_TYPE replaces the default handler
+        :param handler: handler(request) -> str, plain or async function
+        :param cpu_bound: runs on the process pool
+        """
+        if TYPE_SEPARATOR in message_type:
+            raise ValueError(f"message type: '{message_type}' can't contain '{TYPE_SEPARATOR}'")
+        self.handlers[message_type] = _Handler(message_type, handler, cpu_bound)
+
+    def route(self, message_type: str, cpu_bound: bool = False):
+        """
+        decorator version of register:
+            @registry.route("upper")
+            def upper(request): ...
+        """
+        def decorator(handler):
+            self.register(message_type, handler, cpu_bound)
+            return handler
+        return decorator
+
+    def register_stream(self, message_type: str, handler) -> None:
+        """
+        :param message_type: streams opened with this type are handled by it, DEFAULT_TYPE replaces the default stream handler
+        :param handler: handler(stream: IncomingStream) -> str, plain function (runs on the thread pool)
+        """
+        stream_handler = _Handler(message_type, handler, cpu_bound=False)
+        if stream_handler.is_async:
+            raise ValueError(f"stream handler: '{message_type}' is async, stream handlers are plain functions")
+        self.stream_handlers[message_type] = stream_handler
+
+    def use(self, middleware: Middleware) -> None:
+        self.middleware.append(middleware)
+
+    def configure(self, config: dict) -> None:
+        """
+        registers the handlers of the server config:
+        handlers: message type -> "package.module:function", cpu_bound_handlers: list of message types,
+        stream_handlers: message type -> "package.module:function", handler_process_pool_size, handler_thread_pool_size
+        """
+        self.PROCESS_POOL_SIZE = config.get("handler_process_pool_size") or self.PROCESS_POOL_SIZE
+        self.THREAD_POOL_SIZE = config.get("handler_thread_pool_size") or self.THREAD_POOL_SIZE
+        cpu_bound_handlers = set(config.get("cpu_bound_handlers") or ())
+        for message_type, target in (config.get("handlers") or {}).items():
+            self.register(message_type, load_handler(target), message_type in cpu_bound_handlers)
+            self.log.info(f"handler: '{message_type}' -> {target}{' (process pool)' if message_type in cpu_bound_handlers else ''}")
+        for message_type, target in (config.get("stream_handlers") or {}).items():
+            self.register_stream(message_type, load_handler(target))
+            self.log.info(f"stream handler: '{message_type}' -> {target}")
+
+    def _route(self, request: Request) -> _Handler:
+        if request.message_type is not None: # binary envelope
+            handler = self.handlers.get(request.message_type)
+        elif isinstance(request.message, str):
+            message_type, separator, body = request.message.partition(TYPE_SEPARATOR)
+            handler = self.handlers.get(message_type) if separator else None
+            if handler is not None:
+                request.message_type, request.body = message_type, body
+        else: # raw bytes are not routed
+            handler = None
+        if handler is None:
+            request.message_type = DEFAULT_TYPE
+            return self.handlers[DEFAULT_TYPE]
+        return handler
+
+    def _before(self, request: Request):
+        for middleware in self.middleware:
+            response = middleware.before(request)
+            if response is not None:
+                return response
+        return None
+
+    def _after(self, request: Request, response: str) -> str:
+        for middleware in reversed(self.middleware):
+            response = middleware.after(request, response)
+        return response
+
+    def _get_process_pool(self) -> ProcessPoolExecutor:
+        with self._lock:
+            if self._process_pool is None:
+                self._process_pool = ProcessPoolExecutor(self.PROCESS_POOL_SIZE)
+            return self._process_pool
+
+    def _get_thread_pool(self) -> ThreadPoolExecutor:
+        with self._lock:
+            if self._thread_pool is None:
+                self._thread_pool = ThreadPoolExecutor(self.THREAD_POOL_SIZE, thread_name_prefix="handler")
+            return self._thread_pool
+
+    def _get_async_loop(self) -> asyncio.AbstractEventLoop:
+        with self._lock:
+            if self._async_loop is None:
+                self._async_loop = asyncio.new_event_loop()
+                threading.Thread(target=self._async_loop.run_forever, name="async_handlers", daemon=True).start()
+            return self._async_loop
+
+    @staticmethod
+    def _picklable(request: Request) -> Request:
+        # memoryview can't be sent to another process, it is copied only for the process pool
+        if isinstance(request.body, memoryview):
+            request.body = bytes(request.body)
+        if isinstance(request.message, memoryview):
+            request.message = request.body if request.message is request.body else bytes(request.message)
+        return request
+
+    def _failed(self, handler: _Handler, request: Request, error: Exception) -> str:
+        handler.errors.inc()
+        self.log.error(f"handler: '{request.message_type}' failed on message: [{request.message_id}] from: {request.client}, error: {error}")
+        return f"ERROR: {request.message_type}: {error}"
+
+    def handle(self, request: Request) -> str:
+        """
+        runs the pipeline on the calling thread (waits for the process pool / background loop if the handler runs there)
+        :return: the response
+        """
+        handler = self._route(request)
+        response = self._before(request)
+        if response is None:
+            start = time.perf_counter()
+            try:
+                if handler.cpu_bound:
+                    response = self._get_process_pool().submit(handler.function, self._picklable(request)).result()
+                elif handler.is_async:
+                    response = asyncio.run_coroutine_threadsafe(handler.function(request), self._get_async_loop()).result()
+                else:
+                    response = handler.function(request)
+            except Exception as e:
+                response = self._failed(handler, request, e)
+            handler.latency.observe(time.perf_counter() - start)
+        return self._after(request, response)
+
+    async def handle_async(self, request: Request) -> str:
+        """
+        runs the pipeline inside a running event loop, plain handlers are moved to the thread pool so they don't block the loop
+        :return: the response
+        """
+        handler = self._route(request)
+        response = self._before(request)
+        if response is None:
+            start = time.perf_counter()
+            try:
+                if handler.is_async:
+                    response = await handler.function(request)
+                else:
+                    if handler.cpu_bound:
+                        pool, request = self._get_process_pool(), self._picklable(request)
+                    else:
+                        pool = self._get_thread_pool()
+                    response = await asyncio.get_running_loop().run_in_executor(pool, handler.function, request)
+            except Exception as e:
+                response = self._failed(handler, request, e)
+            handler.latency.observe(time.perf_counter() - start)
+        return self._after(request, response)
+
+    def start_stream(self, stream, on_response) -> None:
+        """
+        runs the stream handler of stream.message_type (default stream handler if there is none) on the thread pool
+        :param stream: IncomingStream, fed by the caller meanwhile
+        :param on_response: on_response(stream, response) when the handler returned, response is None if the stream was aborted
+        """
+        handler = self.stream_handlers.get(stream.message_type)
+        if handler is None:
+            stream.message_type = DEFAULT_TYPE
+            handler = self.stream_handlers[DEFAULT_TYPE]
+        self._get_thread_pool().submit(self._run_stream, handler, stream, on_response)
+
+    def _run_stream(self, handler: _Handler, stream, on_response) -> None:
+        start = time.perf_counter()
+        try:
+            response = handler.function(stream)
+        except StreamError as e: # client is gone / aborted, nobody to answer
+            self.log.warning(f"{e}, client: {stream.client}")
+            response = None
+        except Exception as e:
+            response = self._failed(handler, stream, e)
+        finally:
+            stream.close()
+        handler.latency.observe(time.perf_counter() - start)
+        on_response(stream, response)
+
+    def stats(self) -> dict:
+        """
+        :return: key is message type (stream handlers: 'stream:<message type>'), value is its latency snapshot (see Histogram.snapshot) + errors
+        """
+        stats = {message_type: dict(handler.latency.snapshot(), errors=handler.errors.value)
+                 for message_type, handler in self.handlers.items()}
+        stats.update({f"stream:{message_type}": dict(handler.latency.snapshot(), errors=handler.errors.value)
+                      for message_type, handler in self.stream_handlers.items()})
+        return stats
+
+    def print_stats(self):
+        for handler in list(self.handlers.values()) + list(self.stream_handlers.values()):
+            if handler.latency.count:
+                print(f"[{self.app}]: {handler.latency}, errors: {handler.errors.value}")
+
+    def close(self):
+        with self._lock:
+            if self._process_pool:
+                self._process_pool.shutdown()
+                self._process_pool = None
+            if self._thread_pool:
+                self._thread_pool.shutdown()
+                self._thread_pool = None
+            if self._async_loop:
+                self._async_loop.call_soon_threadsafe(self._async_loop.stop)
+                self._async_loop = None
@@ -0,0 +1,112 @@
+import atexit
+import logging
+import os
+import queue
+import sys
+import threading
+from logging.handlers import QueueHandler, QueueListener
+from typing import Final # makes my types be final without ability to change their type
+
+try:
+    from colorama import Fore, init as colorama_init # for printing in colors (optional)
+except ImportError:
+    Fore = None
+
+############################################################################################
+# LOGGING:
+# print() on every message costs a console write + the GIL even when nobody reads the output.
+# here every module logs through a logger with levels:
+#   per message logs (hot paths) are DEBUG with lazy formatting: log.debug("received %s bytes", size)
+#   -> when DEBUG is off the call returns right away, the message is never formatted
+#   lifecycle logs (connect, disconnect, errors) are INFO / WARNING / ERROR
+#
+# the records are put on a queue (QueueHandler) and written to the console by a single background thread (QueueListener),
+# so the thread that logs never waits for the console.
+#
+# usage:
+#   setup_logging("INFO", color=True)    # once per process (first call configures, next calls only change the level)
+#   log = get_logger("SERVER")
+#   log.info("ready")                    # -> [SERVER]: ready
+############################################################################################
+
+LOGGER_NAME: Final[str] = "csa"
+LEVEL_ENV: Final[str] = "CSA_LOG_LEVEL" # environment variable that overrides the configured level
+DEFAULT_LEVEL: Final[str] = "INFO"
+
+_listener = None
+_lock = threading.Lock()
+
+
+def get_logger(app: str) -> logging.Logger:
+    """
+    :param app: name printed in the brackets, for example "SERVER" -> [SERVER]: ...
+    """
+    return logging.getLogger(f"{LOGGER_NAME}.{app}")
+
+
+class AppFormatter(logging.Formatter):
+    """
+    formats a record as: [APP]: message
+    color=True - every thread gets its own color (main thread green, working threads round robin), needs colorama
+    """
+    def __init__(self, color: bool = False):
+        super().__init__("[%(app)s]: %(message)s")
+        self.colors = (Fore.YELLOW, Fore.CYAN, Fore.RED, Fore.BLUE, Fore.GREEN,
+                       Fore.MAGENTA, Fore.LIGHTRED_EX, Fore.LIGHTBLUE_EX, Fore.LIGHTCYAN_EX) if color and Fore else ()
+        self.main_color = Fore.LIGHTGREEN_EX if self.colors else ""
+        self.thread_colors = {} # key is thread name, value is its color
+
+    def _color(self, thread_name: str) -> str:
+        if thread_name == "MainThread":
+            return self.main_color
+        color = self.thread_colors.get(thread_name)
+        if color is None:
+            color = self.thread_colors[thread_name] = self.colors[len(self.thread_colors) % len(self.colors)]
+        return color
+
+    def format(self, record: logging.LogRecord) -> str:
+        record.app = record.name.rsplit(".", 1)[-1]
+        text = super().format(record)
+        if self.colors:
+            return self._color(record.threadName) + text
+        return text
+
+
+def setup_logging(level: str = None, color: bool = False, stream = None) -> None:
+    """
+    :param level: DEBUG | INFO | WARNING | ERROR, None -> INFO, environment variable CSA_LOG_LEVEL wins over both
+    :param color: per thread colors (see AppFormatter)
+    :param stream: where to write, None -> stdout
+    """
+    global _listener
+    logger = logging.getLogger(LOGGER_NAME)
+    logger.setLevel(os.environ.get(LEVEL_ENV) or level or DEFAULT_LEVEL)
+    with _lock:
+        if _listener is not None:
+            return
+        if color and Fore:
+            colorama_init() # needed for Windows
+        console_handler = logging.StreamHandler(stream or sys.stdout)
+        console_handler.setFormatter(AppFormatter(color))
+        log_queue = queue.SimpleQueue()
+        _listener = QueueListener(log_queue, console_handler)
+        logger.addHandler(QueueHandler(log_queue))
+        logger.propagate = False
+        _listener.start()
+        atexit.register(stop_logging)
+
+
+def stop_logging() -> None:
+    """
+    writes all the queued records and stops the background thread, called at exit
+    """
+    global _listener
+    with _lock:
+        if _listener is None:
+            return
+        _listener.stop()
+        logger = logging.getLogger(LOGGER_NAME)
+        for handler in list(logger.handlers):
+            if isinstance(handler, QueueHandler):
+                logger.removeHandler(handler)
+        _listener = None
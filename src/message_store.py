@@ -0,0 +1,414 @@
+import collections
+import json
+import os
+import queue
+import sqlite3
+import threading
+import time
+from pathlib import Path
+from typing import Final, Iterator # makes my types be final without ability to change their type
+
+############################################################################################
+# MESSAGE STORE:
+# every answered message is kept for the final report (print_received_messages / print_sent_messages).
+# it used to be a dict of lists that grows with every message and is never trimmed - a long running server runs out of memory.
+#
+# backends (same interface: add / records / clients / len / close):
+#   MemoryStore       - ring buffer in memory, keeps only the last N messages per client and the last M messages in total
+#   SegmentFileStore  - append only files on disk (segments), a full segment is closed and a new one is opened (rollover),
+#                       too many segments -> the old ones are compacted (only the last N messages per client are kept, within a disk budget)
+#   SQLiteStore       - sqlite database (WAL mode), for persistence + queries per client / time range,
+#                       the records are inserted in batches by a single writer thread, the workers only put them on a queue
+#   NullStore         - keeps nothing
+# reports iterate records(): SegmentFileStore reads the files line by line, so a report never loads the whole store in memory
+############################################################################################
+
+DEFAULT_MAX_PER_CLIENT: Final[int] = 1000
+DEFAULT_MAX_TOTAL: Final[int] = 100_000
+DEFAULT_SEGMENT_SIZE: Final[int] = 1024 * 1024 # bytes
+DEFAULT_MAX_SEGMENTS: Final[int] = 8
+SEGMENT_SUFFIX: Final[str] = ".segment"
+DEFAULT_BATCH_SIZE: Final[int] = 500       # records per insert transaction
+DEFAULT_BATCH_INTERVAL: Final[float] = 0.2 # seconds, max time a record waits for its transaction
+
+
+class MessageRecord:
+    """
+    single message + its response, __slots__ - no __dict__ per record (the store holds a lot of them)
+    """
+    __slots__ = ("client", "index", "message", "response", "timestamp")
+
+    def __init__(self, client, index: int, message: str, response: str = None, timestamp: float = None):
+        self.client = client       # client address on the server side, server address on the client side
+        self.index = index
+        self.message = message
+        self.response = response
+        self.timestamp = time.time() if timestamp is None else timestamp
+
+    def to_list(self) -> list:
+        return [self.client, self.index, self.message, self.response, self.timestamp]
+
+    @classmethod
+    def from_list(cls, values: list) -> "MessageRecord":
+        client, index, message, response, timestamp = values
+        return cls(tuple(client) if isinstance(client, list) else client, index, message, response, timestamp)
+
+    def __eq__(self, other) -> bool:
+        return isinstance(other, MessageRecord) and self.to_list() == other.to_list()
+
+    def __repr__(self) -> str:
+        return f"({self.index}, {self.message!r}, {self.response!r})"
+
+
+class MessageStore:
+    """
+    interface of all the backends, all the methods are thread safe
+    """
+    def add(self, record: MessageRecord) -> None:
+        raise NotImplementedError
+
+    def records(self, client = None) -> Iterator[MessageRecord]:
+        """
+        :param client: only the records of this client, None - all the records
+        :return: records from the oldest to the newest
+        """
+        raise NotImplementedError
+
+    def clients(self) -> list:
+        raise NotImplementedError
+
+    def __len__(self) -> int:
+        raise NotImplementedError
+
+    def close(self) -> None:
+        pass
+
+
+class NullStore(MessageStore):
+    def add(self, record: MessageRecord) -> None:
+        pass
+
+    def records(self, client = None) -> Iterator[MessageRecord]:
+        return iter(())
+
+    def clients(self) -> list:
+        return []
+
+    def __len__(self) -> int:
+        return 0
+
+
+class MemoryStore(MessageStore):
+    """
+    keeps a record while it is one of the last max_total records (of all the clients) and one of the last max_per_client records of its client
+    """
+    def __init__(self, max_per_client: int = DEFAULT_MAX_PER_CLIENT, max_total: int = DEFAULT_MAX_TOTAL):
+        self.max_per_client: Final[int] = max_per_client
+        self.max_total: Final[int] = max_total
+        self._per_client = {}                                  # key is client, value is deque of its records
+        self._all = collections.deque(maxlen=max_total)        # all the records in arrival order (some may be already dropped by the client cap)
+        self._count = 0
+        self._lock = threading.Lock()
+
+    def add(self, record: MessageRecord) -> None:
+        with self._lock:
+            client_records = self._per_client.get(record.client)
+            if client_records is None:
+                client_records = self._per_client[record.client] = collections.deque()
+            if len(client_records) == self.max_per_client:
+                client_records.popleft()
+                self._count -= 1
+            if len(self._all) == self.max_total:
+                self._drop(self._all[0]) # deque drops it by itself on append, its client must drop it too
+            client_records.append(record)
+            self._all.append(record)
+            self._count += 1
+
+    def _drop(self, record: MessageRecord):
+        client_records = self._per_client.get(record.client)
+        if client_records and client_records[0] is record: # not there if it was already dropped by the client cap
+            client_records.popleft()
+            self._count -= 1
+            if not client_records:
+                del self._per_client[record.client]
+
+    def records(self, client = None) -> Iterator[MessageRecord]:
+        with self._lock: # the deque can't be iterated while it is changed, a copy of the references only
+            if client is not None:
+                snapshot = list(self._per_client.get(client, ()))
+            else:
+                snapshot = [record for records in self._per_client.values() for record in records]
+                snapshot.sort(key=lambda record: record.timestamp)
+        return iter(snapshot)
+
+    def clients(self) -> list:
+        with self._lock:
+            return list(self._per_client)
+
+    def __len__(self) -> int:
+        with self._lock:
+            return self._count
+
+
+class SegmentFileStore(MessageStore):
+    """
+    append only log on disk, every record is a json line, files: <directory>/000001.segment, 000002.segment ...
+    the last segment is the active one (appended), when it reaches segment_size a new segment is opened.
+    when there are more than max_segments segments, all the closed segments are compacted into one
+    (only the newest max_per_client records of every client are kept), if it doesn't help - the oldest records are dropped too.
+    """
+    def __init__(self, directory, segment_size: int = DEFAULT_SEGMENT_SIZE, max_segments: int = DEFAULT_MAX_SEGMENTS,
+                 max_per_client: int = DEFAULT_MAX_PER_CLIENT):
+        self.directory: Final[Path] = Path(directory)
+        self.segment_size: Final[int] = segment_size
+        self.max_segments: Final[int] = max(2, max_segments)
+        self.max_per_client: Final[int] = max_per_client
+        self.directory.mkdir(parents=True, exist_ok=True)
+        self._lock = threading.Lock()
+        self._count = 0
+        self._clients = set()
+        for record in self._read(self._segments()): # existing segments of a previous run
+            self._count += 1
+            self._clients.add(record.client)
+        existing = self._segments()
+        self._active_number = int(existing[-1].stem) + 1 if existing else 1
+        self._active = self._open_segment(self._active_number)
+
+    def _segments(self) -> list:
+        return sorted(self.directory.glob(f"*{SEGMENT_SUFFIX}"))
+
+    def _open_segment(self, number: int):
+        return open(self.directory / f"{number:06d}{SEGMENT_SUFFIX}", "a", encoding="utf-8")
+
+    @staticmethod
+    def _read(segments) -> Iterator[MessageRecord]:
+        for segment in segments:
+            with open(segment, encoding="utf-8") as segment_file:
+                for line in segment_file:
+                    yield MessageRecord.from_list(json.loads(line))
+
+    def add(self, record: MessageRecord) -> None:
+        line = json.dumps(record.to_list()) + "\n"
+        with self._lock:
+            self._active.write(line)
+            self._count += 1
+            self._clients.add(record.client)
+            if self._active.tell() >= self.segment_size:
+                self._rollover()
+
+    def _rollover(self):
+        self._active.close()
+        self._active_number += 1
+        self._active = self._open_segment(self._active_number)
+        if len(self._segments()) > self.max_segments:
+            self._compact()
+
+    def _compact(self):
+        segments = self._segments()
+        closed = segments[:-1]
+        # newest max_per_client records of every client, counted over all the segments (the active one too)
+        per_client_total = collections.Counter(record.client for record in self._read(segments))
+        seen = collections.Counter()
+        kept_sizes = [] # size of every kept line, in order
+        for record in self._read(closed):
+            seen[record.client] += 1
+            if per_client_total[record.client] - seen[record.client] < self.max_per_client:
+                kept_sizes.append(len(json.dumps(record.to_list()).encode()) + 1)
+        # too many clients, all under their cap - compaction alone doesn't fit the disk budget, the oldest records are dropped too
+        budget = self.segment_size * max(1, self.max_segments - 2)
+        skip, size = 0, sum(kept_sizes)
+        while size > budget:
+            size -= kept_sizes[skip]
+            skip += 1
+        seen.clear()
+        kept = 0
+        compacted_path = self.directory / f"compacting{SEGMENT_SUFFIX}.tmp"
+        with open(compacted_path, "w", encoding="utf-8") as compacted:
+            for record in self._read(closed):
+                seen[record.client] += 1
+                if per_client_total[record.client] - seen[record.client] < self.max_per_client:
+                    kept += 1
+                    if kept > skip:
+                        compacted.write(json.dumps(record.to_list()) + "\n")
+        dropped = sum(seen.values()) - (kept - skip)
+        for segment in closed:
+            segment.unlink()
+        os.replace(compacted_path, closed[0]) # keeps the number of the oldest segment, so the order stays the same
+        self._count -= dropped
+        self._clients = {record.client for record in self._read(self._segments())}
+
+    def records(self, client = None) -> Iterator[MessageRecord]:
+        with self._lock:
+            if not self._active.closed:
+                self._active.flush()
+            segments = self._segments()
+        for record in self._read(segments):
+            if client is None or record.client == client:
+                yield record
+
+    def clients(self) -> list:
+        with self._lock:
+            return list(self._clients)
+
+    def __len__(self) -> int:
+        with self._lock:
+            return self._count
+
+    def close(self) -> None:
+        with self._lock:
+            self._active.close()
+
+
+class SQLiteStore(MessageStore):
+    """
+    table messages(client, message_index, message, response, timestamp), indexes for per client and time range queries.
+    a commit per message costs an fsync (a few hundred messages per second at most), so add() only puts the record on a queue
+    and a writer thread inserts them in batches: a transaction per batch_size records or per batch_interval seconds, the earlier.
+    WAL journal - the readers (reports, queries) don't block the writer.
+    """
+    _FLUSH = object() # queue marker, put as (_FLUSH, event): the writer commits what it has and sets the event
+
+    def __init__(self, path, batch_size: int = DEFAULT_BATCH_SIZE, batch_interval: float = DEFAULT_BATCH_INTERVAL):
+        self.path: Final[Path] = Path(path)
+        self.batch_size: Final[int] = batch_size
+        self.batch_interval: Final[float] = batch_interval
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        connection = self._connect()
+        connection.executescript("""
+            CREATE TABLE IF NOT EXISTS messages (
+                client TEXT NOT NULL,
+                message_index INTEGER NOT NULL,
+                message TEXT,
+                response TEXT,
+                timestamp REAL NOT NULL
+            );
+            CREATE INDEX IF NOT EXISTS messages_by_client ON messages (client, timestamp);
+            CREATE INDEX IF NOT EXISTS messages_by_time ON messages (timestamp);
+        """)
+        self._count = connection.execute("SELECT COUNT(*) FROM messages").fetchone()[0]
+        self._lock = threading.Lock()
+        self._queue = queue.SimpleQueue()
+        self._writer = threading.Thread(target=self._write_batches, args=(connection,), name="SQLiteWriter", daemon=True)
+        self._writer.start()
+
+    def _connect(self) -> sqlite3.Connection:
+        connection = sqlite3.connect(self.path, check_same_thread=False)
+        connection.execute("PRAGMA journal_mode=WAL")
+        connection.execute("PRAGMA synchronous=NORMAL") # WAL + NORMAL: fsync per checkpoint, not per commit
+        return connection
+
+    @staticmethod
+    def _row(record: MessageRecord) -> tuple:
+        return json.dumps(record.client), record.index, record.message, record.response, record.timestamp
+
+    def _write_batches(self, connection: sqlite3.Connection):
+        # writer thread: the only one that writes to the database
+        running = True
+        while running:
+            item = self._queue.get()
+            batch, flushed = [], []
+            deadline = time.monotonic() + self.batch_interval
+            while True:
+                if item is None:
+                    running = False
+                    break
+                if isinstance(item, tuple) and item[0] is self._FLUSH:
+                    flushed.append(item[1])
+                    break
+                batch.append(self._row(item))
+                if len(batch) >= self.batch_size:
+                    break
+                left = deadline - time.monotonic()
+                try:
+                    item = self._queue.get(timeout=left) if left > 0 else self._queue.get_nowait()
+                except queue.Empty:
+                    break
+            if batch:
+                with connection: # single transaction for the whole batch
+                    connection.executemany("INSERT INTO messages VALUES (?, ?, ?, ?, ?)", batch)
+            for event in flushed:
+                event.set()
+        connection.close()
+
+    def add(self, record: MessageRecord) -> None:
+        with self._lock:
+            self._count += 1
+        self._queue.put(record)
+
+    def flush(self) -> None:
+        """
+        waits until all the records that were added so far are committed
+        """
+        if self._writer.is_alive():
+            event = threading.Event()
+            self._queue.put((self._FLUSH, event)) # a single put: records / flushes of other threads can't get between the two
+            event.wait()
+
+    def _query(self, sql: str, parameters: tuple = ()) -> Iterator[MessageRecord]:
+        self.flush()
+        connection = sqlite3.connect(self.path) # own connection per reader, WAL lets it read while the writer writes
+        try:
+            for client, index, message, response, timestamp in connection.execute(sql, parameters):
+                yield MessageRecord.from_list([json.loads(client), index, message, response, timestamp])
+        finally:
+            connection.close()
+
+    def records(self, client = None) -> Iterator[MessageRecord]:
+        if client is None:
+            return self._query("SELECT * FROM messages ORDER BY timestamp")
+        return self._query("SELECT * FROM messages WHERE client = ? ORDER BY timestamp", (json.dumps(client),))
+
+    def records_between(self, since: float, until: float, client = None) -> Iterator[MessageRecord]:
+        """
+        :param since: timestamp (time.time()), included
+        :param until: timestamp, excluded
+        :param client: only the records of this client, None - all the records
+        """
+        if client is None:
+            return self._query("SELECT * FROM messages WHERE timestamp >= ? AND timestamp < ? ORDER BY timestamp",
+                               (since, until))
+        return self._query("SELECT * FROM messages WHERE client = ? AND timestamp >= ? AND timestamp < ? ORDER BY timestamp",
+                           (json.dumps(client), since, until))
+
+    def clients(self) -> list:
+        self.flush()
+        connection = sqlite3.connect(self.path)
+        try:
+            return [MessageRecord.from_list([json.loads(client), 0, None, None, 0]).client # list -> tuple, same as in the records
+                    for client, in connection.execute("SELECT DISTINCT client FROM messages")]
+        finally:
+            connection.close()
+
+    def __len__(self) -> int:
+        with self._lock:
+            return self._count
+
+    def close(self) -> None:
+        if self._writer.is_alive():
+            self._queue.put(None) # writer commits what is left and stops
+            self._writer.join()
+
+
+def create_store(config: dict) -> MessageStore:
+    """
+    :param config: 'server' / 'client' section of the config file, keys:
+        message_store: memory | segments | sqlite | none
+        message_store_max_per_client, message_store_max_total, message_store_dir, message_store_segment_size, message_store_max_segments,
+        message_store_db, message_store_batch_size, message_store_batch_interval
+    """
+    backend = config.get("message_store", "memory")
+    max_per_client = config.get("message_store_max_per_client", DEFAULT_MAX_PER_CLIENT)
+    if backend == "memory":
+        return MemoryStore(max_per_client, config.get("message_store_max_total", DEFAULT_MAX_TOTAL))
+    if backend == "segments":
+        return SegmentFileStore(config.get("message_store_dir", "data/messages"),
+                                config.get("message_store_segment_size", DEFAULT_SEGMENT_SIZE),
+                                config.get("message_store_max_segments", DEFAULT_MAX_SEGMENTS),
+                                max_per_client)
+    if backend == "sqlite":
+        return SQLiteStore(config.get("message_store_db", "data/messages.db"),
+                           config.get("message_store_batch_size", DEFAULT_BATCH_SIZE),
+                           config.get("message_store_batch_interval", DEFAULT_BATCH_INTERVAL))
+    if backend == "none":
+        return NullStore()
+    raise ValueError(f"unknown message store: {backend}, expected: memory | segments | sqlite | none")
@@ -0,0 +1,389 @@
+import bisect
+import http.server
+import json
+import math
+import threading
+import time
+from typing import Final # makes my types be final without ability to change their type
+
+from src.log import get_logger
+
+# default upper bounds (in seconds) of the histogram buckets: 0.5ms ... 10sec, last bucket (+inf) catches the rest
+LATENCY_BUCKETS: Final[tuple] = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+
+class Histogram:
+    """
+    fixed buckets histogram, cheap to update: one bisect + one counter increment, no list of all the samples is kept
+    """
+    def __init__(self, name: str, buckets: tuple = LATENCY_BUCKETS):
+        self.name: Final[str] = name
+        self.buckets: Final[tuple] = tuple(sorted(buckets))
+        self.counts = [0] * (len(self.buckets) + 1) # +1 for the +inf bucket
+        self.count = 0
+        self.sum = 0.0
+        self._lock = threading.Lock()
+
+    def observe(self, value: float) -> None:
+        index = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            self.counts[index] += 1
+            self.count += 1
+            self.sum += value
+
+    def _read(self) -> tuple:
+        """
+        :return: (counts per bucket, count, sum) - a consistent copy
+        """
+        with self._lock:
+            return list(self.counts), self.count, self.sum
+
+    def percentile(self, percent: float) -> float:
+        """
+        :param percent: 0..100
+        :return: upper bound of the bucket that holds the requested percentile (inf if it is in the last bucket, 0 if empty)
+        """
+        counts, count, _ = self._read()
+        if not count:
+            return 0.0
+        rank = count * percent / 100
+        accumulated = 0
+        for index, bucket_count in enumerate(counts):
+            accumulated += bucket_count
+            if accumulated >= rank and bucket_count:
+                return self.buckets[index] if index < len(self.buckets) else float("inf")
+        return float("inf")
+
+    def snapshot(self) -> dict:
+        counts, count, total = self._read()
+        return {"count": count,
+                "sum": total,
+                "buckets": dict(zip(self.buckets + (float("inf"),), counts))}
+
+    def __str__(self) -> str:
+        _, count, total = self._read()
+        if not count:
+            return f"{self.name}: no samples"
+        return (f"{self.name}: count: {count}, avg: {total / count * 1000:.2f}ms, "
+                f"p50 <= {self.percentile(50) * 1000:g}ms, p99 <= {self.percentile(99) * 1000:g}ms")
+
+
+class LocalHistogram(Histogram):
+    """
+    histogram for the hot path: every thread observes into its own buckets without a lock (only the thread itself writes them),
+    a read (percentile, snapshot) adds up the buckets of all the threads - reads are rare, observes are per message
+    """
+    def __init__(self, name: str, buckets: tuple = LATENCY_BUCKETS):
+        self.name: Final[str] = name
+        self.buckets: Final[tuple] = tuple(sorted(buckets))
+        self._cells = []             # [counts, count, sum] of every thread that ever observed
+        self._local = threading.local()
+        self._lock = threading.Lock() # taken only when a thread observes for the first time, and by the reads
+
+    def _cell(self) -> list:
+        try:
+            return self._local.cell
+        except AttributeError:
+            cell = self._local.cell = [[0] * (len(self.buckets) + 1), 0, 0.0]
+            with self._lock:
+                self._cells.append(cell)
+            return cell
+
+    def observe(self, value: float) -> None:
+        cell = self._cell()
+        cell[0][bisect.bisect_left(self.buckets, value)] += 1
+        cell[1] += 1
+        cell[2] += value
+
+    def _read(self) -> tuple:
+        with self._lock:
+            cells = list(self._cells)
+        counts = [0] * (len(self.buckets) + 1)
+        count, total = 0, 0.0
+        for cell_counts, cell_count, cell_sum in cells:
+            for index, bucket_count in enumerate(cell_counts):
+                counts[index] += bucket_count
+            count += cell_count
+            total += cell_sum
+        return counts, count, total
+
+    @property
+    def count(self) -> int:
+        return self._read()[1]
+
+    @property
+    def sum(self) -> float:
+        return self._read()[2]
+
+
+class Counter:
+    """
+    thread safe counter
+    """
+    def __init__(self, name: str):
+        self.name: Final[str] = name
+        self.value = 0
+        self._lock = threading.Lock()
+
+    def inc(self, amount: int = 1) -> None:
+        with self._lock:
+            self.value += amount
+
+    def __str__(self) -> str:
+        return f"{self.name}: {self.value}"
+
+
+class LocalCounter:
+    """
+    counter for the hot path: every thread increments its own cell without a lock (only the thread itself writes it),
+    value adds up the cells of all the threads. threads that finished keep their cell, nothing they counted is lost
+    """
+    def __init__(self, name: str):
+        self.name: Final[str] = name
+        self._cells = []
+        self._local = threading.local()
+        self._lock = threading.Lock() # taken only when a thread increments for the first time, and by value
+
+    def inc(self, amount = 1) -> None:
+        try:
+            cell = self._local.cell
+        except AttributeError:
+            cell = self._local.cell = [0]
+            with self._lock:
+                self._cells.append(cell)
+        cell[0] += amount
+
+    @property
+    def value(self):
+        with self._lock:
+            cells = list(self._cells)
+        return sum(cell[0] for cell in cells)
+
+    def __str__(self) -> str:
+        return f"{self.name}: {self.value}"
+
+
+class Gauge:
+    """
+    thread safe value that goes up and down (queue depth, ...), remembers the highest value it ever had (peak)
+    """
+    def __init__(self, name: str):
+        self.name: Final[str] = name
+        self.value = 0
+        self.peak = 0
+        self._lock = threading.Lock()
+
+    def inc(self, amount: int = 1) -> int:
+        with self._lock:
+            self.value += amount
+            if self.value > self.peak:
+                self.peak = self.value
+            return self.value
+
+    def dec(self, amount: int = 1) -> int:
+        with self._lock:
+            self.value -= amount
+            return self.value
+
+    def __str__(self) -> str:
+        return f"{self.name}: {self.value} (peak: {self.peak})"
+
+
+class Rate:
+    """
+    per second rate of a counter, computed when it is read (nothing is added to the hot path):
+    the rate over the time since the previous read, recalculated at most once per window
+    """
+    def __init__(self, counter, window: float = 1.0):
+        self.counter = counter
+        self.window: Final[float] = window
+        self._start = (time.monotonic(), counter.value) # start of the current window: (time, counter value)
+        self._rate = 0.0
+        self._lock = threading.Lock()
+
+    @property
+    def value(self) -> float:
+        with self._lock:
+            now, value = time.monotonic(), self.counter.value
+            start, start_value = self._start
+            if now - start >= self.window:
+                self._rate = (value - start_value) / (now - start)
+                self._start = (now, value)
+            return self._rate
+
+
+############################################################################################
+# PROMETHEUS EXPOSITION:
+# MetricsRegistry gives the metrics of a server their exported names, render() returns them in the Prometheus text format:
+#   # HELP csa_received_messages_total messages received from the clients
+#   # TYPE csa_received_messages_total counter
+#   csa_received_messages_total 1234
+# counters get the suffix _total, histograms are exported as cumulative buckets (_bucket{le="..."}) + _sum + _count.
+# a metric is anything with .value (Counter, LocalCounter, Gauge, Rate), a Histogram / LocalHistogram, or a function -> number.
+#
+# MetricsHTTPServer serves it on a local port (a thread of its own, never touches the event loop):
+#   GET /metrics - Prometheus text
+#   GET /stats   - JSON of the stats function (Server.stats())
+############################################################################################
+
+NAMESPACE: Final[str] = "csa"
+COUNTER: Final[str] = "counter"
+GAUGE: Final[str] = "gauge"
+HISTOGRAM: Final[str] = "histogram"
+CONTENT_TYPE: Final[str] = "text/plain; version=0.0.4; charset=utf-8"
+
+
+def _format_value(value) -> str:
+    if isinstance(value, float):
+        if math.isinf(value):
+            return "+Inf" if value > 0 else "-Inf"
+        return repr(value)
+    return str(int(value))
+
+
+def _format_labels(labels: dict) -> str:
+    if not labels:
+        return ""
+    escaped = (str(value).replace("\\", "\\\\").replace("\"", "\\\"").replace("\n", "\\n") for value in labels.values())
+    return "{" + ",".join(f'{name}="{value}"' for name, value in zip(labels, escaped)) + "}"
+
+
+class MetricsRegistry:
+
+    def __init__(self, namespace: str = NAMESPACE):
+        """
+        :param namespace: prefix of all the exported names
+        """
+        self.namespace: Final[str] = namespace
+        self._families = {} # key is exported name, value is (type, help, function -> list of (labels, metric))
+        self._series = {}   # key is exported name, value is list of (labels, metric) of the metrics added by register()
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def _type_of(metric) -> str:
+        if isinstance(metric, Histogram):
+            return HISTOGRAM
+        if isinstance(metric, (Counter, LocalCounter)):
+            return COUNTER
+        return GAUGE
+
+    def _full_name(self, name: str, metric_type: str) -> str:
+        full_name = f"{self.namespace}_{name}" + ("_total" if metric_type == COUNTER else "")
+        family = self._families.get(full_name)
+        if family is not None and family[0] != metric_type:
+            raise ValueError(f"metric: '{full_name}' is already registered as a {family[0]}")
+        return full_name
+
+    def register(self, name: str, metric, help_text: str = "", labels: dict = None, metric_type: str = None):
+        """
+        :param name: exported name without the namespace (and without _total)
+        :param metric: Counter / LocalCounter / Gauge / Rate / Histogram / LocalHistogram, or a function -> number
+        :param labels: labels of this metric, register the same name with other labels to add more of its series
+        :param metric_type: COUNTER | GAUGE | HISTOGRAM, None -> by the class of the metric (a function is a gauge)
+        :return: the metric
+        """
+        metric_type = metric_type or self._type_of(metric)
+        with self._lock:
+            full_name = self._full_name(name, metric_type)
+            series = self._series.get(full_name)
+            if series is None:
+                series = self._series[full_name] = []
+                self._families[full_name] = (metric_type, help_text, series.copy)
+            series.append((labels or {}, metric))
+        return metric
+
+    def register_family(self, name: str, metric_type: str, help_text: str, collect) -> None:
+        """
+        series that change while the server runs (for example: a histogram per handler)
+        :param collect: function -> list of (labels, metric), called on every render
+        """
+        with self._lock:
+            self._families[self._full_name(name, metric_type)] = (metric_type, help_text, collect)
+
+    @staticmethod
+    def _read(metric):
+        return metric() if callable(metric) else metric.value
+
+    def _render_histogram(self, lines: list, full_name: str, labels: dict, histogram: Histogram) -> None:
+        counts, count, total = histogram._read()
+        accumulated = 0
+        for upper_bound, bucket_count in zip(histogram.buckets + (float("inf"),), counts):
+            accumulated += bucket_count
+            lines.append(f"{full_name}_bucket{_format_labels(dict(labels, le=_format_value(float(upper_bound))))} {accumulated}")
+        lines.append(f"{full_name}_sum{_format_labels(labels)} {_format_value(float(total))}")
+        lines.append(f"{full_name}_count{_format_labels(labels)} {count}")
+
+    def render(self) -> str:
+        """
+        :return: all the metrics in the Prometheus text exposition format (version 0.0.4)
+        """
+        with self._lock:
+            families = sorted(self._families.items())
+        lines = []
+        for full_name, (metric_type, help_text, collect) in families:
+            lines.append(f"# HELP {full_name} {help_text}")
+            lines.append(f"# TYPE {full_name} {metric_type}")
+            for labels, metric in collect():
+                if metric_type == HISTOGRAM:
+                    self._render_histogram(lines, full_name, labels, metric)
+                else:
+                    lines.append(f"{full_name}{_format_labels(labels)} {_format_value(self._read(metric))}")
+        return "\n".join(lines) + "\n"
+
+
+class MetricsHTTPServer:
+    """
+    local HTTP endpoint of a MetricsRegistry: GET /metrics (Prometheus text), GET /stats (JSON), each request on a thread of its own
+    """
+    def __init__(self, registry: MetricsRegistry, ip: str = "127.0.0.1", port: int = 0, stats = None, app: str = "METRICS"):
+        """
+        :param port: 0 - any free port (see .port after start())
+        :param stats: function -> dict, served as JSON on /stats, None -> /stats is not found
+        """
+        self.log = get_logger(app)
+        self.registry = registry
+        self.stats = stats
+        self.address = (ip, port)
+        self.port = None
+        self._http_server = None
+
+    def _handler_class(self):
+        metrics_server = self
+
+        class _Handler(http.server.BaseHTTPRequestHandler):
+            def do_GET(self):
+                path = self.path.split("?", 1)[0]
+                if path == "/metrics":
+                    body, content_type = metrics_server.registry.render().encode(), CONTENT_TYPE
+                elif path == "/stats" and metrics_server.stats is not None:
+                    body, content_type = json.dumps(metrics_server.stats(), default=str).encode(), "application/json"
+                else:
+                    self.send_error(404)
+                    return
+                self.send_response(200)
+                self.send_header("Content-Type", content_type)
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, format, *args): # default prints every request to stderr
+                metrics_server.log.debug("%s - " + format, self.address_string(), *args)
+
+        return _Handler
+
+    def start(self) -> int:
+        """
+        :return: the port it listens on
+        """
+        self._http_server = http.server.ThreadingHTTPServer(self.address, self._handler_class())
+        self._http_server.daemon_threads = True
+        self.port = self._http_server.server_address[1]
+        threading.Thread(target=self._http_server.serve_forever, name="metrics_http", daemon=True).start()
+        self.log.info(f"metrics endpoint: http://{self.address[0]}:{self.port}/metrics")
+        return self.port
+
+    def close(self) -> None:
+        if self._http_server:
+            self._http_server.shutdown()
+            self._http_server.server_close()
+            self._http_server = None
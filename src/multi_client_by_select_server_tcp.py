@@ -1,26 +1,61 @@
 import os
 import threading
-from pathlib import Path
+import time
 import queue
 import socket
-import yaml
 from typing import Final # makes my types be final without ability to change their type
 import ssl
-from colorama import Fore, Style, init # for printing in colors
 
+from src.config_resolver import find_file, load_config, SERVER_CONFIG_FILE, CERT_FILE, KEY_FILE
+from src import tls_contexts
 # required for multi client
-import select
-
-colors_dict = {0: Fore.YELLOW,
-               1: Fore.CYAN,
-               2: Fore.RED,
-               3: Fore.BLUE,
-               4: Fore.GREEN,
-               5: Fore.MAGENTA,
-               6: Fore.LIGHTRED_EX,
-               7: Fore.LIGHTBLUE_EX,
-               8: Fore.LIGHTCYAN_EX,
-               9: Fore.LIGHTGREEN_EX}
+from src.event_loop import EventLoop, EVENT_READ, EVENT_WRITE
+from src.framing import FrameBuffer, FrameError, encode_frame
+from src.metrics import COUNTER, HISTOGRAM, Counter, Gauge, Histogram, LocalCounter, LocalHistogram, MetricsHTTPServer, MetricsRegistry, Rate
+from src.log import get_logger, setup_logging
+from src.message_store import MessageRecord, MemoryStore, create_store
+from src.handlers import HandlerRegistry, Request
+from src.codec import CODECS, CodecError, alpn_protocols, is_disconnect, negotiated_codec, negotiated_compression, printable
+from src.compression import DEFAULT_LEVEL, DEFAULT_THRESHOLD, CompressionError, create as create_compression
+from src.timer_wheel import TimerWheel
+from src.streaming import (STREAM_ABORT, STREAM_DATA, STREAM_END, STREAM_OPEN, DEFAULT_WINDOW, KIND_SIZE, IncomingStream, StreamError,
+                           abort_frame, credit_frame, parse_open, stream_kind)
+from src.channels import CHANNEL_OPEN, CHANNEL_SHIFT, MAX_CHANNELS, channel_argument, channel_kind, close_channel_frame
+
+FD_HASH_MULTIPLIER: Final[int] = 2654435761 # 2^32 / golden ratio, see _assign_worker
+WRITE_CHUNK_SIZE: Final[int] = 64 * 1024     # max bytes per send() call, SSL cuts them into records of 16KB
+
+
+class OutputBuffer:
+    """
+    responses of a client that were not sent yet, double buffered:
+    working thread appends to 'pending' (under Server.output_lock), event loop sends from 'sending' without any lock,
+    when 'sending' is all sent the two are swapped - so everything the working thread added meanwhile goes out in a single send()
+    """
+    __slots__ = ("pending", "sending", "offset", "pending_since", "sending_since")
+
+    def __init__(self):
+        self.pending = bytearray()
+        self.sending = bytearray()
+        self.offset = 0 # bytes of 'sending' that were already sent
+        self.pending_since = 0.0 # time the oldest response of 'pending' was buffered
+        self.sending_since = 0.0 # same for 'sending' (send latency is measured from it)
+
+    def __len__(self) -> int:
+        return len(self.pending) + len(self.sending) - self.offset
+
+
+class RequestDeadline:
+    """
+    deadline of a queued message (request_timeout): if it is not answered by then, the event loop answers it with an error
+    and the response of the handler (when it is done) is dropped. both sides decide under Server.output_lock
+    """
+    __slots__ = ("timer", "expired")
+
+    def __init__(self):
+        self.timer = None
+        self.expired = False
+
 
 class Server:
     ############################################################################################
@@ -32,91 +67,293 @@ class Server:
     # recv (blocking wait for Client data) -> return answer
     ############################################################################################
 
-    def __init__(self):
-        self.app: Final[str] = "SERVER"
+    def __init__(self, config_path = None, cert_path = None, key_path = None, worker_index: int = None, stats_queue = None):
+        """
+        :param config_path: explicit path of server_config.yaml, None -> searched (see config_resolver)
+        :param cert_path: explicit path of the certificate, None -> searched (see config_resolver)
+        :param key_path: explicit path of the private key, None -> searched (see config_resolver)
+        :param worker_index: set when the server runs as one of the processes of multi_process_server.Supervisor:
+                             the port is bound with SO_REUSEPORT (shared with the other processes) and the server doesn't finish
+                             when its last client disconnects (the supervisor stops it)
+        :param stats_queue: multiprocessing queue, (worker_index, stats()) is put on it every STATS_INTERVAL seconds
+        """
+        self.worker_index = worker_index
+        self.stats_queue = stats_queue
+        self.app: Final[str] = "SERVER" if worker_index is None else f"SERVER_{worker_index}"
+        self.log = get_logger(self.app)
+        self.config_path = config_path
+        self.cert_path = cert_path
+        self.key_path = key_path
         self.IP: str = None
         self.PORT: str= None
         self.MAX_CONNECTIONS: int = 1
         self.NUMBER_WORKING_THREADS = 0
         self.server_socket = None
-        self.all_clients_messages_queue = queue.Queue() # this Q was created in context of the Server obj, therefore will leave also after thread will finish
-        self.monitored_client_sockets_list = []
-        self.monitored_bad_client_sockets_list = []
+        self.EVENT_LOOP_BACKEND: str = "auto"
+        self.HANDSHAKE_TIMEOUT: float = 10
+        self.IDLE_TIMEOUT: float = 0     # seconds without data from a client (and nothing of it in process) -> disconnected, 0 - never
+        self.REQUEST_TIMEOUT: float = 0  # seconds a message may wait for + spend in its handler, then it is answered with an error, 0 - no deadline
+        # all the timeouts are timers of a single wheel (see timer_wheel) - nothing scans the sockets to find the expired ones
+        self.timers = TimerWheel()
+        self.client_timers = {}    # key is client socket obj, value is its handshake timer (while handshaking) / idle timer
+        self.client_activity = {}  # key is client socket obj, value is the tick of the wheel when data arrived from it last time
+        self.finished = False      # set by a timer that disconnected the last client
+        self.TLS_NUM_TICKETS: int = tls_contexts.DEFAULT_NUM_TICKETS
+        self.ssl_context = None
+        self.MAX_QUEUED_MESSAGES: int = 10000          # high watermark of all the clients together
+        self.MAX_QUEUED_MESSAGES_PER_CLIENT: int = 100 # high watermark of a single client
+        self.QUEUE_LOW_WATERMARK: float = 0.5          # reading is resumed when the queue drains to this part of the high watermark
+        # queue per working thread, created with the threads. these Qs were created in context of the Server obj, therefore will leave also after thread will finish
+        self.worker_queues = []
+        self.client_workers = {}       # key is client socket obj, value is index of the working thread (and its queue) that handles all its messages
+        self.event_loop = None # all monitored sockets (server socket + client sockets) are registered here
         self.all_clients = {}
-        self.received_messages_store = {}
-
-    def _init_colors(self):
-        init() # Initialize colorama (needed for Windows)
+        self.client_frame_buffers = {} # key is client socket obj, value is the bytes received from this client that are not a whole message yet
+        self.client_codecs = {}        # key is client socket obj, value is the codec negotiated in its TLS handshake (see codec)
+        self.CODECS: list = list(CODECS) # codecs the clients can choose, in order of preference
+        self.client_compressions = {}  # key is client socket obj, value is its Compression (only clients that negotiated compression)
+        self.COMPRESSION_THRESHOLD: int = DEFAULT_THRESHOLD # responses shorter than this are not compressed
+        self.COMPRESSION_LEVEL: int = DEFAULT_LEVEL
+        # write path: working threads never touch the client socket (SSL object is not thread safe + a client that doesn't read
+        # would block the thread in sendall forever), they append the response to the output buffer of the client,
+        # the event loop sends it when the socket is writable
+        self.client_outputs = {}       # key is client socket obj, value is its OutputBuffer
+        self.client_events = {}        # key is client socket obj, value is the events it is monitored for now (0 - not monitored)
+        self.output_lock = threading.Lock()
+        self.pending_writes = set()    # client sockets that got new responses since the event loop looked last time
+        self.slow_consumers = set()    # client sockets whose output buffer is full, closed by the event loop
+        self.MAX_OUTPUT_BUFFER: int = 1024 * 1024
+        self.SLOW_CONSUMER_ACTION: str = "disconnect"
+        # counters that are updated per message / per write are thread local (see metrics.LocalCounter), no lock on the hot path
+        self.writes = LocalCounter("writes")
+        self.written_bytes = LocalCounter("written bytes")
+        self.buffered_responses = LocalCounter("buffered responses")
+        self.send_latency = LocalHistogram("send latency") # response buffered by a working thread -> its last byte handed to the OS
+        self.compression_input_bytes = LocalCounter("compression input bytes")   # responses of compressed connections, before ...
+        self.compression_output_bytes = LocalCounter("compression output bytes") # ... and after compression
+        self.dropped_responses = Counter("dropped responses")
+        self.slow_consumer_disconnects = Counter("slow consumer disconnects")
+        self.handshaking_clients = {}  # key is client socket obj that is in the middle of TLS handshake, value is (client address, handshake start time)
+        self.handshake_latency = Histogram("TLS handshake latency")
+        self.handshake_failures = 0
+        self.full_handshakes = Counter("full TLS handshakes")
+        self.resumed_handshakes = Counter("resumed TLS handshakes")
+        self.handshake_timeouts = 0
+        self.idle_disconnects = 0
+        self.request_timeouts = Counter("request timeouts")
+        self.late_responses = Counter("late responses")  # handler finished after the deadline, its response was dropped
+        self.received_messages_store = MemoryStore() # replaced by the configured store (see message_store) in _init
+        self.handlers = HandlerRegistry() # builds the responses, handlers of the config are added in _init (see handlers)
+        # backpressure: messages that were queued but not answered yet, per client and in total.
+        # a client that reached its high watermark (or all the clients together reached theirs) is not read anymore,
+        # its socket is not monitored for read anymore -> OS receive buffer fills up -> TCP flow control stops the client.
+        # its reading is resumed when the working threads drained the queue to the low watermark
+        self.client_queued_messages = {} # key is client socket obj, value is amount of its messages in the queue (or in process)
+        self.queued_messages_lock = threading.Lock()
+        self.queued_messages = Gauge("queued messages")
+        self.paused_clients = set()      # client sockets that are not read because of backpressure
+        self.read_pauses = Counter("read pauses")
+        self.wakeup_reader, self.wakeup_writer = None, None # working threads wake up the event loop (to resume reading) through this pair
+        self.wakeup_pending = False
+        self.REUSE_PORT: bool = worker_index is not None      # several processes accept on the same port, the kernel spreads the connections
+        self.EXIT_WHEN_IDLE: bool = worker_index is None      # server finishes when its last client disconnected
+        self.STATS_INTERVAL: float = 1                        # seconds, how often the stats are put on the stats_queue
+        self.last_stats_time = 0
+        self.connections_accepted = LocalCounter("accepted connections")
+        self.connections_closed = LocalCounter("closed connections")
+        self.received_bytes = LocalCounter("received bytes")
+        self.received_messages = LocalCounter("received messages")
+        self.messages_rate = Rate(self.received_messages)
+        self.worker_busy = []            # LocalCounter per working thread: seconds it spent on messages (not waiting on its queue)
+        # streams (see streaming): big payloads in chunks, handled by the stream handlers on the thread pool of the handlers
+        self.client_streams = {}         # key is client socket obj, value is dict: stream id -> IncomingStream
+        self.STREAM_WINDOW: int = DEFAULT_WINDOW # bytes of a stream that can wait for its handler (credit of the client)
+        self.active_streams = Gauge("active streams")
+        self.streams_opened = Counter("opened streams")
+        self.streams_completed = Counter("completed streams")
+        self.streams_aborted = Counter("aborted streams")
+        self.stream_bytes = LocalCounter("stream bytes")
+        self.stream_buffered = Gauge("stream buffered bytes") # bytes of all the streams that wait for their handlers
+        # channels (see channels): logical conversations over one connection, every channel has a working thread of its own
+        self.client_channels = {}        # key is client socket obj, value is dict: channel -> (message type or None, index of its working thread)
+        self.MAX_CHANNELS_PER_CLIENT: int = 256
+        self.open_channels = Gauge("open channels")
+        self.channels_opened = Counter("opened channels")
+        self.channels_refused = Counter("refused channels")
+        # metrics endpoint: GET /metrics (Prometheus text) + GET /stats (JSON of stats()) on a local port, 0 - disabled
+        self.METRICS_IP: str = "127.0.0.1"
+        self.METRICS_PORT: int = 0
+        self.metrics = MetricsRegistry()
+        self.metrics_server = None
+        self._register_metrics()
 
-    def _find_full_file_path(self, my_path, my_file):
-        for dirpath, _, filenames in os.walk(my_path):  #
-            if my_file in filenames:
-                full_file_path = Path(str(os.path.join(dirpath, my_file)))  # Return full path if found
-                return full_file_path
-        return None  # Return None if not found
+    def _register_metrics(self):
+        register = self.metrics.register
+        register("connections_accepted", self.connections_accepted, "TCP connections accepted")
+        register("connections_closed", self.connections_closed, "client connections closed (also the ones that failed the TLS handshake)")
+        register("clients", lambda: len(self.all_clients), "connected clients (TLS handshake done)")
+        register("handshaking_clients", lambda: len(self.handshaking_clients), "clients in the middle of the TLS handshake")
+        register("handshake_seconds", self.handshake_latency, "TLS handshake time")
+        register("handshakes", self.full_handshakes, "TLS handshakes done", {"kind": "full"})
+        register("handshakes", self.resumed_handshakes, "TLS handshakes done", {"kind": "resumed"})
+        register("handshake_failures", lambda: self.handshake_failures, "failed TLS handshakes", metric_type=COUNTER)
+        register("handshake_timeouts", lambda: self.handshake_timeouts, "TLS handshakes that timed out", metric_type=COUNTER)
+        register("idle_disconnects", lambda: self.idle_disconnects, "clients disconnected because they were idle", metric_type=COUNTER)
+        register("request_timeouts", self.request_timeouts, "messages answered with an error because they missed their deadline")
+        register("late_responses", self.late_responses, "responses dropped because their message already missed its deadline")
+        register("timers", lambda: len(self.timers), "timers in the timer wheel")
+        register("received_bytes", self.received_bytes, "bytes received from the clients (after TLS)")
+        register("sent_bytes", self.written_bytes, "bytes sent to the clients (before TLS)")
+        register("received_messages", self.received_messages, "messages received from the clients")
+        register("messages_per_second", self.messages_rate, "messages received per second (since the previous read, at least 1 second)")
+        register("buffered_responses", self.buffered_responses, "responses buffered for sending")
+        register("writes", self.writes, "send() calls")
+        register("send_latency_seconds", self.send_latency, "response buffered by a working thread -> sent to the OS")
+        register("compression_input_bytes", self.compression_input_bytes, "bytes of the responses of compressed connections before compression")
+        register("compression_output_bytes", self.compression_output_bytes, "bytes of the responses of compressed connections after compression")
+        register("dropped_responses", self.dropped_responses, "responses dropped (slow consumer)")
+        register("slow_consumer_disconnects", self.slow_consumer_disconnects, "clients disconnected because they didn't read their responses")
+        register("queued_messages", self.queued_messages, "messages waiting for the working threads (or in process)")
+        register("paused_clients", lambda: len(self.paused_clients), "clients that are not read because of backpressure")
+        register("read_pauses", self.read_pauses, "times a client was paused because of backpressure")
+        self.metrics.register_family("handler_seconds", HISTOGRAM, "handler time, per message type",
+                                     lambda: [({"type": message_type}, handler.latency) for message_type, handler in self.handlers.handlers.items()])
+        self.metrics.register_family("handler_errors", COUNTER, "handlers that raised, per message type",
+                                     lambda: [({"type": message_type}, handler.errors) for message_type, handler in self.handlers.handlers.items()])
+        self.metrics.register_family("stream_handler_seconds", HISTOGRAM, "stream handler time (whole stream), per message type",
+                                     lambda: [({"type": message_type}, handler.latency) for message_type, handler in self.handlers.stream_handlers.items()])
+        register("active_streams", self.active_streams, "streams that are being received")
+        register("streams_opened", self.streams_opened, "streams opened by the clients")
+        register("streams_completed", self.streams_completed, "streams answered by their handler")
+        register("streams_aborted", self.streams_aborted, "streams whose handler stopped because the stream was aborted")
+        register("stream_bytes", self.stream_bytes, "data bytes received in streams")
+        register("stream_buffered_bytes", self.stream_buffered, "bytes of the streams that wait for their handlers")
+        register("open_channels", self.open_channels, "channels open on all the connections")
+        register("channels_opened", self.channels_opened, "channels opened by the clients")
+        register("channels_refused", self.channels_refused, "channels refused (limit per client / invalid)")
 
     def _init(self):
-        self._init_colors()
-        print(f"[{self.app}]: app is executed with the next parameters: ")
-
-        full_path_to_file = self._find_full_file_path(Path.cwd().parent,"server_config.yaml")
-        print(f"[{self.app}]: Loading configuration for the server from: {full_path_to_file}")
+        full_path_to_file = find_file(SERVER_CONFIG_FILE, self.config_path)
         if not full_path_to_file:
             raise FileExistsError
 
-        with open(full_path_to_file, "r") as yaml_file:
-            config = yaml.safe_load(yaml_file)
+        config = load_config(SERVER_CONFIG_FILE, self.config_path) # loaded once per process, reloaded only if the file was modified
+        # log_color: every working thread is printed in its own color, log_level: DEBUG prints also a line per message
+        setup_logging(config["server"].get("log_level"), config["server"].get("log_color", False))
+        self.log.info("app is executed with the next parameters: ")
+        self.log.info(f"Loaded configuration for the server from: {full_path_to_file}")
+        self.IP = config["server"]["ip_address"]  # also possible to do: socket.gethostbyname(socket.gethostname()) if not ip else ip  # <---- this way we determine the local host address, this way -> we set it hard codded: "127.0.0.1" if not ip else ip
+        self.log.info(f"IP: {self.IP}")
+
+        self.PORT = config["server"]["port"]  # also possible to do: 8820 if not port else port
+        self.log.info(f"PORT: {self.PORT}")
 
-            self.IP = config["server"]["ip_address"]  # also possible to do: socket.gethostbyname(socket.gethostname()) if not ip else ip  # <---- this way we determine the local host address, this way -> we set it hard codded: "127.0.0.1" if not ip else ip
-            print(f"[{self.app}]: IP: {self.IP}")
+        self.MAX_DATA_SIZE = config["server"]["max_data_size"]
+        self.log.info(f"Max data size: {self.MAX_DATA_SIZE}")
 
-            self.PORT = config["server"]["port"]  # also possible to do: 8820 if not port else port
-            print(f"[{self.app}]: PORT: {self.PORT}")
+        self.NUMBER_WORKING_THREADS = config["server"]["number_working_threads"]
+        self.log.info(f"Number working threads: {self.NUMBER_WORKING_THREADS}")
 
-            self.MAX_DATA_SIZE = config["server"]["max_data_size"]
-            print(f"[{self.app}]: Max data size: {self.MAX_DATA_SIZE}")
+        self.EVENT_LOOP_BACKEND = config["server"].get("event_loop_backend", "auto")
+        self.log.info(f"Event loop backend: {self.EVENT_LOOP_BACKEND}")
 
-            self.NUMBER_WORKING_THREADS = config["server"]["number_working_threads"]
-            print(f"[{self.app}]: Number working threads: {self.NUMBER_WORKING_THREADS}")
+        self.HANDSHAKE_TIMEOUT = config["server"].get("handshake_timeout", 10)
+        self.log.info(f"TLS handshake timeout: {self.HANDSHAKE_TIMEOUT}")
+
+        self.STREAM_WINDOW = config["server"].get("stream_window", DEFAULT_WINDOW)
+        self.log.info(f"Stream window: {self.STREAM_WINDOW} bytes")
+
+        self.MAX_CHANNELS_PER_CLIENT = min(config["server"].get("max_channels_per_client", 256), MAX_CHANNELS)
+        self.log.info(f"Max channels per client: {self.MAX_CHANNELS_PER_CLIENT}")
+
+        self.IDLE_TIMEOUT = config["server"].get("idle_timeout", 0)
+        self.REQUEST_TIMEOUT = config["server"].get("request_timeout", 0)
+        self.log.info(f"Idle timeout: {self.IDLE_TIMEOUT or 'none'}, request timeout: {self.REQUEST_TIMEOUT or 'none'}")
+
+        self.TLS_NUM_TICKETS = config["server"].get("tls_num_tickets", tls_contexts.DEFAULT_NUM_TICKETS)
+        self.log.info(f"TLS session tickets: {self.TLS_NUM_TICKETS}")
+
+        self.CODECS = config["server"].get("codecs", self.CODECS)
+        self.log.info(f"Codecs: {self.CODECS}")
+
+        self.COMPRESSION_THRESHOLD = config["server"].get("compression_threshold", DEFAULT_THRESHOLD)
+        self.COMPRESSION_LEVEL = config["server"].get("compression_level", DEFAULT_LEVEL)
+        self.log.info(f"Compression (clients that negotiated it): threshold: {self.COMPRESSION_THRESHOLD} bytes, level: {self.COMPRESSION_LEVEL}")
+
+        store_config = config["server"]
+        if self.worker_index is not None:
+            # processes don't share a store, every one gets its own segment directory / db file
+            store_config = dict(store_config)
+            store_config["message_store_dir"] = os.path.join(store_config.get("message_store_dir", "data/messages"), f"worker_{self.worker_index}")
+            db_root, db_ext = os.path.splitext(store_config.get("message_store_db", "data/messages.db"))
+            store_config["message_store_db"] = f"{db_root}_{self.worker_index}{db_ext}"
+        self.received_messages_store = create_store(store_config)
+        self.log.info(f"Message store: {type(self.received_messages_store).__name__}")
+
+        self.handlers.configure(config["server"])
+
+        self.MAX_QUEUED_MESSAGES = config["server"].get("max_queued_messages", 10000)
+        self.MAX_QUEUED_MESSAGES_PER_CLIENT = config["server"].get("max_queued_messages_per_client", 100)
+        self.QUEUE_LOW_WATERMARK = config["server"].get("queue_low_watermark", 0.5)
+        self.log.info(f"Max queued messages: {self.MAX_QUEUED_MESSAGES}, per client: {self.MAX_QUEUED_MESSAGES_PER_CLIENT}, "
+                      f"resumed at: {self.QUEUE_LOW_WATERMARK}")
+
+        self.MAX_OUTPUT_BUFFER = config["server"].get("max_output_buffer", 1024 * 1024)
+        self.SLOW_CONSUMER_ACTION = config["server"].get("slow_consumer_action", "disconnect")
+        if self.SLOW_CONSUMER_ACTION not in ("disconnect", "drop"):
+            raise ValueError(f"slow_consumer_action: '{self.SLOW_CONSUMER_ACTION}', expected: disconnect | drop")
+        self.log.info(f"Max output buffer: {self.MAX_OUTPUT_BUFFER} bytes per client, slow consumer: {self.SLOW_CONSUMER_ACTION}")
+
+        self.METRICS_IP = config["server"].get("metrics_ip_address", self.METRICS_IP)
+        self.METRICS_PORT = config["server"].get("metrics_port", 0)
+        if self.METRICS_PORT and self.worker_index is not None:
+            self.METRICS_PORT += self.worker_index # every worker process has its own endpoint: metrics_port, metrics_port + 1, ...
+        self.log.info(f"Metrics port: {self.METRICS_PORT or 'disabled'}")
 
     def _create_server_socket(self):
         # 1. Create a socket object
-        print(f"\n\n[{self.app}]: Creating the 'regular' TCP/IP socket ...")
+        self.log.info("Creating the 'regular' TCP/IP socket ...")
         self.server_socket = socket.socket(socket.AF_INET,
                                            socket.SOCK_STREAM)  # use protocol: TCP
 
         self.server_socket.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+        if self.REUSE_PORT:
+            # every process binds the same port, the kernel load balances the new connections between their listen queues
+            if not hasattr(socket, "SO_REUSEPORT"):
+                raise OSError("SO_REUSEPORT is not supported on this platform, run with number_worker_processes: 1")
+            self.server_socket.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEPORT, 1)
 
         # 2. prepare secure context - setting up all the rules for secure communication
         # It helps Python know how to handle encryption (TLS/SSL) for the server or client
         # ssl.Purpose.CLIENT_AUTH tells python - hi I am server, and i wish to communicate securely with client/s
-        print(f"[{self.app}]: Creating the secured SSL context (set of rules for secure connection) ...")
-        context = ssl.create_default_context(ssl.Purpose.CLIENT_AUTH)
+        self.log.info("Creating the secured SSL context (set of rules for secure connection) ...")
         # load certificate + key (certificate for authentication with Client, keys for encryption messages)
-        print(f"[{self.app}]: Load Authentication certificate and encryption keys, for secure connection ...")
+        self.log.info("Load Authentication certificate and encryption keys, for secure connection ...")
 
-        full_path_to_cert_file = self._find_full_file_path(Path.cwd().parent, "ilana_cert_01.pem")
-        full_path_to_key_file = self._find_full_file_path(Path.cwd().parent, "ilana_key_01.pem")
+        full_path_to_cert_file = find_file(CERT_FILE, self.cert_path)
+        full_path_to_key_file = find_file(KEY_FILE, self.key_path)
 
         if not full_path_to_cert_file or not full_path_to_key_file:
             raise FileExistsError
-        print(f"[{self.app}]: Loading cert + key files from: {full_path_to_cert_file}")
+        self.log.info(f"Loading cert + key files from: {full_path_to_cert_file}")
 
-        context.load_cert_chain(certfile=full_path_to_cert_file,
-                                keyfile=full_path_to_key_file)
+        # single context for all the clients, it also issues the session tickets so reconnecting clients do a short handshake
+        # the codec of every connection is chosen in the handshake (ALPN), from self.CODECS
+        context = tls_contexts.get_server_context(full_path_to_cert_file, full_path_to_key_file, self.TLS_NUM_TICKETS,
+                                                  alpn_protocols(self.CODECS))
 
-        # 3. wrap regular server socket with SSL - from this moment all operations with socket, such as: Bind(), Listen(), Accept() wil be done with secured Server socket
-        # wrapping means => putting message in secured envelope. All the data sent/received through the socket is authenticated and encrypted
-        print(f"[{self.app}]: Wrapping the 'regular' TCP/IP socket to be SSL 'secured' socket ...")
-        self.server_socket = context.wrap_socket(self.server_socket,
-                                                 server_side=True)  # <--- this line tells python that this is a Server and not a Client
-        # 4. Bind the socket (secured socket) to an address and port
+        # 3. server socket stays a 'regular' TCP/IP socket, so accept() only takes the TCP connection and never blocks on TLS.
+        # every accepted client socket is wrapped with SSL separately and its TLS handshake is done step by step by the event loop
+        # (if the wrapped server socket was used, accept() would do the whole handshake while all the other clients wait)
+        self.ssl_context = context
+        self.server_socket.setblocking(False)
+        # 4. Bind the socket to an address and port
         self.server_socket.bind((self.IP, self.PORT))
 
         # 5. This method is actually puts Server's socket into listening mode, it is not blocking func
         # OS knows that only 1 connection is allowed, the rest will be rejected
         self.server_socket.listen()
-        print(f"[{self.app}]: Ready and is listening on port 8820...")
+        self.log.info("Ready and is listening on port 8820...")
 
     def _create_working_threads(self, NUM_WORKERS):
         """
@@ -126,94 +363,580 @@ class Server:
             daemon = True means: when main program finishes, all threads will finish automatically
         :return:
         """
-        print(f"[{self.app}]: this machine has: {os.cpu_count()} cores, but will be used {NUM_WORKERS} processing threads")
+        self.log.info(f"this machine has: {os.cpu_count()} cores, but will be used {NUM_WORKERS} processing threads")
         # This line starts n worker threads that will all run (execute) the 'same' worker() function at the same time — in parallel.
-        # all n threads will 'sit' on the Q waiting for new task (new message) task (= message from Client).
-        # when new message appears in queue, any free thread can pick up the message and handle it.
-        # if will be more than 1 free thread the OS will decide who will handle new message
-        print(f"[{self.app}]: creating {NUM_WORKERS} working threads to process incoming messages from clients ...")
+        # every thread 'sits' on its own Q waiting for new task (new message) task (= message from Client).
+        # all the messages of a client are put in the Q of the same thread (see _assign_worker), so:
+        #   messages of a client are handled + answered in the order they were sent
+        #   only 1 thread ever writes to a client socket
+        # different clients are spread over the threads, so the threads still work in parallel.
+        # main thread checks the watermarks before every put, so put never blocks the event loop
+        self.worker_queues = [queue.Queue(maxsize=self.MAX_QUEUED_MESSAGES) for _ in range(NUM_WORKERS)]
+        self.worker_busy = [LocalCounter(f"working_thread_{cnt} busy seconds") for cnt in range(NUM_WORKERS)]
+        for cnt, busy in enumerate(self.worker_busy):
+            self.metrics.register("worker_busy_seconds", busy, "time the working thread spent on messages", {"worker": cnt})
+        self.log.info(f"creating {NUM_WORKERS} working threads to process incoming messages from clients ...")
         for cnt in range(NUM_WORKERS):
             threading.Thread(target=self._working_thread,
+                             args=(cnt,),
                              name=f"working_thread_{cnt}",
                              daemon=True).start() # see comment about this flag !!
 
     def _accept_new_socket(self):
         # this case will run when the server receives a new incoming client connection.
         # server socket is notified (triggered) only when new client socket tries to connect it from the Client side
-        print(Fore.LIGHTGREEN_EX + f"{[self.app]}: new client connection arrived, will be accepted")
-        client_socket, client_address = self.server_socket.accept()
-        # adding new client socket to the list, next time this client will send messages -> server will know it
-        # without adding to the list, server will not notice messages from this connection
-        self.monitored_client_sockets_list.append(client_socket)
-        print(Fore.LIGHTGREEN_EX + f"{[self.app]}: new Client connection: IP: {client_address}, was added to the list of monitored sockets !!!!!")
+        self.log.debug("new client connection arrived, will be accepted")
+        try:
+            client_socket, client_address = self.server_socket.accept() # only TCP connection, no TLS yet - never blocks
+        except (BlockingIOError, InterruptedError): # client gave up before we accepted it
+            return
+        self.connections_accepted.inc()
+        client_socket.setblocking(False)
+        # wrap with SSL but don't do the handshake now (do_handshake_on_connect=False), it will be done by _continue_handshake
+        # each time the client socket is notified, till the handshake is done
+        client_socket = self.ssl_context.wrap_socket(client_socket,
+                                                     server_side=True,
+                                                     do_handshake_on_connect=False)
+        self.handshaking_clients[client_socket] = (client_address, time.monotonic())
+        self.client_timers[client_socket] = self.timers.schedule(self.HANDSHAKE_TIMEOUT, self._handshake_timed_out, client_socket)
+        self.event_loop.register(client_socket, EVENT_READ, client_address)
+        self._continue_handshake(client_socket)
+
+    def _continue_handshake(self, client_socket):
+        """
+        do the next step of TLS handshake, never blocks:
+        if the handshake needs more data from client -> wait till socket is readable
+        if the handshake needs to send data but OS buffer is full -> wait till socket is writable
+        :param client_socket: SSL socket in the middle of handshake
+        :return: None
+        """
+        client_address, handshake_start = self.handshaking_clients[client_socket]
+        try:
+            client_socket.do_handshake()
+        except ssl.SSLWantReadError:
+            self.event_loop.modify(client_socket, EVENT_READ, client_address)
+            return
+        except ssl.SSLWantWriteError:
+            self.event_loop.modify(client_socket, EVENT_WRITE, client_address)
+            return
+        except (ssl.SSLError, OSError) as ee:
+            self.log.warning("TLS handshake with client: %s failed, error: %s", client_address, ee)
+            self.handshake_failures += 1
+            self._close_client_socket(client_socket)
+            return
+
+        # handshake is done - from now on this is a regular client
+        self.handshake_latency.observe(time.monotonic() - handshake_start)
+        tls_contexts.count_handshake(client_socket, self.full_handshakes, self.resumed_handshakes)
+        del self.handshaking_clients[client_socket]
+        self.client_timers.pop(client_socket).cancel()
+        self.client_activity[client_socket] = self.timers.current_tick
+        if self.IDLE_TIMEOUT:
+            self.client_timers[client_socket] = self.timers.schedule(self.IDLE_TIMEOUT, self._idle_check, client_socket)
+        self.event_loop.modify(client_socket, EVENT_READ, client_address)
+        self.log.info("new Client connection: IP: %s, TLS: %s, was added to the monitored sockets !!!!!", client_address, client_socket.version())
         # we also store client sockets for loging, debug, ...
         self.all_clients[client_socket] = client_address
+        self.client_frame_buffers[client_socket] = FrameBuffer(self.MAX_DATA_SIZE)
+        self.client_codecs[client_socket] = negotiated_codec(client_socket)
+        compression = create_compression(negotiated_compression(client_socket), self.COMPRESSION_THRESHOLD, self.COMPRESSION_LEVEL)
+        if compression is not None:
+            self.client_compressions[client_socket] = compression
+        self.client_events[client_socket] = EVENT_READ
+        with self.output_lock:
+            self.client_outputs[client_socket] = OutputBuffer()
+        self._assign_worker(client_socket)
+        if client_socket.pending(): # data that arrived together with the end of handshake, OS will not notify us about it
+            self._receive_new_message(client_socket)
+
+    def _assign_worker(self, client_socket):
+        # fd of a connected socket is unique while it is open, the client stays with the thread of its fd hash till it disconnects.
+        # the OS gives the fds out one after the other but not all of them are our clients (every other one in a process that
+        # is also the client, for example), so plain fd % threads can leave threads empty - the fd is mixed first
+        # (multiplicative / fibonacci hash), that spreads consecutive and strided fds evenly
+        self.client_workers[client_socket] = self._worker_of(client_socket.fileno())
+        self.log.debug("client: %s is handled by working_thread_%s", self.all_clients[client_socket], self.client_workers[client_socket])
+
+    def _worker_of(self, key: int) -> int:
+        return (((key * FD_HASH_MULTIPLIER) & 0xFFFFFFFF) >> 16) % len(self.worker_queues)
+
+    def _handshake_timed_out(self, client_socket):
+        # timer: client that didn't finish the handshake on time is disconnected, otherwise slow / malicious clients would hold the sockets forever
+        self.log.warning("TLS handshake with client: %s timed out, disconnecting", self.handshaking_clients[client_socket][0])
+        self.handshake_timeouts += 1
+        self._close_client_socket(client_socket)
+
+    def _idle_check(self, client_socket):
+        """
+        timer: disconnects the client if nothing arrived from it for IDLE_TIMEOUT seconds.
+        the timer is not moved on every message (a cancel + schedule per recv), the last activity is checked when it fires
+        and the timer is scheduled again for the time the client could become idle
+        """
+        idle = (self.timers.current_tick - self.client_activity[client_socket]) * self.timers.TICK
+        if self.client_queued_messages.get(client_socket) or len(self.client_outputs[client_socket]):
+            idle = 0 # its messages are in process / its responses are on the way, it is waiting for us
+        if idle < self.IDLE_TIMEOUT:
+            self.client_timers[client_socket] = self.timers.schedule(self.IDLE_TIMEOUT - idle, self._idle_check, client_socket)
+            return
+        self.log.info("client: %s was idle for %s seconds, disconnecting", self.all_clients[client_socket], self.IDLE_TIMEOUT)
+        self.idle_disconnects += 1
+        if not self._client_disconnected(client_socket):
+            self.finished = True
+
+    def _request_deadline(self, client_socket, message_id: int, codec) -> RequestDeadline:
+        deadline = RequestDeadline()
+        deadline.timer = self.timers.schedule(self.REQUEST_TIMEOUT, self._request_timed_out, client_socket, message_id, codec, deadline)
+        return deadline
+
+    def _request_timed_out(self, client_socket, message_id: int, codec, deadline: RequestDeadline):
+        # timer: the message was not answered on time - the client gets an error response now, the handler response is dropped later
+        with self.output_lock:
+            if deadline.timer.cancelled or client_socket not in self.client_outputs: # answered meanwhile / client is gone
+                return
+            deadline.expired = True
+        self.request_timeouts.inc()
+        self.log.warning("message [%s] of client: %s was not answered in %s seconds, answered with an error",
+                         message_id, self.all_clients.get(client_socket), self.REQUEST_TIMEOUT)
+        self._buffer_message(client_socket, codec.encode("ERROR: request timeout"), message_id)
+
+    def _close_client_socket(self, client_socket):
+        # order is important: first stop monitoring, then close (closed socket has no fd to unregister)
+        self.event_loop.unregister(client_socket)
+        client_socket.close()
+        self.connections_closed.inc()
+        timer = self.client_timers.pop(client_socket, None)
+        if timer:
+            timer.cancel()
+        self.client_activity.pop(client_socket, None)
+        for stream in self.client_streams.pop(client_socket, {}).values(): # their handlers stop (StreamError)
+            stream.abort("client disconnected")
+            self.active_streams.dec()
+        self.open_channels.dec(len(self.client_channels.pop(client_socket, ())))
+        with self.output_lock: # responses that were not sent yet are dropped, working threads will find that the client is gone
+            self.client_outputs.pop(client_socket, None)
+            self.pending_writes.discard(client_socket)
+            self.slow_consumers.discard(client_socket)
+        # deleting the client socket from dict (key is socket obj, value client address)
+        self.all_clients.pop(client_socket, None)
+        self.client_frame_buffers.pop(client_socket, None)
+        self.client_codecs.pop(client_socket, None)
+        self.client_compressions.pop(client_socket, None)
+        self.handshaking_clients.pop(client_socket, None)
+        self.client_workers.pop(client_socket, None)
+        self.client_events.pop(client_socket, None)
+        self.paused_clients.discard(client_socket)
+        with self.queued_messages_lock: # its messages that are still queued are counted in the total till the working threads take them
+            self.client_queued_messages.pop(client_socket, None)
+
+    def _client_watermark(self, client_socket) -> int:
+        # a connection with N channels carries the conversations of N clients, it gets the watermark of N clients
+        return self.MAX_QUEUED_MESSAGES_PER_CLIENT * max(1, len(self.client_channels.get(client_socket, ())))
+
+    def _is_queue_full(self, client_socket) -> bool:
+        return (self.client_queued_messages.get(client_socket, 0) >= self._client_watermark(client_socket) or
+                self.queued_messages.value >= self.MAX_QUEUED_MESSAGES)
+
+    def _can_resume(self, client_socket) -> bool:
+        return (self.client_queued_messages.get(client_socket, 0) <= self._client_watermark(client_socket) * self.QUEUE_LOW_WATERMARK and
+                self.queued_messages.value <= self.MAX_QUEUED_MESSAGES * self.QUEUE_LOW_WATERMARK)
+
+    def _queue_frames(self, client_socket) -> bool:
+        """
+        put the whole messages that are in the frame buffer of the client in the queue, till its high watermark.
+        messages above the watermark stay in the frame buffer and the client is paused (not read) till the queue drains
+        :param client_socket: client socket obj
+        :return: True if the client disconnects (control frame BYE, or 'q' on a legacy connection)
+        """
+        client_address = self.all_clients[client_socket]
+        frame_buffer = self.client_frame_buffers[client_socket]
+        codec = self.client_codecs[client_socket]
+        compression = self.client_compressions.get(client_socket)
+        worker_queue = self.worker_queues[self.client_workers[client_socket]]
+        channels = self.client_channels.get(client_socket)
+        while not self._is_queue_full(client_socket):
+            frame = frame_buffer.next_frame()
+            if frame is None:
+                return False
+            # the payload is not decoded here, only compared - it is decoded once, by the working thread (codec of the connection)
+            if is_disconnect(frame, codec):
+                return True
+            kind = stream_kind(frame)
+            if kind is not None:
+                self._stream_frame(client_socket, frame, kind, codec)
+                continue
+            kind = channel_kind(frame)
+            if kind is not None:
+                self._channel_frame(client_socket, frame, kind)
+                channels = self.client_channels.get(client_socket)
+                continue
+            if frame.control:
+                self.log.warning("client: %s sent unknown control frame, ignored", client_address)
+                continue
+            if compression is None:
+                payload = bytes(frame.payload) # frame buffer is reused by the next recv, the payload is copied once
+            else:
+                try: # here and not on the working threads: the context of the connection must see the messages in the order they arrived
+                    payload = compression.decompress(frame.payload)
+                except CompressionError as ee:
+                    self.log.error(f"client: {client_address} sent invalid compressed message [{frame.message_id}], error: {ee}, disconnecting ###")
+                    return True
+            with self.queued_messages_lock:
+                self.client_queued_messages[client_socket] = self.client_queued_messages.get(client_socket, 0) + 1
+            self.queued_messages.inc()
+            self.received_messages.inc()
+            # a message of an open channel goes to the working thread of the channel (ordered inside the channel, channels in parallel),
+            # the channel bits of the id mean nothing on a connection that never opened that channel
+            channel = channels.get(frame.message_id >> CHANNEL_SHIFT) if channels else None
+            # method .put() is already thread safe so no need locks / mutexes
+            (self.worker_queues[channel[1]] if channel else worker_queue).put_nowait((client_socket,
+                                     client_address,
+                                     frame.message_id, # response is sent with the same id
+                                     payload,
+                                     codec,
+                                     self._request_deadline(client_socket, frame.message_id, codec) if self.REQUEST_TIMEOUT else None,
+                                     channel[0] if channel else None))
+        self._pause_reading(client_socket)
+        return False
+
+    def _stream_frame(self, client_socket, frame, kind: bytes, codec):
+        """
+        a frame of a stream (see streaming): the chunks go to the stream and its handler, not to the queues of the working threads.
+        memory of a stream is bounded by its credit: the client sends only what it was granted (STREAM_WINDOW, then what the handler consumed)
+        """
+        streams = self.client_streams.setdefault(client_socket, {})
+        stream_id = frame.message_id
+        if kind == STREAM_OPEN:
+            try:
+                message_type, size = parse_open(frame.payload)
+            except (StreamError, UnicodeDecodeError) as ee:
+                self._abort_stream(client_socket, stream_id, f"invalid stream open: {ee}")
+                return
+            if stream_id in streams:
+                self._abort_stream(client_socket, stream_id, "stream id is already open")
+                return
+            stream = IncomingStream(self.all_clients[client_socket], stream_id, message_type, size, self.STREAM_WINDOW,
+                                    grant=lambda amount: self._buffer_response(client_socket, credit_frame(stream_id, amount)),
+                                    buffered=self.stream_buffered)
+            streams[stream_id] = stream
+            self.active_streams.inc()
+            self.streams_opened.inc()
+            self.log.debug("client: %s opened stream [%s], type: %s, size: %s", stream.client, stream_id, message_type, size)
+            self.handlers.start_stream(stream, lambda stream, response: self._stream_done(client_socket, codec, message_type, stream, response))
+            self._buffer_response(client_socket, credit_frame(stream_id, self.STREAM_WINDOW)) # first credit: the whole window
+            return
+        stream = streams.get(stream_id)
+        if stream is None: # answered / aborted already, the frames that were on the way are dropped
+            return
+        if kind == STREAM_DATA:
+            chunk = bytes(frame.payload[KIND_SIZE:]) # frame buffer is reused by the next recv, the chunk is copied once
+            if not stream.feed(chunk):
+                self.log.warning("client: %s sent more than its credit on stream [%s], aborting it", stream.client, stream_id)
+                stream.abort("credit exceeded")
+                self._abort_stream(client_socket, stream_id, "credit exceeded")
+                return
+            self.stream_bytes.inc(len(chunk))
+        elif kind == STREAM_END:
+            stream.finish()
+            del streams[stream_id]
+            self.active_streams.dec()
+        elif kind == STREAM_ABORT:
+            stream.abort("aborted by the client")
+            del streams[stream_id]
+            self.active_streams.dec()
+
+    def _channel_frame(self, client_socket, frame, kind: bytes):
+        """
+        a channel is opened / closed (see channels). the channel is bound to a message type (its handler) + a working thread
+        picked by the hash of the connection and the channel, so channels of one connection spread over the working threads
+        """
+        channels = self.client_channels.setdefault(client_socket, {})
+        channel = frame.message_id >> CHANNEL_SHIFT
+        if kind == CHANNEL_OPEN:
+            reason = None
+            if not channel:
+                reason = "channel 0 is the connection itself"
+            elif channel in channels:
+                reason = "channel is already open"
+            elif len(channels) >= self.MAX_CHANNELS_PER_CLIENT:
+                reason = f"too many channels (max {self.MAX_CHANNELS_PER_CLIENT})"
+            if reason:
+                self.log.warning("client: %s channel [%s] refused: %s", self.all_clients[client_socket], channel, reason)
+                self.channels_refused.inc()
+                self._buffer_response(client_socket, close_channel_frame(channel, reason))
+                return
+            message_type = channel_argument(frame) or None
+            channels[channel] = (message_type, self._worker_of((client_socket.fileno() << 12) | channel))
+            self.open_channels.inc()
+            self.channels_opened.inc()
+            self.log.debug("client: %s opened channel [%s], type: %s, working_thread_%s",
+                           self.all_clients[client_socket], channel, message_type, channels[channel][1])
+        elif channels.pop(channel, None) is not None: # CHANNEL_CLOSE, messages of the channel that are queued are still answered
+            self.open_channels.dec()
+
+    def _abort_stream(self, client_socket, stream_id: int, reason: str):
+        if self.client_streams.get(client_socket, {}).pop(stream_id, None) is not None:
+            self.active_streams.dec()
+        self._buffer_response(client_socket, abort_frame(stream_id, reason))
+
+    def _stream_done(self, client_socket, codec, message_type: str, stream: IncomingStream, response):
+        # thread pool of the handlers: the stream handler returned, its response goes out like any other response
+        if response is None: # stream was aborted, nobody to answer
+            self.streams_aborted.inc()
+            return
+        self.streams_completed.inc()
+        if self._buffer_message(client_socket, codec.encode(response, message_type), stream.message_id):
+            self.received_messages_store.add(MessageRecord(stream.client, stream.message_id, f"stream of {stream.consumed} bytes", printable(response)))
+
+    def _pause_reading(self, client_socket):
+        if client_socket in self.paused_clients:
+            return
+        self.log.debug("queue of client: %s is full (%s messages, %s in total), reading is paused",
+                       self.all_clients[client_socket], self.client_queued_messages.get(client_socket, 0), self.queued_messages.value)
+        self.paused_clients.add(client_socket)
+        self.read_pauses.inc()
+        self._update_events(client_socket) # no more read events, the OS buffers the data and then the client stops sending
+
+    def _update_events(self, client_socket):
+        # read - unless the client is paused (backpressure), write - only while there is something to send
+        # (a socket monitored for write all the time would wake up the event loop on every scan, it is almost always writable)
+        events = 0
+        if client_socket not in self.paused_clients:
+            events |= EVENT_READ
+        if len(self.client_outputs[client_socket]):
+            events |= EVENT_WRITE
+        current_events = self.client_events[client_socket]
+        if events == current_events: # usual case (response was sent at once), no system call
+            return
+        if not events:
+            self.event_loop.unregister(client_socket)
+        elif current_events:
+            self.event_loop.modify(client_socket, events, self.all_clients[client_socket])
+        else:
+            self.event_loop.register(client_socket, events, self.all_clients[client_socket])
+        self.client_events[client_socket] = events
+
+    def _resume_reading(self) -> bool:
+        """
+        called by the event loop when a working thread woke it up: paused clients below the low watermark are read again
+        :return: False if the server should finish (last client disconnected)
+        """
+        for client_socket in list(self.paused_clients):
+            if client_socket not in self.paused_clients or not self._can_resume(client_socket):
+                continue
+            self.paused_clients.discard(client_socket)
+            self.log.debug("reading of client: %s is resumed", self.all_clients[client_socket])
+            self._update_events(client_socket)
+            # messages that were left in the frame buffer when it was paused, the OS will not notify about them
+            try:
+                if self._queue_frames(client_socket) and not self._client_disconnected(client_socket):
+                    return False
+            except FrameError as ee:
+                self.log.error(f"### Receive error: Client: {self.all_clients[client_socket]} sent invalid message, error:\n {ee} ###")
+                self._close_client_socket(client_socket)
+        return True
+
+    def _message_processed(self, client_socket):
+        # called by the working threads, a message was answered (or failed) - it doesn't take space in the queue anymore
+        with self.queued_messages_lock:
+            client_queued = self.client_queued_messages.get(client_socket)
+            if client_queued is not None:
+                self.client_queued_messages[client_socket] = client_queued - 1
+        queued = self.queued_messages.dec()
+        if not self.paused_clients:
+            return
+        if client_socket in self.paused_clients:
+            ready = self._can_resume(client_socket)
+        else: # the total reached the low watermark, the clients that were paused because of the total can be resumed
+            ready = queued == int(self.MAX_QUEUED_MESSAGES * self.QUEUE_LOW_WATERMARK)
+        if ready:
+            self._wake_up()
+
+    def _buffer_message(self, client_socket, payload: bytes, message_id: int, deadline: RequestDeadline = None) -> bool:
+        """
+        a response (regular frame) is framed here - compressed if the client negotiated compression (see compression).
+        the responses of a client share its compression context: they are compressed under its lock in the order they are buffered,
+        and a compressed response is never dropped (the client could not decompress the ones after it), so it is decided before
+        :param payload: response encoded by the codec of the client
+        :return: see _buffer_response
+        """
+        compression = self.client_compressions.get(client_socket)
+        if compression is None:
+            return self._buffer_response(client_socket, encode_frame(payload, message_id), deadline)
+        with compression.lock:
+            if deadline is not None:
+                with self.output_lock:
+                    if deadline.expired:
+                        self.late_responses.inc()
+                        return False
+                    deadline.timer.cancel() # answered, _request_timed_out sees it under the output lock
+            compressed = compression.compress(payload)
+            self.compression_input_bytes.inc(len(payload))
+            self.compression_output_bytes.inc(len(compressed))
+            return self._buffer_response(client_socket, encode_frame(compressed, message_id), compressed=True)
+
+    def _buffer_response(self, client_socket, frame: bytes, deadline: RequestDeadline = None, compressed: bool = False) -> bool:
+        """
+        called by the working threads: the response is added to the output buffer of the client, event loop will send it
+        :param client_socket: client socket obj
+        :param frame: encoded response frame (control frame / see _buffer_message)
+        :param deadline: deadline of the message, the response is dropped if the message was already answered with a timeout error
+        :param compressed: frame was compressed with the context of the client, it can't be dropped - slow consumer is disconnected
+        :return: True if the response was buffered, False if it was dropped (client is gone / slow consumer / too late)
+        """
+        with self.output_lock:
+            output = self.client_outputs.get(client_socket)
+            if output is None:
+                self.log.warning("client disconnected before the response was sent")
+                return False
+            if deadline is not None:
+                if deadline.expired:
+                    self.late_responses.inc()
+                    return False
+                deadline.timer.cancel() # the wheel drops it, _request_timed_out sees it under this lock
+            if len(output) + len(frame) > self.MAX_OUTPUT_BUFFER:
+                # client doesn't read its responses (fast enough), its buffer would grow without limit
+                if self.SLOW_CONSUMER_ACTION == "disconnect" or compressed:
+                    self.slow_consumers.add(client_socket)
+                else:
+                    self.dropped_responses.inc()
+                    return False
+            else:
+                if not output.pending:
+                    output.pending_since = time.monotonic()
+                output.pending += frame
+                self.pending_writes.add(client_socket)
+        self.buffered_responses.inc()
+        self._wake_up()
+        return client_socket not in self.slow_consumers
+
+    def _flush_pending_writes(self) -> bool:
+        """
+        called by the event loop when a working thread woke it up: new responses are sent, slow consumers are disconnected
+        :return: False if the server should finish (last client disconnected)
+        """
+        with self.output_lock:
+            pending_writes, self.pending_writes = self.pending_writes, set()
+            slow_consumers, self.slow_consumers = self.slow_consumers, set()
+        for client_socket in slow_consumers:
+            if client_socket in self.all_clients:
+                self.log.warning("client: %s doesn't read its responses, output buffer is over %s bytes, disconnecting",
+                                 self.all_clients[client_socket], self.MAX_OUTPUT_BUFFER)
+                self.slow_consumer_disconnects.inc()
+                if not self._client_disconnected(client_socket):
+                    return False
+        for client_socket in pending_writes:
+            if client_socket in self.all_clients and not self._flush_output(client_socket):
+                return False
+        return True
+
+    def _flush_output(self, client_socket) -> bool:
+        """
+        send as much of the output buffer as the socket takes now, never blocks.
+        the rest is sent when the socket is writable again (socket is monitored for write till the buffer is empty)
+        :return: False if the server should finish (last client disconnected)
+        """
+        output = self.client_outputs[client_socket]
+        try:
+            while True:
+                if output.offset == len(output.sending): # all sent - take what the working thread added meanwhile
+                    if output.sending: # the oldest response of the batch waited the longest
+                        self.send_latency.observe(time.monotonic() - output.sending_since)
+                        output.sending.clear() # keeps its memory, no new allocation per swap
+                        output.offset = 0
+                    with self.output_lock:
+                        if not output.pending:
+                            break
+                        output.sending, output.pending = output.pending, output.sending
+                        output.sending_since = output.pending_since
+                with memoryview(output.sending) as view:
+                    sent = client_socket.send(view[output.offset:output.offset + WRITE_CHUNK_SIZE])
+                output.offset += sent
+                self.writes.inc()
+                self.written_bytes.inc(sent)
+        except (ssl.SSLWantWriteError, ssl.SSLWantReadError, BlockingIOError):
+            pass # OS send buffer is full, next send is the same chunk again (SSL requires it)
+        except OSError as ee:
+            self.log.warning("failed sending response to client: %s, error: %s", self.all_clients[client_socket], ee)
+            return self._client_disconnected(client_socket)
+        self._update_events(client_socket)
+        return True
+
+    def _wake_up(self):
+        if self.wakeup_pending:
+            return
+        self.wakeup_pending = True
+        try:
+            self.wakeup_writer.send(b"\0")
+        except OSError: # buffer full - the event loop is already woken up / loop is closed
+            pass
+
+    def _client_disconnected(self, client_socket) -> bool:
+        """
+        :return: False if it was the last client and the server should finish
+        """
+        self.log.info(f"client: {self.all_clients.get(client_socket)} - disconnected")
+        self._close_client_socket(client_socket)
+
+        # check if server can finish
+        if self.EXIT_WHEN_IDLE and not self.all_clients and not self.handshaking_clients:
+            self.log.info("main process is finished")
+            return False
+        self.log.info("main process keep on running because more client/s are still running")
+        return True
 
     def _receive_new_message(self, notified_socket) -> bool:
         """
-        extract data (message) from socket and put in queue, if received data is 'q'
+        extract data (messages) from socket and put in queue, if received data is 'q' - client is disconnected
+        single recv can bring part of a message (rest will arrive later) or several messages, each whole message is queued separately
         :param notified_socket:
         :return:
         """
         # extract from socket
         client_address = self.all_clients[notified_socket]
-        print(Fore.LIGHTGREEN_EX + f"{[self.app]}: extracting data that arrived on existing client socket address {client_address}, will be received")
+        frame_buffer = self.client_frame_buffers[notified_socket]
+        self.log.debug("extracting data that arrived on existing client socket address %s, will be received", client_address)
         try:
             # get new data from socket
-            message = notified_socket.recv(self.MAX_DATA_SIZE)
-            print(Fore.LIGHTGREEN_EX + f"[{self.app}]: received data: {message} from client: {client_address}")
-
-            # check if data isnt empty or isnt 'q' - if data ok, put in the Q
-            if message and message.decode() != 'q':
-                # method .put() is already thread safe so no need locks / mutexes
-                self.all_clients_messages_queue.put((notified_socket,
-                                                     client_address,
-                                                     message.decode('utf-8')))
-            else: # empty data (client disconnected forcibly) or message = 'q' (client sent disconnection message)
-                print(Fore.LIGHTGREEN_EX + f"[{self.app}]: client: {client_address} - disconnected")
-                # deleting client socket from list
-                self.monitored_client_sockets_list.remove(notified_socket)
-                # closing this client socket
-                notified_socket.close()
-                # deleting the client socket from dict (key is socket obj, value client address)
-                self.all_clients.pop(notified_socket)
-
-                # check if server can finish
-                if not self.monitored_client_sockets_list and not self.all_clients:
-                    print(Fore.LIGHTGREEN_EX + f"[{self.app}]: main process is finished")
-                    return False
-                print(Fore.LIGHTGREEN_EX + f"[{self.app}]: main process keep on running because more client/s are still running")
+            try:
+                received = frame_buffer.recv_into(notified_socket) # only the event loop uses the SSL object, no lock is needed
+            except (ssl.SSLWantReadError, ssl.SSLWantWriteError, BlockingIOError):
+                return True # only part of TLS record arrived, the rest will arrive later
+            self.log.debug("received %s bytes from client: %s", received, client_address)
+            self.received_bytes.inc(received)
+            self.client_activity[notified_socket] = self.timers.current_tick
+
+            client_disconnected = not received # empty data (client disconnected forcibly)
+            if self._queue_frames(notified_socket):
+                client_disconnected = True
 
+            if client_disconnected:
+                return self._client_disconnected(notified_socket)
+
+        except FrameError as ee:
+            self.log.error(f"### Receive error: Client: {client_address} sent invalid message, error:\n {ee} ###")
+            self._close_client_socket(notified_socket)
         except ConnectionAbortedError as ee:
-            print(Fore.LIGHTGREEN_EX + f"[{self.app}]: ### Receive error: Client connection forcefully terminated, error:\n {ee} ###")
-            # deleting client socket from list
-            self.monitored_client_sockets_list.remove(notified_socket)
-            # closing this client socket
-            notified_socket.close()
-            # deleting the client socket from dict (key is socket obj, value client address)
-            if notified_socket in self.all_clients:
-                del self.all_clients[notified_socket]
+            self.log.error(f"### Receive error: Client connection forcefully terminated, error:\n {ee} ###")
+            self._close_client_socket(notified_socket)
             return False # finish
         return True # keep monitoring
 
     def _scan_sockets(self):
         """
-        monitoring loop, using select method that scans 3 type of lists:
-        list of sockets from which we wish to read in case will be new message there
-        2. list of sockets to which we wish to write  <-- this one we can ignore
-        3. list of special sockets                    <-- this one we can ignore
+        monitoring loop, using event loop (selectors: epoll on Linux, kqueue on macOS, select as a fallback)
 
-        by using method Select - I actually ask this:
+        by using the event loop I actually ask this:
         Tell me:
         Which sockets are ready to be read (new connection = new socket connected | new data arrived on existing socket),
-        and which sockets have errors,  from my list of tracked sockets.”
+        from my registered sockets.
 
-        method 'select' get 3 lists to monitor but even if at the beginning the list is empty, over time it can be filled with sockets so it is breathing lists
+        unlike select.select(), the sockets are not handed over on every scan:
+        server socket is registered once here, client socket is registered once on accept and unregistered once on disconnect.
+        So a scan costs the same with 10 or with 10,000 idle clients, and there is no FD_SETSIZE (1024) limit.
 
-        why we ask to monitor bad sockets?
+        what about bad sockets?
         socket can be broken even if we dont send/receive on it - simple reason -> Client closed it, or timeout or internal error or ....
-        Server must know if Client was broken and will read from dead socked - to avoid it simply check the sock and if socket in the bad list - remove the bad socket from monitoring list and never use it again
-        select is blocking method until at least 1 socket is ready for reading or has an exception, if it is a client socket - then go receive its data.
+        broken socket is notified as 'readable', recv() on it returns empty data (or raises), so it is closed + unregistered in _receive_new_message
 
         !! correct manner:
         we see here that accepting new connections is done in main process of the server while the listening on the queue is done in separate working threads !!
@@ -223,95 +946,255 @@ class Server:
         # usually it depends on how many cores you PC has
         self._create_working_threads(self.NUMBER_WORKING_THREADS)
 
+        self.event_loop = EventLoop(self.EVENT_LOOP_BACKEND)
+        self.log.info(f"event loop is using: {self.event_loop.backend}")
+        self.event_loop.register(self.server_socket, EVENT_READ)
+        self.wakeup_reader, self.wakeup_writer = socket.socketpair()
+        self.wakeup_reader.setblocking(False)
+        self.wakeup_writer.setblocking(False)
+        self.event_loop.register(self.wakeup_reader, EVENT_READ)
+
         # start scanning sockets
         while True:
-            print(Fore.LIGHTGREEN_EX + f"{[self.app]}: main process is scanning the sockets ...")
-            readable_sockets_list, _, bad_sockets_list = select.select([self.server_socket] + self.monitored_client_sockets_list,# read list - this is a list of all sockets we monitor (=all client sockets but also a server_socket)
-                                                                  [],  # write list
-                                                                       self.monitored_bad_client_sockets_list,# list of broken sockets - we are going to collect such sockets so we supply a list that at the beginning is empty but if will be broken socket it will be placed in this list and monitored
-                                                                5)  # <--- this timeout says that select will not be blocking func, after timeout we will go and check if were new messages / new client has connected
+            self.log.debug("main process is scanning the sockets ...")
+            # wakes up for the next timer of the wheel (handshake / idle / request timeouts), not on a fixed polling tick
+            timeout = self.timers.next_delay(min(5, self.STATS_INTERVAL) if self.stats_queue else 5)
+            notified_sockets_list = self.event_loop.poll(timeout)  # <--- this timeout says that poll will not be blocking func, after timeout we will go and check if were new messages / new client has connected
+            # first the timers: the tick of the wheel is also the 'now' of the events below (activity of the clients)
+            self.timers.advance()
+            if self.finished: # a timer disconnected the last client
+                return
             # we are here because were some change in the monitored sockets:
             # change can be on the server socket - new client connection arrived
             # or
             # new message arrived at one of the existing client connections
             # lets find out
-            for notified_socket in readable_sockets_list:
+            for notified_socket, events, _ in notified_sockets_list:
                 if notified_socket is self.server_socket:
                     self._accept_new_socket()
-                else:
-                    if not self._receive_new_message(notified_socket):
+                elif notified_socket is self.wakeup_reader:
+                    try:
+                        self.wakeup_reader.recv(4096)
+                    except BlockingIOError:
+                        pass
+                    # cleared only after the drain: a wake up that came after it either left its byte in the pair
+                    # or is handled right below (its changes were done before it checked the flag)
+                    self.wakeup_pending = False
+                    if not self._flush_pending_writes() or not self._resume_reading():
                         return
-
-            for notified_socket in bad_sockets_list:
-                self.monitored_client_sockets_list.remove(notified_socket)
-                if notified_socket in self.all_clients:
-                    del self.all_clients[notified_socket]
-                notified_socket.close()
+                elif notified_socket in self.handshaking_clients:
+                    self._continue_handshake(notified_socket)
+                elif notified_socket in self.all_clients: # could be closed by an earlier event of this scan
+                    if events & EVENT_WRITE and not self._flush_output(notified_socket):
+                        return
+                    if events & EVENT_READ and notified_socket in self.all_clients:
+                        if not self._receive_new_message(notified_socket):
+                            return
+            if self.stats_queue and time.monotonic() - self.last_stats_time >= self.STATS_INTERVAL:
+                self.report_stats()
 
     # this is a worker thread func
-    def _working_thread(self) -> None:
+    def _working_thread(self, worker_index: int) -> None:
         """
         This is a method that each working thread will run.
         Each working thread will extract from Q only valid messages
-        Each working thread is looping the server queue, once new message entered, the OS decides which on of the processes is free to retrieve the message and to process it
+        Each working thread is looping its own queue, it gets the messages of the clients that were assigned to it (see _assign_worker)
+        :param worker_index: index of the thread, its queue is worker_queues[worker_index]
         :return:
         """
         index = 0
-        col = int(threading.current_thread().name.split('_')[2])
-        print(colors_dict[col] + f"[{self.app}]: process: {threading.current_thread().name} started running ...")
+        thread_name = threading.current_thread().name
+        worker_queue = self.worker_queues[worker_index]
+        self.log.info(f"process: {thread_name} started running ...")
 
         while True:
             try:
                 # .get() is for retrieve message from queue. We retrieve what we put (if we put tuples we should get tuples)
                 # default it is blocking function but we can set a time parameter to limit the blocking time to 1 sec
                 # If no message arrives within 1 second, it raises queue.Empty, which we're catching to simply continue the loop
-                print(colors_dict[col] + f"[{self.app}]: process: {threading.current_thread().name} tries to get a message from a queue ...")
-                client_socket_obj, client_address, message = self.all_clients_messages_queue.get(timeout=8) # method .get() is already thread safe so no need locks / mutexes
-
-                # respond to a client
-                resp_message = f"Hello, client! I received your message: {message}."
-                print(colors_dict[col] + f"[{self.app}]: Sending response message back to client: {client_socket_obj}, [{index}]:{resp_message}")
+                self.log.debug("process: %s tries to get a message from a queue ...", thread_name)
+                client_socket_obj, client_address, message_id, payload, codec, deadline, channel_type = worker_queue.get(timeout=8) # method .get() is already thread safe so no need locks / mutexes
+                busy_start = time.monotonic()
                 try:
-                    client_socket_obj.sendall(resp_message.encode())
-                except Exception as ee:
-                    print(colors_dict[col] + f"[{self.app}]: failed sending response to client: {client_socket_obj}, error: {ee}")
-                else:
-                    print(colors_dict[col] + f"[{self.app}]: message sent !")
-                    # storing all
-                    print(colors_dict[col] + f"[{self.app}]: storing message in internal data base ...")
-                    self.received_messages_store.setdefault(client_address, []).append((index, message, resp_message))
-                    index += 1
+                    if deadline is not None and deadline.expired:
+                        continue # already answered with a timeout error by the event loop, the handler is not called (finally still runs)
+                    # respond to a client, the handler of the message type builds the response (plain handlers run right here)
+                    message_type, flags, message = codec.decode(payload)
+                    if message_type is None:
+                        message_type = channel_type # message of a channel without its own type goes to the handler of the channel
+                    resp_message = self.handlers.handle(Request(client_address, message_id, message, message_type, flags=flags))
+                    self.log.debug("Sending response message back to client: %s, [%s]:%s", client_address, index, resp_message)
+                    # never blocks: the event loop sends it (together with the other responses that are waiting) when the socket is writable
+                    if self._buffer_message(client_socket_obj, codec.encode(resp_message, message_type), message_id, deadline):
+                        self.log.debug("message is buffered for sending !")
+                        # storing all
+                        self.log.debug("storing message in internal data base ...")
+                        self.received_messages_store.add(MessageRecord(client_address, index, printable(message), printable(resp_message)))
+                        index += 1
+                except CodecError as ee:
+                    self.log.error(f"client: {client_address} sent invalid message [{message_id}], error: {ee} ###")
                 finally:
-                    self.all_clients_messages_queue.task_done()
+                    self._message_processed(client_socket_obj)
+                    worker_queue.task_done()
+                    self.worker_busy[worker_index].inc(time.monotonic() - busy_start)
             except queue.Empty:
-                print(colors_dict[col] + f"[{self.app}]: keep polling the queue ...")
+                self.log.debug("keep polling the queue ...")
                 continue
             except Exception as e:
-                print(colors_dict[col] + f"[{self.app}]: failed processing message from a queue: {e} ###")
+                self.log.error(f"failed processing message from a queue: {e} ###")
                 return
-        print(colors_dict[col] + f"[{self.app}]: process: {threading.current_thread().name} - finished")
+        self.log.info(f"process: {thread_name} - finished")
 
     def disconnect(self):
         """
         Server closes both server socket and clients sockets
         :return:
         """
-        print(Fore.LIGHTGREEN_EX + f"[{self.app}]: Closing Server socket (connection) ")
+        self.log.info("Closing Server socket (connection) ")
+        if self.event_loop:
+            self.event_loop.unregister(self.server_socket)
+            self.event_loop.unregister(self.wakeup_reader)
+            self.event_loop.close()
         self.server_socket.close()
-        print(Fore.LIGHTGREEN_EX + f"[{self.app}]: Server socket is closed + all client sockets are close, app is finished !!!")
+        if self.wakeup_reader:
+            self.wakeup_reader.close()
+            self.wakeup_writer.close()
+        self.received_messages_store.close() # still can be read after close
+        self.handlers.close()
+        if self.metrics_server:
+            self.metrics_server.close()
+            self.metrics_server = None
+        self.log.info("Server socket is closed + all client sockets are close, app is finished !!!")
+
+    def print_handshake_stats(self):
+        print(f"\n[{self.app}]: {self.handshake_latency}, failed: {self.handshake_failures}, timed out: {self.handshake_timeouts}")
+        print(f"[{self.app}]: {self.full_handshakes}, {self.resumed_handshakes}")
+        for upper_bound, count in self.handshake_latency.snapshot()["buckets"].items():
+            if count:
+                print(f"[{self.app}]:     <= {upper_bound * 1000:g}ms: {count}")
+
+    def queue_stats(self) -> dict:
+        """
+        :return: depth of the queue between the event loop and the working threads + its watermarks
+        """
+        return {"queued_messages": self.queued_messages.value,
+                "queued_messages_peak": self.queued_messages.peak,
+                "high_watermark": self.MAX_QUEUED_MESSAGES,
+                "low_watermark": int(self.MAX_QUEUED_MESSAGES * self.QUEUE_LOW_WATERMARK),
+                "per_client_high_watermark": self.MAX_QUEUED_MESSAGES_PER_CLIENT,
+                "per_client_low_watermark": int(self.MAX_QUEUED_MESSAGES_PER_CLIENT * self.QUEUE_LOW_WATERMARK),
+                "paused_clients": len(self.paused_clients),
+                "read_pauses": self.read_pauses.value,
+                "worker_queues": [worker_queue.qsize() for worker_queue in self.worker_queues]}
+
+    def write_stats(self) -> dict:
+        """
+        :return: write path counters, responses_per_write > 1 means several responses went out in a single send (coalescing)
+        """
+        writes = self.writes.value
+        return {"buffered_responses": self.buffered_responses.value,
+                "writes": writes,
+                "written_bytes": self.written_bytes.value,
+                "bytes_per_write": self.written_bytes.value / writes if writes else 0,
+                "responses_per_write": self.buffered_responses.value / writes if writes else 0,
+                "dropped_responses": self.dropped_responses.value,
+                "slow_consumer_disconnects": self.slow_consumer_disconnects.value}
+
+    def print_write_stats(self):
+        stats = self.write_stats()
+        print(f"\n[{self.app}]: {self.writes}, {stats['bytes_per_write']:.0f} bytes / {stats['responses_per_write']:.1f} responses per write")
+        print(f"[{self.app}]: {self.dropped_responses}, {self.slow_consumer_disconnects}")
+
+    def print_queue_stats(self):
+        stats = self.queue_stats()
+        print(f"\n[{self.app}]: {self.queued_messages}, watermarks: high: {stats['high_watermark']}, low: {stats['low_watermark']}, "
+              f"per client high: {stats['per_client_high_watermark']}, low: {stats['per_client_low_watermark']}")
+        print(f"[{self.app}]: {self.read_pauses}, paused clients now: {stats['paused_clients']}")
+
+    def traffic_stats(self) -> dict:
+        """
+        :return: connections, bytes + messages in and out, busy seconds of every working thread, streams,
+                 'send_latency' + 'handshake_latency' - histogram snapshots (see Histogram.snapshot)
+        """
+        return {"connections_accepted": self.connections_accepted.value,
+                "connections_closed": self.connections_closed.value,
+                "received_bytes": self.received_bytes.value,
+                "received_messages": self.received_messages.value,
+                "messages_per_sec": self.messages_rate.value,
+                "worker_busy_seconds": [busy.value for busy in self.worker_busy],
+                "active_streams": self.active_streams.value,
+                "streams_opened": self.streams_opened.value,
+                "streams_completed": self.streams_completed.value,
+                "streams_aborted": self.streams_aborted.value,
+                "stream_bytes": self.stream_bytes.value,
+                "stream_buffered_bytes": self.stream_buffered.value,
+                "stream_buffered_bytes_peak": self.stream_buffered.peak,
+                "compressed_clients": len(self.client_compressions),
+                "compression_input_bytes": self.compression_input_bytes.value,
+                "compression_output_bytes": self.compression_output_bytes.value,
+                "open_channels": self.open_channels.value,
+                "channels_opened": self.channels_opened.value,
+                "channels_refused": self.channels_refused.value,
+                "send_latency": self.send_latency.snapshot(),
+                "handshake_latency": self.handshake_latency.snapshot()}
+
+    def print_traffic_stats(self):
+        stats = self.traffic_stats()
+        print(f"\n[{self.app}]: connections: accepted: {stats['connections_accepted']}, closed: {stats['connections_closed']}, "
+              f"received: {stats['received_messages']} messages, {stats['received_bytes']} bytes")
+        print(f"[{self.app}]: {self.send_latency}, working threads busy: "
+              f"{', '.join(f'{seconds:.2f}s' for seconds in stats['worker_busy_seconds'])}")
+        print(f"[{self.app}]: idle disconnects: {self.idle_disconnects}, {self.request_timeouts}, {self.late_responses}")
+
+    def stats(self) -> dict:
+        """
+        :return: all the counters of the server in a single dict (queue_stats + write_stats + traffic_stats + clients, messages, handshakes),
+                 'handlers' - latency + errors of every handler
+        """
+        stats = {"clients": len(self.all_clients),
+                 "handshaking_clients": len(self.handshaking_clients),
+                 "stored_messages": len(self.received_messages_store),
+                 "full_handshakes": self.full_handshakes.value,
+                 "resumed_handshakes": self.resumed_handshakes.value,
+                 "handshake_failures": self.handshake_failures,
+                 "handshake_timeouts": self.handshake_timeouts,
+                 "idle_disconnects": self.idle_disconnects,
+                 "request_timeouts": self.request_timeouts.value,
+                 "late_responses": self.late_responses.value,
+                 "timers": len(self.timers)}
+        stats.update(self.queue_stats())
+        stats.update(self.write_stats())
+        stats.update(self.traffic_stats())
+        stats["handlers"] = self.handlers.stats()
+        return stats
+
+    def report_stats(self):
+        """
+        puts (worker_index, stats()) on the stats_queue, read by the supervisor
+        """
+        self.last_stats_time = time.monotonic()
+        try:
+            self.stats_queue.put_nowait((self.worker_index, self.stats()))
+        except queue.Full: # supervisor is behind, next report replaces this one anyway
+            pass
 
     def print_received_messages(self):
-        print(Fore.LIGHTGREEN_EX + f"\n[{self.app}]: All the messages that were sent: Client -> Server\n")
+        print(f"\n[{self.app}]: All the messages that were sent: Client -> Server (last {len(self.received_messages_store)} are kept)\n")
+        # records are streamed from the store (for a file store - read from the disk one by one)
+        for record in self.received_messages_store.records():
+            print(f"[{self.app}]: Client: [{record.client}]: {record}")
 
-        #print(f"the len of the store is: {len(self.received_messages_store)}")
-        for client_address, all_client_messages_list in self.received_messages_store.items():
-            print(Fore.LIGHTGREEN_EX + f"\n\n[{self.app}]: Client: [{client_address}], messages are: ")
-            for message in all_client_messages_list:
-                print(Fore.LIGHTGREEN_EX + f"[{self.app}]: {message}")
+    def _start_metrics_server(self):
+        # its own threads, it only reads the counters - the event loop is never blocked by a scrape
+        if not self.METRICS_PORT:
+            return
+        self.metrics_server = MetricsHTTPServer(self.metrics, self.METRICS_IP, self.METRICS_PORT, self.stats, app=f"{self.app}_METRICS")
+        self.metrics_server.start()
 
     def start(self):
         self._init()
         self._create_server_socket()
+        self._start_metrics_server()
         self._scan_sockets()
 
 
@@ -320,4 +1203,9 @@ if __name__ == '__main__':
     server = Server()
     server.start()
     server.disconnect()
-    server.print_received_messages()
\ No newline at end of file
+    server.print_received_messages()
+    server.print_handshake_stats()
+    server.print_queue_stats()
+    server.print_write_stats()
+    server.print_traffic_stats()
+    server.handlers.print_stats()
\ No newline at end of file
@@ -0,0 +1,193 @@
+import multiprocessing
+import multiprocessing.connection
+import queue
+import signal
+import sys
+import threading
+import time
+from typing import Final # makes my types be final without ability to change their type
+
+from src.config_resolver import load_config, SERVER_CONFIG_FILE
+from src.log import get_logger, setup_logging
+
+SUM_EXCEPT: Final[tuple] = ("high_watermark", "low_watermark", "per_client_high_watermark", "per_client_low_watermark")
+
+
+def _run_worker(worker_index: int, config_path, cert_path, key_path, stats_queue) -> None:
+    """
+    body of a worker process: a regular select server (own event loop + working threads) on the shared port
+    """
+    from src.multi_client_by_select_server_tcp import Server
+    # the supervisor stops the workers with SIGTERM, Ctrl+C in the terminal is sent to the whole group - the supervisor handles it
+    signal.signal(signal.SIGTERM, lambda signum, frame: sys.exit(0))
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+    server = Server(config_path, cert_path, key_path, worker_index=worker_index, stats_queue=stats_queue)
+    try:
+        server.start()
+    finally:
+        if server.server_socket:
+            server.disconnect()
+            server.report_stats() # last stats, after the store was closed
+
+
+def _add_up(total: dict, stats: dict) -> dict:
+    # histogram snapshots (see Histogram.snapshot) and the stats of every handler: counts, sums and bucket counts add up
+    for key, value in stats.items():
+        if isinstance(value, dict):
+            total[key] = _add_up(total.get(key, {}), value)
+        elif isinstance(value, (int, float)):
+            total[key] = total.get(key, 0) + value
+    return total
+
+
+class Supervisor:
+    ############################################################################################
+    # MULTI PROCESS SERVER:
+    # a single select server is a single process - its event loop + the working threads share one GIL, so it uses ~1 core.
+    # here N processes (number_worker_processes) run a select server each, all bound to the same port with SO_REUSEPORT:
+    # the kernel spreads the new connections between the listen queues of the processes, a connection stays in its process.
+    #
+    # the supervisor (this process) doesn't touch the clients, it:
+    #   starts the worker processes
+    #   restarts a worker that died (crash, killed) - its clients are disconnected, new connections go to the others meanwhile
+    #   collects the stats every worker reports every STATS_INTERVAL seconds, stats() returns their sum
+    #   stops the workers on SIGTERM / SIGINT (Ctrl+C) or stop()
+    #
+    # usage:
+    #   supervisor = Supervisor(processes=4)
+    #   supervisor.start()      # blocking, till stop() / SIGTERM / SIGINT
+    #   supervisor.print_stats()
+    #
+    # workers are started with "spawn" - a fresh interpreter, nothing is inherited from the threads of this process
+    ############################################################################################
+    def __init__(self, processes: int = None, config_path = None, cert_path = None, key_path = None):
+        """
+        :param processes: amount of worker processes, None -> 'number_worker_processes' from server_config.yaml
+        :param config_path, cert_path, key_path: passed to every worker Server
+        """
+        self.app: Final[str] = "SUPERVISOR"
+        self.log = get_logger(self.app)
+        config = load_config(SERVER_CONFIG_FILE, config_path)["server"]
+        setup_logging(config.get("log_level"), config.get("log_color", False))
+        self.PROCESSES: Final[int] = processes or config.get("number_worker_processes", 1)
+        self.RESTART_DELAY: float = 0.5 # seconds between restarts of the same worker, a worker that dies on start doesn't spin the CPU
+        self.config_path = config_path
+        self.cert_path = cert_path
+        self.key_path = key_path
+
+        self._context = multiprocessing.get_context("spawn")
+        self._stats_queue = self._context.Queue()
+        self.workers = {}         # key is worker index, value is its Process
+        self.worker_stats = {}    # key is worker index, value is the last stats it reported
+        self.restarts = 0
+        self._stopping = False
+
+    def _start_worker(self, worker_index: int):
+        process = self._context.Process(target=_run_worker,
+                                        args=(worker_index, self.config_path, self.cert_path, self.key_path, self._stats_queue),
+                                        name=f"server_worker_{worker_index}",
+                                        daemon=True)
+        process.start()
+        self.workers[worker_index] = process
+        self.log.info(f"worker {worker_index} started, pid: {process.pid}")
+
+    def _drain_stats(self):
+        while True:
+            try:
+                worker_index, stats = self._stats_queue.get_nowait()
+            except queue.Empty:
+                return
+            self.worker_stats[worker_index] = stats
+
+    def _restart_dead_workers(self):
+        for worker_index, process in list(self.workers.items()):
+            if process.is_alive():
+                continue
+            process.join()
+            self.log.warning(f"worker {worker_index} (pid: {process.pid}) exited with code: {process.exitcode}, restarting ...")
+            self.restarts += 1
+            # the stats of the dead process are lost with it (the new one starts from 0)
+            self.worker_stats.pop(worker_index, None)
+            time.sleep(self.RESTART_DELAY)
+            self._start_worker(worker_index)
+
+    def _handle_signal(self, signum, frame):
+        self.log.info(f"signal {signum} received, stopping the workers ...")
+        self._stopping = True
+
+    def start(self):
+        """
+        starts the workers and supervises them, returns when stop() was called (or SIGTERM / SIGINT received)
+        """
+        if threading.current_thread() is threading.main_thread(): # signals can be handled only by the main thread
+            signal.signal(signal.SIGTERM, self._handle_signal)
+            signal.signal(signal.SIGINT, self._handle_signal)
+        self.log.info(f"starting {self.PROCESSES} worker processes ...")
+        for worker_index in range(self.PROCESSES):
+            self._start_worker(worker_index)
+
+        while not self._stopping:
+            # wakes up when a worker exits (its sentinel becomes ready) or every second to read the stats
+            multiprocessing.connection.wait([process.sentinel for process in self.workers.values()], timeout=1)
+            self._drain_stats()
+            if not self._stopping:
+                self._restart_dead_workers()
+        self._stop_workers()
+
+    def stop(self):
+        """
+        can be called from another thread, start() returns within a second
+        """
+        self._stopping = True
+
+    def _stop_workers(self):
+        for process in self.workers.values():
+            if process.is_alive():
+                process.terminate() # SIGTERM -> the worker closes its sockets + store and reports its last stats
+        deadline = time.monotonic() + 5
+        for worker_index, process in self.workers.items():
+            # the stats are read while waiting - a process doesn't exit before the data it put on the queue was taken
+            while process.is_alive() and time.monotonic() < deadline:
+                process.join(timeout=0.1)
+                self._drain_stats()
+            if process.is_alive():
+                self.log.warning(f"worker {worker_index} did not stop, killing it")
+                process.kill()
+                process.join()
+        self._drain_stats()
+        self.log.info("all the workers are stopped")
+
+    def stats(self) -> dict:
+        """
+        :return: sum of the last stats of all the workers (see Server.stats()), the ratios are recalculated,
+                 latency histograms + 'handlers' are merged (bucket counts of all the workers),
+                 'workers' - stats of every worker, 'restarts' - amount of restarted workers
+        """
+        total = {}
+        for stats in self.worker_stats.values():
+            for key, value in stats.items():
+                if key in SUM_EXCEPT or key.endswith("_peak"):
+                    total[key] = max(total.get(key, 0), value)
+                elif isinstance(value, list):
+                    total[key] = total.get(key, []) + value
+                elif isinstance(value, dict):
+                    total[key] = _add_up(total.get(key, {}), value)
+                elif isinstance(value, (int, float)):
+                    total[key] = total.get(key, 0) + value
+        writes = total.get("writes", 0)
+        total["bytes_per_write"] = total.get("written_bytes", 0) / writes if writes else 0
+        total["responses_per_write"] = total.get("buffered_responses", 0) / writes if writes else 0
+        total["processes"] = self.PROCESSES
+        total["restarts"] = self.restarts
+        total["workers"] = dict(sorted(self.worker_stats.items()))
+        return total
+
+    def print_stats(self):
+        stats = self.stats()
+        print(f"\n[{self.app}]: {stats['processes']} worker processes, restarts: {stats['restarts']}")
+        for worker_index, worker_stats in stats["workers"].items():
+            print(f"[{self.app}]:     worker {worker_index}: responses: {worker_stats['buffered_responses']}, "
+                  f"handshakes: {worker_stats['full_handshakes'] + worker_stats['resumed_handshakes']}, "
+                  f"clients now: {worker_stats['clients']}")
+        print(f"[{self.app}]: total: responses: {stats.get('buffered_responses', 0)}, writes: {stats.get('writes', 0)}, "
+              f"read pauses: {stats.get('read_pauses', 0)}, slow consumer disconnects: {stats.get('slow_consumer_disconnects', 0)}")
@@ -0,0 +1,379 @@
+import collections
+import selectors
+import socket
+import ssl
+import threading
+from concurrent.futures import Future
+from typing import Final # makes my types be final without ability to change their type
+
+from src.client_tcp import Client
+from src.config_resolver import load_config, CLIENT_CONFIG_FILE
+from src.framing import FrameBuffer, FrameError, encode_frame
+from src.log import get_logger
+from src.codec import disconnect_frame
+from src.compression import CompressionError
+from src.channels import (CHANNEL_CLOSE, CHANNEL_SHIFT, MAX_CHANNELS, ChannelError, channel_argument, channel_kind, channel_message_id,
+                          close_channel_frame, open_channel_frame)
+
+WRITE_BATCH_SIZE: Final[int] = 64 * 1024 # max bytes the I/O thread takes from the channels for a single send
+
+
+class Channel:
+    """
+    logical conversation of a MultiplexClient, made by MultiplexClient.open_channel()
+        future = channel.send("hello")        # concurrent.futures.Future of the response, waits while the window of the channel is full
+        response = channel.request("hello")   # send + wait for the response
+        channel.close()
+    the messages of a channel are answered in order, the channels of the connection are handled in parallel by the server
+    """
+    def __init__(self, mux, channel_id: int, message_type: str, window: int):
+        self.mux = mux
+        self.id: Final[int] = channel_id
+        self.message_type = message_type # handler of all the messages of the channel on the server side, None - the default one
+        self.WINDOW: Final[int] = window # max messages of the channel that wait for a response
+        self.sent = 0
+        self.answered = 0
+        self.error = None                # ChannelError / ConnectionError that closed the channel
+        self._window = threading.Semaphore(window)
+        self._sequence = 0
+        self._in_flight = 0              # under the lock of the mux
+        self._outgoing = collections.deque() # encoded frames / (payload, message id) to compress, wait for the I/O thread, under the lock of the mux
+        self._closing = False            # close() was called, CC is queued after the messages of the channel
+        self._close_sent = False         # CC was handed to the socket
+
+    @property
+    def closed(self) -> bool:
+        return self._closing or self.error is not None
+
+    def send(self, message, message_type: str = None, timeout: float = None) -> Future:
+        """
+        :param message: str / bytes, encoded by the codec of the connection
+        :param message_type: binary codec only - handler of this message, None - the handler of the channel
+        :param timeout: seconds to wait for room in the window, None - wait forever
+        :return: Future of the response (ChannelError / ConnectionError if the channel / connection closed before it arrived)
+        """
+        if not self._window.acquire(timeout=timeout):
+            raise TimeoutError(f"window of channel [{self.id}] is full ({self.WINDOW} messages wait for a response)")
+        try:
+            future = self.mux._send(self, self.mux.codec.encode(message, message_type))
+        except BaseException:
+            self._window.release()
+            raise
+        return future
+
+    def request(self, message, message_type: str = None, timeout: float = None):
+        """
+        send + wait for the response
+        :return: the response (str / bytes by the codec of the connection)
+        """
+        return self.send(message, message_type, timeout).result(timeout)
+
+    def close(self) -> None:
+        """
+        the messages that were sent are still answered, the channel id is reused only after their responses arrived
+        """
+        self.mux._close_channel(self)
+
+
+class MultiplexClient:
+    ############################################################################################
+    # MULTIPLEXED CLIENT (many logical channels over a single connection):
+    # a Client / AsyncClient is one conversation per connection (every conversation pays its own TCP + TLS handshake and socket on
+    # both sides), here hundreds of conversations share one TLS session: every channel is a numbered conversation (see channels),
+    # the channel is in the high bits of the message id, the server handles every channel on a working thread of its own.
+    #
+    #   per channel window: a channel has at most 'window' messages without response, a busy channel doesn't take the whole connection
+    #   fair scheduling: the I/O thread takes one frame of every channel that has something to send in turn (round robin),
+    #                    so a channel with thousands of queued messages doesn't delay the others, and sends them in batches
+    #                    (several frames of several channels per send)
+    #
+    # one I/O thread does all the reads + writes of the socket (SSL object is not thread safe), the senders only append frames to
+    # their channel and wake it up, the responses resolve the futures on the I/O thread
+    #
+    # usage:
+    #   mux = MultiplexClient(window=32)
+    #   orders = mux.open_channel("orders")                       # all its messages go to the handler of "orders"
+    #   chat = mux.open_channel()
+    #   futures = [orders.send(f"order {ind}") for ind in range(100)]
+    #   print(chat.request("hello"), [future.result() for future in futures])
+    #   orders.close()
+    #   mux.close()
+    ############################################################################################
+    def __init__(self, window: int = None, config_path = None, cert_path = None):
+        """
+        :param window: max messages without response per channel, None -> 'channel_window' from client_config.yaml
+        :param config_path, cert_path: passed to the Client that makes the connection
+        """
+        self.app: Final[str] = "MULTIPLEX_CLIENT"
+        self.log = get_logger(self.app)
+        config = load_config(CLIENT_CONFIG_FILE, config_path)["client"]
+        self.WINDOW: Final[int] = window or config.get("channel_window", 32)
+        # the connection is made by a regular Client (config, retries, TLS session resumption, codec), then the I/O thread takes over
+        self.client = Client(config_path=config_path, cert_path=cert_path, auto_reconnect=False)
+        self.codec = self.client.codec
+        self.compression = self.client.compression # context of the connection goes on with the I/O thread (see compression)
+        if self.codec.legacy:
+            self.client.disconnect()
+            raise ChannelError("server didn't negotiate a codec, it doesn't know channels (see codec)")
+        self.sock = self.client.client_socket
+        self.sock.setblocking(False)
+        self.frame_buffer = FrameBuffer(64 * 1024)
+        self.log.info(f"Channel window: {self.WINDOW} messages")
+
+        self._lock = threading.Lock()
+        self._channels = {}                  # key is channel id, value is Channel (open + closed ones that wait for their responses)
+        self._next_channel_id = 1
+        self._in_flight = {}                 # key is message id, value is (Channel, Future)
+        self._ready = collections.deque()    # channels that have frames to send, in the order they are served
+        self._control = collections.deque()  # frames of the connection itself (disconnect)
+        self._sending = bytearray()
+        self._offset = 0
+        self._closing = False
+        self.error = None                    # exception that stopped the I/O thread, None - closed by close()
+        self.writes = 0
+        self.written_frames = 0
+        self.written_bytes = 0
+
+        self._selector = selectors.DefaultSelector()
+        self._wakeup_reader, self._wakeup_writer = socket.socketpair()
+        self._wakeup_reader.setblocking(False)
+        self._wakeup_writer.setblocking(False)
+        self._wakeup_pending = False
+        self._selector.register(self.sock, selectors.EVENT_READ)
+        self._selector.register(self._wakeup_reader, selectors.EVENT_READ)
+        self._events = selectors.EVENT_READ
+        self._io_thread = threading.Thread(target=self._io_loop, name="multiplex_client_io", daemon=True)
+        self._io_thread.start()
+
+    def open_channel(self, message_type: str = None, window: int = None) -> Channel:
+        """
+        :param message_type: handler of the messages of the channel on the server side, None - the default handler
+        :param window: max messages of the channel without response, None - the window of the client
+        :return: Channel, usable right away (the open frame goes out before its first message)
+        """
+        with self._lock:
+            self._check_open()
+            if len(self._channels) >= MAX_CHANNELS:
+                raise ChannelError(f"all {MAX_CHANNELS} channels are in use")
+            while self._next_channel_id in self._channels:
+                self._next_channel_id = self._next_channel_id % MAX_CHANNELS + 1
+            channel = Channel(self, self._next_channel_id, message_type, window or self.WINDOW)
+            self._next_channel_id = self._next_channel_id % MAX_CHANNELS + 1
+            self._channels[channel.id] = channel
+            self._queue_frame(channel, open_channel_frame(channel.id, message_type))
+        self._wake_up()
+        self.log.debug("channel [%s] opened, type: %s", channel.id, message_type)
+        return channel
+
+    def _check_open(self):
+        if self.error is not None:
+            raise ConnectionError(f"connection is lost: {self.error}")
+        if self._closing:
+            raise ConnectionError("client is closed")
+
+    def _queue_frame(self, channel: Channel, frame: bytes):
+        # under the lock: a channel is in the ready queue once, while it has frames
+        if not channel._outgoing:
+            self._ready.append(channel)
+        channel._outgoing.append(frame)
+
+    def _send(self, channel: Channel, payload: bytes) -> Future:
+        future = Future()
+        with self._lock:
+            self._check_open()
+            if channel.closed:
+                raise channel.error or ChannelError(f"channel [{channel.id}] is closed")
+            message_id = channel_message_id(channel.id, channel._sequence)
+            channel._sequence += 1
+            channel._in_flight += 1
+            channel.sent += 1
+            self._in_flight[message_id] = (channel, future)
+            # a compressed message is framed by the I/O thread: the frames must be compressed in the order they are written
+            self._queue_frame(channel, (payload, message_id) if self.compression else encode_frame(payload, message_id))
+        self._wake_up()
+        return future
+
+    def _close_channel(self, channel: Channel):
+        with self._lock:
+            if channel.closed or self._closing:
+                return
+            channel._closing = True
+            self._queue_frame(channel, close_channel_frame(channel.id))
+        self._wake_up()
+        self.log.debug("channel [%s] closed", channel.id)
+
+    def _release_channel(self, channel: Channel):
+        # under the lock: the id is free when the server got the CC and nothing of the channel is on the way anymore
+        if channel._close_sent and not channel._in_flight:
+            self._channels.pop(channel.id, None)
+
+    def _wake_up(self):
+        with self._lock:
+            if self._wakeup_pending:
+                return
+            self._wakeup_pending = True
+        try:
+            self._wakeup_writer.send(b"\0")
+        except (BlockingIOError, OSError):
+            pass # a byte is already waiting / the client is closed
+
+    ############################################################################################
+    # I/O thread
+    ############################################################################################
+
+    def _io_loop(self):
+        try:
+            while True:
+                for key, events in self._selector.select():
+                    if key.fileobj is self._wakeup_reader:
+                        try:
+                            self._wakeup_reader.recv(4096)
+                        except BlockingIOError:
+                            pass
+                        with self._lock:
+                            self._wakeup_pending = False
+                    elif events & selectors.EVENT_READ:
+                        self._read()
+                if not self._write():
+                    break # closing, everything was sent
+        except (OSError, FrameError, ChannelError, CompressionError) as ee:
+            self.log.warning(f"Connection lost: {ee}")
+            self.error = ee
+        self._fail_all(self.error or ConnectionError("client is closed"))
+
+    def _read(self):
+        try:
+            received = self.frame_buffer.recv_into(self.sock)
+        except (ssl.SSLWantReadError, ssl.SSLWantWriteError, BlockingIOError):
+            return # only part of TLS record arrived
+        if not received:
+            raise ConnectionError("server closed the connection")
+        for frame in self.frame_buffer.frames():
+            if frame.control:
+                if channel_kind(frame) == CHANNEL_CLOSE: # server refused the channel
+                    self._channel_refused(frame.message_id >> CHANNEL_SHIFT, channel_argument(frame))
+                continue
+            # every response goes through the context (even a dropped one), in the order of the wire
+            payload = self.compression.decompress(frame.payload) if self.compression else frame.payload
+            with self._lock:
+                channel, future = self._in_flight.pop(frame.message_id, (None, None))
+                if channel is not None:
+                    channel._in_flight -= 1
+                    channel.answered += 1
+                    self._release_channel(channel)
+            if future is None:
+                self.log.warning("response [%s] doesn't match any message, dropped", frame.message_id)
+                continue
+            channel._window.release()
+            _, _, body = self.codec.decode(payload)
+            future.set_result(bytes(body) if isinstance(body, memoryview) else body) # frame buffer is reused, the body is copied
+
+    def _channel_refused(self, channel_id: int, reason: str):
+        error = ChannelError(f"channel [{channel_id}] was closed by the server: {reason}")
+        self.log.warning(str(error))
+        with self._lock:
+            channel = self._channels.pop(channel_id, None)
+            if channel is None:
+                return
+            channel.error = error
+            if channel._outgoing: # its frames are dropped, _fill must not find it in the ready queue without them
+                self._ready.remove(channel)
+                channel._outgoing.clear()
+            failed = [(message_id, future) for message_id, (owner, future) in self._in_flight.items() if owner is channel]
+            for message_id, _ in failed:
+                del self._in_flight[message_id]
+        for _, future in failed:
+            channel._window.release()
+            future.set_exception(error)
+
+    def _fill(self):
+        # under the lock: one frame of every ready channel in turn till the batch is full - a channel with many queued frames
+        # gets its turn like all the others. frames of the connection itself go after the channels
+        while self._ready and len(self._sending) < WRITE_BATCH_SIZE:
+            channel = self._ready.popleft()
+            frame = channel._outgoing.popleft()
+            if isinstance(frame, tuple):
+                payload, message_id = frame
+                frame = encode_frame(self.compression.compress(payload), message_id)
+            self._sending += frame
+            self.written_frames += 1
+            if channel._outgoing:
+                self._ready.append(channel)
+            elif channel._closing and not channel._close_sent: # the last frame of a closed channel is its CC
+                channel._close_sent = True
+                self._release_channel(channel)
+        while not self._ready and self._control:
+            self._sending += self._control.popleft()
+
+    def _write(self) -> bool:
+        """
+        sends as much as the socket takes now, the rest when it is writable again
+        :return: False if the client is closing and everything was sent
+        """
+        while True:
+            if self._offset == len(self._sending):
+                self._sending.clear()
+                self._offset = 0
+                with self._lock:
+                    self._fill()
+                    if not self._sending:
+                        done = self._closing
+                        break
+            try:
+                with memoryview(self._sending) as view:
+                    sent = self.sock.send(view[self._offset:])
+            except (ssl.SSLWantWriteError, ssl.SSLWantReadError, BlockingIOError):
+                done = False
+                break # OS send buffer is full, next send is the same data again (SSL requires it)
+            self._offset += sent
+            self.writes += 1
+            self.written_bytes += sent
+        events = selectors.EVENT_READ | (selectors.EVENT_WRITE if self._sending else 0)
+        if events != self._events:
+            self._selector.modify(self.sock, events)
+            self._events = events
+        return not done
+
+    def _fail_all(self, error: Exception):
+        with self._lock:
+            failed = list(self._in_flight.values())
+            self._in_flight.clear()
+            for channel in self._channels.values():
+                if channel.error is None:
+                    channel.error = error
+                channel._outgoing.clear()
+            self._ready.clear()
+        for channel, future in failed:
+            channel._window.release() # senders that wait for room wake up and find the channel closed
+            if not future.done():
+                future.set_exception(error)
+
+    def close(self, timeout: float = 5) -> None:
+        """
+        the frames that were queued are sent, then the server gets a disconnect. responses that didn't arrive are failed (ConnectionError)
+        """
+        with self._lock:
+            if self._closing:
+                return
+            self._closing = True
+            self._control.append(disconnect_frame(self.codec))
+        self._wake_up()
+        self._io_thread.join(timeout)
+        self._selector.close()
+        self.sock.close()
+        self._wakeup_reader.close()
+        self._wakeup_writer.close()
+        self.client.disconnect()
+        self.log.info("multiplexed connection is closed")
+
+    def stats(self) -> dict:
+        """
+        :return: channels, messages without response, frames_per_write > 1 means frames of several channels went out in a single send
+        """
+        with self._lock:
+            return {"channels": sum(not channel.closed for channel in self._channels.values()),
+                    "in_flight": len(self._in_flight),
+                    "writes": self.writes,
+                    "written_frames": self.written_frames,
+                    "written_bytes": self.written_bytes,
+                    "frames_per_write": self.written_frames / self.writes if self.writes else 0}
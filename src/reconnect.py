@@ -0,0 +1,149 @@
+import asyncio
+import errno
+import logging
+import random
+import ssl
+import threading
+import time
+from typing import Final # makes my types be final without ability to change their type
+
+from src.log import get_logger
+
+############################################################################################
+# RECONNECT POLICY:
+# fixed delay between the connect attempts makes all the clients of a restarted server retry at the same moments
+# (thundering herd on the server accept), here the delay grows exponentially and is randomized ("full jitter"):
+#   delay of attempt N = random between 0 and min(max_delay, base_delay * multiplier ** N)
+# attempts stop after max_retries or when the deadline (seconds since the first attempt) passes,
+# then ReconnectError is raised - the caller decides what to do, the process is not killed.
+############################################################################################
+
+# errors that mean "server is not there (yet)": refused / reset / timed out, TLS handshake cut by a restarting server (SSLEOFError, ...),
+# host / network unreachable while it comes back. other errors (bad certificate, ...) will not be fixed by a retry
+RETRY_ON: Final[tuple] = (ConnectionError, TimeoutError, ssl.SSLError, OSError)
+NOT_TRANSIENT: Final[tuple] = (ssl.SSLCertVerificationError,)
+TRANSIENT_ERRNOS: Final[frozenset] = frozenset({errno.EHOSTUNREACH, errno.ENETUNREACH, errno.ENETDOWN, errno.EHOSTDOWN,
+                                                 errno.EADDRNOTAVAIL})
+
+_log = get_logger("RECONNECT")
+
+
+class ReconnectError(ConnectionError):
+    """
+    all the connect attempts have failed, the last error is chained (__cause__)
+    """
+
+
+def is_transient(error: OSError) -> bool:
+    """
+    :return: True if a retry can succeed (see RETRY_ON), False - the same error would come again (bad certificate, ...)
+    """
+    if isinstance(error, NOT_TRANSIENT):
+        return False
+    if isinstance(error, (ConnectionError, TimeoutError, ssl.SSLError)):
+        return True
+    return error.errno in TRANSIENT_ERRNOS
+
+
+class ReconnectPolicy:
+    def __init__(self, max_retries: int = 10, base_delay: float = 0.5, max_delay: float = 30,
+                 multiplier: float = 2, deadline: float = None):
+        """
+        :param max_retries: max connect attempts
+        :param base_delay: seconds, max delay after the first failed attempt
+        :param max_delay: seconds, max delay between 2 attempts
+        :param multiplier: growth of the max delay per attempt
+        :param deadline: seconds since the first attempt after which no new attempt is done, None - no deadline
+        """
+        self.max_retries: Final[int] = max_retries
+        self.base_delay: Final[float] = base_delay
+        self.max_delay: Final[float] = max_delay
+        self.multiplier: Final[float] = multiplier
+        self.deadline: Final[float] = deadline
+
+    @classmethod
+    def from_config(cls, config: dict) -> "ReconnectPolicy":
+        """
+        :param config: 'client' section of client_config.yaml
+        """
+        return cls(max_retries=config["max_retries"],
+                   base_delay=config["retry_delay"],
+                   max_delay=config.get("max_retry_delay", 30),
+                   deadline=config.get("reconnect_deadline"))
+
+    def delay(self, attempt: int) -> float:
+        """
+        :param attempt: number of failed attempts so far - 1 (0 for the first failure)
+        :return: seconds to wait before the next attempt
+        """
+        return random.uniform(0, min(self.max_delay, self.base_delay * self.multiplier ** attempt))
+
+    def _delays(self):
+        # yields the delay before every retry, stops when no retry is left (max_retries / deadline)
+        started = time.monotonic()
+        for attempt in range(self.max_retries - 1):
+            delay = self.delay(attempt)
+            if self.deadline is not None:
+                left = self.deadline - (time.monotonic() - started)
+                if left <= 0:
+                    return
+                delay = min(delay, left)
+            yield attempt + 2, delay
+
+    def retry(self, connect, retry_on: tuple = RETRY_ON, cancelled: threading.Event = None,
+              log: logging.Logger = None):
+        """
+        :param connect: function without parameters that connects, raises on failure
+        :param retry_on: exceptions that cause a retry, other exceptions (and OSErrors that are not transient) are raised right away
+        :param cancelled: when set - the waiting between the attempts stops and ReconnectError is raised
+        :param log: logger of the caller
+        :return: what connect() returned
+        """
+        log = log or _log
+        last_error = None
+        delays = self._delays()
+        attempt, delay = 1, 0
+        while True:
+            log.info("Connect attempt [%s] ...", attempt)
+            try:
+                return connect()
+            except retry_on as ee:
+                if isinstance(ee, OSError) and not is_transient(ee):
+                    raise
+                last_error = ee
+            next_attempt = next(delays, None)
+            if next_attempt is None:
+                break
+            attempt, delay = next_attempt
+            log.info("Server is down / not started yet (%s), retrying in %.2f seconds...", last_error, delay)
+            if cancelled is not None:
+                if cancelled.wait(delay):
+                    raise ReconnectError("reconnect was cancelled") from last_error
+            else:
+                time.sleep(delay)
+        raise ReconnectError(f"Failed to connect to the Server after {attempt} attempts") from last_error
+
+    async def retry_async(self, connect, retry_on: tuple = RETRY_ON, log: logging.Logger = None):
+        """
+        same as retry(), for asyncio: connect is a function without parameters that returns an awaitable,
+        cancel the task that awaits this to stop the retries
+        """
+        log = log or _log
+        last_error = None
+        delays = self._delays()
+        attempt, delay = 1, 0
+        while True:
+            log.info("Connect attempt [%s] ...", attempt)
+            try:
+                return await connect()
+            except retry_on as ee:
+                if isinstance(ee, OSError) and not is_transient(ee):
+                    raise
+                last_error = ee
+            next_attempt = next(delays, None)
+            if next_attempt is None:
+                break
+            attempt, delay = next_attempt
+            log.info("Server is down / not started yet (%s), retrying in %.2f seconds...", last_error, delay)
+            await asyncio.sleep(delay)
+        raise ReconnectError(f"Failed to connect to the Server after {attempt} attempts") from last_error
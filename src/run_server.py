@@ -0,0 +1,59 @@
+import argparse
+
+############################################################################################
+# single entry point for all the server implementations:
+#   threaded - server_tcp.Server: single client, 2 threads (receive + process)
+#   select   - multi_client_by_select_server_tcp.Server: many clients, event loop + pool of working threads
+#   asyncio  - async_server_tcp.Server: many clients, single thread asyncio (uvloop if installed)
+#
+# select engine with number_worker_processes > 1 (or --processes N) runs multi_process_server.Supervisor:
+# N select servers in their own processes on the same port (SO_REUSEPORT), it runs till SIGTERM / Ctrl+C
+#
+# run from the repo root:
+#   python -m src.run_server --engine asyncio
+#   python -m src.run_server --engine select --processes 4
+############################################################################################
+
+ENGINES = ("threaded", "select", "asyncio")
+
+
+def create_server(engine: str):
+    # imports are done here so running one engine doesn't require the dependencies of the others (colorama, uvloop)
+    if engine == "threaded":
+        from src.server_tcp import Server
+    elif engine == "select":
+        from src.multi_client_by_select_server_tcp import Server
+    elif engine == "asyncio":
+        from src.async_server_tcp import Server
+    else:
+        raise ValueError(f"unknown server engine: '{engine}', supported: {ENGINES}")
+    return Server()
+
+
+def _worker_processes(processes: int = None) -> int:
+    from src.config_resolver import load_config, SERVER_CONFIG_FILE
+    return processes or load_config(SERVER_CONFIG_FILE)["server"].get("number_worker_processes", 1)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="run the TLS echo server")
+    parser.add_argument("--engine", choices=ENGINES, default="select")
+    parser.add_argument("--processes", type=int, default=None,
+                        help="select engine only, amount of server processes (default: number_worker_processes from the config)")
+    args = parser.parse_args()
+
+    if args.engine == "select" and _worker_processes(args.processes) > 1:
+        from src.multi_process_server import Supervisor
+        supervisor = Supervisor(processes=args.processes)
+        supervisor.start()
+        supervisor.print_stats()
+        return
+
+    server = create_server(args.engine)
+    server.start()
+    server.disconnect()
+    server.print_received_messages()
+
+
+if __name__ == '__main__':
+    main()
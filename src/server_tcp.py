@@ -2,14 +2,21 @@
 from threading import Thread
 import queue
 import socket
-import yaml
 from typing import Final # makes my types be final without ability to change their type
-import ssl
-import os
-from pathlib import Path
 
-# required for multi client
-import select
+from src.config_resolver import find_file, load_config, SERVER_CONFIG_FILE, CERT_FILE, KEY_FILE
+from src import tls_contexts
+from src.framing import FrameBuffer, send_frame
+from src.log import get_logger, setup_logging
+from src.message_store import MessageRecord, create_store
+from src.handlers import HandlerRegistry, Request, acknowledge
+from src.codec import CODECS, CodecError, alpn_protocols, is_disconnect, negotiated_codec, negotiated_compression, printable
+from src.compression import DEFAULT_LEVEL, DEFAULT_THRESHOLD, CompressionError, create as create_compression
+from src.streaming import STREAM_OPEN, abort_frame, stream_kind
+
+# put in the queue instead of a payload - the stream of this id is refused (only the select server handles streams),
+# the abort frame is sent by the processing thread, the only thread that writes to the client socket
+REFUSE_STREAM: Final[object] = object()
 
 
 class Server:
@@ -22,60 +29,86 @@ class Server:
     # recv (blocking wait for Client data) -> return answer
     ############################################################################################
 
-    def __init__(self):
+    def __init__(self, config_path = None, cert_path = None, key_path = None):
+        """
+        :param config_path: explicit path of server_config.yaml, None -> searched (see config_resolver)
+        :param cert_path: explicit path of the certificate, None -> searched (see config_resolver)
+        :param key_path: explicit path of the private key, None -> searched (see config_resolver)
+        """
         self.app: Final[str] = "SERVER"
+        self.log = get_logger(self.app)
+        self.config_path = config_path
+        self.cert_path = cert_path
+        self.key_path = key_path
         # self.ip: Final[str] = "127.0.0.1" if not ip else ip
         # self.port: Final[int] = 8820 if not port else port
 
         self.MAX_CONNECTIONS: Final[int] = 1
         self.client_socket = None
+        self.client_address = None
         self.server_socket = None
         self.client_messages_queue = queue.Queue() # this Q was created in context of the Server obj, therefore will leave also after thread will finish
-        self.received_messages_store = {}                 # multiprocessing.Queue() <-- this is good when we used processes and not threads
+        self.codec = None # negotiated in the TLS handshake with the client (see codec)
+        self.compression = None # Compression of the connection if the client negotiated it (see compression)
 
         # for multi client
         self.client_sockets = []
 
-        ip, port, max_data_size = self._init()
-        print(f"[{self.app}]: app is executed using the next parameters: ")
+        (ip, port, max_data_size, tls_num_tickets, message_store, handlers_config, codecs,
+         compression_threshold, compression_level) = self._init()
+        self.log.info("app is executed using the next parameters: ")
         self.IP: Final[str] = ip # also possible to do: socket.gethostbyname(socket.gethostname()) if not ip else ip  # <---- this way we determine the local host address, this way -> we set it hard codded: "127.0.0.1" if not ip else ip
-        print(f"[{self.app}]: IP: {self.IP}")
+        self.log.info(f"IP: {self.IP}")
 
         self.PORT: Final[int] = port # also possible to do: 8820 if not port else port
-        print(f"[{self.app}]: PORT: {self.PORT}")
+        self.log.info(f"PORT: {self.PORT}")
 
         self.MAX_DATA_SIZE = max_data_size
-        print(f"[{self.app}]: Max data size: {self.MAX_DATA_SIZE}")
+        self.log.info(f"Max data size: {self.MAX_DATA_SIZE}")
+
+        self.TLS_NUM_TICKETS = tls_num_tickets
+        self.log.info(f"TLS session tickets: {self.TLS_NUM_TICKETS}")
+
+        self.handlers = HandlerRegistry(default=acknowledge) # builds the responses (see handlers)
+        self.handlers.configure(handlers_config)
 
-    def _find_full_file_path(self, my_path, my_file):
-        for dirpath, _, filenames in os.walk(my_path):
-            if my_file in filenames:
-                full_file_path = Path(str(os.path.join(dirpath, my_file)))  # Return full path if found
-                return full_file_path
-        return None  # Return None if not found
+        self.CODECS: Final[list] = codecs
+        self.log.info(f"Codecs: {self.CODECS}")
+
+        self.COMPRESSION_THRESHOLD: Final[int] = compression_threshold # responses shorter than this are not compressed
+        self.COMPRESSION_LEVEL: Final[int] = compression_level
+
+        self.received_messages_store = message_store # bounded (see message_store), multiprocessing.Queue() <-- this is good when we used processes and not threads
+        self.log.info(f"Message store: {type(self.received_messages_store).__name__}")
 
     def _init(self):
-        full_path_to_file = self._find_full_file_path(Path.cwd().parent,
-                                              "server_config.yaml")
+        full_path_to_file = find_file(SERVER_CONFIG_FILE, self.config_path)
         if not full_path_to_file:
             raise FileExistsError
-        print(f"[{self.app}]: Loading configuration for the server from: {full_path_to_file}")
 
-        with open(full_path_to_file, "r") as yaml_file:
-            config = yaml.safe_load(yaml_file)
-            return config["server"]["ip_address"],\
-                   config["server"]["port"], \
-                   config["server"]["max_data_size"]
+        config = load_config(SERVER_CONFIG_FILE, self.config_path) # loaded once per process, reloaded only if the file was modified
+        setup_logging(config["server"].get("log_level"), config["server"].get("log_color", False))
+        self.log.info(f"Loaded configuration for the server from: {full_path_to_file}")
+        return config["server"]["ip_address"],\
+               config["server"]["port"], \
+               config["server"]["max_data_size"], \
+               config["server"].get("tls_num_tickets", tls_contexts.DEFAULT_NUM_TICKETS), \
+               create_store(config["server"]), \
+               config["server"], \
+               config["server"].get("codecs", list(CODECS)), \
+               config["server"].get("compression_threshold", DEFAULT_THRESHOLD), \
+               config["server"].get("compression_level", DEFAULT_LEVEL)
 
     def start(self):
         """
         Start the server, will create 2 process:
         1. that listen to the socket + receives the messages from a client and stores in the queue
-        2. that listens on the queue to the new message, retrieve and print it + add to SQL DB
+        2. that listens on the queue to the new message, retrieve and print it + add to the message store
+           (message_store: sqlite -> SQL DB, written in batches by the writer thread of the store)
         :return: None
         """
         # 1. Create a socket object
-        print(f"\n\n[{self.app}]: Creating the 'regular' TCP/IP socket ...")
+        self.log.info("Creating the 'regular' TCP/IP socket ...")
         self.server_socket = socket.socket(socket.AF_INET,
                                            socket.SOCK_STREAM) # use protocol: TCP
         # important (but optional) line - it tells os that port will be free right after server disconnect.
@@ -86,21 +119,22 @@ class Server:
         # 2. prepare secure context - setting up all the rules for secure communication
         # It helps Python know how to handle encryption (TLS/SSL) for the server or client
         # ssl.Purpose.CLIENT_AUTH tells python - hi I am server, and i wish to communicate securely with client/s
-        print(f"[{self.app}]: Creating the secured SSL context (set of rules for secure connection) ...")
-        context = ssl.create_default_context(ssl.Purpose.CLIENT_AUTH)
+        self.log.info("Creating the secured SSL context (set of rules for secure connection) ...")
         # load certificate + key (certificate for authentication with Client, keys for encryption messages)
-        print(f"[{self.app}]: Load Authentication certificate and encryption keys, for secure connection ...")
-        full_path_to_cert_file = self._find_full_file_path(Path.cwd().parent,"ilana_cert_01.pem")
-        full_path_to_key_file = self._find_full_file_path(Path.cwd().parent, "ilana_key_01.pem")
+        self.log.info("Load Authentication certificate and encryption keys, for secure connection ...")
+        full_path_to_cert_file = find_file(CERT_FILE, self.cert_path)
+        full_path_to_key_file = find_file(KEY_FILE, self.key_path)
 
         if not full_path_to_cert_file or not full_path_to_key_file:
             raise FileExistsError
-        print(f"[{self.app}]: Loading cert + key files from: {full_path_to_cert_file}")
-        context.load_cert_chain(certfile=full_path_to_cert_file,
-                                keyfile=full_path_to_key_file)
+        self.log.info(f"Loading cert + key files from: {full_path_to_cert_file}")
+        # context is built once per process, it also issues the session tickets (see tls_contexts)
+        # the codec of the connection is chosen in the handshake (ALPN), from self.CODECS
+        context = tls_contexts.get_server_context(full_path_to_cert_file, full_path_to_key_file, self.TLS_NUM_TICKETS,
+                                                  alpn_protocols(self.CODECS))
         # 3. wrap regular server socket with SSL - from this moment all operations with socket, such as: Bind(), Listen(), Accept() wil be done with secured Server socket
         # wrapping means => putting message in secured envelope. All the data sent/received through the socket is authenticated and encrypted
-        print(f"[{self.app}]: Wrapping the 'regular' TCP/IP socket to be SSL 'secured' socket ...")
+        self.log.info("Wrapping the 'regular' TCP/IP socket to be SSL 'secured' socket ...")
         self.server_socket = context.wrap_socket(self.server_socket,
                                                  server_side=True) # <--- this line tells python that this is a Server and not a Client
 
@@ -110,7 +144,7 @@ class Server:
         # 5. This method is actually puts Server's socket into listening mode, it is not blocking func
         # OS knows that only 1 connection is allowed, the rest will be rejected
         self.server_socket.listen(self.MAX_CONNECTIONS)
-        print(f"[{self.app}]: Ready and is listening on port 8820...")
+        self.log.info("Ready and is listening on port 8820...")
 
         # make server no get stack waiting till client connects but check and keep running and vise versa
         # print(f"[{self.SERVER}]: configured not to stack and wait till the client is connected")
@@ -119,16 +153,19 @@ class Server:
         # 6. Server is blocked (stack, pauses, waiting) till first Client (single client) connection. Server will wait forever for the connection
         # first connected client will get the Server from stack, will be returned Client connection details: client_ip, client_socket (only socket actually in use)
         # then server will be stacked waiting for messages from connected client
-        print(f"[SERVER]: is paused until client arrives ...")
-        self.client_socket, client_address = self.server_socket.accept()
-        print(f"[{self.app}]: Connection is established with client ip address: {client_address}, type: {type(self.client_socket)} !!!!!!")
+        self.log.info("is paused until client arrives ...")
+        self.client_socket, self.client_address = self.server_socket.accept()
+        self.codec = negotiated_codec(self.client_socket)
+        self.compression = create_compression(negotiated_compression(self.client_socket), self.COMPRESSION_THRESHOLD, self.COMPRESSION_LEVEL)
+        self.log.info(f"Connection is established with client ip address: {self.client_address}, type: {type(self.client_socket)}, "
+                      f"codec: {self.codec.name}{' (legacy)' if self.codec.legacy else ''}{' + compression' if self.compression else ''} !!!!!!")
 
         # 7. create 2 different procs to handle receive and process of the messages from a client
-        print(f"[{self.app}]: Creating 2 parallel server activities: receive_client_messages, process_client_messages ...")
+        self.log.info("Creating 2 parallel server activities: receive_client_messages, process_client_messages ...")
         # receiver_proc = multiprocessing.Process(target=self._receive_messages)#, args=(self.client_socket, self.client_messages_queue))
         # processor_proc = multiprocessing.Process(target=self._process_messages)#, args=(self. client_socket, self.client_messages_queue))
 
-        print(f"[{self.app}]: Starting these activities to run")
+        self.log.info("Starting these activities to run")
         receiver_thread = Thread(target=self._receive_messages)
         processor_thread = Thread(target=self._process_messages)
 
@@ -138,15 +175,18 @@ class Server:
         receiver_thread.join()
         # if we are here kill the next thread too
         processor_thread.join()
-        print(f"[{self.app}]: Server shut down.")
+        self.log.info("Server shut down.")
 
     def _receive_messages(self):
         """
         Looping the server socket, once new message entered, retrieve and handle: insert into internal queue for further respond
         :return: None
         """
-        while True:
-            print(f"[{self.app}]: process 'receive & store' is running ...")
+        # single recv() can bring part of a message or several messages, the buffer cuts the received bytes back to messages
+        frame_buffer = FrameBuffer(self.MAX_DATA_SIZE)
+        client_disconnected = False
+        while not client_disconnected:
+            self.log.debug("process 'receive & store' is running ...")
             try:
                 # Several scenarios can be here: --------------------------------------------------------------------------------------------------------------------
                 # 1: if no incoming message (from a client), server is stack (blocked) and keeps on waiting
@@ -156,22 +196,39 @@ class Server:
                 # 4: if client connection was forcefully disconnected, recv() will return exception that we will catch,
                 #    still the Server will close both (server + client) connection properly
                 # --------------------------------------------------------------------------------------------------------------------------------------------------
-                data = self.client_socket.recv(self.MAX_DATA_SIZE) # its bad idea to do: data = self.client_socket.recv(self.MAX_DATA_SIZE).decode() as a data can be empty
-                if data: # even if 'q' we put in queue
-                    message_from_client = data.decode('utf-8')
-                    print(f"[{self.app}]: Received message from a client: <{message_from_client}>")
-                    self.client_messages_queue.put(message_from_client)
-                    # also if 'q' finish this thread (the other thread will finish as well)
-                    if message_from_client == 'q': # empty data (client disconnected forcibly) or message = 'q' (client sent disconnection message)
-                        print(f"[{self.app}]: client - disconnected")
-                        print(f"[{self.app}]: Server - finished")
-                        break
-                else: # if arrived empty data (=client disconnected forcibly) - we finish this thread + we need to make other thread to finish too, so we put in queue 'q'
-                    self.client_messages_queue.put('q')
+                received = frame_buffer.recv_into(self.client_socket) # its bad idea to decode here as a data can be empty or can be a part of message
+                if received:
+                    for frame in frame_buffer.frames():
+                        # disconnection (control frame BYE, or 'q' on a legacy connection) is put in the queue as None,
+                        # finish this thread (the other thread will finish as well)
+                        if is_disconnect(frame, self.codec):
+                            self.client_messages_queue.put((frame.message_id, None))
+                            self.log.info("client - disconnected")
+                            self.log.info("Server - finished")
+                            client_disconnected = True
+                            break
+                        if stream_kind(frame) == STREAM_OPEN: # without an answer Client.send_stream waits for its credit forever
+                            self.client_messages_queue.put((frame.message_id, REFUSE_STREAM))
+                            continue
+                        if frame.control:
+                            self.log.warning("client sent unknown control frame, ignored")
+                            continue
+                        self.log.debug("Received message from a client: [%s] %s bytes", frame.message_id, len(frame.payload))
+                        # message id is kept with the message, response will be sent with the same id
+                        # payload is copied (frame buffer is reused by the next recv) and decoded by the processing thread,
+                        # decompressed here - the compression context must see the messages in the order they arrived
+                        self.client_messages_queue.put((frame.message_id,
+                                                        self.compression.decompress(frame.payload) if self.compression else bytes(frame.payload)))
+                else: # if arrived empty data (=client disconnected forcibly) - we finish this thread + we need to make other thread to finish too, so we put in queue None
+                    self.client_messages_queue.put((0, None))
                     break
             except ConnectionAbortedError as ee:
-                print(f"[{self.app}]: client - seems like failed")
-                print(f"[{self.app}]: Thread - finished")
+                self.log.warning("client - seems like failed")
+                self.log.info("Thread - finished")
+                break
+            except CompressionError as ee:
+                self.log.error(f"client sent invalid compressed message, error: {ee}, disconnecting ###")
+                self.client_messages_queue.put((0, None))
                 break
 
     def _process_messages(self) -> None:
@@ -182,53 +239,65 @@ class Server:
         index = 0
 
         while True:
-            print(f"[{self.app}]: process 'retrieve & respond' running ...")
+            self.log.debug("process 'retrieve & respond' running ...")
             try:
                 # .get() is for retrieve message from queue
                 # default it is blocking function but we can set a time parameter to limit the blocking time to 1 sec
                 # If no message arrives within 1 second, it raises queue.Empty, which we're catching to simply continue the loop
 
-                message = self.client_messages_queue.get(timeout=8)
-                self.received_messages_store.setdefault(index, []).append(message)
+                message_id, payload = self.client_messages_queue.get(timeout=8)
 
-                # check message, if empty then finish
-                if message == 'q':
-                    print(f"[{self.app}]: extracted message = {message}, finish polling the queue")
-                    break  # consider here to close the DB
+                # check message, if None (client disconnected) then finish
+                if payload is None:
+                    self.log.info("extracted disconnection message, finish polling the queue")
+                    self.received_messages_store.add(MessageRecord(self.client_address, index, "q"))
+                    break  # the store (DB) is closed in disconnect(), after the last record was added
+                if payload is REFUSE_STREAM:
+                    self.log.warning(f"client opened stream [{message_id}], streams are not supported, aborting it")
+                    self.client_socket.sendall(abort_frame(message_id, "streams are not supported"))
+                    continue
 
+                try:
+                    message_type, flags, message = self.codec.decode(payload)
+                except CodecError as ee:
+                    self.log.error(f"client sent invalid message [{message_id}], error: {ee} ###")
+                    continue
                 # respond to a client
-                resp_message = "Hello, client! I received your message."
-                print(f"[{self.app}]: Sending response message back to client: {index}.{resp_message}")
-                self.client_socket.sendall(resp_message.encode())
-                self.received_messages_store.setdefault(index, []).append(resp_message)
+                resp_message = self.handlers.handle(Request(self.client_address, message_id, message, message_type, flags=flags))
+                self.log.debug("Sending response message back to client: %s.%s", index, resp_message)
+                payload = self.codec.encode(resp_message, message_type)
+                send_frame(self.client_socket, self.compression.compress(payload) if self.compression else payload, message_id)
+                self.received_messages_store.add(MessageRecord(self.client_address, index, printable(message), printable(resp_message)))
                 index += 1
-                print(f"[{self.app}]: Message sent !")
+                self.log.debug("Message sent !")
             except queue.Empty:
-                print(f"[{self.app}]: yet found any message in queue, keep polling the queue ...")
+                self.log.debug("yet found any message in queue, keep polling the queue ...")
                 continue
             except Exception as e:
-                print(f"[{self.app}]: Queue processing error: {e} ###")
+                self.log.error(f"Queue processing error: {e} ###")
                 break
         self.client_messages_queue.task_done()
-        print(f"[{self.app}]: thread that processing messages - finished !!!")
+        self.log.info("thread that processing messages - finished !!!")
 
     def disconnect(self):
         # 7. Server closes the connection - in any way either if client disconnected properly or if client's connection forcefully closed
         # If the server doesn’t call close(), the socket could remain in a "half-closed" state
         # where resources are still being held open even though the client is no longer connected.
         # Server MUST close Clients connection and his own Server connection according to the protocol
-        print(f"[{self.app}]: Closing Client socket (connection) ")
+        self.log.info("Closing Client socket (connection) ")
         self.client_socket.close()
-        print(f"[{self.app}]: Closing Server socket (connection) ")
+        self.log.info("Closing Server socket (connection) ")
         self.server_socket.close()
-        print(f"[{self.app}]: both processes - finished !!!")
+        self.received_messages_store.close() # still can be read after close
+        self.handlers.close()
+        self.log.info("both processes - finished !!!")
 
     def print_received_messages(self):
         print(f"\n[{self.app}]: All the messages that were sent: Client -> Server\n"
               f"--------------------------------------------------------------------")
         print(f"the len of the store is: {len(self.received_messages_store)}")
-        for index, messages_list in self.received_messages_store.items():
-            print(f"[{self.app}]: [{index}]: {messages_list}")
+        for record in self.received_messages_store.records():
+            print(f"[{self.app}]: {record}")
 
 # I added here a main just in case I wish to run the server directly and not from simpl_client_server_app.py
 if __name__ == '__main__':
@@ -0,0 +1,281 @@
+import collections
+import io
+import os
+import struct
+import threading
+from typing import Final # makes my types be final without ability to change their type
+
+from src.framing import CONTROL_FLAG, HEADER, encode_frame, recv_frame
+
+############################################################################################
+# STREAMS (big payloads / files over the existing TLS connection):
+# a message is a single frame that is held in memory as a whole, a stream is cut into chunks that are handled one by one,
+# so neither side ever holds the whole payload. all the frames of a stream are control frames (see framing)
+# with the id of the stream as their message id, the first 2 bytes of the payload say what the frame is:
+#
+#   client -> server:  SO (open: size + message type) -> SD (data chunk) ... SD -> SE (end)
+#   server -> client:  SC (credit: bytes the client may send more) ... SC -> response (a regular frame with the stream id)
+#   both:              SA (abort: reason)
+#
+# flow control (per stream): the client sends data only for the credit it got, the server gives the first credit (its window)
+# when the stream is opened and more credit as its handler consumes the chunks - a slow handler slows the client down
+# and the server never buffers more than 'window' bytes of a stream.
+#
+# client side: Client.send_stream(file / bytes / iterable of chunks), a file is read with readinto() into a single reused
+# buffer that already has the frame header in front of the data - no copy per chunk.
+# server side: stream handler (HandlerRegistry.register_stream) gets an IncomingStream - iterate it to get the chunks
+############################################################################################
+
+STREAM_OPEN: Final[bytes] = b"SO"
+STREAM_DATA: Final[bytes] = b"SD"
+STREAM_END: Final[bytes] = b"SE"
+STREAM_CREDIT: Final[bytes] = b"SC"
+STREAM_ABORT: Final[bytes] = b"SA"
+STREAM_KINDS: Final[frozenset] = frozenset((STREAM_OPEN, STREAM_DATA, STREAM_END, STREAM_CREDIT, STREAM_ABORT))
+KIND_SIZE: Final[int] = 2
+OPEN_HEADER: Final[struct.Struct] = struct.Struct("!Q") # total size (0 - unknown), followed by the message type (ascii)
+CREDIT: Final[struct.Struct] = struct.Struct("!I")
+DEFAULT_CHUNK_SIZE: Final[int] = 64 * 1024
+DEFAULT_WINDOW: Final[int] = 1024 * 1024
+
+
+class StreamError(Exception):
+    pass
+
+
+def stream_kind(frame):
+    """
+    :return: kind of a stream frame (STREAM_OPEN, ...), None if the frame is not part of a stream
+    """
+    if not frame.control:
+        return None
+    kind = bytes(frame.payload[:KIND_SIZE])
+    return kind if kind in STREAM_KINDS else None
+
+
+def open_frame(stream_id: int, message_type: str = None, size: int = None) -> bytes:
+    return encode_frame(STREAM_OPEN + OPEN_HEADER.pack(size or 0) + (message_type or "").encode('ascii'), stream_id, control=True)
+
+
+def parse_open(payload) -> tuple:
+    """
+    :return: (message type or None, size or None)
+    """
+    if len(payload) < KIND_SIZE + OPEN_HEADER.size:
+        raise StreamError(f"stream open frame of {len(payload)} bytes is shorter than its header")
+    size, = OPEN_HEADER.unpack_from(payload, KIND_SIZE)
+    message_type = str(payload[KIND_SIZE + OPEN_HEADER.size:], 'ascii')
+    return message_type or None, size or None
+
+
+def end_frame(stream_id: int) -> bytes:
+    return encode_frame(STREAM_END, stream_id, control=True)
+
+
+def credit_frame(stream_id: int, amount: int) -> bytes:
+    return encode_frame(STREAM_CREDIT + CREDIT.pack(amount), stream_id, control=True)
+
+
+def abort_frame(stream_id: int, reason: str) -> bytes:
+    return encode_frame(STREAM_ABORT + reason.encode('utf-8', 'replace'), stream_id, control=True)
+
+
+############################################################################################
+# client side
+############################################################################################
+
+class _IterableReader(io.RawIOBase):
+    # readinto() over an iterable of bytes chunks, chunks bigger than the buffer are handed out in parts
+    def __init__(self, chunks):
+        self._chunks = iter(chunks)
+        self._rest = memoryview(b"")
+
+    def readable(self) -> bool:
+        return True
+
+    def readinto(self, buffer) -> int:
+        while not self._rest:
+            chunk = next(self._chunks, None)
+            if chunk is None:
+                return 0
+            self._rest = memoryview(chunk.encode() if isinstance(chunk, str) else chunk).cast("B")
+        size = min(len(buffer), len(self._rest))
+        buffer[:size] = self._rest[:size]
+        self._rest = self._rest[size:]
+        return size
+
+
+def _reader(source):
+    if hasattr(source, "readinto"):
+        return source
+    if isinstance(source, (bytes, bytearray, memoryview)):
+        return _IterableReader((source,))
+    return _IterableReader(source)
+
+
+def source_size(source):
+    """
+    :return: bytes left in a bytes / file source, None if it is not known (iterable)
+    """
+    if isinstance(source, (bytes, bytearray, memoryview)):
+        return memoryview(source).nbytes
+    try:
+        return os.fstat(source.fileno()).st_size - source.tell()
+    except (AttributeError, OSError, ValueError, io.UnsupportedOperation):
+        return None
+
+
+def _next_event(sock, frame_buffer, stream_id: int) -> tuple:
+    """
+    reads till a frame of this stream arrives
+    :return: (credit, None) or (0, response frame)
+    """
+    while True:
+        frame = recv_frame(sock, frame_buffer)
+        if frame is None:
+            raise ConnectionError("server closed the connection in the middle of the stream")
+        if frame.message_id != stream_id:
+            continue
+        kind = stream_kind(frame)
+        if kind == STREAM_CREDIT:
+            return CREDIT.unpack_from(frame.payload, KIND_SIZE)[0], None
+        if kind == STREAM_ABORT:
+            raise StreamError(f"stream was aborted by the server: {str(frame.payload[KIND_SIZE:], 'utf-8', 'replace')}")
+        if not frame.control:
+            return 0, frame
+
+
+def send_stream(sock, frame_buffer, stream_id: int, source, message_type: str = None, size: int = None,
+                chunk_size: int = DEFAULT_CHUNK_SIZE, progress = None):
+    """
+    blocking: sends the source as a stream and waits for the response of the stream handler
+    :param sock: blocking socket obj (regular or SSL)
+    :param frame_buffer: FrameBuffer of the connection (credit + response frames are read with it)
+    :param source: file opened in binary mode / bytes / iterable of bytes chunks
+    :param size: total bytes (the handler + progress get it), None -> taken from the source if it can be (see source_size)
+    :param chunk_size: max data bytes per frame
+    :param progress: progress(sent bytes, size) after every chunk
+    :return: response Frame (payload as bytes, encoded by the codec of the connection)
+    """
+    size = source_size(source) if size is None else size
+    reader = _reader(source)
+    data_start = HEADER.size + KIND_SIZE
+    buffer = bytearray(data_start + chunk_size) # header + kind + data, the data is read right behind the header
+    buffer[HEADER.size:data_start] = STREAM_DATA
+    credit, sent = 0, 0
+    sock.sendall(open_frame(stream_id, message_type, size))
+    with memoryview(buffer) as view:
+        while True:
+            if not credit:
+                granted, response = _next_event(sock, frame_buffer, stream_id)
+                if response is not None: # handler answered without reading the whole stream, the rest is not needed
+                    sock.sendall(abort_frame(stream_id, "answered"))
+                    return response
+                credit += granted
+                continue
+            read = reader.readinto(view[data_start:data_start + min(chunk_size, credit)])
+            if not read:
+                break
+            HEADER.pack_into(buffer, 0, (KIND_SIZE + read) | CONTROL_FLAG, stream_id)
+            sock.sendall(view[:data_start + read])
+            credit -= read
+            sent += read
+            if progress:
+                progress(sent, size)
+    sock.sendall(end_frame(stream_id))
+    while True:
+        _, response = _next_event(sock, frame_buffer, stream_id)
+        if response is not None:
+            return response
+
+
+############################################################################################
+# server side
+############################################################################################
+
+class IncomingStream:
+    """
+    chunks of a stream: the event loop feeds them, the stream handler iterates them on its own thread
+        for chunk in stream: ...       # bytes, blocks till the next chunk arrives, raises StreamError if the stream was aborted
+    the handler can look at: client, message_id (stream id), message_type, size (None - unknown), received, consumed
+    """
+    def __init__(self, client, message_id: int, message_type: str, size: int, window: int, grant, buffered = None):
+        """
+        :param window: max bytes of the stream that wait for the handler (the credit the client gets)
+        :param grant: grant(amount) - gives the client more credit, called on the thread of the handler
+        :param buffered: Gauge of the bytes that wait in all the streams, None - not counted
+        """
+        self.client = client
+        self.message_id = message_id
+        self.message_type = message_type
+        self.size = size
+        self.window: Final[int] = window
+        self.received = 0  # bytes that arrived
+        self.consumed = 0  # bytes the handler took
+        self.error = None  # reason of the abort
+        self.closed = False # handler returned, chunks that still arrive are dropped
+        self._grant = grant
+        self._buffered = buffered
+        self._ungranted = 0 # consumed bytes that were not given back to the client as credit yet
+        self._chunks = collections.deque()
+        self._finished = False
+        self._condition = threading.Condition()
+
+    def feed(self, chunk: bytes) -> bool:
+        """
+        event loop: a data chunk arrived
+        :return: False if the client sent more than its credit
+        """
+        with self._condition:
+            if self.closed or self.error is not None:
+                return True
+            if self.received - self.consumed + len(chunk) > self.window:
+                return False
+            self._chunks.append(chunk)
+            self.received += len(chunk)
+            self._condition.notify()
+        if self._buffered is not None:
+            self._buffered.inc(len(chunk))
+        return True
+
+    def finish(self) -> None:
+        # event loop: the client sent the whole stream
+        with self._condition:
+            self._finished = True
+            self._condition.notify()
+
+    def abort(self, reason: str) -> None:
+        # event loop: client aborted the stream / disconnected
+        with self._condition:
+            if self.error is None:
+                self.error = reason
+            self._condition.notify()
+
+    def close(self) -> None:
+        # thread of the handler: the handler returned
+        with self._condition:
+            self.closed = True
+            dropped = sum(len(chunk) for chunk in self._chunks)
+            self._chunks.clear()
+        if self._buffered is not None and dropped:
+            self._buffered.dec(dropped)
+
+    def __iter__(self):
+        while True:
+            with self._condition:
+                while not self._chunks and not self._finished and self.error is None:
+                    self._condition.wait()
+                if self.error is not None:
+                    raise StreamError(f"stream [{self.message_id}] was aborted: {self.error}")
+                if not self._chunks: # finished + all taken
+                    return
+                chunk = self._chunks.popleft()
+                self.consumed += len(chunk)
+            if self._buffered is not None:
+                self._buffered.dec(len(chunk))
+            yield chunk
+            # the chunk was handled - the client may send that much more, given back in batches of half a window
+            self._ungranted += len(chunk)
+            if self._ungranted >= self.window // 2:
+                self._grant(self._ungranted)
+                self._ungranted = 0
@@ -0,0 +1,117 @@
+import math
+import time
+from typing import Final # makes my types be final without ability to change their type
+
+############################################################################################
+# HASHED TIMER WHEEL:
+# timeouts of the select server (TLS handshake, idle clients, request deadlines) without scanning all the sockets:
+# the time is cut into ticks (TICK seconds), a timer is put in the slot of the tick it expires at (tick % SLOTS):
+#
+#   slot:   0      1      2      3    ...  SLOTS-1
+#          [t1]   []     [t2,t3] []        [t4]        <- current tick points at one of them, advance() moves it forward
+#
+#   schedule  - O(1): append to a slot
+#   cancel    - O(1): a flag, the timer is dropped when its slot is visited (safe from any thread)
+#   advance   - visits only the slots of the ticks that passed, fires the timers that are due there
+# a timer that is more than a whole round away (SLOTS * TICK seconds) stays in its slot and is skipped till its round comes.
+#
+# a timer never fires early, it fires up to 1 TICK late (+ the time the event loop was busy)
+# schedule + advance are called only by the event loop thread (no lock), the callbacks run on it too
+#
+# usage:
+#   timers = TimerWheel(tick=0.1, slots=1024)
+#   timer = timers.schedule(10, on_timeout, client_socket)
+#   timer.cancel()
+#   poll(timers.next_delay(5)); timers.advance()
+############################################################################################
+
+DEFAULT_TICK: Final[float] = 0.1 # seconds
+DEFAULT_SLOTS: Final[int] = 1024 # one round: ~100 seconds
+
+
+class Timer:
+    __slots__ = ("tick", "callback", "args", "cancelled")
+
+    def __init__(self, tick: int, callback, args: tuple):
+        self.tick = tick # absolute tick it expires at
+        self.callback = callback
+        self.args = args
+        self.cancelled = False
+
+    def cancel(self) -> None:
+        self.cancelled = True
+
+
+class TimerWheel:
+
+    def __init__(self, tick: float = DEFAULT_TICK, slots: int = DEFAULT_SLOTS, now: float = None):
+        """
+        :param tick: seconds per slot - the resolution of the timers
+        :param slots: slots of the wheel, timers further than slots * tick seconds stay for more than one round
+        :param now: start time (time.monotonic() if None)
+        """
+        self.TICK: Final[float] = tick
+        self.SLOTS: Final[int] = slots
+        self.wheel = [[] for _ in range(slots)]
+        self.current_tick = self._tick_of(time.monotonic() if now is None else now)
+        self.count = 0 # timers in the wheel (cancelled ones are counted till their slot is visited)
+
+    def _ticks(self, when: float) -> float:
+        return round(when / self.TICK, 9) # 0.3 / 0.1 is 2.9999999999999996, not 3
+
+    def _tick_of(self, when: float) -> int:
+        return math.floor(self._ticks(when))
+
+    def __len__(self) -> int:
+        return self.count
+
+    def schedule(self, delay: float, callback, *args, now: float = None) -> Timer:
+        """
+        :param delay: seconds from now
+        :param callback: callback(*args), called by advance() on the event loop thread
+        :return: Timer, cancel() it if it is not needed anymore
+        """
+        when = (time.monotonic() if now is None else now) + delay
+        # first tick that starts at the deadline or after it (never early), at least the next tick
+        timer = Timer(max(math.ceil(self._ticks(when)), self.current_tick + 1), callback, args)
+        self.wheel[timer.tick % self.SLOTS].append(timer)
+        self.count += 1
+        return timer
+
+    def advance(self, now: float = None) -> int:
+        """
+        fires the timers that expired till now
+        :return: amount of timers that were fired
+        """
+        target_tick = self._tick_of(time.monotonic() if now is None else now)
+        fired = 0
+        # after a long stall every slot is visited once, not once per tick that passed
+        self.current_tick = max(self.current_tick, target_tick - self.SLOTS)
+        while self.current_tick < target_tick:
+            # moved before the callbacks run, a timer they schedule lands in a slot that was not visited yet
+            self.current_tick += 1
+            index = self.current_tick % self.SLOTS
+            slot, self.wheel[index] = self.wheel[index], [] # callbacks can schedule into this slot meanwhile
+            for timer in slot:
+                if timer.cancelled:
+                    self.count -= 1
+                elif timer.tick <= target_tick:
+                    self.count -= 1
+                    fired += 1
+                    timer.callback(*timer.args)
+                else: # due in one of the next rounds
+                    self.wheel[index].append(timer)
+        return fired
+
+    def next_delay(self, limit: float) -> float:
+        """
+        :param limit: max seconds to return
+        :return: seconds till the next tick that has timers in its slot (poll timeout of the event loop), limit if there is none before it
+        """
+        if not self.count:
+            return limit
+        now = time.monotonic()
+        for step in range(1, min(math.ceil(limit / self.TICK), self.SLOTS) + 1):
+            if self.wheel[(self.current_tick + step) % self.SLOTS]:
+                return min(limit, max(0.0, (self.current_tick + step) * self.TICK - now))
+        return limit
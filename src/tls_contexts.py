@@ -0,0 +1,114 @@
+import ssl
+import threading
+from pathlib import Path
+from typing import Final # makes my types be final without ability to change their type
+
+from src.metrics import Counter
+
+############################################################################################
+# TLS CONTEXTS + SESSIONS:
+# building an SSLContext means parsing the certificate (and key) files, it was done on every connection.
+# here every context is built once per process and cached by the certificate path (+ mtime, a replaced certificate is reloaded).
+#
+# session resumption: after a full handshake the server gives the client a session ticket,
+# a client that reconnects with this ticket does a short (resumed) handshake - no certificate exchange, no key exchange.
+# for this:
+#   server side - all the connections must use the same context (tickets are encrypted with a key that lives in the context)
+#   client side - the SSLSession of the last connection is kept (per server address) and given to the next wrap_socket()
+############################################################################################
+
+DEFAULT_NUM_TICKETS: Final[int] = 2 # same as OpenSSL default, tickets sent to the client after each TLS 1.3 handshake
+
+full_handshakes = Counter("full TLS handshakes")
+resumed_handshakes = Counter("resumed TLS handshakes")
+
+_contexts = {}  # key is (purpose, cert path, key path, mtimes of the files, ...), value is the SSLContext
+_sessions = {}  # key is (server (ip, port), client SSLContext), value is the last resumable SSLSession
+_lock = threading.Lock()
+
+
+def _mtime(path) -> int:
+    return Path(path).stat().st_mtime_ns
+
+
+def get_client_context(cert_path, alpn_protocols = None) -> ssl.SSLContext:
+    """
+    :param cert_path: self-signed certificate of the server, the only one the client trusts
+    :param alpn_protocols: protocols offered in the handshake (see codec), None - nothing is offered
+    :return: cached client context
+    """
+    alpn_protocols = tuple(alpn_protocols or ())
+    key = ("client", str(cert_path), None, _mtime(cert_path), alpn_protocols)
+    with _lock:
+        context = _contexts.get(key)
+        if context is None:
+            context = ssl.create_default_context(cafile=cert_path)  # <--- tell client to verify specific self signed certificate
+            # Disable hostname verification, it is good while testing but in production we must replace this with: True
+            context.check_hostname = False
+            if alpn_protocols:
+                context.set_alpn_protocols(list(alpn_protocols))
+            _contexts[key] = context
+    return context
+
+
+def get_server_context(cert_path, key_path, num_tickets: int = DEFAULT_NUM_TICKETS, alpn_protocols = None) -> ssl.SSLContext:
+    """
+    :param cert_path: certificate file
+    :param key_path: private key file
+    :param num_tickets: TLS 1.3 session tickets per handshake, 0 disables session resumption
+    :param alpn_protocols: protocols the server accepts, in order of preference (see codec), None - no ALPN
+    :return: cached server context
+    """
+    alpn_protocols = tuple(alpn_protocols or ())
+    # a new key file (renewed with the same certificate file) gets a new context too
+    key = ("server", str(cert_path), str(key_path), _mtime(cert_path), _mtime(key_path), num_tickets, alpn_protocols)
+    with _lock:
+        context = _contexts.get(key)
+        if context is None:
+            # ssl.Purpose.CLIENT_AUTH tells python - hi I am server, and i wish to communicate securely with client/s
+            context = ssl.create_default_context(ssl.Purpose.CLIENT_AUTH)
+            context.load_cert_chain(certfile=cert_path, keyfile=key_path)
+            if num_tickets:
+                context.options &= ~ssl.OP_NO_TICKET # session tickets for TLS 1.2 clients
+                context.num_tickets = num_tickets    # session tickets for TLS 1.3 clients
+            else:
+                context.options |= ssl.OP_NO_TICKET
+                context.num_tickets = 0
+            if alpn_protocols:
+                context.set_alpn_protocols(list(alpn_protocols))
+            _contexts[key] = context
+    return context
+
+
+def get_session(server_address, context: ssl.SSLContext):
+    """
+    :param server_address: (ip, port)
+    :param context: client context of the new connection - a session can be resumed only with the context that made it
+                    (clients with other codecs offered have other contexts)
+    :return: last resumable session of this server, None if there is no such
+    """
+    with _lock:
+        return _sessions.get((tuple(server_address), context))
+
+
+def remember_session(server_address, tls_socket) -> None:
+    """
+    keep the session of this connection for the next connection to the same server
+    (TLS 1.3 ticket arrives after the handshake, so call it after something was received)
+    """
+    session = tls_socket.session
+    if session is not None and session.has_ticket:
+        with _lock:
+            _sessions[(tuple(server_address), tls_socket.context)] = session
+
+
+def count_handshake(tls_socket, full: Counter = full_handshakes, resumed: Counter = resumed_handshakes) -> bool:
+    """
+    :param full, resumed: counters to update, default - the process-wide counters of the client side
+    :return: True if the handshake of this socket was resumed (short) one
+    """
+    if tls_socket.session_reused:
+        resumed.inc()
+        return True
+    full.inc()
+    return False
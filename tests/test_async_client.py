@@ -0,0 +1,73 @@
+import asyncio
+import ssl
+import pytest
+from src.async_client_tcp import AsyncClient
+from src.config_resolver import find_file, load_config, SERVER_CONFIG_FILE, CERT_FILE, KEY_FILE
+from src.framing import FrameBuffer, encode_frame
+
+
+async def _start_reversing_mock_server(batch_size):
+    """
+    Echo Mock Server that collects 'batch_size' messages and answers them in reversed order,
+    only a client that matches responses by message id will get the right response for each message
+    """
+    cert_file = find_file(CERT_FILE)
+    key_file = find_file(KEY_FILE)
+    if not cert_file or not key_file:
+        raise FileExistsError
+    config = load_config(SERVER_CONFIG_FILE)
+    context = ssl.create_default_context(ssl.Purpose.CLIENT_AUTH)
+    context.load_cert_chain(certfile=cert_file, keyfile=key_file)
+
+    async def handle_client(reader, writer):
+        frame_buffer = FrameBuffer(1024)
+        batch = []
+        while data := await reader.read(1024):
+            frame_buffer.feed(data)
+            for frame in frame_buffer.frames():
+                if bytes(frame.payload) == b"q":
+                    writer.close()
+                    return
+                batch.append((frame.message_id, bytes(frame.payload)))
+                if len(batch) == batch_size:
+                    for message_id, payload in reversed(batch):
+                        writer.write(encode_frame(b"echo: " + payload, message_id))
+                    batch.clear()
+            await writer.drain()
+        writer.close()
+
+    return await asyncio.start_server(handle_client, config["server"]["ip_address"], config["server"]["port"],
+                                      ssl=context, reuse_address=True)
+
+
+class TestAsyncClient:
+
+    def test_pipelined_responses_are_matched_by_message_id(self):
+        """
+        Many messages are sent without waiting, server answers out of order - every message must get its own response
+        """
+        async def scenario():
+            server = await _start_reversing_mock_server(batch_size=5)
+            async with server:
+                client = AsyncClient(max_in_flight=10)
+                await client.connect()
+                futures = [await client.send(f"[msg_{ind}]:Hello_Server") for ind in range(100)]
+                responses = await asyncio.gather(*futures)
+                await client.disconnect()
+            return responses
+
+        responses = asyncio.run(scenario())
+        assert responses == [f"echo: [msg_{ind}]:Hello_Server" for ind in range(100)]
+
+    def test_pending_requests_fail_when_server_disconnects(self):
+        async def scenario():
+            server = await _start_reversing_mock_server(batch_size=1000) # never answers
+            client = AsyncClient(max_in_flight=10)
+            async with server:
+                await client.connect()
+                future = await client.send("Hello_Server")
+                client.writer.transport.abort() # connection lost while waiting for the response
+                with pytest.raises(ConnectionError):
+                    await future
+
+        asyncio.run(scenario())
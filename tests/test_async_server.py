@@ -0,0 +1,129 @@
+import asyncio
+import socket
+import threading
+import pytest
+from src import tls_contexts
+from src.async_server_tcp import Server
+from src.codec import CODECS, alpn_protocols, disconnect_frame
+from src.config_resolver import find_file, CERT_FILE
+from src.framing import FrameBuffer, send_frame, recv_frame
+from src.streaming import StreamError, send_stream
+from tests.test_select_server import _wait_for
+
+
+def _start_server(**settings):
+    # asyncio server in a thread (with its own event loop), its settings are changed after the config was loaded
+    server = Server()
+    server._init()
+    server.USE_UVLOOP = False # event loop policy is process wide, the other tests keep the default loop
+    for name, value in settings.items():
+        setattr(server, name, value)
+    server._create_ssl_context()
+    server_thread = threading.Thread(target=lambda: asyncio.run(server._serve()), daemon=True)
+    server_thread.start()
+    return server, server_thread
+
+
+def _connect(server, codecs=None):
+    # the server listens only after its loop started, connection refused till then
+    context = tls_contexts.get_client_context(find_file(CERT_FILE), alpn_protocols(codecs or []))
+    tcp_sockets = []
+
+    def attempt():
+        try:
+            tcp_sockets.append(socket.create_connection((server.IP, server.PORT)))
+            return True
+        except ConnectionRefusedError:
+            return False
+
+    assert _wait_for(attempt)
+    return context.wrap_socket(tcp_sockets[0], server_hostname=server.IP)
+
+
+def _closed_by_server(tls_socket) -> bool:
+    tls_socket.settimeout(5)
+    try:
+        return tls_socket.recv(1024) == b""
+    except (ConnectionError, OSError):
+        return True
+
+
+class TestAsyncServer:
+
+    def test_pipelined_messages_are_answered_with_their_ids(self):
+        server, server_thread = _start_server()
+        try:
+            tls_socket = _connect(server, ["text"])
+            for index in range(100): # all sent before the first response is read
+                send_frame(tls_socket, f"message {index}".encode(), 1000 + index)
+            frame_buffer = FrameBuffer()
+            responses = [recv_frame(tls_socket, frame_buffer) for _ in range(100)]
+            assert [frame.message_id for frame in responses] == [1000 + index for index in range(100)]
+            assert all(bytes(frame.payload).endswith(f"message {index}.".encode()) for index, frame in enumerate(responses))
+            assert len(server.received_messages_store) == 100
+            tls_socket.sendall(disconnect_frame(CODECS["text"]))
+            assert _closed_by_server(tls_socket)
+            tls_socket.close() # TLS shutdown of the server waits for the client side
+            server_thread.join(timeout=5)
+            assert not server_thread.is_alive()
+        finally:
+            server.disconnect()
+
+    def test_q_disconnects_only_a_legacy_client(self):
+        server, server_thread = _start_server()
+        try:
+            text_socket = _connect(server, ["text"])
+            legacy_socket = _connect(server) # no ALPN - legacy text codec
+            frame_buffer = FrameBuffer()
+            send_frame(text_socket, b"q", 1) # a regular message on a negotiated connection
+            response = recv_frame(text_socket, frame_buffer)
+            assert response.message_id == 1 and bytes(response.payload).endswith(b"q.")
+
+            send_frame(legacy_socket, b"q", 1)
+            assert _closed_by_server(legacy_socket)
+            legacy_socket.close()
+            assert _wait_for(lambda: len(server.all_clients) == 1)
+            assert server_thread.is_alive() # the text client is still connected
+
+            text_socket.sendall(disconnect_frame(CODECS["text"])) # out-of-band control frame (BYE)
+            assert _closed_by_server(text_socket)
+            text_socket.close()
+            server_thread.join(timeout=5)
+            assert not server_thread.is_alive()
+        finally:
+            server.disconnect()
+
+    def test_server_finishes_when_its_last_client_leaves(self):
+        server, server_thread = _start_server()
+        try:
+            first = _connect(server, ["binary"])
+            second = _connect(server, ["raw"])
+            frame_buffer = FrameBuffer()
+            send_frame(second, b"Hello_Server", 7)
+            assert recv_frame(second, frame_buffer).message_id == 7 # both are connected and served
+            first.close() # without a disconnect message
+            assert _wait_for(lambda: len(server.all_clients) == 1)
+            assert server_thread.is_alive()
+            second.close()
+            server_thread.join(timeout=5)
+            assert not server_thread.is_alive() and not server.all_clients
+        finally:
+            server.disconnect()
+
+    def test_stream_is_aborted_instead_of_waiting_for_a_credit(self):
+        server, server_thread = _start_server()
+        try:
+            tls_socket = _connect(server, ["text"])
+            tls_socket.settimeout(5) # a stream that is never answered fails the test instead of hanging it
+            frame_buffer = FrameBuffer()
+            with pytest.raises(StreamError, match="streams are not supported"):
+                send_stream(tls_socket, frame_buffer, 1, b"x" * 1000)
+            send_frame(tls_socket, b"Hello_Server", 2) # the connection is still served
+            assert recv_frame(tls_socket, frame_buffer).message_id == 2
+            tls_socket.sendall(disconnect_frame(CODECS["text"]))
+            assert _closed_by_server(tls_socket)
+            tls_socket.close()
+            server_thread.join(timeout=5)
+            assert not server_thread.is_alive()
+        finally:
+            server.disconnect()
@@ -0,0 +1,64 @@
+import time
+from src.client_tcp import Client
+from src.codec import CODECS, disconnect_frame
+from tests.test_codec import _connect
+from tests.test_select_server import _start_server, _wait_for
+
+
+class TestBatching:
+
+    def test_send_many_packs_the_messages_and_returns_the_responses_in_order(self):
+        server, server_thread = _start_server(working_threads=2)
+        server.handlers.register("upper", lambda request: request.body.upper())
+        client = None
+        try:
+            anchor = _connect(server, ["text"]) # the server finishes when the last client disconnects
+            client = Client(auto_reconnect=False)
+            messages = [f"upper:reading {index}" for index in range(1000)]
+            responses = client.send_many(messages)
+            assert responses == [f"READING {index}" for index in range(1000)]
+            stats = client.batch_stats()
+            # a batch is sent when the window is full (max_in_flight), then every time half of it was answered
+            assert stats["batched_messages"] == 1000 and stats["messages_per_batch"] >= client.MAX_IN_FLIGHT // 2
+            assert server.stats()["received_messages"] == 1000
+
+            # the regular send + receive still works after a batch, ids go on
+            assert client.send("upper:single") and client._receive() and client.last_response == "SINGLE"
+            assert client.send_many([]) == []
+            assert {"READING 999", "SINGLE"} <= {record.response for record in client.connection_store.records()} # batched messages are stored too
+            client.send_disconnect()
+            anchor.sendall(disconnect_frame(CODECS["text"]))
+            server_thread.join(timeout=5)
+            anchor.close()
+        finally:
+            if client:
+                client.disconnect()
+            server.disconnect()
+
+    def test_auto_batching_sends_a_partial_batch_after_the_delay(self):
+        server, server_thread = _start_server(working_threads=1)
+        client = None
+        try:
+            anchor = _connect(server, ["text"])
+            client = Client(auto_reconnect=False, batch_max_bytes=16 * 1024, batch_max_delay_us=20_000)
+            for index in range(10):
+                assert client.send(f"sample {index}")
+            # nobody calls _receive / sends more: the flusher thread sends the 10 messages together after 20ms
+            assert _wait_for(lambda: server.stats()["received_messages"] == 10)
+            assert client.batch_stats() == {"batches": 1, "batched_messages": 10, "messages_per_batch": 10, "waiting_responses": 10}
+            for index in range(10):
+                assert client._receive() and client.last_response.endswith(f": sample {index}.")
+
+            # a full batch doesn't wait for the delay
+            start = time.monotonic()
+            responses = client.send_many(f"{index:0>1000}" for index in range(40))
+            assert len(responses) == 40 and time.monotonic() - start < 1
+            assert client.batch_stats()["batches"] >= 3 # 40KB in batches of 16KB
+            client.send_disconnect()
+            anchor.sendall(disconnect_frame(CODECS["text"]))
+            server_thread.join(timeout=5)
+            anchor.close()
+        finally:
+            if client:
+                client.disconnect()
+            server.disconnect()
@@ -0,0 +1,130 @@
+import threading
+from src.channels import MAX_CHANNELS, ChannelError, open_channel_frame
+from src.codec import CODECS, disconnect_frame
+from src.framing import FrameBuffer, recv_frame, send_frame
+from src.multiplex_client import MultiplexClient
+from tests.test_codec import _connect
+from tests.test_select_server import _start_server, _wait_for
+
+
+class TestChannels:
+
+    def test_channels_share_one_connection_and_each_is_answered_in_order(self):
+        server, server_thread = _start_server(working_threads=4)
+        server.handlers.register("upper", lambda request: request.body.upper())
+        mux = None
+        try:
+            anchor = _connect(server, ["text"]) # the server finishes when the last client disconnects
+            mux = MultiplexClient(window=8)
+            channels = [mux.open_channel("upper" if index % 2 else None) for index in range(100)]
+            # more messages than the window of a channel: send() waits for room, the frames of all the channels are interleaved
+            futures = [[channel.send(f"message {index}") for index in range(20)] for channel in channels]
+            for channel, channel_futures in zip(channels, futures):
+                expected = [f"message {index}" for index in range(20)]
+                responses = [future.result(timeout=10) for future in channel_futures]
+                if channel.message_type == "upper":
+                    assert responses == [message.upper() for message in expected]
+                else:
+                    assert all(response.endswith(f": {message}.") for message, response in zip(expected, responses))
+            stats = server.stats()
+            assert stats["clients"] == 2 and stats["open_channels"] == 100 and stats["channels_opened"] == 100
+            assert stats["received_messages"] == 2000
+            assert mux.stats()["frames_per_write"] > 1 # several channels per send
+
+            for channel in channels[:50]:
+                channel.close()
+            assert _wait_for(lambda: server.stats()["open_channels"] == 50)
+            mux.close()
+            assert _wait_for(lambda: server.stats()["open_channels"] == 0)
+            anchor.sendall(disconnect_frame(CODECS["text"]))
+            server_thread.join(timeout=5)
+            anchor.close()
+        finally:
+            if mux:
+                mux.close()
+            server.disconnect()
+
+    def test_a_blocked_channel_doesnt_hold_the_other_channels(self):
+        server, server_thread = _start_server(working_threads=4)
+        released = threading.Event()
+        server.handlers.register("wait", lambda request: "released" if released.wait(5) else "timed out")
+        server.handlers.register("release", lambda request: released.set() or "done")
+        mux = None
+        try:
+            anchor = _connect(server, ["text"])
+            mux = MultiplexClient()
+            blocked = mux.open_channel("wait")
+            assert _wait_for(lambda: server.client_channels) # only the multiplexed connection has channels
+            bindings = next(iter(server.client_channels.values())) # channel -> (message type, working thread)
+            # a channel that is handled by another working thread than the blocked one
+            other = mux.open_channel("release")
+            while not _wait_for(lambda: other.id in bindings) or bindings[other.id][1] == bindings[blocked.id][1]:
+                other = mux.open_channel("release")
+            waiting = blocked.send("hold")
+            assert other.request("go", timeout=5) == "done"
+            assert waiting.result(timeout=5) == "released"
+            mux.close()
+            anchor.sendall(disconnect_frame(CODECS["text"]))
+            server_thread.join(timeout=5)
+            anchor.close()
+        finally:
+            if mux:
+                mux.close()
+            server.disconnect()
+
+    def test_server_refuses_channels_above_its_limit(self):
+        server, server_thread = _start_server(working_threads=1, MAX_CHANNELS_PER_CLIENT=2)
+        mux = None
+        try:
+            anchor = _connect(server, ["binary"])
+            mux = MultiplexClient()
+            first, second, third = (mux.open_channel() for _ in range(3))
+            assert "hello" in first.request("hello", timeout=5)
+            assert _wait_for(lambda: third.closed) and server.stats()["channels_refused"] == 1
+            try:
+                third.send("too many")
+                assert False, "a message was sent on a refused channel"
+            except ChannelError as ee:
+                assert "too many channels" in str(ee)
+            assert "hello" in second.request("hello", timeout=5)
+
+            # channel bits of the message id of a client that opened no channel are just a number
+            frame_buffer = FrameBuffer()
+            anchor.sendall(open_channel_frame(0))
+            send_frame(anchor, CODECS["binary"].encode(b"plain"), 5 << 20)
+            response = recv_frame(anchor, frame_buffer)
+            assert response.control # CC: channel 0 is refused
+            assert recv_frame(anchor, frame_buffer).message_id == 5 << 20
+            assert MAX_CHANNELS == 4095
+            mux.close()
+            anchor.sendall(disconnect_frame(CODECS["binary"]))
+            server_thread.join(timeout=5)
+            anchor.close()
+        finally:
+            if mux:
+                mux.close()
+            server.disconnect()
+
+    def test_refused_channel_with_queued_frames_doesnt_stop_the_others(self):
+        # the messages of the refused channel that were on the way are answered (echo), the responses are bigger than the default buffer
+        server, server_thread = _start_server(working_threads=1, MAX_CHANNELS_PER_CLIENT=1, MAX_OUTPUT_BUFFER=64 * 1024 * 1024)
+        mux = None
+        try:
+            anchor = _connect(server, ["text"])
+            mux = MultiplexClient()
+            first = mux.open_channel()
+            refused = mux.open_channel(window=64)
+            # more than a write batch: frames of the refused channel still wait for the I/O thread when its CC arrives
+            futures = [refused.send("x" * 200_000) for _ in range(64)]
+            assert _wait_for(lambda: refused.closed)
+            assert all(isinstance(future.exception(timeout=5), ChannelError) for future in futures)
+            assert "hello" in first.request("hello", timeout=5) # the I/O thread is still running
+            assert mux.error is None
+            mux.close()
+            anchor.sendall(disconnect_frame(CODECS["text"]))
+            server_thread.join(timeout=5)
+            anchor.close()
+        finally:
+            if mux:
+                mux.close()
+            server.disconnect()
@@ -1,12 +1,11 @@
-import os
-from pathlib import Path
 import pytest
 from src.client_tcp import Client
+from src.config_resolver import find_file, load_config, SERVER_CONFIG_FILE, CERT_FILE, KEY_FILE
+from src.framing import FrameBuffer, send_frame, recv_frame
 from multiprocessing import Process # < --- to simulate Server in a process to be anle to kill the server process in any moment
 import socket
 from typing import Final # < --- makes my types be final without ability to change their type
 import ssl
-import yaml
 import time
 
 class MockServer:
@@ -18,21 +17,20 @@ class MockServer:
         self.is_server_connected = False
         self.mock_server_app: Final[str] = app_name
 
-        self.cert_file = self._find_full_file_path(Path.cwd().parent, "ilana_cert_01.pem")
-        self.key_file = self._find_full_file_path(Path.cwd().parent, "ilana_key_01.pem")
+        self.cert_file = find_file(CERT_FILE)
+        self.key_file = find_file(KEY_FILE)
         if not self.cert_file or not self.key_file:
             raise FileExistsError
         print(f"[{self.mock_server_app}]: Loading cert file, from path: {self.cert_file}")
         print(f"[{self.mock_server_app}]: Loading key file, from path: {self.key_file}")
 
-        full_path_to_file = self._find_full_file_path(Path.cwd().parent, "server_config.yaml")
+        full_path_to_file = find_file(SERVER_CONFIG_FILE)
         print(f"[{self.mock_server_app}]: Loading configuration for the server from: {full_path_to_file}")
         if not full_path_to_file:
             raise FileExistsError
 
         print(f"[{self.mock_server_app}]: app is executed using the next parameters: ")
-        with open(full_path_to_file, "r") as yaml_file:
-            config = yaml.safe_load(yaml_file)
+        config = load_config(SERVER_CONFIG_FILE)
 
         self.IP: Final[str] = config["server"]["ip_address"]  # also possible to do: socket.gethostbyname(socket.gethostname()) if not ip else ip  # <---- this way we determine the local host address, this way -> we set it hard codded: "127.0.0.1" if not ip else ip
         print(f"[{self.mock_server_app}]: IP: {self.IP}")
@@ -41,13 +39,6 @@ class MockServer:
         self.MAX_DATA_SIZE = config["server"]["max_data_size"]
         print(f"[{self.mock_server_app}]: Max data size: {self.MAX_DATA_SIZE}")
 
-    def _find_full_file_path(self, my_path, my_file):
-        for dirpath, _, filenames in os.walk(my_path):  #
-            if my_file in filenames:
-                full_file_path = Path(str(os.path.join(dirpath, my_file)))  # Return full path if found
-                return full_file_path
-        return None  # Return None if not found
-
     def _always_living_mock_echo_server(self):
         print(f"[{self.mock_server_app}] @@@ Echo Mock Server started, waiting for Client connection @@@ ...")
         self.client_socket, client_address = self.server_socket.accept()
@@ -55,15 +46,16 @@ class MockServer:
         print(f"[{self.mock_server_app}]: Client connection is established with client ip address: {client_address}, type: {type(self.client_socket)}")
 
         print(f"[{self.mock_server_app}]: Server started receiving and resending back ...")
+        frame_buffer = FrameBuffer(self.MAX_DATA_SIZE)
         while True:
             try:
-                data = self.client_socket.recv(1024)
-                if not data:
+                if not frame_buffer.recv_into(self.client_socket):
                     print(f"[{self.mock_server_app}]: Detected that Client was gracefully disconnected")
                     break
-                print(f"[{self.mock_server_app}] got request from client-----> {data.decode()}")
-                self.client_socket.sendall(data)
-                print(f"[{self.mock_server_app}] sent echo response")
+                for frame in frame_buffer.frames():
+                    print(f"[{self.mock_server_app}] got request from client-----> {str(frame.payload, 'utf-8')}")
+                    send_frame(self.client_socket, frame.payload, frame.message_id)
+                    print(f"[{self.mock_server_app}] sent echo response")
             except Exception:
                 print(f"[{self.mock_server_app}]: seems like Client crashed")
                 break
@@ -93,16 +85,17 @@ class MockServer:
         print(f"[{self.mock_server_app}]: Client connection is established with client ip address: {client_address}, type: {type(self.client_socket)}")
 
         print(f"[{self.mock_server_app}]: Server started receiving and resending back ...")
+        frame_buffer = FrameBuffer(self.MAX_DATA_SIZE)
         ind = 0
         while ind <= 10:
             try:
                 print(f"[{self.mock_server_app}]: waiting to receive msg: {ind}")
-                data = self.client_socket.recv(1024)
-                if not data:
+                frame = recv_frame(self.client_socket, frame_buffer)
+                if frame is None:
                     print(f"[{self.mock_server_app}]: Client disconnected")
                     break
-                print(f"[{self.mock_server_app}] received msg: -----> {data.decode()}")
-                self.client_socket.sendall(data)
+                print(f"[{self.mock_server_app}] received msg: -----> {frame.payload.decode()}")
+                send_frame(self.client_socket, frame.payload, frame.message_id)
                 print(f"[{self.mock_server_app}] sent echo response")
                 ind += 1
             except Exception:
@@ -328,6 +321,7 @@ class TestClient:
         else:
             print(f"[CLIENT_TEST]: Mock Server is terminated after connection with Client and before Client could send first msg")
         print(f"[CLIENT_TEST]: all the attempts to send msg from Client -> Mock server, expected to be resulted with False: \n{results_list}")
+        client_obj.disconnect() # stops the background reconnect, otherwise it connects to the server of the next test
         assert all(not bool(item) for item in results_list)
 
     # def test_client_single_message_send(self, always_living_mock_server_fixture):
@@ -0,0 +1,106 @@
+import socket
+import threading
+import time
+from src import tls_contexts
+from src.client_pool import ClientPool
+from src.config_resolver import find_file, load_config, SERVER_CONFIG_FILE, CERT_FILE, KEY_FILE
+from src.framing import FrameBuffer, send_frame, recv_frame
+
+
+class MultiClientEchoServer:
+    """
+    echo server for many connections (thread per connection), listens on the port from server_config.yaml
+    """
+    def __init__(self):
+        config = load_config(SERVER_CONFIG_FILE)["server"]
+        self.context = tls_contexts.get_server_context(find_file(CERT_FILE), find_file(KEY_FILE))
+        self.server_socket = socket.create_server((config["ip_address"], config["port"]))
+        self.client_sockets = []
+        threading.Thread(target=self._accept, daemon=True).start()
+
+    def _accept(self):
+        while True:
+            try:
+                client_socket, _ = self.server_socket.accept()
+            except OSError:
+                return # server socket was closed
+            tls_socket = self.context.wrap_socket(client_socket, server_side=True)
+            self.client_sockets.append(tls_socket)
+            threading.Thread(target=self._echo, args=(tls_socket,), daemon=True).start()
+
+    @staticmethod
+    def _echo(tls_socket):
+        frame_buffer = FrameBuffer()
+        try:
+            while (frame := recv_frame(tls_socket, frame_buffer)) is not None and frame.payload != b'q':
+                send_frame(tls_socket, frame.payload, frame.message_id)
+        except OSError:
+            pass
+        tls_socket.close()
+
+    def wait_for_connections(self, amount, timeout=5):
+        deadline = time.monotonic() + timeout
+        while len(self.client_sockets) < amount and time.monotonic() < deadline:
+            time.sleep(0.05)
+        return len(self.client_sockets)
+
+    def close(self):
+        self.server_socket.shutdown(socket.SHUT_RDWR) # wakes up the blocked accept(), otherwise the port stays taken
+        self.server_socket.close()
+
+
+class TestClientPool:
+
+    def test_parallel_senders_share_the_warm_connections(self):
+        server = MultiClientEchoServer()
+        pool = ClientPool(size=3)
+        try:
+            assert len(pool) == 3 and server.wait_for_connections(3) == 3
+            results = []
+
+            def sender(index):
+                for _ in range(5):
+                    with pool.connection(timeout=5) as client:
+                        results.append(client.send(f"Hello_Server_{index}") and client._receive())
+
+            threads = [threading.Thread(target=sender, args=(index,)) for index in range(6)]
+            for thread in threads:
+                thread.start()
+            for thread in threads:
+                thread.join(timeout=10)
+            assert results == [True] * 30
+            assert len(server.client_sockets) == 3 # no new connections were opened
+        finally:
+            pool.close()
+            server.close()
+
+    def test_broken_connection_is_replaced(self):
+        server = MultiClientEchoServer()
+        pool = ClientPool(size=2, health_check_interval=0.1)
+        try:
+            server.wait_for_connections(2)
+            server.client_sockets[0].shutdown(socket.SHUT_RDWR) # server side drops one of the idle connections
+            assert server.wait_for_connections(3) == 3 and len(pool) == 2
+
+            for _ in range(2):
+                with pool.connection(timeout=5) as client:
+                    assert client.send("Hello_Server") and client._receive()
+        finally:
+            pool.close()
+            server.close()
+
+    def test_client_that_lost_its_connection_is_not_checked_in(self):
+        server = MultiClientEchoServer()
+        pool = ClientPool(size=1, health_check_interval=60) # the health check doesn't run during the test
+        try:
+            server.wait_for_connections(1)
+            server.client_sockets[0].shutdown(socket.SHUT_RDWR) # server side drops the connection
+            with pool.connection(timeout=5) as client:
+                assert not (client.send("Hello_Server") and client._receive()) # reported by the return value, nothing raised
+
+            with pool.connection(timeout=5) as client: # the replacement, not the dead client
+                assert client.send("Hello_Server") and client._receive()
+            assert server.wait_for_connections(2) == 2 and len(pool) == 1
+        finally:
+            pool.close()
+            server.close()
@@ -0,0 +1,66 @@
+import socket
+import pytest
+from src import tls_contexts
+from src.codec import CODECS, LEGACY_CODEC, CodecError, alpn_protocols, disconnect_frame, is_disconnect, negotiated_codec
+from src.config_resolver import find_file, CERT_FILE
+from src.framing import FrameBuffer, Frame, ControlFrame, CONTROL_BYE, send_frame, recv_frame
+from tests.test_select_server import _start_server
+
+
+def _connect(server, codecs):
+    context = tls_contexts.get_client_context(find_file(CERT_FILE), alpn_protocols(codecs))
+    return context.wrap_socket(socket.create_connection((server.IP, server.PORT)), server_hostname=server.IP)
+
+
+class TestCodecs:
+
+    def test_binary_envelope_carries_type_and_flags_and_keeps_the_body_as_bytes(self):
+        binary = CODECS["binary"]
+        payload = binary.encode(b"\x00\xffbody", "upper", flags=3)
+        message_type, flags, body = binary.decode(payload)
+        assert (message_type, flags, bytes(body)) == ("upper", 3, b"\x00\xffbody")
+        assert isinstance(body, memoryview)
+        assert binary.decode(binary.encode("text"))[0] is None
+        with pytest.raises(CodecError):
+            binary.decode(b"\x00\x09abc") # type is longer than the message
+
+    def test_q_is_a_disconnect_only_on_a_legacy_connection(self):
+        assert is_disconnect(Frame(0, b"q"), LEGACY_CODEC)
+        assert not is_disconnect(Frame(0, b"q"), CODECS["text"])
+        assert is_disconnect(ControlFrame(0, CONTROL_BYE), CODECS["text"])
+        frame_buffer = FrameBuffer()
+        frame_buffer.feed(disconnect_frame(CODECS["binary"], 7))
+        frame = frame_buffer.next_frame()
+        assert frame.control and frame.message_id == 7
+
+
+class TestNegotiation:
+
+    def test_codec_is_chosen_in_the_handshake(self):
+        server, server_thread = _start_server(working_threads=1)
+        try:
+            legacy_socket = _connect(server, []) # no ALPN - legacy text, keeps the server running
+            binary_socket = _connect(server, ["binary", "text"])
+            assert negotiated_codec(binary_socket).name == "binary"
+            assert negotiated_codec(legacy_socket) is LEGACY_CODEC
+
+            frame_buffer = FrameBuffer()
+            send_frame(binary_socket, CODECS["binary"].encode(b"\xff\x00", "raw_bytes"), 1)
+            message_type, _, body = CODECS["binary"].decode(recv_frame(binary_socket, frame_buffer).payload)
+            assert message_type == "raw_bytes" and bytes(body) == b"Hello, client! I received your message: \xff\x00."
+            binary_socket.sendall(disconnect_frame(CODECS["binary"]))
+            binary_socket.close()
+
+            text_socket = _connect(server, ["text"])
+            frame_buffer = FrameBuffer()
+            send_frame(text_socket, b"q", 2) # a regular message on a negotiated connection
+            assert recv_frame(text_socket, frame_buffer) == (2, b"Hello, client! I received your message: q.")
+            text_socket.sendall(disconnect_frame(CODECS["text"]))
+            text_socket.close()
+
+            send_frame(legacy_socket, b"q")
+            server_thread.join(timeout=5)
+            assert not server_thread.is_alive()
+            legacy_socket.close()
+        finally:
+            server.disconnect()
@@ -0,0 +1,77 @@
+import json
+import pytest
+import yaml
+from src.client_tcp import Client
+from src.codec import CODECS, disconnect_frame, negotiated_codec, negotiated_compression
+from src.compression import PLAIN_MARKER, ZLIB_MARKER, Compression, CompressionError
+from src.config_resolver import find_file, CLIENT_CONFIG_FILE
+from src.multiplex_client import MultiplexClient
+from tests.test_codec import _connect
+from tests.test_select_server import _start_server, _wait_for
+
+
+def _client_config(tmp_path, codecs):
+    with open(find_file(CLIENT_CONFIG_FILE)) as yaml_file:
+        config = yaml.safe_load(yaml_file)
+    config["client"].update(codecs=codecs, auto_reconnect=False)
+    path = tmp_path / CLIENT_CONFIG_FILE
+    path.write_text(yaml.safe_dump(config))
+    return path
+
+
+class TestCompression:
+
+    def test_context_is_reused_and_short_messages_go_plain(self):
+        sender, receiver = Compression(threshold=64), Compression(threshold=64)
+        assert sender.compress(b"short") == PLAIN_MARKER + b"short"
+        reading = json.dumps({"sensor": "sensor-1", "unit": "celsius", "values": list(range(40))}).encode()
+        first = sender.compress(reading)
+        second = sender.compress(reading) # compressed against the first one
+        assert first[:1] == ZLIB_MARKER and len(second) < len(first) < len(reading)
+        assert [receiver.decompress(payload) for payload in (PLAIN_MARKER + b"short", first, second)] == [b"short", reading, reading]
+        stats = sender.stats()
+        assert stats["messages"] == 3 and stats["compressed_messages"] == 2 and stats["ratio"] < 0.5
+
+        with pytest.raises(CompressionError):
+            Compression().decompress(b"\x07abc") # unknown marker
+        bomb = Compression(threshold=0).compress(b"\x00" * 100_000)
+        with pytest.raises(CompressionError):
+            Compression(max_size=1000).decompress(bomb)
+
+    def test_client_negotiates_compression_with_the_select_server(self, tmp_path):
+        server, server_thread = _start_server(working_threads=2)
+        client = mux = None
+        try:
+            anchor = _connect(server, ["text"]) # the server finishes when the last client disconnects, not compressed
+            assert negotiated_compression(anchor) is None
+            client = Client(config_path=_client_config(tmp_path, ["text+zlib", "text"]))
+            assert client.codec.name == "text" and client.compression is not None
+            message = json.dumps({"sensor": "sensor-1", "samples": [{"unit": "celsius", "value": 20.5}] * 20})
+            for _ in range(20):
+                assert client.send(message) and client._receive()
+                assert client.last_response == f"Hello, client! I received your message: {message}."
+            assert client.send("short") and client._receive() and client.last_response.endswith(": short.")
+            assert client.compression.stats()["compressed_messages"] == 20
+            stats = server.stats()
+            assert stats["compressed_clients"] == 1
+            assert stats["compression_output_bytes"] * 5 < stats["compression_input_bytes"]
+
+            # the channels of a compressed connection share its context, frames are compressed in the order they are written
+            mux = MultiplexClient(config_path=_client_config(tmp_path, ["binary+zlib"]))
+            assert mux.compression is not None
+            channels = [mux.open_channel() for _ in range(4)]
+            futures = [channel.send(message.encode()) for _ in range(10) for channel in channels]
+            assert all(future.result(timeout=10).endswith(message.encode() + b".") for future in futures)
+            mux.close()
+            client.send_disconnect()
+            assert _wait_for(lambda: server.stats()["compressed_clients"] == 0)
+            anchor.sendall(disconnect_frame(CODECS["text"]))
+            server_thread.join(timeout=5)
+            assert negotiated_codec(anchor).name == "text"
+            anchor.close()
+        finally:
+            if mux:
+                mux.close()
+            if client:
+                client.disconnect()
+            server.disconnect()
@@ -0,0 +1,36 @@
+import os
+from src.config_resolver import FileResolver, SERVER_CONFIG_FILE, CERT_FILE
+
+
+class TestConfigResolver:
+
+    def test_single_walk_finds_all_known_files(self, tmp_path, monkeypatch):
+        (tmp_path / "deep" / "configs").mkdir(parents=True)
+        (tmp_path / "deep" / "configs" / SERVER_CONFIG_FILE).write_text("server:\n  port: 1\n")
+        (tmp_path / "deep" / CERT_FILE).write_text("cert")
+        resolver = FileResolver(search_root=tmp_path, well_known_dirs=())
+
+        walks = []
+        original_walk = os.walk
+        monkeypatch.setattr(os, "walk", lambda path: walks.append(path) or original_walk(path))
+        assert resolver.find(SERVER_CONFIG_FILE) == tmp_path / "deep" / "configs" / SERVER_CONFIG_FILE
+        assert resolver.find(CERT_FILE) == tmp_path / "deep" / CERT_FILE # found by the same walk
+        assert resolver.find(SERVER_CONFIG_FILE) == tmp_path / "deep" / "configs" / SERVER_CONFIG_FILE
+        assert len(walks) == 1
+
+    def test_explicit_path_and_environment_override(self, tmp_path, monkeypatch):
+        resolver = FileResolver(search_root=tmp_path, well_known_dirs=())
+        monkeypatch.setenv("CSA_CERT_FILE", str(tmp_path / "from_env.pem"))
+        assert resolver.find(CERT_FILE) == tmp_path / "from_env.pem"
+        assert resolver.find(CERT_FILE, tmp_path / "explicit.pem") == tmp_path / "explicit.pem"
+
+    def test_config_is_reloaded_only_when_modified(self, tmp_path):
+        config_file = tmp_path / SERVER_CONFIG_FILE
+        config_file.write_text("server:\n  port: 1\n")
+        resolver = FileResolver(search_root=tmp_path, well_known_dirs=())
+        first = resolver.load_config(SERVER_CONFIG_FILE)
+        assert resolver.load_config(SERVER_CONFIG_FILE) is first # cached
+
+        config_file.write_text("server:\n  port: 2\n")
+        os.utime(config_file, ns=(0, config_file.stat().st_mtime_ns + 1_000_000_000))
+        assert resolver.load_config(SERVER_CONFIG_FILE)["server"]["port"] == 2
@@ -0,0 +1,48 @@
+import socket
+import pytest
+from src.framing import FrameBuffer, FrameError, encode_frame, send_frame, recv_frame
+
+
+class TestFraming:
+
+    def test_coalesced_messages_are_split_back(self):
+        """
+        Several messages that arrive in a single recv() must be returned as separate messages
+        """
+        frame_buffer = FrameBuffer(1024)
+        frame_buffer.feed(encode_frame(b"first") + encode_frame(b"second") + encode_frame(b"q"))
+        assert [bytes(frame.payload) for frame in frame_buffer.frames()] == [b"first", b"second", b"q"]
+        assert len(frame_buffer) == 0
+
+    def test_message_split_over_many_receives(self):
+        """
+        Message much bigger than a single recv() must be returned only once it arrived completely
+        """
+        payload = bytes(range(256)) * 40 # 10K, the recv size is 1K
+        frame_buffer = FrameBuffer(1024)
+        data = encode_frame(payload)
+        received = []
+        for ind in range(0, len(data), 1000):
+            frame_buffer.feed(data[ind:ind + 1000])
+            received.extend(bytes(frame.payload) for frame in frame_buffer.frames())
+        assert received == [payload]
+
+    def test_recv_frame_over_socket(self):
+        """
+        Pipelined messages sent one after the other are received one by one, leftovers are kept for the next call
+        """
+        server_end, client_end = socket.socketpair()
+        with server_end, client_end:
+            messages = [f"[msg_{ind}]:Hello_Server".encode() * ind for ind in range(1, 50)]
+            for message_id, message in enumerate(messages):
+                send_frame(client_end, message, message_id)
+            frame_buffer = FrameBuffer(64)
+            assert [recv_frame(server_end, frame_buffer) for _ in messages] == list(enumerate(messages))
+            client_end.close()
+            assert recv_frame(server_end, frame_buffer) is None
+
+    def test_too_big_frame_is_rejected(self):
+        frame_buffer = FrameBuffer(1024, max_frame_size=100)
+        frame_buffer.feed(encode_frame(b"x" * 101))
+        with pytest.raises(FrameError):
+            frame_buffer.next_frame()
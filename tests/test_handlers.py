@@ -0,0 +1,76 @@
+import asyncio
+import os
+import pytest
+from src.handlers import HandlerRegistry, Middleware, Request, echo, load_handler
+
+
+def process_id(request):
+    # module level - pickled to the process pool
+    return str(os.getpid())
+
+
+async def slow_upper(request):
+    await asyncio.sleep(0.01)
+    return request.body.upper()
+
+
+class _Auth(Middleware):
+    def before(self, request):
+        return "denied" if request.body == "secret" else None
+
+    def after(self, request, response):
+        return f"<{response}>"
+
+
+class TestHandlerRegistry:
+
+    def test_messages_are_routed_by_type_and_the_rest_go_to_the_default(self):
+        registry = HandlerRegistry()
+        registry.register("upper", lambda request: request.body.upper())
+        assert registry.handle(Request("a", 1, "upper:hello")) == "HELLO"
+        assert registry.handle(Request("a", 2, "hello")) == echo(Request("a", 2, "hello"))
+        assert registry.handle(Request("a", 3, "lower:hello")) == "Hello, client! I received your message: lower:hello."
+        stats = registry.stats()
+        assert stats["upper"]["count"] == 1 and stats["default"]["count"] == 2
+        registry.close()
+
+    def test_middleware_wraps_the_handler_and_can_answer_by_itself(self):
+        registry = HandlerRegistry()
+        registry.register("upper", lambda request: request.body.upper())
+        registry.use(_Auth())
+        assert registry.handle(Request("a", 1, "upper:hi")) == "<HI>"
+        assert registry.handle(Request("a", 2, "upper:secret")) == "<denied>"
+        assert registry.stats()["upper"]["count"] == 1 # the handler was not called for the denied message
+        registry.close()
+
+    def test_async_and_cpu_bound_handlers_run_from_both_paths(self):
+        registry = HandlerRegistry(process_pool_size=1)
+        registry.register("upper", slow_upper)
+        registry.register("pid", process_id, cpu_bound=True)
+        assert registry.handle(Request("a", 1, "upper:hi")) == "HI"
+        assert registry.handle(Request("a", 2, "pid:")) != str(os.getpid())
+
+        async def run():
+            return (await registry.handle_async(Request("a", 3, "upper:hi")),
+                    await registry.handle_async(Request("a", 4, "pid:")))
+        assert asyncio.run(run())[0] == "HI"
+        assert registry.stats()["pid"]["count"] == 2
+        registry.close()
+
+    def test_failed_handler_is_answered_with_an_error_and_counted(self):
+        registry = HandlerRegistry()
+        registry.register("div", lambda request: str(1 / int(request.body)))
+        assert registry.handle(Request("a", 1, "div:0")).startswith("ERROR: div:")
+        assert registry.stats()["div"]["errors"] == 1
+        with pytest.raises(ValueError):
+            registry.register("async_pid", slow_upper, cpu_bound=True)
+        registry.close()
+
+    def test_handlers_are_loaded_from_the_config(self):
+        registry = HandlerRegistry()
+        registry.configure({"handlers": {"pid": "tests.test_handlers:process_id"}, "cpu_bound_handlers": ["pid"]})
+        assert registry.handlers["pid"].cpu_bound
+        assert load_handler("src.handlers:echo") is echo
+        with pytest.raises(ValueError):
+            load_handler("src.handlers.echo")
+        registry.close()
@@ -0,0 +1,19 @@
+import logging
+from src.log import AppFormatter, get_logger
+
+
+class _Unformattable:
+    def __str__(self):
+        raise AssertionError("message was formatted although the level is off")
+
+
+class TestLog:
+
+    def test_record_is_printed_with_the_app_name(self):
+        record = get_logger("SERVER").makeRecord("csa.SERVER", logging.INFO, __file__, 1, "received %s bytes", (10,), None)
+        assert AppFormatter().format(record) == "[SERVER]: received 10 bytes"
+
+    def test_disabled_level_does_not_format_the_message(self):
+        log = get_logger("LAZY")
+        log.setLevel(logging.INFO)
+        log.debug("message: %s", _Unformattable())
@@ -0,0 +1,118 @@
+import queue
+import threading
+import time
+import pytest
+from src.message_store import MessageRecord, MemoryStore, SegmentFileStore, SQLiteStore, create_store, NullStore
+
+
+def _record(client, index):
+    return MessageRecord(client, index, f"message {index}", f"response {index}")
+
+
+class TestMemoryStore:
+
+    def test_keeps_only_the_last_messages_of_every_client(self):
+        store = MemoryStore(max_per_client=3, max_total=100)
+        for index in range(5):
+            store.add(_record(("127.0.0.1", 1), index))
+        store.add(_record(("127.0.0.1", 2), 0))
+        assert [record.index for record in store.records(("127.0.0.1", 1))] == [2, 3, 4]
+        assert len(store) == 4
+
+    def test_keeps_only_the_last_messages_of_all_the_clients(self):
+        store = MemoryStore(max_per_client=10, max_total=4)
+        for index in range(3):
+            store.add(_record("a", index))
+            store.add(_record("b", index))
+        assert [(record.client, record.index) for record in store.records()] == [("a", 1), ("b", 1), ("a", 2), ("b", 2)]
+        assert len(store) == 4
+
+
+class TestSegmentFileStore:
+
+    def test_rollover_and_compaction_keep_the_last_messages_of_every_client(self, tmp_path):
+        store = SegmentFileStore(tmp_path, segment_size=400, max_segments=4, max_per_client=5)
+        for index in range(100):
+            store.add(_record(("127.0.0.1", index % 2), index))
+        assert len(list(tmp_path.glob("*.segment"))) <= 4
+        kept = [record.index for record in store.records(("127.0.0.1", 0))]
+        assert kept[-5:] == [90, 92, 94, 96, 98]
+        assert kept == sorted(kept)
+        assert len(store) == len(list(store.records()))
+        store.close()
+
+    def test_records_survive_a_restart(self, tmp_path):
+        store = SegmentFileStore(tmp_path)
+        store.add(_record(("127.0.0.1", 1), 0))
+        store.close()
+        reopened = SegmentFileStore(tmp_path)
+        reopened.add(_record(("127.0.0.1", 1), 1))
+        assert [record.index for record in reopened.records()] == [0, 1]
+        assert len(reopened) == 2
+        assert reopened.clients() == [("127.0.0.1", 1)]
+        reopened.close()
+
+
+class TestCreateStore:
+
+    def test_backend_is_taken_from_the_config(self, tmp_path):
+        assert isinstance(create_store({}), MemoryStore)
+        assert isinstance(create_store({"message_store": "none"}), NullStore)
+        store = create_store({"message_store": "segments", "message_store_dir": str(tmp_path)})
+        assert isinstance(store, SegmentFileStore)
+        store.close()
+        with pytest.raises(ValueError):
+            create_store({"message_store": "redis"})
+
+
+class TestSQLiteStore:
+
+    def test_records_are_queried_per_client_and_time_range(self, tmp_path):
+        store = SQLiteStore(tmp_path / "messages.db", batch_size=10, batch_interval=0.05)
+        for index in range(25):
+            store.add(MessageRecord(("127.0.0.1", index % 2), index, f"message {index}", f"response {index}", timestamp=1000 + index))
+        assert [record.index for record in store.records(("127.0.0.1", 1))] == list(range(1, 25, 2))
+        assert [record.index for record in store.records_between(1010, 1015)] == [10, 11, 12, 13, 14]
+        assert [record.index for record in store.records_between(1010, 1015, ("127.0.0.1", 0))] == [10, 12, 14]
+        assert sorted(store.clients()) == [("127.0.0.1", 0), ("127.0.0.1", 1)]
+        store.close()
+
+    def test_records_are_committed_on_close(self, tmp_path):
+        store = SQLiteStore(tmp_path / "messages.db", batch_size=1000, batch_interval=60)
+        store.add(_record(("127.0.0.1", 1), 0))
+        store.close()
+        reopened = SQLiteStore(tmp_path / "messages.db")
+        assert len(reopened) == 1
+        assert [record.index for record in reopened.records()] == [0]
+        reopened.close()
+
+    def test_flush_while_other_threads_add_and_flush(self, tmp_path, monkeypatch):
+        class YieldingQueue(queue.SimpleQueue):
+            def put(self, item, block=True, timeout=None):
+                super().put(item, block, timeout)
+                time.sleep(0.0001) # the other threads put between any two puts of a thread
+
+        monkeypatch.setattr(queue, "SimpleQueue", YieldingQueue)
+        store = SQLiteStore(tmp_path / "messages.db", batch_size=50, batch_interval=0.001)
+        monkeypatch.undo()
+
+        def add(client):
+            for index in range(200):
+                store.add(_record(("127.0.0.1", client), index))
+                if index % 20 == 0:
+                    store.flush()
+
+        def flush():
+            for _ in range(100):
+                store.flush()
+
+        threads = [threading.Thread(target=add, args=(client,), daemon=True) for client in range(4)]
+        threads += [threading.Thread(target=flush, daemon=True) for _ in range(2)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join(timeout=30)
+        assert not any(thread.is_alive() for thread in threads) # no flush waits forever
+        assert store._writer.is_alive()
+        assert len(list(store.records())) == len(store) == 800 # every record was committed
+        store.close()
@@ -0,0 +1,87 @@
+import json
+import socket
+import threading
+import urllib.request
+from src.codec import LEGACY_DISCONNECT
+from src.framing import FrameBuffer, send_frame, recv_frame
+from src.metrics import Histogram, LocalCounter, LocalHistogram, MetricsRegistry
+from tests.test_select_server import _connect, _start_server, _wait_for
+
+
+def _free_port():
+    with socket.socket() as probe:
+        probe.bind(("127.0.0.1", 0))
+        return probe.getsockname()[1]
+
+
+def _get(port, path):
+    with urllib.request.urlopen(f"http://127.0.0.1:{port}{path}", timeout=5) as response:
+        return response.read().decode()
+
+
+class TestMetrics:
+
+    def test_thread_local_metrics_add_up_the_threads(self):
+        counter, histogram, plain = LocalCounter("c"), LocalHistogram("h"), Histogram("h")
+
+        def count():
+            for index in range(1000):
+                counter.inc()
+                histogram.observe(index / 1000)
+                plain.observe(index / 1000)
+
+        threads = [threading.Thread(target=count) for _ in range(4)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        # finished threads keep their cells
+        assert counter.value == 4000
+        assert histogram.count == 4000
+        assert histogram.snapshot() == plain.snapshot()
+        assert histogram.percentile(99) == plain.percentile(99)
+
+    def test_registry_renders_the_prometheus_text_format(self):
+        registry = MetricsRegistry()
+        registry.register("messages", LocalCounter("messages"), "messages", {"worker": 0}).inc(3)
+        registry.register("messages", LocalCounter("messages"), "messages", {"worker": 1}).inc(2)
+        registry.register("clients", lambda: 7, "clients")
+        registry.register("latency_seconds", LocalHistogram("latency", buckets=(0.1, 1.0)), "latency").observe(0.5)
+        lines = registry.render().splitlines()
+        assert "# TYPE csa_messages_total counter" in lines
+        assert 'csa_messages_total{worker="0"} 3' in lines and 'csa_messages_total{worker="1"} 2' in lines
+        assert "csa_clients 7" in lines
+        # buckets are cumulative
+        assert 'csa_latency_seconds_bucket{le="0.1"} 0' in lines
+        assert 'csa_latency_seconds_bucket{le="1.0"} 1' in lines
+        assert 'csa_latency_seconds_bucket{le="+Inf"} 1' in lines
+        assert "csa_latency_seconds_count 1" in lines
+
+    def test_select_server_serves_its_metrics_over_http(self):
+        server, server_thread = _start_server(working_threads=2, METRICS_PORT=_free_port())
+        server._start_metrics_server()
+        try:
+            tls_socket = _connect(server)
+            frame_buffer = FrameBuffer()
+            for index in range(20):
+                send_frame(tls_socket, f"message {index}".encode(), index)
+            assert [recv_frame(tls_socket, frame_buffer).message_id for _ in range(20)] == list(range(20))
+            assert _wait_for(lambda: server.send_latency.count > 0)
+
+            metrics = _get(server.METRICS_PORT, "/metrics").splitlines()
+            assert "csa_connections_accepted_total 1" in metrics
+            assert "csa_received_messages_total 20" in metrics
+            assert "csa_clients 1" in metrics
+            assert 'csa_handler_seconds_count{type="default"} 20' in metrics
+            assert any(line.startswith("csa_send_latency_seconds_count ") for line in metrics)
+
+            stats = json.loads(_get(server.METRICS_PORT, "/stats"))
+            assert stats["received_messages"] == 20 and stats["buffered_responses"] == 20
+            assert stats["received_bytes"] > 0 and len(stats["worker_busy_seconds"]) == 2
+
+            send_frame(tls_socket, LEGACY_DISCONNECT)
+            server_thread.join(timeout=5)
+            tls_socket.close()
+            assert server.stats()["connections_closed"] == 1
+        finally:
+            server.disconnect()
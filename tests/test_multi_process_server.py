@@ -0,0 +1,78 @@
+import os
+import signal
+import socket
+import threading
+import time
+from src import tls_contexts
+from src.config_resolver import find_file, load_config, CERT_FILE, SERVER_CONFIG_FILE
+from src.framing import FrameBuffer, send_frame, recv_frame
+from src.metrics import Histogram
+from src.multi_process_server import Supervisor
+
+
+def _connect(address, timeout=20):
+    # the workers are fresh interpreters, retried till one of them listens
+    context = tls_contexts.get_client_context(find_file(CERT_FILE))
+    deadline = time.monotonic() + timeout
+    while True:
+        try:
+            tcp_socket = socket.create_connection(address, timeout=5)
+            return context.wrap_socket(tcp_socket, server_hostname=address[0])
+        except OSError:
+            if time.monotonic() > deadline:
+                raise
+            time.sleep(0.1)
+
+
+def _wait_for(condition, timeout=20):
+    deadline = time.monotonic() + timeout
+    while not condition() and time.monotonic() < deadline:
+        time.sleep(0.05)
+    return condition()
+
+
+class TestSupervisor:
+
+    def test_workers_share_the_port_and_a_dead_worker_is_restarted(self):
+        config = load_config(SERVER_CONFIG_FILE)["server"]
+        address = (config["ip_address"], config["port"])
+        supervisor = Supervisor(processes=2)
+        supervisor_thread = threading.Thread(target=supervisor.start, daemon=True)
+        supervisor_thread.start()
+        try:
+            tls_sockets = [_connect(address) for _ in range(6)]
+            for index, tls_socket in enumerate(tls_sockets):
+                send_frame(tls_socket, b"Hello_Server", index)
+                assert recv_frame(tls_socket, FrameBuffer()).message_id == index
+            assert _wait_for(lambda: supervisor.stats().get("buffered_responses") == 6)
+            assert len(supervisor.stats()["workers"]) == 2
+            for tls_socket in tls_sockets:
+                send_frame(tls_socket, b"q")
+                tls_socket.close()
+
+            os.kill(supervisor.workers[0].pid, signal.SIGKILL)
+            assert _wait_for(lambda: supervisor.restarts == 1)
+            # the port is still served (by the other worker and by the new one)
+            tls_socket = _connect(address)
+            send_frame(tls_socket, b"Hello_Server", 0)
+            assert recv_frame(tls_socket, FrameBuffer()).message_id == 0
+            tls_socket.close()
+        finally:
+            supervisor.stop()
+            supervisor_thread.join(timeout=15)
+        assert not supervisor_thread.is_alive()
+        assert not any(process.is_alive() for process in supervisor.workers.values())
+
+    def test_histograms_and_handler_stats_of_the_workers_are_merged(self):
+        supervisor = Supervisor(processes=2)
+        for worker_index, latencies in enumerate(([0.0002, 0.003], [0.04])):
+            histogram = Histogram("send latency")
+            for latency in latencies:
+                histogram.observe(latency)
+            supervisor.worker_stats[worker_index] = {"writes": 2, "written_bytes": 100, "send_latency": histogram.snapshot(),
+                                                     "handlers": {"upper": dict(histogram.snapshot(), errors=worker_index)}}
+        stats = supervisor.stats()
+        assert stats["send_latency"]["count"] == 3 and abs(stats["send_latency"]["sum"] - 0.0432) < 1e-9
+        assert sum(stats["send_latency"]["buckets"].values()) == 3
+        assert stats["handlers"]["upper"]["count"] == 3 and stats["handlers"]["upper"]["errors"] == 1
+        assert stats["bytes_per_write"] == 50
@@ -0,0 +1,115 @@
+import asyncio
+import errno
+import socket
+import ssl
+import threading
+import pytest
+from src.client_tcp import Client
+from src.reconnect import ReconnectPolicy, ReconnectError
+from tests.test_client_pool import MultiClientEchoServer
+
+
+class TestReconnectPolicy:
+
+    def test_delays_grow_exponentially_with_full_jitter(self):
+        policy = ReconnectPolicy(base_delay=1, max_delay=10, multiplier=2)
+        for attempt, upper_bound in ((0, 1), (1, 2), (2, 4), (3, 8), (4, 10), (10, 10)):
+            delays = [policy.delay(attempt) for _ in range(200)]
+            assert all(0 <= delay <= upper_bound for delay in delays)
+            assert len(set(delays)) > 1 # randomized, clients don't retry in lockstep
+
+    def test_raises_after_max_retries_with_the_last_error(self):
+        attempts = []
+
+        def connect():
+            attempts.append(1)
+            raise ConnectionRefusedError("refused")
+
+        with pytest.raises(ReconnectError) as error:
+            ReconnectPolicy(max_retries=4, base_delay=0.001).retry(connect)
+        assert len(attempts) == 4
+        assert isinstance(error.value.__cause__, ConnectionRefusedError)
+
+    def test_deadline_and_cancel_stop_the_retries(self):
+        def connect():
+            raise ConnectionRefusedError
+
+        with pytest.raises(ReconnectError):
+            ReconnectPolicy(max_retries=1000, base_delay=0.01, deadline=0.1).retry(connect)
+
+        cancelled = threading.Event()
+        cancelled.set()
+        with pytest.raises(ReconnectError, match="cancelled"):
+            ReconnectPolicy(max_retries=1000, base_delay=10).retry(connect, cancelled=cancelled)
+
+    def test_server_restart_errors_are_retried_the_others_are_not(self):
+        errors = [ssl.SSLEOFError(8, "EOF occurred in violation of protocol"), OSError(errno.EHOSTUNREACH, "No route to host")]
+
+        def connect():
+            if errors:
+                raise errors.pop(0)
+            return "connected"
+
+        assert ReconnectPolicy(base_delay=0.001).retry(connect) == "connected" and not errors
+
+        attempts = []
+
+        def bad_certificate():
+            attempts.append(1)
+            raise ssl.SSLCertVerificationError("certificate verify failed")
+
+        def not_permitted():
+            attempts.append(1)
+            raise PermissionError(errno.EACCES, "Permission denied")
+
+        with pytest.raises(ssl.SSLCertVerificationError):
+            ReconnectPolicy(base_delay=0.001).retry(bad_certificate)
+        with pytest.raises(PermissionError):
+            ReconnectPolicy(base_delay=0.001).retry(not_permitted)
+        assert len(attempts) == 2 # a single attempt each
+
+    def test_async_variant_returns_after_the_server_is_up(self):
+        attempts = []
+
+        async def connect():
+            attempts.append(1)
+            if len(attempts) < 3:
+                raise ConnectionRefusedError
+            return "connected"
+
+        assert asyncio.run(ReconnectPolicy(base_delay=0.001).retry_async(connect)) == "connected"
+        assert len(attempts) == 3
+
+
+class TestClientAutoReconnect:
+
+    def test_client_reconnects_in_the_background_after_connection_loss(self):
+        server = MultiClientEchoServer()
+        client = Client()
+        try:
+            server.wait_for_connections(1)
+            server.client_sockets[0].shutdown(socket.SHUT_RDWR) # server drops the connection
+            assert not client._receive()          # connection loss is found, reconnect starts in the background
+            assert client.wait_connected(timeout=10)
+            assert client.send("Hello_Server") and client._receive()
+        finally:
+            client.disconnect()
+            server.close()
+
+    def test_background_reconnect_records_an_error_that_is_not_retried(self):
+        server = MultiClientEchoServer()
+        client = Client()
+        try:
+            server.wait_for_connections(1)
+
+            def reconnect():
+                raise ssl.SSLCertVerificationError("certificate verify failed")
+
+            client.reconnect = reconnect
+            server.client_sockets[0].shutdown(socket.SHUT_RDWR)
+            assert not client._receive()
+            client._reconnect_thread.join(timeout=5)
+            assert isinstance(client.reconnect_error, ssl.SSLCertVerificationError) and not client.wait_connected(timeout=0)
+        finally:
+            client.disconnect()
+            server.close()
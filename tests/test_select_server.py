@@ -0,0 +1,197 @@
+import socket
+import threading
+import time
+from src import tls_contexts
+from src.config_resolver import find_file, CERT_FILE
+from src.framing import FrameBuffer, send_frame, recv_frame
+from src.multi_client_by_select_server_tcp import Server
+
+
+def _start_server(working_threads, paused_workers=False, **settings):
+    # select server in a thread, its settings are changed after the config was loaded
+    # paused_workers - the working threads are not started (start them with: Server._working_thread(server, index))
+    server = Server()
+    server._init()
+    server.NUMBER_WORKING_THREADS = working_threads
+    for name, value in settings.items():
+        setattr(server, name, value)
+    if paused_workers:
+        server._working_thread = lambda worker_index: None
+    server._create_server_socket()
+    server_thread = threading.Thread(target=server._scan_sockets, daemon=True)
+    server_thread.start()
+    return server, server_thread
+
+
+def _connect(server, receive_buffer=None):
+    context = tls_contexts.get_client_context(find_file(CERT_FILE))
+    tcp_socket = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+    if receive_buffer:
+        tcp_socket.setsockopt(socket.SOL_SOCKET, socket.SO_RCVBUF, receive_buffer)
+    tcp_socket.connect((server.IP, server.PORT))
+    return context.wrap_socket(tcp_socket, server_hostname=server.IP)
+
+
+def _wait_for(condition, timeout=5):
+    deadline = time.monotonic() + timeout
+    while not condition() and time.monotonic() < deadline:
+        time.sleep(0.02)
+    return condition()
+
+
+class TestSelectServer:
+
+    def test_client_above_its_high_watermark_is_not_read_till_the_queue_drains(self):
+        server, server_thread = _start_server(working_threads=1, paused_workers=True, MAX_QUEUED_MESSAGES_PER_CLIENT=10)
+        try:
+            tls_socket = _connect(server)
+            for index in range(50):
+                send_frame(tls_socket, f"message {index}".encode(), index)
+            # nobody takes the messages from the queue - the client is paused at its high watermark
+            assert _wait_for(lambda: server.queue_stats()["paused_clients"] == 1)
+            assert server.queue_stats()["queued_messages"] == 10
+
+            threading.Thread(target=Server._working_thread, args=(server, 0), daemon=True).start()
+            frame_buffer = FrameBuffer()
+            responses = [recv_frame(tls_socket, frame_buffer).message_id for _ in range(50)]
+            assert sorted(responses) == list(range(50))
+            stats = server.queue_stats()
+            assert stats["queued_messages_peak"] <= 10 and stats["read_pauses"] >= 1
+
+            send_frame(tls_socket, b"q")
+            server_thread.join(timeout=5)
+            assert not server_thread.is_alive() # last client disconnected
+            tls_socket.close()
+        finally:
+            server.disconnect()
+
+    def test_messages_of_a_client_are_answered_in_order(self):
+        server, server_thread = _start_server(working_threads=4)
+        try:
+            tls_sockets = [_connect(server) for _ in range(4)]
+            for tls_socket in tls_sockets:
+                for index in range(200):
+                    send_frame(tls_socket, f"message {index}".encode(), index)
+            for tls_socket in tls_sockets:
+                frame_buffer = FrameBuffer()
+                assert [recv_frame(tls_socket, frame_buffer).message_id for _ in range(200)] == list(range(200))
+            assert len(set(server.client_workers.values())) > 1 # clients are spread over the working threads
+
+            for tls_socket in tls_sockets:
+                send_frame(tls_socket, b"q")
+                tls_socket.close()
+            server_thread.join(timeout=5)
+            assert not server_thread.is_alive()
+        finally:
+            server.disconnect()
+
+    def test_client_that_does_not_read_is_disconnected_without_stalling_the_others(self):
+        server, server_thread = _start_server(working_threads=1, MAX_OUTPUT_BUFFER=64 * 1024)
+        try:
+            tls_socket = _connect(server) # connected first, the server finishes when the last client disconnects
+            slow_socket = _connect(server, receive_buffer=4096)
+
+            def flood():
+                # sends and never reads the responses
+                try:
+                    for index in range(20000):
+                        send_frame(slow_socket, b"x" * 900, index)
+                except OSError:
+                    pass # disconnected by the server
+
+            flood_thread = threading.Thread(target=flood, daemon=True)
+            flood_thread.start()
+            assert _wait_for(lambda: server.write_stats()["slow_consumer_disconnects"] == 1, timeout=10)
+
+            # the single working thread is not stuck on the slow client
+            frame_buffer = FrameBuffer()
+            for index in range(10):
+                send_frame(tls_socket, b"Hello_Server", index)
+                assert recv_frame(tls_socket, frame_buffer).message_id == index
+            flood_thread.join(timeout=10)
+            send_frame(tls_socket, b"q")
+            server_thread.join(timeout=5)
+            assert not server_thread.is_alive()
+            tls_socket.close()
+            slow_socket.close()
+        finally:
+            server.disconnect()
+
+    def test_client_that_does_not_handshake_does_not_delay_the_others(self):
+        server, server_thread = _start_server(working_threads=1)
+        try:
+            raw_socket = socket.create_connection((server.IP, server.PORT)) # TCP only, the TLS handshake never starts
+            assert _wait_for(lambda: server.stats()["handshaking_clients"] == 1)
+            start = time.monotonic()
+            tls_socket = _connect(server)
+            frame_buffer = FrameBuffer()
+            send_frame(tls_socket, b"Hello_Server", 1)
+            assert recv_frame(tls_socket, frame_buffer).message_id == 1
+            assert time.monotonic() - start < 1 # far below the handshake timeout the stalled client waits for
+            raw_socket.close() # the server drops it when it reads the EOF
+            assert _wait_for(lambda: server.stats()["handshaking_clients"] == 0)
+            send_frame(tls_socket, b"q")
+            server_thread.join(timeout=5)
+            assert not server_thread.is_alive()
+            assert server.stats()["handshake_timeouts"] == 0
+            tls_socket.close()
+        finally:
+            server.disconnect()
+
+    def test_client_that_does_not_handshake_is_disconnected_by_its_timer(self):
+        server, server_thread = _start_server(working_threads=1, HANDSHAKE_TIMEOUT=0.5)
+        try:
+            tls_socket = _connect(server) # the server finishes when the last client disconnects
+            raw_socket = socket.create_connection((server.IP, server.PORT))
+            raw_socket.settimeout(5)
+            start = time.monotonic()
+            assert raw_socket.recv(1024) == b"" # closed by the server
+            assert 0.4 < time.monotonic() - start < 3
+            assert _wait_for(lambda: server.stats()["handshaking_clients"] == 0)
+            assert server.stats()["handshake_timeouts"] == 1 and server.stats()["clients"] == 1
+            send_frame(tls_socket, b"q")
+            server_thread.join(timeout=5)
+            assert not server_thread.is_alive()
+            tls_socket.close()
+            raw_socket.close()
+        finally:
+            server.disconnect()
+
+    def test_idle_client_is_disconnected_by_its_timer(self):
+        server, server_thread = _start_server(working_threads=1, IDLE_TIMEOUT=0.5)
+        try:
+            tls_socket = _connect(server)
+            frame_buffer = FrameBuffer()
+            for index in range(3): # activity keeps it connected past the timeout
+                send_frame(tls_socket, b"Hello_Server", index)
+                assert recv_frame(tls_socket, frame_buffer).message_id == index
+                time.sleep(0.3)
+            assert server.stats()["idle_disconnects"] == 0
+            # silent now - disconnected, it was the last client so the server finishes
+            server_thread.join(timeout=5)
+            assert not server_thread.is_alive()
+            assert server.stats()["idle_disconnects"] == 1 and server.stats()["clients"] == 0
+            tls_socket.close()
+        finally:
+            server.disconnect()
+
+    def test_message_that_misses_its_deadline_is_answered_with_an_error(self):
+        server, server_thread = _start_server(working_threads=1, REQUEST_TIMEOUT=0.2)
+        server.handlers.register("slow", lambda request: time.sleep(0.6) or "done")
+        try:
+            tls_socket = _connect(server)
+            frame_buffer = FrameBuffer()
+            send_frame(tls_socket, b"slow:x", 1)
+            send_frame(tls_socket, b"Hello_Server", 2) # waits behind the slow one, misses its deadline too
+            responses = [recv_frame(tls_socket, frame_buffer) for _ in range(2)]
+            assert [(frame.message_id, bytes(frame.payload)) for frame in responses] == [(1, b"ERROR: request timeout"),
+                                                                                          (2, b"ERROR: request timeout")]
+            assert _wait_for(lambda: server.stats()["late_responses"] == 1) # the slow handler finished, its response was dropped
+            send_frame(tls_socket, b"Hello_Server", 3) # on time again
+            assert recv_frame(tls_socket, frame_buffer).message_id == 3
+            assert server.stats()["request_timeouts"] == 2
+            send_frame(tls_socket, b"q")
+            server_thread.join(timeout=5)
+            tls_socket.close()
+        finally:
+            server.disconnect()
@@ -0,0 +1,110 @@
+import hashlib
+import io
+import time
+from src.client_tcp import Client
+from src.codec import CODECS, disconnect_frame
+from src.framing import FrameBuffer, encode_frame
+from src.streaming import STREAM_DATA, open_frame, send_stream
+from tests.test_codec import _connect
+from tests.test_select_server import _start_server, _wait_for
+
+
+def _chunks(count, size):
+    for index in range(count):
+        yield bytes([index % 256]) * size
+
+
+class TestStreaming:
+
+    def test_big_stream_goes_through_with_bounded_server_memory(self):
+        server, server_thread = _start_server(working_threads=1, STREAM_WINDOW=256 * 1024)
+
+        def slow_sum(stream):
+            total = 0
+            for chunk in stream:
+                time.sleep(0.001) # handler slower than the client - the credit holds the client back
+                total += len(chunk)
+            return f"{total} of {stream.size}"
+
+        server.handlers.register_stream("sum", slow_sum)
+        try:
+            tls_socket = _connect(server, ["binary"])
+            frame_buffer = FrameBuffer()
+            progress = []
+            # 32MB from an iterable of 100KB chunks (cut into 64KB frames), size is not known up front
+            response = send_stream(tls_socket, frame_buffer, 1, _chunks(320, 100 * 1024), "sum", progress=lambda sent, size: progress.append(sent))
+            _, _, body = CODECS["binary"].decode(response.payload)
+            assert response.message_id == 1 and bytes(body) == b"32768000 of None"
+            assert progress[-1] == 32768000
+            stats = server.stats()
+            assert stats["stream_bytes"] == 32768000 and stats["streams_completed"] == 1
+            assert stats["stream_buffered_bytes_peak"] <= 256 * 1024
+
+            # a file goes to the default stream handler: size + sha256
+            data = bytes(range(256)) * 4000
+            response = send_stream(tls_socket, frame_buffer, 2, io.BytesIO(data))
+            _, _, body = CODECS["binary"].decode(response.payload)
+            assert bytes(body).decode().endswith(f"{len(data)} bytes, sha256: {hashlib.sha256(data).hexdigest()}.")
+
+            tls_socket.sendall(disconnect_frame(CODECS["binary"]))
+            server_thread.join(timeout=5)
+            tls_socket.close()
+        finally:
+            server.disconnect()
+
+    def test_handler_that_answers_early_or_fails_ends_the_stream(self):
+        server, server_thread = _start_server(working_threads=1, STREAM_WINDOW=64 * 1024)
+
+        def first_chunk(stream):
+            return f"first: {len(next(iter(stream)))}"
+
+        def broken(stream):
+            raise ValueError("disk full")
+
+        server.handlers.register_stream("first", first_chunk)
+        server.handlers.register_stream("broken", broken)
+        try:
+            tls_socket = _connect(server, ["text"])
+            frame_buffer = FrameBuffer()
+            response = send_stream(tls_socket, frame_buffer, 1, _chunks(100, 64 * 1024), "first", chunk_size=16 * 1024)
+            assert response.payload == b"first: 16384"
+            response = send_stream(tls_socket, frame_buffer, 2, b"x" * 100000, "broken")
+            assert response.payload == b"ERROR: broken: disk full"
+            # the connection still works after the streams that were cut short
+            response = send_stream(tls_socket, frame_buffer, 3, b"y" * 10)
+            assert b"10 bytes" in response.payload
+            assert _wait_for(lambda: server.stats()["active_streams"] == 0)
+            assert server.stats()["handlers"]["stream:broken"]["errors"] == 1
+
+            tls_socket.sendall(disconnect_frame(CODECS["text"]))
+            server_thread.join(timeout=5)
+            tls_socket.close()
+        finally:
+            server.disconnect()
+
+    def test_client_sends_a_file_and_a_disconnect_stops_the_handler(self, tmp_path):
+        server, server_thread = _start_server(working_threads=1, STREAM_WINDOW=64 * 1024)
+        server.handlers.register_stream("stuck", lambda stream: sum(len(chunk) for chunk in stream))
+        client = None
+        try:
+            anchor = _connect(server, ["text"]) # the server finishes when the last client disconnects
+            path = tmp_path / "payload.bin"
+            path.write_bytes(b"z" * 3_000_000)
+            client = Client(auto_reconnect=False)
+            with open(path, "rb") as file:
+                response = client.send_stream(file, progress=lambda sent, size: None)
+            assert response.endswith(f"3000000 bytes, sha256: {hashlib.sha256(path.read_bytes()).hexdigest()}.")
+
+            # the client vanishes in the middle of a stream - its handler gets StreamError instead of waiting forever
+            client.client_socket.sendall(open_frame(99, "stuck"))
+            client.client_socket.sendall(encode_frame(STREAM_DATA + b"a" * 1000, 99, control=True))
+            client.client_socket.close()
+            assert _wait_for(lambda: server.stats()["streams_aborted"] == 1)
+            anchor.sendall(disconnect_frame(CODECS["text"]))
+            server_thread.join(timeout=5)
+            anchor.close()
+        finally:
+            if client:
+                client.disconnect()
+            server.disconnect()
+
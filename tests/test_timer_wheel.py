@@ -0,0 +1,42 @@
+from src.timer_wheel import TimerWheel
+
+
+class TestTimerWheel:
+
+    def test_timers_fire_in_their_tick_never_early(self):
+        timers = TimerWheel(tick=0.1, slots=8, now=0)
+        fired = []
+        timers.schedule(0.25, fired.append, "a", now=0)
+        timers.schedule(0.1, fired.append, "b", now=0)
+        cancelled = timers.schedule(0.2, fired.append, "c", now=0)
+        cancelled.cancel()
+        assert timers.advance(now=0.05) == 0
+        assert timers.advance(now=0.2) == 1 and fired == ["b"]
+        assert timers.advance(now=0.29) == 0
+        assert timers.advance(now=0.3) == 1 and fired == ["b", "a"]
+        assert len(timers) == 0 # the cancelled one was dropped when its slot was visited
+
+    def test_timers_further_than_a_round_wait_for_their_round(self):
+        timers = TimerWheel(tick=1, slots=4, now=0)
+        fired = []
+        timers.schedule(10, fired.append, "far", now=0)   # same slot as tick 2 and 6
+        timers.schedule(2, fired.append, "near", now=0)
+        timers.advance(now=6)
+        assert fired == ["near"]
+        # a long stall visits every slot once and fires everything that is due
+        timers.advance(now=100)
+        assert fired == ["near", "far"] and len(timers) == 0
+
+    def test_callback_can_schedule_again(self):
+        timers = TimerWheel(tick=1, slots=4, now=0)
+        fired = []
+
+        def again(count):
+            fired.append(count)
+            if count < 3:
+                timers.schedule(4, again, count + 1, now=timers.current_tick) # a whole round: the slot that is being fired
+
+        timers.schedule(1, again, 1, now=0)
+        for now in range(1, 10):
+            timers.advance(now=now)
+        assert fired == [1, 2, 3]
@@ -0,0 +1,57 @@
+import os
+import shutil
+import socket
+import threading
+from src import tls_contexts
+from src.config_resolver import find_file, CERT_FILE, KEY_FILE
+from src.framing import FrameBuffer, send_frame, recv_frame
+
+
+def _echo_server(server_socket, context, connections):
+    # answers a single message on each connection, then closes it
+    for _ in range(connections):
+        client_socket, _ = server_socket.accept()
+        with context.wrap_socket(client_socket, server_side=True) as tls_socket:
+            frame = recv_frame(tls_socket, FrameBuffer())
+            send_frame(tls_socket, frame.payload, frame.message_id)
+
+
+class TestTlsContexts:
+
+    def test_contexts_are_cached(self):
+        cert_file, key_file = find_file(CERT_FILE), find_file(KEY_FILE)
+        assert tls_contexts.get_client_context(cert_file) is tls_contexts.get_client_context(cert_file)
+        assert tls_contexts.get_server_context(cert_file, key_file) is tls_contexts.get_server_context(cert_file, key_file)
+
+    def test_replaced_key_file_gets_a_new_server_context(self, tmp_path):
+        cert_file, key_file = shutil.copy(find_file(CERT_FILE), tmp_path), shutil.copy(find_file(KEY_FILE), tmp_path)
+        context = tls_contexts.get_server_context(cert_file, key_file)
+        stat = os.stat(key_file)
+        os.utime(key_file, ns=(stat.st_atime_ns, stat.st_mtime_ns + 1_000_000_000)) # key replaced, the certificate file untouched
+        assert tls_contexts.get_server_context(cert_file, key_file) is not context
+
+    def test_reconnect_resumes_the_session(self):
+        """
+        Second connection to the same server, with the session of the first one, must do a resumed (short) handshake
+        """
+        cert_file, key_file = find_file(CERT_FILE), find_file(KEY_FILE)
+        server_context = tls_contexts.get_server_context(cert_file, key_file)
+        client_context = tls_contexts.get_client_context(cert_file)
+
+        with socket.create_server(("127.0.0.1", 0)) as server_socket:
+            server_address = server_socket.getsockname()
+            server_thread = threading.Thread(target=_echo_server, args=(server_socket, server_context, 2), daemon=True)
+            server_thread.start()
+
+            resumed = []
+            for _ in range(2):
+                with client_context.wrap_socket(socket.create_connection(server_address),
+                                                server_hostname=server_address[0],
+                                                session=tls_contexts.get_session(server_address, client_context)) as tls_socket:
+                    resumed.append(tls_socket.session_reused)
+                    send_frame(tls_socket, b"Hello_Server", 1)
+                    assert recv_frame(tls_socket, FrameBuffer()) == (1, b"Hello_Server")
+                    tls_contexts.remember_session(server_address, tls_socket)
+            server_thread.join(timeout=5)
+
+        assert resumed == [False, True]